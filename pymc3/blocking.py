@@ -19,6 +19,10 @@ DataMap = collections.namedtuple('DataMap', 'list_ind, slc, shp, dtype, name')
 class ArrayOrdering:
     """
     An ordering for an array space
+
+    The ordering is a table of the variable name, slice, shape and dtype of
+    every variable in the flat array, computed once. `by_name` gives
+    constant time access to the entries by variable name.
     """
 
     def __init__(self, vars):
@@ -55,9 +59,10 @@ class DictToArrayBijection:
         self.dpt = dpoint
 
         # determine smallest float dtype that will fit all data
-        if all([x.dtyp == 'float16' for x in ordering.vmap]):
+        dtypes = set(x.dtyp for x in ordering.vmap)
+        if dtypes <= {'float16'}:
             self.array_dtype = 'float16'
-        elif all([x.dtyp == 'float32' for x in ordering.vmap]):
+        elif dtypes <= {'float32'}:
             self.array_dtype = 'float32'
         else:
             self.array_dtype = 'float64'
@@ -79,14 +84,18 @@ class DictToArrayBijection:
         """
         Maps value from array space to dict space
 
+        The values of variables whose dtype is the dtype of `apt` are
+        reshaped views into `apt`, not copies.
+
         Parameters
         ----------
         apt : array
         """
         dpt = self.dpt.copy()
+        apt = np.atleast_1d(apt)
 
         for var, slc, shp, dtyp in self.ordering.vmap:
-            dpt[var] = np.atleast_1d(apt)[slc].reshape(shp).astype(dtyp)
+            dpt[var] = apt[slc].reshape(shp).astype(dtyp, copy=False)
 
         return dpt
 
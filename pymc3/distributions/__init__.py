@@ -56,6 +56,9 @@ from .distribution import NoDistribution
 from .distribution import TensorType
 from .distribution import draw_values
 from .distribution import generate_samples
+from .distribution import get_random_state
+from .distribution import use_random_state
+from .distribution import record_sampling_loops
 
 from .mixture import Mixture
 from .mixture import NormalMixture
@@ -77,6 +80,7 @@ from .timeseries import GaussianRandomWalk
 from .timeseries import GARCH11
 from .timeseries import MvGaussianRandomWalk
 from .timeseries import MvStudentTRandomWalk
+from .timeseries import LinearGaussianStateSpace
 
 from .transforms import transform
 from .transforms import stick_breaking
@@ -146,6 +150,7 @@ __all__ = ['Uniform',
            'MvGaussianRandomWalk',
            'MvStudentTRandomWalk',
            'GARCH11',
+           'LinearGaussianStateSpace',
            'SkewNormal',
            'Mixture',
            'NormalMixture',
@@ -7,7 +7,6 @@ import numpy as np
 import theano.tensor as tt
 from scipy import stats
 from scipy.special import expit
-from scipy.interpolate import InterpolatedUnivariateSpline
 import warnings
 
 from pymc3.theanof import floatX
@@ -17,10 +16,10 @@ from .special import log_i0
 from ..math import invlogit, logit, logdiffexp
 from .dist_math import (
     alltrue_elemwise, betaln, bound, gammaln, i0e, incomplete_beta, logpow,
-    normal_lccdf, normal_lcdf, SplineWrapper, std_cdf, zvalue,
+    normal_lccdf, normal_lcdf, LinearInterpolation, std_cdf, zvalue,
 )
 from .distribution import (Continuous, draw_values, generate_samples,
-                           broadcast_distribution_samples)
+                           broadcast_distribution_samples, get_random_state)
 
 __all__ = ['Uniform', 'Flat', 'HalfFlat', 'Normal', 'TruncatedNormal', 'Beta',
            'Kumaraswamy', 'Exponential', 'Laplace', 'StudentT', 'Cauchy',
@@ -173,6 +172,8 @@ class Uniform(BoundedContinuous):
         Upper limit.
     """
 
+    vectorized_random = True
+
     def __init__(self, lower=0, upper=1, *args, **kwargs):
         self.lower = lower = tt.as_tensor_variable(floatX(lower))
         self.upper = upper = tt.as_tensor_variable(floatX(upper))
@@ -418,6 +419,8 @@ class Normal(Continuous):
             x = pm.Normal('x', mu=0, tau=1/23)
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0, sigma=None, tau=None, sd=None, **kwargs):
         if sd is not None:
             sigma = sd
@@ -564,6 +567,8 @@ class TruncatedNormal(BoundedContinuous):
 
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0, sigma=None, tau=None, lower=None, upper=None,
                  transform='auto', sd=None, *args, **kwargs):
         if sd is not None:
@@ -750,6 +755,8 @@ class HalfNormal(PositiveContinuous):
             x = pm.HalfNormal('x', tau=1/15)
     """
 
+    vectorized_random = True
+
     def __init__(self, sigma=None, tau=None, sd=None, *args, **kwargs):
         if sd is not None:
             sigma = sd
@@ -904,6 +911,8 @@ class Wald(PositiveContinuous):
        statmod: Probability Calculations for the Inverse Gaussian Distribution
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=None, lam=None, phi=None, alpha=0., *args, **kwargs):
         super().__init__(*args, **kwargs)
         mu, lam, phi = self.get_mu_lam_phi(mu, lam, phi)
@@ -939,10 +948,10 @@ class Wald(PositiveContinuous):
                          'mu and lam, mu and phi, or lam and phi.')
 
     def _random(self, mu, lam, alpha, size=None):
-        v = np.random.normal(size=size)**2
+        v = get_random_state().normal(size=size)**2
         value = (mu + (mu**2) * v / (2. * lam) - mu / (2. * lam)
                  * np.sqrt(4. * mu * lam * v + (mu * v)**2))
-        z = np.random.uniform(size=size)
+        z = get_random_state().uniform(size=size)
         i = np.floor(z - mu / (mu + value)) * 2 + 1
         value = (value**-i) * (mu**(i + 1))
         return value + alpha
@@ -1115,6 +1124,8 @@ class Beta(UnitContinuous):
     the binomial distribution.
     """
 
+    vectorized_random = True
+
     def __init__(self, alpha=None, beta=None, mu=None, sigma=None,
                  sd=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1260,6 +1271,8 @@ class Kumaraswamy(UnitContinuous):
         b > 0.
     """
 
+    vectorized_random = True
+
     def __init__(self, a, b, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -1275,7 +1288,7 @@ class Kumaraswamy(UnitContinuous):
         assert_negative_support(b, 'b', 'Kumaraswamy')
 
     def _random(self, a, b, size=None):
-        u = np.random.uniform(size=size)
+        u = get_random_state().uniform(size=size)
         return (1 - (1 - u) ** (1 / b)) ** (1 / a)
 
     def random(self, point=None, size=None):
@@ -1373,6 +1386,8 @@ class Exponential(PositiveContinuous):
         Rate or inverse scale (lam > 0)
     """
 
+    vectorized_random = True
+
     def __init__(self, lam, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.lam = lam = tt.as_tensor_variable(floatX(lam))
@@ -1497,6 +1512,8 @@ class Laplace(Continuous):
         Scale parameter (b > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, mu, b, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.b = b = tt.as_tensor_variable(floatX(b))
@@ -1633,6 +1650,8 @@ class Lognormal(PositiveContinuous):
             x = pm.Lognormal('x', mu=2, tau=1/100)
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0, sigma=None, tau=None, sd=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if sd is not None:
@@ -1653,7 +1672,7 @@ class Lognormal(PositiveContinuous):
         assert_negative_support(sigma, 'sigma', 'Lognormal')
 
     def _random(self, mu, tau, size=None):
-        samples = np.random.normal(size=size)
+        samples = get_random_state().normal(size=size)
         return np.exp(mu + (tau**-0.5) * samples)
 
     def random(self, point=None, size=None):
@@ -1790,6 +1809,8 @@ class StudentT(Continuous):
             x = pm.StudentT('x', nu=15, mu=0, lam=1/23)
     """
 
+    vectorized_random = True
+
     def __init__(self, nu, mu=0, lam=None, sigma=None, sd=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         super(StudentT, self).__init__(*args, **kwargs)
@@ -1923,6 +1944,8 @@ class Pareto(Continuous):
         Scale parameter (m > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, alpha, m, transform='lowerbound', *args, **kwargs):
         self.alpha = alpha = tt.as_tensor_variable(floatX(alpha))
         self.m = m = tt.as_tensor_variable(floatX(m))
@@ -1943,7 +1966,7 @@ class Pareto(Continuous):
         super().__init__(transform=transform, *args, **kwargs)
 
     def _random(self, alpha, m, size=None):
-        u = np.random.uniform(size=size)
+        u = get_random_state().uniform(size=size)
         return m * (1. - u)**(-1. / alpha)
 
     def random(self, point=None, size=None):
@@ -2060,6 +2083,8 @@ class Cauchy(Continuous):
         Scale parameter > 0
     """
 
+    vectorized_random = True
+
     def __init__(self, alpha, beta, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.median = self.mode = self.alpha = tt.as_tensor_variable(floatX(alpha))
@@ -2068,7 +2093,7 @@ class Cauchy(Continuous):
         assert_negative_support(beta, 'beta', 'Cauchy')
 
     def _random(self, alpha, beta, size=None):
-        u = np.random.uniform(size=size)
+        u = get_random_state().uniform(size=size)
         return alpha + beta * np.tan(np.pi * (u - 0.5))
 
     def random(self, point=None, size=None):
@@ -2169,6 +2194,8 @@ class HalfCauchy(PositiveContinuous):
         Scale parameter (beta > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, beta, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.mode = tt.as_tensor_variable(0)
@@ -2177,7 +2204,7 @@ class HalfCauchy(PositiveContinuous):
         assert_negative_support(beta, 'beta', 'HalfCauchy')
 
     def _random(self, beta, size=None):
-        u = np.random.uniform(size=size)
+        u = get_random_state().uniform(size=size)
         return beta * np.abs(np.tan(np.pi * (u - 0.5)))
 
     def random(self, point=None, size=None):
@@ -2296,6 +2323,8 @@ class Gamma(PositiveContinuous):
         Alternative scale parameter (sigma > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, alpha=None, beta=None, mu=None, sigma=None,
                  sd=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -2442,6 +2471,8 @@ class InverseGamma(PositiveContinuous):
         Alternative scale parameter (sigma > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, alpha=None, beta=None, mu=None, sigma=None, sd=None,
                  *args, **kwargs):
         super().__init__(*args, defaults=('mode',), **kwargs)
@@ -2578,6 +2609,8 @@ class ChiSquared(Gamma):
         Degrees of freedom (nu > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, nu, *args, **kwargs):
         self.nu = nu = tt.as_tensor_variable(floatX(nu))
         super().__init__(alpha=nu / 2., beta=0.5, *args, **kwargs)
@@ -2635,6 +2668,8 @@ class Weibull(PositiveContinuous):
         Scale parameter (beta > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, alpha, beta, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.alpha = alpha = tt.as_tensor_variable(floatX(alpha))
@@ -2672,7 +2707,7 @@ class Weibull(PositiveContinuous):
         alpha, beta = broadcast_distribution_samples([alpha, beta], size=size)
 
         def _random(a, b, size=None):
-            return b * (-np.log(np.random.uniform(size=size)))**(1 / a)
+            return b * (-np.log(get_random_state().uniform(size=size)))**(1 / a)
 
         return generate_samples(_random, alpha, beta,
                                 dist_shape=self.shape,
@@ -2789,6 +2824,8 @@ class HalfStudentT(PositiveContinuous):
             x = pm.HalfStudentT('x', lam=4, nu=10)
     """
 
+    vectorized_random = True
+
     def __init__(self, nu=1, sigma=None, lam=None, sd=None,
                  *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -2928,6 +2965,8 @@ class ExGaussian(Continuous):
         Vol. 4, No. 1, pp 35-45.
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0., sigma=None, nu=None, sd=None,
                  *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -2967,8 +3006,8 @@ class ExGaussian(Continuous):
                                                        size=size)
 
         def _random(mu, sigma, nu, size=None):
-            return (np.random.normal(mu, sigma, size=size)
-                    + np.random.exponential(scale=nu, size=size))
+            return (get_random_state().normal(mu, sigma, size=size)
+                    + get_random_state().exponential(scale=nu, size=size))
 
         return generate_samples(_random, mu, sigma, nu,
                                 dist_shape=self.shape,
@@ -3081,6 +3120,8 @@ class VonMises(Continuous):
         Concentration (\frac{1}{kappa} is analogous to \sigma^2).
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0.0, kappa=None, transform='circular',
                  *args, **kwargs):
         if transform == 'circular':
@@ -3203,6 +3244,8 @@ class SkewNormal(Continuous):
 
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0.0, sigma=None, tau=None, alpha=1, sd=None,
                  *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -3339,6 +3382,8 @@ class Triangular(BoundedContinuous):
         Upper limit.
     """
 
+    vectorized_random = True
+
     def __init__(self, lower=0, upper=1, c=0.5,
                  *args, **kwargs):
         self.median = self.mean = self.c = c = tt.as_tensor_variable(floatX(c))
@@ -3475,6 +3520,8 @@ class Gumbel(Continuous):
         Scale parameter (beta > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0, beta=1.0, **kwargs):
         self.mu = tt.as_tensor_variable(floatX(mu))
         self.beta = tt.as_tensor_variable(floatX(beta))
@@ -3586,6 +3633,8 @@ class Rice(PositiveContinuous):
 
     """
 
+    vectorized_random = True
+
     def __init__(self, nu=None, sigma=None, b=None, sd=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if sd is not None:
@@ -3702,6 +3751,8 @@ class Logistic(Continuous):
         Scale (s > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0., s=1., *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -3835,6 +3886,8 @@ class LogitNormal(UnitContinuous):
         Scale parameter (tau > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0, sigma=None, tau=None, sd=None, **kwargs):
         if sd is not None:
             sigma = sd
@@ -3931,21 +3984,26 @@ class Interpolated(BoundedContinuous):
         Probability density function evaluated on lattice `x_points`
     """
 
+    vectorized_random = True
+
     def __init__(self, x_points, pdf_points, *args, **kwargs):
         self.lower = lower = tt.as_tensor_variable(x_points[0])
         self.upper = upper = tt.as_tensor_variable(x_points[-1])
 
         super().__init__(lower=lower, upper=upper, *args, **kwargs)
 
-        interp = InterpolatedUnivariateSpline(
-            x_points, pdf_points, k=1, ext='zeros')
-        Z = interp.integral(x_points[0], x_points[-1])
+        x_points = np.asarray(x_points, dtype='float64')
+        pdf_points = np.asarray(pdf_points, dtype='float64')
+        # exact integrals of the piecewise linear density
+        cdf_points = np.concatenate([[0.], np.cumsum(
+            np.diff(x_points) * (pdf_points[1:] + pdf_points[:-1]) / 2)])
+        Z = cdf_points[-1]
 
-        self.Z = tt.as_tensor_variable(Z)
-        self.interp_op = SplineWrapper(interp)
+        self.Z = tt.as_tensor_variable(floatX(Z))
+        self.interp_op = LinearInterpolation()
         self.x_points = x_points
         self.pdf_points = pdf_points / Z
-        self.cdf_points = interp.antiderivative()(x_points) / Z
+        self.cdf_points = cdf_points / Z
 
         self.median = self._argcdf(0.5)
 
@@ -3954,28 +4012,29 @@ class Interpolated(BoundedContinuous):
         cdf = self.cdf_points
         x = self.x_points
 
-        index = np.searchsorted(cdf, p) - 1
+        index = np.clip(np.searchsorted(cdf, p) - 1, 0, len(x) - 2)
         slope = (pdf[index + 1] - pdf[index]) / (x[index + 1] - x[index])
 
-        return x[index] + np.where(
-            np.abs(slope) <= 1e-8,
-            np.where(
-                np.abs(pdf[index]) <= 1e-8,
-                np.zeros(index.shape),
-                (p - cdf[index]) / pdf[index]
-            ),
-            (-pdf[index] + np.sqrt(pdf[index] ** 2 + 2 * slope * (p - cdf[index]))) / slope
-        )
+        # solve the quadratic of each segment, without dividing by small
+        # slopes: p - cdf = pdf * dx + slope * dx**2 / 2
+        dp = p - cdf[index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dx = 2 * dp / (pdf[index] + np.sqrt(np.maximum(
+                pdf[index] ** 2 + 2 * slope * dp, 0)))
+        return x[index] + np.where(np.isfinite(dx), dx, 0.)
 
     def _random(self, size=None):
-        return self._argcdf(np.random.uniform(size=size))
+        return self._argcdf(get_random_state().uniform(size=size))
 
-    def random(self, size=None):
+    def random(self, point=None, size=None):
         """
         Draw random values from Interpolated distribution.
 
         Parameters
         ----------
+        point : dict, optional
+            Dict of variable values on which random values are to be
+            conditioned (uses default point if not specified).
         size : int, optional
             Desired size of random sample (returns one sample if not
             specified).
@@ -4002,4 +4061,5 @@ class Interpolated(BoundedContinuous):
         -------
         TensorVariable
         """
-        return tt.log(self.interp_op(value) / self.Z)
+        return tt.log(self.interp_op(value, floatX(self.x_points),
+                                     floatX(self.pdf_points)))
@@ -6,7 +6,7 @@ import warnings
 from pymc3.util import get_variable_name
 from .dist_math import bound, factln, binomln, betaln, logpow, random_choice
 from .distribution import (Discrete, draw_values, generate_samples,
-                           broadcast_distribution_samples)
+                           broadcast_distribution_samples, get_random_state)
 from pymc3.math import tround, sigmoid, logaddexp, logit, log1pexp
 from ..theanof import floatX, intX
 
@@ -59,6 +59,8 @@ class Binomial(Discrete):
         Probability of success in each trial (0 < p < 1).
     """
 
+    vectorized_random = True
+
     def __init__(self, n, p, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.n = n = tt.as_tensor_variable(intX(n))
@@ -145,6 +147,8 @@ class BetaBinomial(Discrete):
         beta > 0.
     """
 
+    vectorized_random = True
+
     def __init__(self, alpha, beta, n, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.alpha = alpha = tt.as_tensor_variable(floatX(alpha))
@@ -154,11 +158,13 @@ class BetaBinomial(Discrete):
 
     def _random(self, alpha, beta, n, size=None):
         size = size or 1
-        p = stats.beta.rvs(a=alpha, b=beta, size=size).flatten()
+        p = stats.beta.rvs(a=alpha, b=beta, size=size,
+                           random_state=get_random_state()).flatten()
         # Sometimes scipy.beta returns nan. Ugh.
         while np.any(np.isnan(p)):
             i = np.isnan(p)
-            p[i] = stats.beta.rvs(a=alpha, b=beta, size=np.sum(i))
+            p[i] = stats.beta.rvs(a=alpha, b=beta, size=np.sum(i),
+                                  random_state=get_random_state())
         # Sigh...
         _n, _p, _size = np.atleast_1d(n).flatten(), p.flatten(), p.shape[0]
 
@@ -168,7 +174,9 @@ class BetaBinomial(Discrete):
                 _n.shape[0], _p.shape[0]))
         if quotient != 1:
             _n = np.tile(_n, quotient)
-        samples = np.reshape(stats.binom.rvs(n=_n, p=_p, size=_size), size)
+        samples = np.reshape(stats.binom.rvs(n=_n, p=_p, size=_size,
+                                             random_state=get_random_state()),
+                             size)
         return samples
 
     def random(self, point=None, size=None):
@@ -238,6 +246,8 @@ class Bernoulli(Discrete):
         can be specified.
     """
 
+    vectorized_random = True
+
     def __init__(self, p=None, logit_p=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if sum(int(var is None) for var in [p, logit_p]) != 1:
@@ -317,6 +327,9 @@ class DiscreteWeibull(Discrete):
     Variance  :math:`2 \sum_{x = 1}^{\infty} x q^{x^{\beta}} - \mu - \mu^2`
     ========  ======================
     """
+
+    vectorized_random = True
+
     def __init__(self, q, beta, *args, **kwargs):
         super().__init__(*args, defaults=('median',), **kwargs)
 
@@ -345,7 +358,7 @@ class DiscreteWeibull(Discrete):
         return (tt.ceil(tt.power(tt.log(1 - p) / tt.log(q), 1. / beta)) - 1).astype('int64')
 
     def _random(self, q, beta, size=None):
-        p = np.random.uniform(size=size)
+        p = get_random_state().uniform(size=size)
 
         return np.ceil(np.power(np.log(1 - p) / np.log(q), 1. / beta)) - 1
 
@@ -412,6 +425,8 @@ class Poisson(Discrete):
     binomial distribution.
     """
 
+    vectorized_random = True
+
     def __init__(self, mu, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.mu = mu = tt.as_tensor_variable(floatX(mu))
@@ -491,6 +506,8 @@ class NegativeBinomial(Discrete):
         Gamma distribution parameter (alpha > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, mu, alpha, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.mu = mu = tt.as_tensor_variable(floatX(mu))
@@ -503,7 +520,8 @@ class NegativeBinomial(Discrete):
                              dist_shape=self.shape,
                              size=size)
         g[g == 0] = np.finfo(float).eps  # Just in case
-        return np.asarray(stats.poisson.rvs(g)).reshape(g.shape)
+        return np.asarray(stats.poisson.rvs(
+            g, random_state=get_random_state())).reshape(g.shape)
 
     def logp(self, value):
         mu = self.mu
@@ -566,6 +584,8 @@ class Geometric(Discrete):
         Probability of success on an individual trial (0 < p <= 1).
     """
 
+    vectorized_random = True
+
     def __init__(self, p, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.p = p = tt.as_tensor_variable(floatX(p))
@@ -630,6 +650,8 @@ class DiscreteUniform(Discrete):
         Upper limit (upper > lower).
     """
 
+    vectorized_random = True
+
     def __init__(self, lower, upper, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.lower = intX(tt.floor(lower))
@@ -640,7 +662,8 @@ class DiscreteUniform(Discrete):
     def _random(self, lower, upper, size=None):
         # This way seems to be the only to deal with lower and upper
         # as array-like.
-        samples = stats.randint.rvs(lower, upper + 1, size=size)
+        samples = stats.randint.rvs(lower, upper + 1, size=size,
+                                    random_state=get_random_state())
         return samples
 
     def random(self, point=None, size=None):
@@ -702,6 +725,8 @@ class Categorical(Discrete):
         rescaled otherwise.
     """
 
+    vectorized_random = True
+
     def __init__(self, p, *args, **kwargs):
         super().__init__(*args, **kwargs)
         try:
@@ -764,6 +789,8 @@ class Constant(Discrete):
         Constant parameter.
     """
 
+    vectorized_random = True
+
     def __init__(self, c, *args, **kwargs):
         warnings.warn("Constant has been deprecated. We recommend using a Deterministic object instead.",
                     DeprecationWarning)
@@ -844,6 +871,8 @@ class ZeroInflatedPoisson(Discrete):
         (theta >= 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, psi, theta, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.theta = theta = tt.as_tensor_variable(floatX(theta))
@@ -857,7 +886,7 @@ class ZeroInflatedPoisson(Discrete):
                              dist_shape=self.shape,
                              size=size)
         g, psi = broadcast_distribution_samples([g, psi], size=size)
-        return g * (np.random.random(g.shape) < psi)
+        return g * (get_random_state().random_sample(g.shape) < psi)
 
     def logp(self, value):
         psi = self.psi
@@ -936,6 +965,8 @@ class ZeroInflatedBinomial(Discrete):
 
     """
 
+    vectorized_random = True
+
     def __init__(self, psi, n, p, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.n = n = tt.as_tensor_variable(intX(n))
@@ -950,7 +981,7 @@ class ZeroInflatedBinomial(Discrete):
                              dist_shape=self.shape,
                              size=size)
         g, psi = broadcast_distribution_samples([g, psi], size=size)
-        return g * (np.random.random(g.shape) < psi)
+        return g * (get_random_state().random_sample(g.shape) < psi)
 
     def logp(self, value):
         psi = self.psi
@@ -1053,6 +1084,8 @@ class ZeroInflatedNegativeBinomial(Discrete):
 
     """
 
+    vectorized_random = True
+
     def __init__(self, psi, mu, alpha, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.mu = mu = tt.as_tensor_variable(floatX(mu))
@@ -1069,7 +1102,9 @@ class ZeroInflatedNegativeBinomial(Discrete):
                              size=size)
         g[g == 0] = np.finfo(float).eps  # Just in case
         g, psi = broadcast_distribution_samples([g, psi], size=size)
-        return stats.poisson.rvs(g) * (np.random.random(g.shape) < psi)
+        random_state = get_random_state()
+        return (stats.poisson.rvs(g, random_state=random_state)
+                * (random_state.random_sample(g.shape) < psi))
 
     def logp(self, value):
         alpha = self.alpha
@@ -1174,6 +1209,10 @@ class OrderedLogistic(Categorical):
 
     """
 
+    # the category probabilities are a theano graph of eta and the
+    # cutpoints, which is not evaluated for all samples at once
+    vectorized_random = False
+
     def __init__(self, eta, cutpoints, *args, **kwargs):
         self.eta = tt.as_tensor_variable(floatX(eta))
         self.cutpoints = tt.as_tensor_variable(cutpoints)
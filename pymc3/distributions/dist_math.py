@@ -3,11 +3,15 @@ Created on Mar 7, 2011
 
 @author: johnsalvatier
 '''
+from collections import OrderedDict, namedtuple
+
 import numpy as np
 import scipy.linalg
+import scipy.sparse
+import scipy.special
 import theano.tensor as tt
 import theano
-from theano.scalar import UnaryScalarOp, upgrade_to_float_no_complex
+from theano.scalar import ScalarOp, UnaryScalarOp, upgrade_to_float_no_complex
 from theano.tensor.slinalg import Cholesky
 from theano.scan_module import until
 from theano import scan
@@ -244,6 +248,326 @@ def MvNormalLogp():
         [cov, delta], [logp], grad_overrides=dlogp, inline=True)
 
 
+class MvNormalQuadForm(theano.Op):
+    """
+    Quadratic forms and log-determinant of a multivariate normal.
+
+    Computes the squared Mahalanobis distances of the rows of `delta` and
+    half the log-determinant of the covariance matrix with one
+    factorization. The gradients reuse the factor of the forward pass.
+
+    Parameters
+    ----------
+    param : str
+        Parameterization of the matrix input, one of 'cov', 'tau' and
+        'chol' (lower triangular cholesky factor of the covariance).
+        Only the lower triangle of the matrix is used.
+
+    Notes
+    -----
+    The inputs are the matrix, the deviations `delta` of shape `(n, k)`
+    and, if the matrix is a stack of `G` matrices of shape `(G, k, k)`, the
+    index `groups` of the matrix of every row.
+
+    The outputs are the distances `quaddist` of shape `(n,)`, `logdet`,
+    `ok` (False if the matrix is not positive definite), both of shape
+    `(G,)` for a stack of matrices, and, for the gradient, the lower
+    cholesky factor of the matrix and the deviations whitened by it.
+    """
+
+    __props__ = ('param',)
+
+    def __init__(self, param='cov'):
+        if param not in ('cov', 'tau', 'chol'):
+            raise ValueError('Unknown parameterization: %s' % param)
+        self.param = param
+
+    def make_node(self, matrix, delta, groups=None):
+        matrix = tt.as_tensor_variable(matrix)
+        delta = tt.as_tensor_variable(delta)
+        if matrix.ndim not in (2, 3) or delta.ndim != 2:
+            raise ValueError('matrix must have two or three dimensions, '
+                             'delta must be two dimensional.')
+        dtype = theano.scalar.upcast(matrix.dtype, delta.dtype)
+        if dtype not in tt.float_dtypes:
+            dtype = theano.config.floatX
+        inputs = [tt.cast(matrix, dtype), tt.cast(delta, dtype)]
+        if matrix.ndim == 3:
+            if groups is None:
+                raise ValueError('groups are required for a stack of matrices.')
+            groups = tt.as_tensor_variable(groups)
+            if groups.ndim != 1 or groups.dtype not in tt.integer_dtypes:
+                raise TypeError('groups must be a vector of integers.')
+            inputs.append(groups)
+        elif groups is not None:
+            raise ValueError('groups are only used with a stack of matrices.')
+        batch = (False,) * (matrix.ndim - 2)
+        outputs = [tt.vector(dtype=dtype), tt.TensorType(dtype, batch)(),
+                   tt.TensorType('bool', batch)(), inputs[0].type(),
+                   tt.matrix(dtype=dtype)]
+        return tt.Apply(self, inputs, outputs)
+
+    def perform(self, node, inputs, output_storage):
+        matrix, delta = inputs[:2]
+        batched = matrix.ndim == 3
+        matrices = matrix if batched else matrix[None]
+        G, k = matrices.shape[:2]
+        if matrices.shape[-1] != k or delta.shape[1] != k:
+            raise ValueError('Shapes of matrix and delta do not match.')
+        if batched:
+            groups = _check_groups(inputs[2], G, len(delta))
+        if self.param == 'chol':
+            chol = np.tril(matrices)
+        else:
+            try:
+                chol = np.linalg.cholesky(matrices)
+            except np.linalg.LinAlgError:
+                chol = np.array([_cholesky_or_nan(m) for m in matrices])
+        diag = np.diagonal(chol, axis1=-2, axis2=-1)
+        ok = np.all(diag > 0, axis=-1)
+        if not ok.all():
+            # the outputs are discarded, but must be finite
+            chol[~ok] = np.eye(k, dtype=chol.dtype)
+            diag = np.diagonal(chol, axis1=-2, axis2=-1)
+        if not batched:
+            if self.param == 'tau':
+                whitened = delta.dot(chol[0])
+            else:
+                whitened = scipy.linalg.solve_triangular(
+                    chol[0], delta.T, lower=True, check_finite=False).T
+        elif self.param == 'tau':
+            whitened = _group_matvec(chol, delta, groups, transpose=True)
+        else:
+            # all rows at once with the inverse factors of their matrices
+            whitened = _group_matvec(np.linalg.inv(chol), delta, groups)
+        logdet = np.sum(np.log(diag), axis=-1)
+        if self.param == 'tau':
+            logdet = -logdet
+        quaddist = np.sum(whitened ** 2, axis=-1)
+        if not batched:
+            logdet, ok, chol = logdet[0], ok[0], chol[0]
+        results = [quaddist, logdet, ok, chol, whitened]
+        for storage, out, value in zip(output_storage, node.outputs, results):
+            storage[0] = np.asarray(value, dtype=out.dtype)
+
+    def infer_shape(self, node, shapes):
+        matrix_shape, delta_shape = shapes[:2]
+        return [delta_shape[:1], matrix_shape[:-2], matrix_shape[:-2],
+                matrix_shape, delta_shape]
+
+    def L_op(self, inputs, outputs, grads):
+        matrix, delta = inputs[:2]
+        _, _, ok, chol, whitened = outputs
+        # ok is boolean, its gradient is always zero
+        for g in grads[3:]:
+            if not isinstance(g.type, theano.gradient.DisconnectedType):
+                raise NotImplementedError(
+                    'Only quaddist and logdet are differentiable.')
+        g_quaddist, g_logdet = grads[:2]
+        if isinstance(g_quaddist.type, theano.gradient.DisconnectedType):
+            g_quaddist = tt.zeros_like(delta[:, 0])
+        if isinstance(g_logdet.type, theano.gradient.DisconnectedType):
+            g_logdet = tt.zeros_like(outputs[1])
+        grad_inputs = [matrix, delta, chol, whitened, ok, g_quaddist, g_logdet]
+        g_matrix, g_delta = MvNormalQuadFormGrad(self.param)(
+            *(grad_inputs + inputs[2:]))
+        # the groups are integers
+        return [g_matrix, g_delta] + [
+            groups.zeros_like(dtype=theano.config.floatX) for groups in inputs[2:]]
+
+
+def _weighted_gram(a, weights):
+    """Compute `a.T diag(weights) a` as symmetric products `b.T b`, which
+    take half the operations of a general matrix product."""
+    result = np.zeros((a.shape[1], a.shape[1]), dtype=a.dtype)
+    for sign in (1, -1):
+        w = np.maximum(sign * weights, 0)
+        if w.any():
+            b = a * np.sqrt(w)[:, None]
+            result += sign * b.T.dot(b)
+    return result
+
+
+class MvNormalQuadFormGrad(theano.Op):
+    """Gradient of :class:`MvNormalQuadForm` with respect to its inputs."""
+
+    __props__ = ('param',)
+
+    def __init__(self, param='cov'):
+        self.param = param
+
+    def make_node(self, matrix, delta, chol, whitened, ok, g_quaddist,
+                  g_logdet, groups=None):
+        inputs = [matrix, delta, chol, whitened, ok, g_quaddist, g_logdet]
+        if groups is not None:
+            inputs.append(groups)
+        inputs = [tt.as_tensor_variable(i) for i in inputs]
+        return tt.Apply(self, inputs, [inputs[0].type(), inputs[1].type()])
+
+    def perform(self, node, inputs, output_storage):
+        _, delta, chol, whitened, ok, g_q, g_logdet = inputs[:7]
+        if chol.ndim == 3:
+            groups = _check_groups(inputs[7], len(chol), len(delta))
+            g_matrix, g_delta = self._grad_batched(
+                delta, chol, whitened, g_q, g_logdet, groups)
+            g_matrix[~ok] = np.nan
+            g_delta[~ok[groups]] = np.nan
+        elif ok:
+            g_matrix, g_delta = self._grad(delta, chol, whitened, g_q, g_logdet)
+        else:
+            g_matrix = np.full_like(chol, np.nan)
+            g_delta = np.full_like(delta, np.nan)
+        output_storage[0][0] = np.asarray(g_matrix, dtype=node.outputs[0].dtype)
+        output_storage[1][0] = np.asarray(g_delta, dtype=node.outputs[1].dtype)
+
+    def _grad_batched(self, delta, chol, whitened, g_q, g_logdet, groups):
+        """Gradients for a stack of matrices, with the rows of all groups
+        at once."""
+        G, k = chol.shape[:2]
+        inv_chol = np.linalg.inv(chol)
+        diag = np.arange(k)
+        if self.param == 'tau':
+            # delta tau = whitened chol.T
+            g_delta = 2 * g_q[:, None] * _group_matvec(chol, whitened, groups)
+            inverse = np.einsum('gji,gjk->gik', inv_chol, inv_chol)
+            g_matrix = (_group_gram(delta, g_q, groups, G)
+                        - 0.5 * g_logdet[:, None, None] * inverse)
+        else:
+            # cov^-1 delta, with cov = chol chol.T
+            scaled = _group_matvec(inv_chol, whitened, groups, transpose=True)
+            g_delta = 2 * g_q[:, None] * scaled
+            inner = _group_gram(whitened, -g_q, groups, G)
+            if self.param == 'chol':
+                g_matrix = 2 * np.einsum('gji,gjk->gik', inv_chol, inner)
+                g_matrix[:, diag, diag] += g_logdet[:, None] / chol[:, diag, diag]
+                return np.tril(g_matrix), g_delta
+            inner[:, diag, diag] += 0.5 * g_logdet[:, None]
+            # chol.T^-1 inner chol^-1
+            g_matrix = np.einsum('gji,gjk,gkl->gil', inv_chol, inner, inv_chol)
+        # only the lower triangle of the symmetric matrix is read
+        g_matrix = 2 * np.tril(g_matrix)
+        g_matrix[:, diag, diag] /= 2
+        return g_matrix, g_delta
+
+    def _grad(self, delta, chol, whitened, g_q, g_logdet):
+        k = chol.shape[0]
+        if self.param == 'tau':
+            # delta tau = whitened chol.T
+            g_delta = 2 * g_q[:, None] * whitened.dot(chol.T)
+            inverse = scipy.linalg.cho_solve(
+                (chol, True), np.eye(k), check_finite=False)
+            g_matrix = _weighted_gram(delta, g_q) - 0.5 * g_logdet * inverse
+        else:
+            # cov^-1 delta, with cov = chol chol.T
+            scaled = scipy.linalg.solve_triangular(
+                chol, whitened.T, lower=True, trans='T', check_finite=False).T
+            g_delta = 2 * g_q[:, None] * scaled
+            inner = _weighted_gram(whitened, -g_q)
+            if self.param == 'chol':
+                g_matrix = 2 * scipy.linalg.solve_triangular(
+                    chol, inner, lower=True, trans='T', check_finite=False)
+                g_matrix[np.diag_indices(k)] += g_logdet / np.diag(chol)
+                return np.tril(g_matrix), g_delta
+            inner[np.diag_indices(k)] += 0.5 * g_logdet
+            # chol.T^-1 inner chol^-1
+            g_matrix = scipy.linalg.solve_triangular(
+                chol, inner, lower=True, trans='T', check_finite=False)
+            g_matrix = scipy.linalg.solve_triangular(
+                chol, g_matrix.T, lower=True, trans='T', check_finite=False)
+        # only the lower triangle of the symmetric matrix is read
+        g_matrix = 2 * np.tril(g_matrix) - np.diag(np.diag(g_matrix))
+        return g_matrix, g_delta
+
+    def infer_shape(self, node, shapes):
+        return shapes[:2]
+
+    def connection_pattern(self, node):
+        pattern = [[True, True], [True, True], [False, False], [False, False],
+                   [False, False], [True, True], [True, True]]
+        return pattern + [[False, False]] * (len(node.inputs) - 7)
+
+    def L_op(self, inputs, outputs, grads):
+        # second derivatives of the generic graph
+        matrix, delta = inputs[:2]
+        if matrix.ndim != 2:
+            raise NotImplementedError('Second derivatives are only '
+                                      'implemented for a single matrix.')
+        g_inputs = [matrix, delta] + inputs[5:7]
+        quaddist, logdet = _quaddist_graph(self.param, matrix, delta)
+        first = tt.grad(None, [matrix, delta], known_grads=OrderedDict(
+            [(quaddist, inputs[5]), (logdet, inputs[6])]))
+        grads = [tt.zeros_like(o) if isinstance(g.type, theano.gradient.DisconnectedType)
+                 else g for o, g in zip(outputs, grads)]
+        second = theano.gradient.Lop(first, g_inputs, grads,
+                                     disconnected_inputs='ignore')
+        disconnected = [theano.gradient.disconnected_type() for _ in range(3)]
+        return second[:2] + disconnected + second[2:]
+
+
+def _quaddist_graph(param, matrix, delta):
+    """Quadratic forms and log-determinant of :class:`MvNormalQuadForm` as a
+    graph of generic linear algebra ops."""
+    if param == 'chol':
+        chol = tt.tril(matrix)
+    else:
+        chol = Cholesky(lower=True, on_error='nan')(matrix)
+    diag = tt.nlinalg.diag(chol)
+    if param == 'tau':
+        whitened = tt.dot(delta, chol)
+        logdet = -tt.sum(tt.log(diag))
+    else:
+        whitened = tt.slinalg.solve_lower_triangular(chol, delta.T).T
+        logdet = tt.sum(tt.log(diag))
+    return (whitened ** 2).sum(axis=-1), logdet
+
+
+def _check_groups(groups, n_groups, n_rows):
+    """Check that `groups` holds the index of one of `n_groups` matrices
+    for each of `n_rows` rows."""
+    if len(groups) != n_rows:
+        raise ValueError('groups must have one entry per row.')
+    if len(groups) and (groups.min() < 0 or groups.max() >= n_groups):
+        raise IndexError('groups out of bounds for %d matrices.' % n_groups)
+    return groups
+
+
+def _group_matvec(matrices, x, groups, transpose=False):
+    """Products `matrices[groups[n]].dot(x[n])` of all rows `n`, or with the
+    transposed matrices.
+
+    The products are formed one row of the matrices at a time, so only
+    `len(x) * k` entries are gathered instead of a k by k matrix per row.
+    """
+    if transpose:
+        matrices = np.swapaxes(matrices, -1, -2)
+    result = np.empty((len(x), matrices.shape[1]),
+                      dtype=np.result_type(matrices, x))
+    for i in range(matrices.shape[1]):
+        result[:, i] = np.einsum('nj,nj->n', matrices[groups, i], x)
+    return result
+
+
+def _group_gram(x, weights, groups, n_groups):
+    """Sums of `weights[n] * outer(x[n], x[n])` over the rows of every group,
+    one row of the outer products at a time."""
+    k = x.shape[1]
+    indicator = scipy.sparse.csr_matrix(
+        (np.ones(len(groups), dtype=x.dtype), (groups, np.arange(len(groups)))),
+        shape=(n_groups, len(groups)))
+    weighted = weights[:, None] * x
+    result = np.empty((n_groups, k, k), dtype=np.result_type(x, weights))
+    for i in range(k):
+        result[:, i] = indicator.dot(x[:, i, None] * weighted)
+    return result
+
+
+def _cholesky_or_nan(matrix):
+    try:
+        return scipy.linalg.cholesky(matrix, lower=True, check_finite=False)
+    except (scipy.linalg.LinAlgError, ValueError):
+        return np.full_like(matrix, np.nan)
+
+
 class SplineWrapper(theano.Op):
     """
     Creates a theano operation from scipy.interpolate.UnivariateSpline
@@ -281,6 +605,823 @@ class SplineWrapper(theano.Op):
         return [x_grad * self.grad_op(x)]
 
 
+class LinearInterpolation(theano.Op):
+    """
+    Piecewise linear interpolation of the points `(xp, fp)` at `x`.
+
+    `xp` must be increasing. The interpolant is zero outside of
+    `[xp[0], xp[-1]]`, like `InterpolatedUnivariateSpline` of order 1 with
+    `ext='zeros'`. The segment of every value is found by binary search.
+
+    Parameters
+    ----------
+    derivative : bool
+        Evaluate the slope of the interpolant instead of its value.
+    """
+
+    __props__ = ('derivative',)
+
+    def __init__(self, derivative=False):
+        self.derivative = derivative
+
+    def make_node(self, x, xp, fp):
+        x, xp, fp = map(tt.as_tensor_variable, (x, xp, fp))
+        dtype = theano.scalar.upcast(x.dtype, xp.dtype, fp.dtype)
+        if dtype not in tt.float_dtypes:
+            dtype = theano.config.floatX
+        x, xp, fp = (tt.cast(v, dtype) for v in (x, xp, fp))
+        if xp.ndim != 1 or fp.ndim != 1:
+            raise ValueError('xp and fp must be vectors.')
+        return tt.Apply(self, [x, xp, fp], [x.type()])
+
+    def perform(self, node, inputs, output_storage):
+        x, xp, fp = inputs
+        if xp.shape != fp.shape or len(xp) < 2:
+            raise ValueError('xp and fp must have the same length of at least 2.')
+        index = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+        slope = (fp[index + 1] - fp[index]) / (xp[index + 1] - xp[index])
+        inside = (x >= xp[0]) & (x <= xp[-1])
+        if self.derivative:
+            z = np.where(inside, slope, 0)
+        else:
+            z = np.where(inside, fp[index] + slope * (x - xp[index]), 0)
+        output_storage[0][0] = np.asarray(z, dtype=node.outputs[0].dtype)
+
+    def grad(self, inputs, grads):
+        x, xp, fp = inputs
+        gz, = grads
+        if self.derivative:
+            # piecewise constant
+            x_grad = tt.zeros_like(x)
+        else:
+            x_grad = gz * LinearInterpolation(derivative=True)(x, xp, fp)
+        return [x_grad,
+                theano.gradient.grad_not_implemented(self, 1, xp),
+                theano.gradient.grad_not_implemented(self, 2, fp)]
+
+    def infer_shape(self, node, shapes):
+        return [shapes[0]]
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        x, xp, fp = inputs
+        z, = outputs
+        fail = sub['fail']
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        derivative = int(self.derivative)
+        return """
+        {
+        PyArrayObject *x_c = PyArray_GETCONTIGUOUS(%(x)s);
+        PyArrayObject *xp_c = PyArray_GETCONTIGUOUS(%(xp)s);
+        PyArrayObject *fp_c = PyArray_GETCONTIGUOUS(%(fp)s);
+        npy_intp n = PyArray_SIZE(x_c);
+        npy_intp m = PyArray_SIZE(xp_c);
+        if (PyArray_SIZE(fp_c) != m || m < 2) {
+            Py_DECREF(x_c); Py_DECREF(xp_c); Py_DECREF(fp_c);
+            PyErr_SetString(PyExc_ValueError,
+                "xp and fp must have the same length of at least 2.");
+            %(fail)s
+        }
+        Py_XDECREF(%(z)s);
+        %(z)s = (PyArrayObject*) PyArray_EMPTY(
+            PyArray_NDIM(x_c), PyArray_DIMS(x_c), %(typenum)s, 0);
+        if (!%(z)s) {
+            Py_DECREF(x_c); Py_DECREF(xp_c); Py_DECREF(fp_c);
+            %(fail)s
+        }
+        const dtype_%(x)s *xv = (dtype_%(x)s*) PyArray_DATA(x_c);
+        const dtype_%(xp)s *xpv = (dtype_%(xp)s*) PyArray_DATA(xp_c);
+        const dtype_%(fp)s *fpv = (dtype_%(fp)s*) PyArray_DATA(fp_c);
+        dtype_%(z)s *zv = (dtype_%(z)s*) PyArray_DATA(%(z)s);
+        for (npy_intp i = 0; i < n; i++) {
+            dtype_%(x)s v = xv[i];
+            if (!(v >= xpv[0] && v <= xpv[m - 1])) {
+                zv[i] = 0;
+                continue;
+            }
+            /* last index lo with xp[lo] <= v, limited to the last segment */
+            npy_intp lo = 0, hi = m - 1;
+            while (hi - lo > 1) {
+                npy_intp mid = lo + (hi - lo) / 2;
+                if (xpv[mid] <= v)
+                    lo = mid;
+                else
+                    hi = mid;
+            }
+            dtype_%(z)s slope = (fpv[lo + 1] - fpv[lo]) / (xpv[lo + 1] - xpv[lo]);
+            zv[i] = %(derivative)s ? slope : fpv[lo] + slope * (v - xpv[lo]);
+        }
+        Py_DECREF(x_c); Py_DECREF(xp_c); Py_DECREF(fp_c);
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,)
+
+
+class LinearRecurrence(theano.Op):
+    """
+    First-order linear recurrence `h[t] = innov[t] + coef[t] * h[t - 1]`,
+    with `h[-1] = init`.
+
+    `coef` and `innov` are vectors of the same length. The recurrence is
+    evaluated by a loop in C, instead of a `scan` with a node per step.
+    The gradient is the adjoint recurrence, which runs backwards in time
+    with the same coefficients and is evaluated by this op as well.
+    """
+
+    __props__ = ()
+
+    def make_node(self, init, coef, innov):
+        init, coef, innov = map(tt.as_tensor_variable, (init, coef, innov))
+        dtype = theano.scalar.upcast(init.dtype, coef.dtype, innov.dtype)
+        if dtype not in tt.float_dtypes:
+            dtype = theano.config.floatX
+        init, coef, innov = (tt.cast(v, dtype) for v in (init, coef, innov))
+        if init.ndim != 0:
+            raise ValueError('init must be a scalar.')
+        if coef.ndim != 1 or innov.ndim != 1:
+            raise ValueError('coef and innov must be vectors.')
+        return tt.Apply(self, [init, coef, innov], [innov.type()])
+
+    def perform(self, node, inputs, output_storage):
+        init, coef, innov = inputs
+        if coef.shape != innov.shape:
+            raise ValueError('coef and innov must have the same length.')
+        h = np.empty_like(innov)
+        h_prev = init
+        for t in range(len(h)):
+            h_prev = h[t] = innov[t] + coef[t] * h_prev
+        output_storage[0][0] = h
+
+    def L_op(self, inputs, outputs, grads):
+        init, coef, innov = inputs
+        h, = outputs
+        g_h, = grads
+        # adjoint[t] = g_h[t] + coef[t + 1] * adjoint[t + 1], backwards
+        coef_adjoint = tt.concatenate([tt.zeros((1,), coef.dtype), coef[:0:-1]])
+        adjoint = self(tt.zeros((), init.dtype), coef_adjoint, g_h[::-1])[::-1]
+        h_prev = tt.concatenate([init.dimshuffle('x'), h[:-1]])
+        return [tt.sum(coef[:1] * adjoint[:1]), adjoint * h_prev, adjoint]
+
+    def infer_shape(self, node, shapes):
+        return [shapes[2]]
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        init, coef, innov = inputs
+        h, = outputs
+        fail = sub['fail']
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        return """
+        {
+        PyArrayObject *coef_c = PyArray_GETCONTIGUOUS(%(coef)s);
+        PyArrayObject *innov_c = PyArray_GETCONTIGUOUS(%(innov)s);
+        npy_intp n = PyArray_SIZE(innov_c);
+        if (PyArray_SIZE(coef_c) != n) {
+            Py_DECREF(coef_c); Py_DECREF(innov_c);
+            PyErr_SetString(PyExc_ValueError,
+                "coef and innov must have the same length.");
+            %(fail)s
+        }
+        Py_XDECREF(%(h)s);
+        %(h)s = (PyArrayObject*) PyArray_EMPTY(1, &n, %(typenum)s, 0);
+        if (!%(h)s) {
+            Py_DECREF(coef_c); Py_DECREF(innov_c);
+            %(fail)s
+        }
+        const dtype_%(coef)s *coefv = (dtype_%(coef)s*) PyArray_DATA(coef_c);
+        const dtype_%(innov)s *innovv = (dtype_%(innov)s*) PyArray_DATA(innov_c);
+        dtype_%(h)s *hv = (dtype_%(h)s*) PyArray_DATA(%(h)s);
+        dtype_%(h)s h_prev = ((dtype_%(init)s*) PyArray_DATA(%(init)s))[0];
+        for (npy_intp t = 0; t < n; t++) {
+            h_prev = innovv[t] + coefv[t] * h_prev;
+            hv[t] = h_prev;
+        }
+        Py_DECREF(coef_c); Py_DECREF(innov_c);
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,)
+
+
+linear_recurrence = LinearRecurrence()
+
+
+KalmanFilterResult = namedtuple(
+    'KalmanFilterResult',
+    'logp, pred_mean, pred_cov, filt_mean, filt_cov, gain, alpha, inv_cov')
+
+
+def _kalman_filter(y, F, Q, H, R, m0, P0):
+    """Kalman filter of the linear Gaussian state space model of
+    :class:`KalmanFilter`.
+
+    Returns a :class:`KalmanFilterResult` with the log-likelihoods of the
+    observations, the means and covariances of the states predicted from
+    the previous observations and filtered with the current one, the
+    Kalman gains `P H^T S^-1`, the whitened innovations `S^-1 e` and the
+    inverses of the innovation covariances `S`. The log-likelihoods are
+    `-inf` from the first innovation covariance that is not positive
+    definite, the other results of these steps are zero.
+    """
+    T, k = y.shape
+    d = len(m0)
+    if (F.shape != (d, d) or Q.shape != (d, d) or P0.shape != (d, d)
+            or H.shape != (k, d) or R.shape != (k, k)):
+        raise ValueError('Shapes of the state space matrices do not match.')
+    dtype = y.dtype
+    logp = np.full(T, -np.inf, dtype=dtype)
+    pred_mean, filt_mean = np.zeros((T, d), dtype), np.zeros((T, d), dtype)
+    pred_cov, filt_cov = np.zeros((T, d, d), dtype), np.zeros((T, d, d), dtype)
+    gain = np.zeros((T, d, k), dtype)
+    alpha = np.zeros((T, k), dtype)
+    inv_cov = np.zeros((T, k, k), dtype)
+    eye = np.eye(k, dtype=dtype)
+    const = k * np.log(2 * np.pi)
+    m, P = m0, P0
+    for t in range(T):
+        if t:
+            m = F.dot(m)
+            P = F.dot(P).dot(F.T) + Q
+        pred_mean[t], pred_cov[t] = m, P
+        PHt = P.dot(H.T)
+        try:
+            chol = scipy.linalg.cholesky(H.dot(PHt) + R, lower=True,
+                                         check_finite=False)
+        except (scipy.linalg.LinAlgError, ValueError):
+            break
+        Sinv = scipy.linalg.cho_solve((chol, True), eye, check_finite=False)
+        e = y[t] - H.dot(m)
+        a = Sinv.dot(e)
+        K = PHt.dot(Sinv)
+        logp[t] = -0.5 * (e.dot(a) + 2 * np.sum(np.log(np.diag(chol))) + const)
+        m = m + K.dot(e)
+        P = P - K.dot(PHt.T)
+        filt_mean[t], filt_cov[t] = m, P
+        gain[t], alpha[t], inv_cov[t] = K, a, Sinv
+    return KalmanFilterResult(logp, pred_mean, pred_cov, filt_mean, filt_cov,
+                              gain, alpha, inv_cov)
+
+
+def _kalman_backward(filt, F, H, g_logp, grads):
+    """Adjoints of the steps of :func:`_kalman_filter` in reverse order,
+    accumulated into `grads`, the gradients of y, F, Q, H, R, m0 and P0."""
+    g_y, g_F, g_Q, g_H, g_R, g_m0, g_P0 = grads
+    d = F.shape[0]
+    # adjoints of the filtered mean and covariance of the current step
+    g_m = np.zeros(d, dtype=F.dtype)
+    g_P = np.zeros((d, d), dtype=F.dtype)
+    for t in range(len(g_logp) - 1, -1, -1):
+        m, P = filt.pred_mean[t], filt.pred_cov[t]
+        K, a, Sinv = filt.gain[t], filt.alpha[t], filt.inv_cov[t]
+        g = g_logp[t]
+        # update: logp = -(e^T S^-1 e + log|S|) / 2, m + K e, P - K S K^T
+        Ktg_m = K.T.dot(g_m)
+        g_e = Ktg_m - g * a
+        g_S = (0.5 * g * (np.outer(a, a) - Sinv) - np.outer(Ktg_m, a)
+               + K.T.dot(g_P).dot(K))
+        # adjoint of P H^T
+        g_PHt = np.outer(g_m, a) - (g_P + g_P.T).dot(K)
+        g_y[t] = g_e
+        g_R += g_S
+        HP = H.dot(P)
+        g_H += (g_PHt.T.dot(P) + (g_S + g_S.T).dot(HP)
+                - np.outer(g_e, m))
+        g_m = g_m - H.T.dot(g_e)
+        g_P = g_P + (g_PHt + H.T.dot(g_S)).dot(H)
+        if t:
+            # prediction: F m, F P F^T + Q
+            m_prev, P_prev = filt.filt_mean[t - 1], filt.filt_cov[t - 1]
+            g_F += np.outer(g_m, m_prev) + (g_P + g_P.T).dot(F).dot(P_prev)
+            g_Q += g_P
+            g_m = F.T.dot(g_m)
+            g_P = F.T.dot(g_P).dot(F)
+    g_m0 += g_m
+    g_P0 += g_P
+
+
+_KALMAN_C_SUPPORT = """
+/* Lower cholesky factor of the symmetric k x k matrix S in place, only its
+   lower triangle is read. Returns 0 if S is not positive definite. */
+static int pymc3_kalman_cholesky(int k, double *S)
+{
+    for (int j = 0; j < k; j++) {
+        double diag = S[j * k + j];
+        for (int l = 0; l < j; l++)
+            diag -= S[j * k + l] * S[j * k + l];
+        if (!(diag > 0))
+            return 0;
+        diag = sqrt(diag);
+        S[j * k + j] = diag;
+        for (int i = j + 1; i < k; i++) {
+            double v = S[i * k + j];
+            for (int l = 0; l < j; l++)
+                v -= S[i * k + l] * S[j * k + l];
+            S[i * k + j] = v / diag;
+            S[j * k + i] = 0;
+        }
+    }
+    return 1;
+}
+
+/* Kalman filter with row-major arrays, see `_kalman_filter`. The outputs
+   must be zero initialized, `work` holds d * d + d * k + 2 * k * k + k
+   doubles. */
+static void pymc3_kalman_filter(npy_intp T, int d, int k,
+    const double *y, const double *F, const double *Q, const double *H,
+    const double *R, const double *m0, const double *P0, double *logp,
+    double *pred_mean, double *pred_cov, double *filt_mean, double *filt_cov,
+    double *gain, double *alpha, double *inv_cov, double *work)
+{
+    double *FP = work, *PHt = FP + d * d, *L = PHt + d * k, *Linv = L + k * k;
+    double *e = Linv + k * k;
+    /* log(2 pi) */
+    const double log_2pi = 1.8378770664093453;
+    for (npy_intp t = 0; t < T; t++) {
+        double *m = pred_mean + t * d, *P = pred_cov + t * d * d;
+        double *mf = filt_mean + t * d, *Pf = filt_cov + t * d * d;
+        double *K = gain + t * d * k, *a = alpha + t * k;
+        double *Sinv = inv_cov + t * k * k;
+        const double *yt = y + t * k;
+        if (t == 0) {
+            for (int i = 0; i < d; i++)
+                m[i] = m0[i];
+            for (int i = 0; i < d * d; i++)
+                P[i] = P0[i];
+        } else {
+            /* prediction: F m, F P F^T + Q */
+            const double *mp = mf - d, *Pp = Pf - d * d;
+            for (int i = 0; i < d; i++) {
+                double v = 0;
+                for (int l = 0; l < d; l++)
+                    v += F[i * d + l] * mp[l];
+                m[i] = v;
+            }
+            for (int i = 0; i < d; i++)
+                for (int l = 0; l < d; l++) {
+                    double v = 0;
+                    for (int j = 0; j < d; j++)
+                        v += F[i * d + j] * Pp[j * d + l];
+                    FP[i * d + l] = v;
+                }
+            for (int i = 0; i < d; i++)
+                for (int j = 0; j < d; j++) {
+                    double v = Q[i * d + j];
+                    for (int l = 0; l < d; l++)
+                        v += FP[i * d + l] * F[j * d + l];
+                    P[i * d + j] = v;
+                }
+        }
+        /* innovation covariance S = H P H^T + R and its factor */
+        for (int i = 0; i < d; i++)
+            for (int j = 0; j < k; j++) {
+                double v = 0;
+                for (int l = 0; l < d; l++)
+                    v += P[i * d + l] * H[j * d + l];
+                PHt[i * k + j] = v;
+            }
+        for (int i = 0; i < k; i++)
+            for (int j = 0; j < k; j++) {
+                double v = R[i * k + j];
+                for (int l = 0; l < d; l++)
+                    v += H[i * d + l] * PHt[l * k + j];
+                L[i * k + j] = v;
+            }
+        if (!pymc3_kalman_cholesky(k, L)) {
+            for (npy_intp s = t; s < T; s++)
+                logp[s] = -INFINITY;
+            return;
+        }
+        /* S^-1 = L^-T L^-1 */
+        double logdet = 0;
+        for (int j = 0; j < k; j++) {
+            logdet += log(L[j * k + j]);
+            for (int i = 0; i < k; i++) {
+                if (i < j) {
+                    Linv[i * k + j] = 0;
+                    continue;
+                }
+                double v = (i == j) ? 1 : 0;
+                for (int l = j; l < i; l++)
+                    v -= L[i * k + l] * Linv[l * k + j];
+                Linv[i * k + j] = v / L[i * k + i];
+            }
+        }
+        for (int i = 0; i < k; i++)
+            for (int j = 0; j < k; j++) {
+                double v = 0;
+                for (int l = (i > j ? i : j); l < k; l++)
+                    v += Linv[l * k + i] * Linv[l * k + j];
+                Sinv[i * k + j] = v;
+            }
+        /* update with the innovation e = y - H m */
+        double quad = 0;
+        for (int i = 0; i < k; i++) {
+            double v = yt[i];
+            for (int l = 0; l < d; l++)
+                v -= H[i * d + l] * m[l];
+            e[i] = v;
+        }
+        for (int i = 0; i < k; i++) {
+            double v = 0;
+            for (int j = 0; j < k; j++)
+                v += Sinv[i * k + j] * e[j];
+            a[i] = v;
+            quad += e[i] * v;
+        }
+        logp[t] = -0.5 * (quad + 2 * logdet + k * log_2pi);
+        for (int i = 0; i < d; i++)
+            for (int j = 0; j < k; j++) {
+                double v = 0;
+                for (int l = 0; l < k; l++)
+                    v += PHt[i * k + l] * Sinv[l * k + j];
+                K[i * k + j] = v;
+            }
+        for (int i = 0; i < d; i++) {
+            double v = m[i];
+            for (int j = 0; j < k; j++)
+                v += K[i * k + j] * e[j];
+            mf[i] = v;
+        }
+        for (int i = 0; i < d; i++)
+            for (int j = 0; j < d; j++) {
+                double v = P[i * d + j];
+                for (int l = 0; l < k; l++)
+                    v -= K[i * k + l] * PHt[j * k + l];
+                Pf[i * d + j] = v;
+            }
+    }
+}
+
+/* Adjoints of the filter steps in reverse order, see `_kalman_backward`.
+   The gradients must be zero initialized, `work` holds
+   3 * d * d + 2 * d * k + k * k + 2 * d + 2 * k doubles. */
+static void pymc3_kalman_backward(npy_intp T, int d, int k,
+    const double *F, const double *H, const double *g_logp,
+    const double *pred_mean, const double *pred_cov,
+    const double *filt_mean, const double *filt_cov, const double *gain,
+    const double *alpha, const double *inv_cov, double *g_y, double *g_F,
+    double *g_Q, double *g_H, double *g_R, double *g_m0, double *g_P0,
+    double *work)
+{
+    double *g_P = work, *sym = g_P + d * d, *tmp_dd = sym + d * d;
+    double *g_PHt = tmp_dd + d * d, *tmp_dk = g_PHt + d * k;
+    double *g_S = tmp_dk + d * k, *g_m = g_S + k * k, *tmp_d = g_m + d;
+    double *Ktg_m = tmp_d + d, *g_e = Ktg_m + k;
+    for (int i = 0; i < d * d; i++)
+        g_P[i] = 0;
+    for (int i = 0; i < d; i++)
+        g_m[i] = 0;
+    for (npy_intp t = T - 1; t >= 0; t--) {
+        const double *m = pred_mean + t * d, *P = pred_cov + t * d * d;
+        const double *K = gain + t * d * k, *a = alpha + t * k;
+        const double *Sinv = inv_cov + t * k * k;
+        const double g = g_logp[t];
+        /* update: logp = -(e^T S^-1 e + log|S|) / 2, m + K e, P - K S K^T */
+        for (int j = 0; j < k; j++) {
+            double v = 0;
+            for (int i = 0; i < d; i++)
+                v += K[i * k + j] * g_m[i];
+            Ktg_m[j] = v;
+            g_e[j] = v - g * a[j];
+        }
+        for (int i = 0; i < d; i++)
+            for (int j = 0; j < d; j++)
+                sym[i * d + j] = g_P[i * d + j] + g_P[j * d + i];
+        /* K^T g_P, stored as k x d */
+        for (int i = 0; i < k; i++)
+            for (int l = 0; l < d; l++) {
+                double v = 0;
+                for (int j = 0; j < d; j++)
+                    v += K[j * k + i] * g_P[j * d + l];
+                tmp_dk[i * d + l] = v;
+            }
+        for (int i = 0; i < k; i++)
+            for (int j = 0; j < k; j++) {
+                double v = 0.5 * g * (a[i] * a[j] - Sinv[i * k + j])
+                    - Ktg_m[i] * a[j];
+                for (int l = 0; l < d; l++)
+                    v += tmp_dk[i * d + l] * K[l * k + j];
+                g_S[i * k + j] = v;
+            }
+        /* adjoint of P H^T */
+        for (int i = 0; i < d; i++)
+            for (int j = 0; j < k; j++) {
+                double v = g_m[i] * a[j];
+                for (int l = 0; l < d; l++)
+                    v -= sym[i * d + l] * K[l * k + j];
+                g_PHt[i * k + j] = v;
+            }
+        for (int j = 0; j < k; j++)
+            g_y[t * k + j] = g_e[j];
+        for (int i = 0; i < k * k; i++)
+            g_R[i] += g_S[i];
+        /* H P, stored as k x d */
+        for (int i = 0; i < k; i++)
+            for (int l = 0; l < d; l++) {
+                double v = 0;
+                for (int j = 0; j < d; j++)
+                    v += H[i * d + j] * P[j * d + l];
+                tmp_dk[i * d + l] = v;
+            }
+        for (int j = 0; j < k; j++)
+            for (int l = 0; l < d; l++) {
+                double v = -g_e[j] * m[l];
+                for (int i = 0; i < d; i++)
+                    v += g_PHt[i * k + j] * P[i * d + l];
+                for (int i = 0; i < k; i++)
+                    v += (g_S[j * k + i] + g_S[i * k + j]) * tmp_dk[i * d + l];
+                g_H[j * d + l] += v;
+            }
+        for (int l = 0; l < d; l++) {
+            double v = 0;
+            for (int j = 0; j < k; j++)
+                v += H[j * d + l] * g_e[j];
+            g_m[l] -= v;
+        }
+        /* g_P += (g_PHt + H^T g_S) H */
+        for (int l = 0; l < d; l++)
+            for (int j = 0; j < k; j++) {
+                double v = g_PHt[l * k + j];
+                for (int i = 0; i < k; i++)
+                    v += H[i * d + l] * g_S[i * k + j];
+                tmp_dk[l * k + j] = v;
+            }
+        for (int i = 0; i < d; i++)
+            for (int l = 0; l < d; l++) {
+                double v = 0;
+                for (int j = 0; j < k; j++)
+                    v += tmp_dk[i * k + j] * H[j * d + l];
+                g_P[i * d + l] += v;
+            }
+        if (t == 0)
+            break;
+        /* prediction: F m, F P F^T + Q */
+        const double *mp = filt_mean + (t - 1) * d;
+        const double *Pp = filt_cov + (t - 1) * d * d;
+        for (int i = 0; i < d; i++)
+            for (int l = 0; l < d; l++) {
+                double v = 0;
+                for (int j = 0; j < d; j++)
+                    v += (g_P[i * d + j] + g_P[j * d + i]) * F[j * d + l];
+                tmp_dd[i * d + l] = v;
+            }
+        for (int i = 0; i < d; i++)
+            for (int j = 0; j < d; j++) {
+                double v = g_m[i] * mp[j];
+                for (int l = 0; l < d; l++)
+                    v += tmp_dd[i * d + l] * Pp[l * d + j];
+                g_F[i * d + j] += v;
+            }
+        for (int i = 0; i < d * d; i++)
+            g_Q[i] += g_P[i];
+        for (int l = 0; l < d; l++) {
+            double v = 0;
+            for (int i = 0; i < d; i++)
+                v += F[i * d + l] * g_m[i];
+            tmp_d[l] = v;
+        }
+        for (int l = 0; l < d; l++)
+            g_m[l] = tmp_d[l];
+        /* F^T g_P F */
+        for (int l = 0; l < d; l++)
+            for (int j = 0; j < d; j++) {
+                double v = 0;
+                for (int i = 0; i < d; i++)
+                    v += F[i * d + l] * g_P[i * d + j];
+                tmp_dd[l * d + j] = v;
+            }
+        for (int l = 0; l < d; l++)
+            for (int j = 0; j < d; j++) {
+                double v = 0;
+                for (int i = 0; i < d; i++)
+                    v += tmp_dd[l * d + i] * F[i * d + j];
+                g_P[l * d + j] = v;
+            }
+    }
+    for (int i = 0; i < d; i++)
+        g_m0[i] += g_m[i];
+    for (int i = 0; i < d * d; i++)
+        g_P0[i] += g_P[i];
+}
+"""
+
+
+def _kalman_c_code(inputs, outputs, dims, call, work_size, sub):
+    """C code of the Kalman filter ops: makes the inputs contiguous,
+    allocates zero initialized outputs of the shapes `dims` (C expressions
+    of `T`, `d` and `k`), and runs `call` with a work array of `work_size`
+    doubles. `call` refers to the data of input `i` as `in_data[i]` and of
+    output `i` as `out_data[i]`."""
+    fail = sub['fail']
+    n_in, n_out = len(inputs), len(outputs)
+    code = ["""
+    {
+    PyArrayObject *in_c[%(n_in)d];
+    const double *in_data[%(n_in)d];
+    double *out_data[%(n_out)d];
+    double *work = NULL;
+    int ok = 1;
+    """ % locals()]
+    for i, name in enumerate(inputs):
+        code.append("""
+    in_c[%(i)d] = PyArray_GETCONTIGUOUS(%(name)s);
+    in_data[%(i)d] = (const double*) PyArray_DATA(in_c[%(i)d]);""" % locals())
+    code.append("""
+    npy_intp T = PyArray_DIMS(in_c[0])[0];
+    npy_intp k = PyArray_DIMS(in_c[0])[1];
+    npy_intp d = PyArray_DIMS(in_c[5])[0];
+    npy_intp expected[7][2] = {{T, k}, {d, d}, {d, d}, {k, d}, {k, k}, {d, 0}, {d, d}};
+    for (int i = 0; i < 7; i++) {
+        for (int j = 0; j < PyArray_NDIM(in_c[i]); j++)
+            if (PyArray_DIMS(in_c[i])[j] != expected[i][j])
+                ok = 0;
+    }
+    if (!ok)
+        PyErr_SetString(PyExc_ValueError,
+            "Shapes of the state space matrices do not match.");""")
+    for i, (name, shape) in enumerate(zip(outputs, dims)):
+        ndim = len(shape)
+        shape = ', '.join(shape)
+        code.append("""
+    if (ok) {
+        npy_intp dims[%(ndim)d] = {%(shape)s};
+        Py_XDECREF(%(name)s);
+        %(name)s = (PyArrayObject*) PyArray_ZEROS(%(ndim)d, dims, NPY_FLOAT64, 0);
+        if (%(name)s)
+            out_data[%(i)d] = (double*) PyArray_DATA(%(name)s);
+        else
+            ok = 0;
+    }""" % locals())
+    code.append("""
+    if (ok) {
+        work = (double*) malloc((%(work_size)s + 1) * sizeof(double));
+        if (!work) {
+            PyErr_NoMemory();
+            ok = 0;
+        }
+    }
+    if (ok) {
+        %(call)s
+    }
+    free(work);
+    for (int i = 0; i < %(n_in)d; i++)
+        Py_DECREF(in_c[i]);
+    if (!ok) {
+        %(fail)s
+    }
+    }
+    """ % locals())
+    return ''.join(code)
+
+
+class KalmanFilter(theano.Op):
+    R"""
+    Log-likelihoods of the observations of a linear Gaussian state space
+    model, with the states marginalized by a Kalman filter.
+
+    .. math::
+
+        x_0 \sim N(m_0, P_0), \quad
+        x_t = F x_{t-1} + w_t, \quad w_t \sim N(0, Q), \quad
+        y_t = H x_t + v_t, \quad v_t \sim N(0, R)
+
+    The inputs are the observations `y` of shape `(T, k)`, `F`, `Q`, `H`,
+    `R`, `m0` and `P0`. The covariance matrices must be symmetric.
+
+    The first output are the log-likelihoods of the `T` observations given
+    the previous ones. The others are the intermediate results of the
+    filter in the order of :class:`KalmanFilterResult`, which the gradient
+    :class:`KalmanFilterGrad` reuses in one backward pass. Both loops over
+    the time steps run in C for float64 inputs.
+    """
+
+    __props__ = ()
+
+    def make_node(self, y, F, Q, H, R, m0, P0):
+        inputs = list(map(tt.as_tensor_variable, (y, F, Q, H, R, m0, P0)))
+        dtype = theano.scalar.upcast(*(i.dtype for i in inputs))
+        if dtype not in tt.float_dtypes:
+            dtype = theano.config.floatX
+        inputs = [tt.cast(i, dtype) for i in inputs]
+        if [i.ndim for i in inputs] != [2, 2, 2, 2, 2, 1, 2]:
+            raise ValueError('y, F, Q, H, R and P0 must be matrices, '
+                             'm0 must be a vector.')
+        outputs = [tt.TensorType(dtype, (False,) * ndim)()
+                   for ndim in (1, 2, 3, 2, 3, 3, 2, 3)]
+        return tt.Apply(self, inputs, outputs)
+
+    def perform(self, node, inputs, output_storage):
+        filt = _kalman_filter(*inputs)
+        for storage, value in zip(output_storage, filt):
+            storage[0] = value
+
+    def infer_shape(self, node, shapes):
+        T, k = shapes[0]
+        d, = shapes[5]
+        return [(T,), (T, d), (T, d, d), (T, d), (T, d, d), (T, d, k), (T, k),
+                (T, k, k)]
+
+    def L_op(self, inputs, outputs, grads):
+        for g in grads[1:]:
+            if not isinstance(g.type, theano.gradient.DisconnectedType):
+                raise NotImplementedError(
+                    'Only the log-likelihoods are differentiable.')
+        return KalmanFilterGrad()(*(inputs + outputs + grads[:1]))
+
+    def c_support_code(self):
+        return _KALMAN_C_SUPPORT
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        if node.outputs[0].dtype != 'float64':
+            raise NotImplementedError('only float64 is implemented')
+        dims = [('T',), ('T', 'd'), ('T', 'd', 'd'), ('T', 'd'), ('T', 'd', 'd'),
+                ('T', 'd', 'k'), ('T', 'k'), ('T', 'k', 'k')]
+        call = """
+        pymc3_kalman_filter(T, d, k, in_data[0], in_data[1], in_data[2],
+            in_data[3], in_data[4], in_data[5], in_data[6], out_data[0],
+            out_data[1], out_data[2], out_data[3], out_data[4], out_data[5],
+            out_data[6], out_data[7], work);"""
+        return _kalman_c_code(inputs, outputs, dims, call,
+                              'd * d + d * k + 2 * k * k + k', sub)
+
+    def c_code_cache_version(self):
+        return (1,)
+
+
+class KalmanFilterGrad(theano.Op):
+    """Gradient of :class:`KalmanFilter` with respect to its inputs.
+
+    The inputs are the ones of :class:`KalmanFilter`, its outputs and the
+    gradient of the log-likelihoods. The adjoints of the filter steps run
+    in reverse order with the stored intermediate results. The gradient is
+    NaN if an innovation covariance is not positive definite.
+    """
+
+    __props__ = ()
+
+    def make_node(self, *inputs):
+        inputs = list(map(tt.as_tensor_variable, inputs))
+        if len(inputs) != 16:
+            raise TypeError('KalmanFilterGrad takes the 7 inputs and 8 outputs '
+                            'of KalmanFilter and the gradient of the '
+                            'log-likelihoods.')
+        return tt.Apply(self, inputs, [i.type() for i in inputs[:7]])
+
+    def perform(self, node, inputs, output_storage):
+        F, H = inputs[1], inputs[3]
+        filt = KalmanFilterResult(*inputs[7:15])
+        g_logp = inputs[15]
+        grads = [np.zeros_like(i) for i in inputs[:7]]
+        if not np.all(np.isfinite(filt.logp)):
+            for g in grads:
+                g[...] = np.nan
+        else:
+            _kalman_backward(filt, F, H, g_logp, grads)
+        for storage, out, g in zip(output_storage, node.outputs, grads):
+            storage[0] = np.asarray(g, dtype=out.dtype)
+
+    def infer_shape(self, node, shapes):
+        return shapes[:7]
+
+    def c_support_code(self):
+        return _KALMAN_C_SUPPORT
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        if node.outputs[0].dtype != 'float64':
+            raise NotImplementedError('only float64 is implemented')
+        dims = [('T', 'k'), ('d', 'd'), ('d', 'd'), ('k', 'd'), ('k', 'k'),
+                ('d',), ('d', 'd')]
+        call = """
+        const double *logp = in_data[7];
+        int finite = 1;
+        for (npy_intp t = 0; t < T; t++)
+            if (!isfinite(logp[t]))
+                finite = 0;
+        if (finite) {
+            pymc3_kalman_backward(T, d, k, in_data[1], in_data[3],
+                in_data[15], in_data[8], in_data[9], in_data[10],
+                in_data[11], in_data[12], in_data[13], in_data[14],
+                out_data[0], out_data[1], out_data[2], out_data[3],
+                out_data[4], out_data[5], out_data[6], work);
+        } else {
+            for (int i = 0; i < 7; i++) {
+                double *g = out_data[i];
+                for (npy_intp j = 0; j < PyArray_SIZE(in_c[i]); j++)
+                    g[j] = NAN;
+            }
+        }"""
+        return _kalman_c_code(inputs, outputs, dims, call,
+                              '3 * d * d + 2 * d * k + k * k + 2 * d + 2 * k',
+                              sub)
+
+    def c_code_cache_version(self):
+        return (1,)
+
+
+kalman_filter = KalmanFilter()
+
+
 class I1e(UnaryScalarOp):
     """
     Modified Bessel function of the first kind of order 1, exponentially scaled.
@@ -314,14 +1455,496 @@ i0e_scalar = I0e(upgrade_to_float_no_complex, name="i0e")
 i0e = tt.Elemwise(i0e_scalar, name="Elemwise{i0e,no_inplace}")
 
 
+_BETAINC_C_SUPPORT = """
+#ifndef PYMC3_BETAINC
+#define PYMC3_BETAINC
+/* Regularized incomplete beta function, after incbet.c of the Cephes
+   library by Steve Moshier. */
+#define PYMC3_MACHEP 1.11022302462515654042E-16
+#define PYMC3_MINLOG -7.08396418532264106224E2
+#define PYMC3_BIG 4.503599627370496e15
+#define PYMC3_BIGINV 2.22044604925031308085e-16
+
+static double pymc3_lbeta(double a, double b)
+{
+    return lgamma(a) + lgamma(b) - lgamma(a + b);
+}
+
+/* Power series, for small b * x and x not too close to 1 */
+static double pymc3_incbet_ps(double a, double b, double x)
+{
+    double s, t, u, v, n, t1, z, ai;
+    int i = 0;
+
+    ai = 1.0 / a;
+    u = (1.0 - b) * x;
+    v = u / (a + 1.0);
+    t1 = v;
+    t = u;
+    n = 2.0;
+    s = 0.0;
+    z = PYMC3_MACHEP * ai;
+    while (fabs(v) > z && i++ < 10000) {
+        u = (n - b) * x / n;
+        t *= u;
+        v = t / (a + n);
+        s += v;
+        n += 1.0;
+    }
+    s += t1 + ai;
+    t = a * log(x) - pymc3_lbeta(a, b) + log(s);
+    return t < PYMC3_MINLOG ? 0.0 : exp(t);
+}
+
+/* Continued fraction expansions, `second` selects the one for
+   x * (a + b - 2) - (a - 1) >= 0 */
+static double pymc3_incbet_cf(double a, double b, double x, int second)
+{
+    double xk, pk, pkm1, pkm2, qk, qkm1, qkm2;
+    double k1, k2, k3, k4, k5, k6, k7, k8, k26;
+    double r, t, ans;
+    int n = 0;
+
+    k1 = a;
+    k3 = a;
+    k4 = a + 1.0;
+    k5 = 1.0;
+    k8 = a + 2.0;
+    if (second) {
+        k2 = b - 1.0;
+        k6 = a + b;
+        k7 = a + 1.0;
+        k26 = -1.0;
+        x = x / (1.0 - x);
+    } else {
+        k2 = a + b;
+        k6 = b - 1.0;
+        k7 = k4;
+        k26 = 1.0;
+    }
+    pkm2 = 0.0;
+    qkm2 = 1.0;
+    pkm1 = 1.0;
+    qkm1 = 1.0;
+    ans = 1.0;
+    r = 1.0;
+    do {
+        xk = -(x * k1 * k2) / (k3 * k4);
+        pk = pkm1 + pkm2 * xk;
+        qk = qkm1 + qkm2 * xk;
+        pkm2 = pkm1;
+        pkm1 = pk;
+        qkm2 = qkm1;
+        qkm1 = qk;
+
+        xk = (x * k5 * k6) / (k7 * k8);
+        pk = pkm1 + pkm2 * xk;
+        qk = qkm1 + qkm2 * xk;
+        pkm2 = pkm1;
+        pkm1 = pk;
+        qkm2 = qkm1;
+        qkm1 = qk;
+
+        if (qk != 0)
+            r = pk / qk;
+        if (r != 0) {
+            t = fabs((ans - r) / r);
+            ans = r;
+        } else {
+            t = 1.0;
+        }
+        if (t < 3.0 * PYMC3_MACHEP)
+            break;
+
+        k1 += 1.0;
+        k2 += k26;
+        k3 += 2.0;
+        k4 += 2.0;
+        k5 += 1.0;
+        k6 -= k26;
+        k7 += 2.0;
+        k8 += 2.0;
+
+        if ((fabs(qk) + fabs(pk)) > PYMC3_BIG) {
+            pkm2 *= PYMC3_BIGINV;
+            pkm1 *= PYMC3_BIGINV;
+            qkm2 *= PYMC3_BIGINV;
+            qkm1 *= PYMC3_BIGINV;
+        }
+        if ((fabs(qk) < PYMC3_BIGINV) || (fabs(pk) < PYMC3_BIGINV)) {
+            pkm2 *= PYMC3_BIG;
+            pkm1 *= PYMC3_BIG;
+            qkm2 *= PYMC3_BIG;
+            qkm1 *= PYMC3_BIG;
+        }
+    } while (++n < 300);
+    return ans;
+}
+
+static double pymc3_betainc(double aa, double bb, double xx)
+{
+    double a, b, t, x, xc, w, y;
+    int flip = 0;
+
+    if (aa <= 0.0 || bb <= 0.0 || xx < 0.0 || xx > 1.0 || xx != xx)
+        return NAN;
+    if (xx == 0.0 || xx == 1.0)
+        return xx;
+    if (bb * xx <= 1.0 && xx <= 0.95)
+        return pymc3_incbet_ps(aa, bb, xx);
+
+    w = 1.0 - xx;
+    /* reverse a and b if x is greater than the mean */
+    if (xx > aa / (aa + bb)) {
+        flip = 1;
+        a = bb;
+        b = aa;
+        xc = xx;
+        x = w;
+    } else {
+        a = aa;
+        b = bb;
+        xc = w;
+        x = xx;
+    }
+    if (flip && b * x <= 1.0 && x <= 0.95) {
+        t = pymc3_incbet_ps(a, b, x);
+    } else {
+        y = x * (a + b - 2.0) - (a - 1.0);
+        if (y < 0.0)
+            w = pymc3_incbet_cf(a, b, x, 0);
+        else
+            w = pymc3_incbet_cf(a, b, x, 1) / xc;
+        y = a * log(x) + b * log(xc) - pymc3_lbeta(a, b) + log(w / a);
+        t = y < PYMC3_MINLOG ? 0.0 : exp(y);
+    }
+    if (flip)
+        t = t <= PYMC3_MACHEP ? 1.0 - PYMC3_MACHEP : 1.0 - t;
+    return t;
+}
+#endif
+"""
+
+
+class BetaInc(ScalarOp):
+    """
+    Regularized incomplete beta function :math:`I_x(a, b)`.
+
+    The C implementation follows the Cephes library, like
+    `scipy.special.betainc`, which is used without a C compiler.
+    """
+    nin = 3
+    nfunc_spec = ('scipy.special.betainc', 3, 1)
+
+    def impl(self, a, b, x):
+        return scipy.special.betainc(a, b, x)
+
+    def grad(self, inp, grads):
+        a, b, x = inp
+        gz, = grads
+        log_beta = (theano.scalar.gammaln(a) + theano.scalar.gammaln(b)
+                    - theano.scalar.gammaln(a + b))
+        dx = theano.scalar.exp((a - 1) * theano.scalar.log(x) +
+                               (b - 1) * theano.scalar.log1p(-x) - log_beta)
+        return [gz * betainc_da_scalar(a, b, x),
+                gz * betainc_db_scalar(a, b, x),
+                gz * dx]
+
+    def c_support_code(self):
+        return _BETAINC_C_SUPPORT
+
+    def c_code(self, node, name, inp, out, sub):
+        a, b, x = inp
+        z, = out
+        if node.inputs[0].type in theano.scalar.float_types:
+            return "%(z)s = pymc3_betainc(%(a)s, %(b)s, %(x)s);" % locals()
+        raise NotImplementedError('only floating point is implemented')
+
+    def c_code_cache_version(self):
+        return (1,)
+
+
+def _betainc_derivative(a, b, x, wrt, max_iter=200, tol=1e-12):
+    """Derivative of the regularized incomplete beta function with
+    respect to `a` (`wrt=0`) or `b` (`wrt=1`).
+
+    Evaluates the derivative of the continued fraction of Boik and
+    Robison-Cox (1998), for all elements at once. Only the recurrence of
+    the requested derivative is run.
+    """
+    a, b, x = np.broadcast_arrays(*(np.asarray(v, dtype='float64') for v in (a, b, x)))
+    # use I_x(a, b) = 1 - I_{1-x}(b, a) above the mean
+    flip = x > a / (a + b)
+    p = np.where(flip, b, a)
+    q = np.where(flip, a, b)
+    x = np.where(flip, 1. - x, x)
+    # the derivative with respect to `a` is the one with respect to the
+    # second parameter of the flipped elements and vice versa
+    wrt_p = flip == bool(wrt)
+    # I_x(a, b) is constant at x = 0 and x = 1, which are x = 0 here
+    inner = x != 0.
+    result = np.zeros_like(x)
+    for mask, derivative_p in ((wrt_p & inner, True), (~wrt_p & inner, False)):
+        if mask.any():
+            result[mask] = _betainc_cf_derivative(p[mask], q[mask], x[mask],
+                                                  derivative_p, max_iter, tol)
+    return np.where(flip, -result, result)
+
+
+def _betainc_cf_derivative(p, q, x, wrt_p, max_iter, tol):
+    """Derivative of the continued fraction for :math:`I_x(p, q)` with
+    respect to `p` if `wrt_p` and to `q` otherwise, for `x` below the
+    mean."""
+    with np.errstate(all='ignore'):
+        f = q * x / (p * (1. - x))
+        K = np.exp(p * np.log(x) + (q - 1.) * np.log1p(-x) - np.log(p)
+                   - scipy.special.betaln(p, q))
+        if wrt_p:
+            dK = np.log(x) - 1. / p + scipy.special.digamma(p + q) - scipy.special.digamma(p)
+        else:
+            dK = np.log1p(-x) + scipy.special.digamma(p + q) - scipy.special.digamma(q)
+        zeros = np.zeros_like(x)
+        A2, A1 = zeros + 1., zeros + 1.
+        B2, B1 = zeros, zeros + 1.
+        dA2, dA1, dB2, dB1 = zeros, zeros, zeros, zeros
+        result = zeros
+        done = np.zeros(x.shape, bool)
+        pp = p**2
+        pf = p * f
+        for n in range(1, max_iter + 1):
+            p2n = p + 2 * n
+            if n == 1:
+                an = pf * (q - 1) / (q * (p + 1))
+                if wrt_p:
+                    dan = -pf * (q - 1) / (q * (p + 1)**2)
+                else:
+                    dan = pf / (q * (p + 1))
+            else:
+                denom = (p2n - 3) * (p2n - 2)**2 * (p2n - 1)
+                an = (pp * f**2 * (n - 1) / q**2 * (p + q + n - 2) * (p + n - 1)
+                      * (q - n) / denom)
+                if wrt_p:
+                    poly = ((-8 + 8 * p + 8 * q) * n**3
+                            + (16 * pp + (-44 + 20 * q) * p + 26 - 24 * q) * n**2
+                            + (10 * pp * p + (14 * q - 46) * pp + (-40 * q + 66) * p
+                               - 28 + 24 * q) * n
+                            + 2 * pp**2 + (-13 + 3 * q) * pp * p + (-14 * q + 30) * pp
+                            + (-29 + 19 * q) * p + 10 - 8 * q)
+                    dan = (-(n - 1) * f**2 * pp * (q - n) / (q**2 * (p2n - 3)**2)
+                           * poly / ((p2n - 2)**3 * (p2n - 1)**2))
+                else:
+                    dan = (pp * f**2 / q**2 * (n - 1) * (p + n - 1) * (2 * q + p - 2)
+                           / denom)
+            bn = ((2 * (pf + 2 * q) * n * (n + p - 1) + p * q * (p - 2 - pf))
+                  / (q * (p2n - 2) * p2n))
+            if wrt_p:
+                dbn = pf / q * ((-4 * p - 4 * q + 4) * n**2 + (4 * p - 4 + 4 * q - 2 * pp) * n
+                                + pp * q) / ((p2n - 2)**2 * p2n**2)
+            else:
+                dbn = -pp * f / (q * (p2n - 2) * p2n)
+            A = an * A2 + bn * A1
+            B = an * B2 + bn * B1
+            dA = dan * A2 + an * dA2 + dbn * A1 + bn * dA1
+            dB = dan * B2 + an * dB2 + dbn * B1 + bn * dB1
+            A2, A1 = A1, A
+            B2, B1 = B1, B
+            dA2, dA1 = dA1, dA
+            dB2, dB1 = dB1, dB
+            if n == 1:
+                continue
+            derivative = K * (A / B * dK + (dA - A / B * dB) / B)
+            converged = (np.abs(derivative - result)
+                         <= tol * np.maximum(tol, np.abs(derivative)))
+            result = np.where(done, result, derivative)
+            done = done | converged
+            if done.all():
+                break
+    return result
+
+
+def _betainc_output_dtype(*inputs):
+    types = [theano.scalar.get_scalar_type(str(np.asarray(v).dtype)) for v in inputs]
+    return upgrade_to_float_no_complex(*types)[0].dtype
+
+
+def betainc_da_numpy(a, b, x):
+    return _betainc_derivative(a, b, x, 0).astype(_betainc_output_dtype(a, b, x))
+
+
+def betainc_db_numpy(a, b, x):
+    return _betainc_derivative(a, b, x, 1).astype(_betainc_output_dtype(a, b, x))
+
+
+_BETAINC_DERIVATIVE_C_SUPPORT = _BETAINC_C_SUPPORT + """
+#ifndef PYMC3_BETAINC_DERIVATIVE
+#define PYMC3_BETAINC_DERIVATIVE
+/* Derivatives of the regularized incomplete beta function with respect to
+   its parameters, as in _betainc_derivative. */
+#define PYMC3_BETAINC_MAX_ITER 200
+#define PYMC3_BETAINC_TOL 1e-12
+
+/* Digamma function for positive x, by the recurrence and the asymptotic
+   series for x >= 10 */
+static double pymc3_digamma(double x)
+{
+    double result = 0.0, r;
+    if (!(x > 0.0))
+        return NAN;
+    while (x < 10.0) {
+        result -= 1.0 / x;
+        x += 1.0;
+    }
+    r = 1.0 / (x * x);
+    return result + log(x) - 0.5 / x
+        - r * (1.0 / 12 - r * (1.0 / 120 - r * (1.0 / 252 - r * (1.0 / 240 - r / 132))));
+}
+
+static double pymc3_betainc_cf_derivative(double p, double q, double x, int wrt_p)
+{
+    double f = q * x / (p * (1.0 - x));
+    double K = exp(p * log(x) + (q - 1.0) * log1p(-x) - log(p) - pymc3_lbeta(p, q));
+    double pp = p * p, pf = p * f, dK;
+    double A2 = 1.0, A1 = 1.0, B2 = 0.0, B1 = 1.0;
+    double dA2 = 0.0, dA1 = 0.0, dB2 = 0.0, dB1 = 0.0;
+    double p2n, denom, poly, an, dan, bn, dbn, A, B, dA, dB;
+    double derivative, result = 0.0;
+    int n;
+
+    if (wrt_p)
+        dK = log(x) - 1.0 / p + pymc3_digamma(p + q) - pymc3_digamma(p);
+    else
+        dK = log1p(-x) + pymc3_digamma(p + q) - pymc3_digamma(q);
+    for (n = 1; n <= PYMC3_BETAINC_MAX_ITER; n++) {
+        p2n = p + 2 * n;
+        if (n == 1) {
+            an = pf * (q - 1) / (q * (p + 1));
+            if (wrt_p)
+                dan = -pf * (q - 1) / (q * (p + 1) * (p + 1));
+            else
+                dan = pf / (q * (p + 1));
+        } else {
+            denom = (p2n - 3) * (p2n - 2) * (p2n - 2) * (p2n - 1);
+            an = pp * f * f * (n - 1) / (q * q) * (p + q + n - 2) * (p + n - 1)
+                * (q - n) / denom;
+            if (wrt_p) {
+                poly = (-8 + 8 * p + 8 * q) * n * n * n
+                    + (16 * pp + (-44 + 20 * q) * p + 26 - 24 * q) * n * n
+                    + (10 * pp * p + (14 * q - 46) * pp + (-40 * q + 66) * p
+                       - 28 + 24 * q) * n
+                    + 2 * pp * pp + (-13 + 3 * q) * pp * p + (-14 * q + 30) * pp
+                    + (-29 + 19 * q) * p + 10 - 8 * q;
+                dan = -(n - 1) * f * f * pp * (q - n) / (q * q * (p2n - 3) * (p2n - 3))
+                    * poly / ((p2n - 2) * (p2n - 2) * (p2n - 2) * (p2n - 1) * (p2n - 1));
+            } else {
+                dan = pp * f * f / (q * q) * (n - 1) * (p + n - 1) * (2 * q + p - 2)
+                    / denom;
+            }
+        }
+        bn = (2 * (pf + 2 * q) * n * (n + p - 1) + p * q * (p - 2 - pf))
+            / (q * (p2n - 2) * p2n);
+        if (wrt_p)
+            dbn = pf / q * ((-4 * p - 4 * q + 4) * n * n + (4 * p - 4 + 4 * q - 2 * pp) * n
+                            + pp * q) / ((p2n - 2) * (p2n - 2) * p2n * p2n);
+        else
+            dbn = -pp * f / (q * (p2n - 2) * p2n);
+        A = an * A2 + bn * A1;
+        B = an * B2 + bn * B1;
+        dA = dan * A2 + an * dA2 + dbn * A1 + bn * dA1;
+        dB = dan * B2 + an * dB2 + dbn * B1 + bn * dB1;
+        A2 = A1;
+        A1 = A;
+        B2 = B1;
+        B1 = B;
+        dA2 = dA1;
+        dA1 = dA;
+        dB2 = dB1;
+        dB1 = dB;
+        if (n == 1)
+            continue;
+        derivative = K * (A / B * dK + (dA - A / B * dB) / B);
+        if (fabs(derivative - result)
+                <= PYMC3_BETAINC_TOL * fmax(PYMC3_BETAINC_TOL, fabs(derivative)))
+            return derivative;
+        result = derivative;
+    }
+    return result;
+}
+
+/* with respect to a if wrt is 0 and to b otherwise */
+static double pymc3_betainc_derivative(double a, double b, double x, int wrt)
+{
+    if (x == 0.0 || x == 1.0)
+        return 0.0;
+    /* I_x(a, b) = 1 - I_{1-x}(b, a) above the mean */
+    if (x > a / (a + b))
+        return -pymc3_betainc_cf_derivative(b, a, 1.0 - x, wrt);
+    return pymc3_betainc_cf_derivative(a, b, x, !wrt);
+}
+#endif
+"""
+
+
+class _BetaIncDerivative(ScalarOp):
+    nin = 3
+    # 0 for the derivative with respect to `a`, 1 for `b`
+    wrt = None
+
+    def c_support_code(self):
+        return _BETAINC_DERIVATIVE_C_SUPPORT
+
+    def c_code(self, node, name, inp, out, sub):
+        a, b, x = inp
+        z, = out
+        wrt = self.wrt
+        if node.inputs[0].type in theano.scalar.float_types:
+            return "%(z)s = pymc3_betainc_derivative(%(a)s, %(b)s, %(x)s, %(wrt)d);" % locals()
+        raise NotImplementedError('only floating point is implemented')
+
+    def c_code_cache_version(self):
+        return (1,)
+
+
+class BetaIncDa(_BetaIncDerivative):
+    """
+    Derivative of the regularized incomplete beta function with respect
+    to `a`.
+    """
+    wrt = 0
+    nfunc_spec = ('pymc3.distributions.dist_math.betainc_da_numpy', 3, 1)
+
+    def impl(self, a, b, x):
+        return betainc_da_numpy(a, b, x)[()]
+
+
+class BetaIncDb(_BetaIncDerivative):
+    """
+    Derivative of the regularized incomplete beta function with respect
+    to `b`.
+    """
+    wrt = 1
+    nfunc_spec = ('pymc3.distributions.dist_math.betainc_db_numpy', 3, 1)
+
+    def impl(self, a, b, x):
+        return betainc_db_numpy(a, b, x)[()]
+
+
+betainc_scalar = BetaInc(upgrade_to_float_no_complex, name="betainc")
+betainc = tt.Elemwise(betainc_scalar, name="Elemwise{betainc,no_inplace}")
+betainc_da_scalar = BetaIncDa(upgrade_to_float_no_complex, name="betainc_da")
+betainc_da = tt.Elemwise(betainc_da_scalar, name="Elemwise{betainc_da,no_inplace}")
+betainc_db_scalar = BetaIncDb(upgrade_to_float_no_complex, name="betainc_db")
+betainc_db = tt.Elemwise(betainc_db_scalar, name="Elemwise{betainc_db,no_inplace}")
+
+
 def random_choice(*args, **kwargs):
     """Return draws from a categorial probability functions
 
     Args:
         p: array
            Probability of each class. If p.ndim > 1, the last axis is
-           interpreted as the probability of each class, and numpy.random.choice
-           is iterated for every other axis element.
+           interpreted as the probability of each class, and the classes
+           of all other axis elements are drawn at once by inverting the
+           cumulative probabilities.
         size: int or tuple
             Shape of the desired output array. If p is multidimensional, size
             should broadcast with p.shape[:-1].
@@ -330,26 +1953,27 @@ def random_choice(*args, **kwargs):
         random sample: array
 
     """
+    from .distribution import get_random_state
+    random_state = get_random_state()
     p = kwargs.pop('p')
     size = kwargs.pop('size')
     k = p.shape[-1]
 
     if p.ndim > 1:
         # If p is an nd-array, the last axis is interpreted as the class
-        # probability. We must iterate over the elements of all the other
-        # dimensions.
+        # probability and all other dimensions are batch dimensions.
         # We first ensure that p is broadcasted to the output's shape
         size = to_tuple(size) + (1,)
         p = np.broadcast_arrays(p, np.empty(size))[0]
-        out_shape = p.shape[:-1]
-        # np.random.choice accepts 1D p arrays, so we semiflatten p to
-        # iterate calls using the last axis as the category probabilities
-        p = np.reshape(p, (-1, p.shape[-1]))
-        samples = np.array([np.random.choice(k, p=p_) for p_ in p])
-        # We reshape to the desired output shape
-        samples = np.reshape(samples, out_shape)
+        if np.any(p < 0):
+            raise ValueError('probabilities are not non-negative')
+        cdf = np.cumsum(p, axis=-1)
+        u = random_state.uniform(size=cdf.shape[:-1] + (1,)) * cdf[..., -1:]
+        # the number of cumulative probabilities smaller or equal to u, as
+        # numpy.random.choice does with searchsorted
+        samples = np.minimum(np.sum(u >= cdf, axis=-1), k - 1)
     else:
-        samples = np.random.choice(k, p=p, size=size)
+        samples = random_state.choice(k, p=p, size=size)
     return samples
 
 
@@ -503,6 +2127,17 @@ def incomplete_beta(a, b, value):
     '''Incomplete beta implementation
     Power series and continued fraction expansions chosen for best numerical
     convergence across the board based on inputs.
+
+    Evaluated elementwise by `betainc`, see `incomplete_beta_scan` for the
+    implementation with `theano.scan`.
+    '''
+    return betainc(a, b, value)
+
+
+def incomplete_beta_scan(a, b, value):
+    '''Incomplete beta implementation with `theano.scan`
+    Power series and continued fraction expansions chosen for best numerical
+    convergence across the board based on inputs.
     '''
     machep = tt.constant(np.MachAr().eps, dtype='float64')
     one = tt.constant(1, dtype='float64')
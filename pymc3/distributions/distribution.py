@@ -1,4 +1,8 @@
+import collections
+import contextlib
+import functools
 import numbers
+import threading
 
 import numpy as np
 import theano.tensor as tt
@@ -13,7 +17,8 @@ from ..vartypes import string_types
 from .dist_math import to_tuple
 
 __all__ = ['DensityDist', 'Distribution', 'Continuous', 'Discrete',
-           'NoDistribution', 'TensorType', 'draw_values', 'generate_samples']
+           'NoDistribution', 'TensorType', 'draw_values', 'generate_samples',
+           'get_random_state', 'use_random_state', 'record_sampling_loops']
 
 
 class _Unpickling:
@@ -22,6 +27,12 @@ class _Unpickling:
 
 class Distribution:
     """Statistical distribution"""
+    # Whether `random` draws all samples of a call with vectorized numpy
+    # operations, also when the parameters have a leading axis of length
+    # `size` (as drawn by `draw_values`), returning an array with the
+    # shape `size + shape`.
+    vectorized_random = False
+
     def __new__(cls, name, *args, **kwargs):
         if name is _Unpickling:
             return object.__new__(cls)  # for pickle
@@ -239,8 +250,12 @@ class _DrawValuesContext(Context, metaclass=InitContextMeta):
             # same drawn values.
             # The drawn_vars keys shall be (RV, size) tuples
             self.drawn_vars = self.parent.drawn_vars
+            # Nested calls store their draw orders on the model of the
+            # outermost call
+            self.draw_values_plans = self.parent.draw_values_plans
         else:
             self.drawn_vars = dict()
+            self.draw_values_plans = None
 
     @property
     def parent(self):
@@ -261,6 +276,7 @@ class _DrawValuesContextBlocker(_DrawValuesContext, metaclass=InitContextMeta):
 
     def __init__(self):
         self.drawn_vars = dict()
+        self.draw_values_plans = None
 
 
 def is_fast_drawable(var):
@@ -270,7 +286,110 @@ def is_fast_drawable(var):
                             tt.sharedvar.SharedVariable))
 
 
-def draw_values(params, point=None, size=None):
+# the random state activated by `use_random_state` in each thread
+_ACTIVE_RANDOM_STATE = threading.local()
+
+
+def get_random_state():
+    """The random state that `random` methods draw their samples from.
+
+    This is the state activated by the innermost `use_random_state` (or
+    `draw_values` with a `random_state`) of the calling thread, and the
+    global numpy random state otherwise.
+    """
+    state = getattr(_ACTIVE_RANDOM_STATE, 'state', None)
+    if state is None:
+        return np.random.mtrand._rand
+    return state
+
+
+def _as_random_state(seed):
+    """The random state `seed`, a new one created from it, or the current
+    random state if `seed` is None."""
+    if seed is None:
+        return get_random_state()
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    return np.random.RandomState(seed)
+
+
+@contextlib.contextmanager
+def use_random_state(random_state):
+    """Draw the samples of `random` methods from `random_state`.
+
+    The state is only active in the calling thread, so that several
+    threads can draw reproducible samples at the same time.
+
+    Parameters
+    ----------
+    random_state : int, array of ints, numpy.random.RandomState or None
+        The random state, or a seed to create one from. None keeps the
+        current random state.
+
+    Yields
+    ------
+    numpy.random.RandomState
+        The active random state.
+    """
+    if random_state is None:
+        yield get_random_state()
+        return
+    previous = getattr(_ACTIVE_RANDOM_STATE, 'state', None)
+    _ACTIVE_RANDOM_STATE.state = state = _as_random_state(random_state)
+    try:
+        yield state
+    finally:
+        _ACTIVE_RANDOM_STATE.state = previous
+
+
+# the counters of `record_sampling_loops` in each thread
+_SAMPLING_LOOPS = threading.local()
+
+
+@contextlib.contextmanager
+def record_sampling_loops():
+    """Count the Python loops over samples in drawing random values.
+
+    Distributions that declare `vectorized_random` draw all samples at
+    once, the draws of the other distributions are counted as loops over
+    the samples. The code paths that fall back to a loop over the samples,
+    e.g. for the values of deterministics, report the number of iterations
+    here.
+
+    Yields
+    ------
+    collections.Counter
+        The numbers of iterations, by the name of the code path.
+    """
+    counter = collections.Counter()
+    previous = getattr(_SAMPLING_LOOPS, 'counter', None)
+    _SAMPLING_LOOPS.counter = counter
+    try:
+        yield counter
+    finally:
+        _SAMPLING_LOOPS.counter = previous
+        if previous is not None:
+            previous.update(counter)
+
+
+def _record_sampling_loop(name, iterations):
+    counter = getattr(_SAMPLING_LOOPS, 'counter', None)
+    if counter is not None:
+        counter[name] += int(iterations)
+
+
+def _bind_random_state(generator, random_state):
+    """`generator` drawing from `random_state` instead of the global state,
+    for the methods of numpy random states and scipy distributions."""
+    owner = getattr(generator, '__self__', None)
+    if isinstance(owner, np.random.RandomState):
+        return getattr(random_state, generator.__name__)
+    if owner is not None and getattr(generator, '__name__', None) == 'rvs':
+        return functools.partial(generator, random_state=random_state)
+    return generator
+
+
+def draw_values(params, point=None, size=None, random_state=None):
     """
     Draw (fix) parameter values. Handles a number of cases:
 
@@ -287,13 +406,15 @@ def draw_values(params, point=None, size=None):
             a) are named parameters in the point
             b) are *RVs with a random method
 
+    If `random_state` (a numpy RandomState or a seed) is given, all random
+    draws are taken from it instead of the global numpy random state.
     """
     # Get fast drawable values (i.e. things in point or numbers, arrays,
     # constants or shares, or things that were already drawn in related
     # contexts)
     if point is None:
         point = {}
-    with _DrawValuesContext() as context:
+    with use_random_state(random_state), _DrawValuesContext() as context:
         params = dict(enumerate(params))
         drawn = context.drawn_vars
         evaluated = {}
@@ -324,6 +445,33 @@ def draw_values(params, point=None, size=None):
             # params that could be drawn in variable order
             return [evaluated[i] for i in params]
 
+        # The order in which the nodes can be drawn only depends on the graph
+        # and on the variables that are given in the point, so it is
+        # resolved once and replayed on later calls
+        plans = _get_draw_values_plans(params.values())
+        if plans is None:
+            plans = context.draw_values_plans
+        else:
+            context.draw_values_plans = plans
+        plan_key = (tuple(symbolic_params), frozenset(point))
+        try:
+            hash(plan_key)
+        except TypeError:
+            plans = None
+        # other threads may drop the plan concurrently
+        plan = None if plans is None else plans.get(plan_key)
+        if plan is not None:
+            try:
+                _run_draw_values_plan(plan, params, point, size,
+                                      drawn, evaluated)
+                return [evaluated[j] for j in params]
+            except theano.gof.fg.MissingInputError:
+                # Some of the values that were drawn in related contexts
+                # when the plan was made are missing now
+                plans.pop(plan_key, None)
+        plan_nodes = []
+        plan_order = []
+
         # Distribution parameters may be nodes which have named node-inputs
         # specified in the point. Need to find the node-inputs, their
         # parents and children to replace them.
@@ -392,6 +540,7 @@ def draw_values(params, point=None, size=None):
                                         size=size)
                     givens[next_.name] = (next_, value)
                     drawn[(next_, size)] = value
+                    plan_nodes.append((next_, children))
                 except theano.gof.fg.MissingInputError:
                     # The node failed, so we must add the node's parents to
                     # the stack of nodes to try to draw from. We exclude the
@@ -415,6 +564,7 @@ def draw_values(params, point=None, size=None):
                 param = params[param_idx]
                 if (param, size) in drawn:
                     evaluated[param_idx] = drawn[(param, size)]
+                    plan_order.append(param_idx)
                 else:
                     try:  # might evaluate in a bad order,
                         value = _draw_value(param,
@@ -423,19 +573,76 @@ def draw_values(params, point=None, size=None):
                                             size=size)
                         evaluated[param_idx] = drawn[(param, size)] = value
                         givens[param.name] = (param, value)
+                        plan_order.append(param_idx)
                     except theano.gof.fg.MissingInputError:
                         missing_inputs.add(param_idx)
 
+        if plans is not None:
+            plans[plan_key] = (plan_nodes, plan_order)
+
     return [evaluated[j] for j in params] # set the order back
 
 
-@memoize
+def _get_draw_values_plans(params):
+    """The cache of draw orders of the model that `params` belong to.
+
+    Returns None if there is no model to store the plans on.
+    """
+    model = None
+    for param in params:
+        if isinstance(getattr(param, 'model', None), Model):
+            model = param.model
+            break
+    else:
+        # The innermost context is the `_DrawValuesContext` of the caller
+        models = [ctx for ctx in Model.get_contexts()
+                  if isinstance(ctx, Model)]
+        if not models:
+            return None
+        model = models[-1]
+    try:
+        return model._draw_values_plans
+    except AttributeError:
+        # Models unpickled from older versions
+        model._draw_values_plans = {}
+        return model._draw_values_plans
+
+
+def _run_draw_values_plan(plan, params, point, size, drawn, evaluated):
+    """Draw the symbolic `params` in the order recorded by `draw_values`.
+
+    Raises `MissingInputError` if the plan does not fit the values that
+    are already drawn.
+    """
+    plan_nodes, plan_order = plan
+    givens = {p.name: (p, v) for (p, _), v in drawn.items()
+              if getattr(p, 'name', None) is not None}
+    for node, children in plan_nodes:
+        if (node, size) in drawn:
+            continue
+        temp_givens = [givens[k] for k in givens if k in children]
+        value = _draw_value(node, point=point, givens=temp_givens, size=size)
+        givens[node.name] = (node, value)
+        drawn[(node, size)] = value
+    for param_idx in plan_order:
+        param = params[param_idx]
+        if (param, size) in drawn:
+            evaluated[param_idx] = drawn[(param, size)]
+        else:
+            value = _draw_value(param, point=point, givens=givens.values(),
+                                size=size)
+            evaluated[param_idx] = drawn[(param, size)] = value
+            givens[param.name] = (param, value)
+
+
+@memoize(maxsize=512)
 def _compile_theano_function(param, vars, givens=None):
     """Compile theano function for a given parameter and input variables.
 
     This function is memoized to avoid repeating costly theano compilations
     when repeatedly drawing values, which is done when generating posterior
-    predictive samples.
+    predictive samples. The least recently used functions are dropped once
+    512 are cached.
 
     Parameters
     ----------
@@ -454,6 +661,88 @@ def _compile_theano_function(param, vars, givens=None):
                     allow_input_downcast=True)
 
 
+def _batched_graph(param, vars, batched):
+    """Rebuild the graph of `param` for values of the `batched` input
+    variables with an additional leading axis of samples.
+
+    Only elementwise operations, dimshuffles, sums and indexing are
+    supported.
+
+    Returns
+    -------
+    The new input variables and the output, or None if the graph contains
+    other operations.
+    """
+    replacements = {}
+    inputs = []
+    for var, is_batched in zip(vars, batched):
+        if is_batched:
+            var_batched = tt.TensorType(
+                var.dtype, (False,) + var.broadcastable)(var.name)
+            replacements[var] = var_batched
+            inputs.append(var_batched)
+        else:
+            inputs.append(var)
+    for node in theano.gof.graph.io_toposort(list(vars), [param]):
+        if not any(i in replacements for i in node.inputs):
+            continue
+        node_inputs = [replacements.get(i, i) for i in node.inputs]
+        op = node.op
+        if isinstance(op, tt.Elemwise):
+            # inputs without the samples axis are broadcast against it
+            outputs = op(*node_inputs, return_list=True)
+        elif isinstance(op, tt.DimShuffle):
+            order = [0] + [o if o == 'x' else o + 1 for o in op.new_order]
+            outputs = [node_inputs[0].dimshuffle(order)]
+        elif isinstance(op, tt.elemwise.Sum):
+            axis = range(node.inputs[0].ndim) if op.axis is None else op.axis
+            outputs = [tt.sum(node_inputs[0], axis=[a + 1 for a in axis],
+                              dtype=op.dtype, acc_dtype=op.acc_dtype)]
+        elif (isinstance(op, tt.subtensor.Subtensor)
+              and node.inputs[0] in replacements
+              and not any(i in replacements for i in node.inputs[1:])):
+            idx_list = [slice(None)] + list(op.idx_list)
+            outputs = [tt.subtensor.Subtensor(idx_list)(*node_inputs)]
+        elif (isinstance(op, tt.subtensor.AdvancedSubtensor1)
+              and node.inputs[0] in replacements
+              and node.inputs[1] not in replacements):
+            outputs = [tt.take(node_inputs[0], node_inputs[1], axis=1)]
+        else:
+            return None
+        replacements.update(zip(node.outputs, outputs))
+    if param not in replacements:
+        return None
+    return inputs, replacements[param]
+
+
+@memoize(maxsize=512)
+def _compile_batched_theano_function(param, vars, batched):
+    """Compile a theano function of `param` that takes the values of the
+    `batched` input variables with an additional leading axis of samples,
+    or return None if the graph of `param` does not allow it.
+    """
+    with theano.configparser.change_flags(compute_test_value='off'):
+        graph = _batched_graph(param, vars, batched)
+    if graph is None:
+        return None
+    inputs, output = graph
+    return function(inputs, output,
+                    on_unused_input='ignore',
+                    allow_input_downcast=True)
+
+
+@memoize(maxsize=4096)
+def _ancestor_mask(param, variables):
+    """Flag the `variables` that are inputs of the graph of `param`.
+
+    This function is memoized, so that repeated draws of `param` don't
+    walk its graph again.
+    """
+    param_ancestors = set(theano.gof.graph.ancestors([param],
+                                                     blockers=list(variables)))
+    return [var in param_ancestors for var in variables]
+
+
 def _draw_value(param, point=None, givens=None, size=None):
     """Draw a random value from a distribution or return a constant.
 
@@ -483,10 +772,12 @@ def _draw_value(param, point=None, givens=None, size=None):
         if point and hasattr(param, 'model') and param.name in point:
             return point[param.name]
         elif hasattr(param, 'random') and param.random is not None:
+            _record_random_loop(getattr(param, 'distribution', None), size)
             return param.random(point=point, size=size)
         elif (hasattr(param, 'distribution') and
                 hasattr(param.distribution, 'random') and
                 param.distribution.random is not None):
+            _record_random_loop(param.distribution, size)
             if hasattr(param, 'observations'):
                 # shape inspection for ObservedRV
                 dist_tmp = param.distribution
@@ -525,13 +816,10 @@ def _draw_value(param, point=None, givens=None, size=None):
                 variables = values = []
             # We only truly care if the ancestors of param that were given
             # value have the matching dshape and val.shape
-            param_ancestors = \
-                set(theano.gof.graph.ancestors([param],
-                                               blockers=list(variables))
-                    )
-            inputs = [(var, val) for var, val in
-                      zip(variables, values)
-                      if var in param_ancestors]
+            is_input = _ancestor_mask(param, tuple(variables))
+            inputs = [(var, val) for var, val, keep in
+                      zip(variables, values, is_input)
+                      if keep]
             if inputs:
                 input_vars, input_vals = list(zip(*inputs))
             else:
@@ -542,18 +830,51 @@ def _draw_value(param, point=None, givens=None, size=None):
                 size = np.atleast_1d(size)
             dshaped_variables = all((hasattr(var, 'dshape')
                                      for var in input_vars))
-            if (values and dshaped_variables and
+            # the samples of the values have an additional leading axis
+            batched = tuple(size is not None and val.ndim == var.ndim + 1
+                            for var, val in zip(input_vars, input_vals))
+            func_batched = None
+            if any(batched) and all(
+                    is_batched or val.ndim == var.ndim
+                    for var, val, is_batched in zip(input_vars, input_vals,
+                                                    batched)):
+                func_batched = _compile_batched_theano_function(
+                    param, tuple(input_vars), batched)
+            if func_batched is not None:
+                output = func_batched(*input_vals)
+            elif (values and dshaped_variables and
                 not all(var.dshape == getattr(val, 'shape', tuple())
                         for var, val in zip(input_vars, input_vals))):
-                output = np.array([func(*v) for v in zip(*input_vals)])
+                output = _evaluate_per_sample(param, func, input_vals)
             elif (size is not None and any((val.ndim > var.ndim)
                   for var, val in zip(input_vars, input_vals))):
-                output = np.array([func(*v) for v in zip(*input_vals)])
+                output = _evaluate_per_sample(param, func, input_vals)
             else:
                 output = func(*input_vals)
             return output
     raise ValueError('Unexpected type in draw_value: %s' % type(param))
 
+
+def _record_random_loop(distribution, size):
+    """Count the draws of `size` samples from `distribution` as a loop over
+    the samples, unless it declares `vectorized_random`."""
+    if (distribution is not None and size is not None
+            and not getattr(distribution, 'vectorized_random', False)):
+        _record_sampling_loop(
+            'random of {}'.format(type(distribution).__name__),
+            np.prod(size, dtype=int))
+
+
+def _evaluate_per_sample(param, func, input_vals):
+    """Evaluate the compiled function of `param` for one sample of the
+    input values at a time."""
+    output = np.array([func(*v) for v in zip(*input_vals)])
+    _record_sampling_loop(
+        'theano graph of {}'.format(getattr(param, 'name', None) or param),
+        len(output))
+    return output
+
+
 def _is_one_d(dist_shape):
     if hasattr(dist_shape, 'dshape') and dist_shape.dshape in ((), (0,), (1,)):
         return True
@@ -592,6 +913,11 @@ def generate_samples(generator, *args, **kwargs):
     not_broadcast_kwargs: dict or None
         Key word argument dictionary to provide to the random generator, which
         must not be broadcasted with the rest of the *args and **kwargs.
+    random_state: int, numpy.random.RandomState or None
+        The random state to draw the samples from. Defaults to the one
+        returned by `get_random_state`. Methods of numpy random states and
+        the `rvs` methods of scipy distributions are bound to it, other
+        generators should draw from `get_random_state()`.
 
     Any remaining *args and **kwargs are passed on to the generator function.
     """
@@ -602,9 +928,18 @@ def generate_samples(generator, *args, **kwargs):
     not_broadcast_kwargs = kwargs.pop('not_broadcast_kwargs', None)
     if not_broadcast_kwargs is None:
         not_broadcast_kwargs = dict()
+    random_state = kwargs.pop('random_state', None)
     if size is None:
         size = 1
 
+    with use_random_state(random_state) as random_state:
+        return _generate_samples(_bind_random_state(generator, random_state),
+                                 args, kwargs, dist_shape, one_d, size,
+                                 broadcast_shape, not_broadcast_kwargs)
+
+
+def _generate_samples(generator, args, kwargs, dist_shape, one_d, size,
+                      broadcast_shape, not_broadcast_kwargs):
     args = tuple(p[0] if isinstance(p, tuple) else p for p in args)
 
     for key in kwargs:
@@ -614,8 +949,17 @@ def generate_samples(generator, *args, **kwargs):
     if broadcast_shape is None:
         inputs = args + tuple(kwargs.values())
         try:
-            broadcast_shape = np.broadcast(*inputs).shape  # size of generator(size=1)
-        except ValueError:  # sometimes happens if args have shape (500,) and (500, 4)
+            if inputs:
+                broadcast_shape = np.broadcast(*inputs).shape  # size of generator(size=1)
+            else:
+                broadcast_shape = ()
+        except ValueError:
+            aligned = _align_sample_axes(args, kwargs, to_tuple(size),
+                                         to_tuple(dist_shape))
+            if aligned is not None:
+                args, kwargs, broadcast_shape = aligned
+        if broadcast_shape is None:
+            # sometimes happens if args have shape (500,) and (500, 4)
             max_dims = max(j.ndim for j in args + tuple(kwargs.values()))
             args = tuple([j.reshape(j.shape + (1,) * (max_dims - j.ndim)) for j in args])
             kwargs = {k: v.reshape(v.shape + (1,) * (max_dims - v.ndim)) for k, v in kwargs.items()}
@@ -650,6 +994,8 @@ def generate_samples(generator, *args, **kwargs):
                     samples = samples[0]
                 else:
                     suffix = broadcast_shape[len(size_tup):] + dist_shape
+                    _record_sampling_loop('generate_samples',
+                                          np.prod(suffix, dtype=int))
                     samples.extend([generator(*args, **kwargs).
                                     reshape(broadcast_shape)[..., np.newaxis]
                                     for _ in range(np.prod(suffix,
@@ -669,8 +1015,18 @@ def generate_samples(generator, *args, **kwargs):
     # Inputs have the right size, have to manually broadcast to the right dist_shape
     elif broadcast_shape[:len(size_tup)] == size_tup:
         suffix = broadcast_shape[len(size_tup):] + dist_shape
-        samples = [generator(*args, **kwargs).reshape(size_tup + (1,)) for _ in range(np.prod(suffix, dtype=int))]
-        samples = np.hstack(samples).reshape(size_tup + suffix)
+        if np.prod(broadcast_shape[len(size_tup):], dtype=int) == 1:
+            # one value per sample, append axes for the dist_shape to them
+            new_axes = (1,) * len(dist_shape)
+            args = tuple(np.reshape(p, np.shape(p) + new_axes) for p in args)
+            kwargs = {k: v if k in not_broadcast_kwargs
+                      else np.reshape(v, np.shape(v) + new_axes)
+                      for k, v in kwargs.items()}
+            samples = generator(size=size_tup + suffix, *args, **kwargs)
+        else:
+            _record_sampling_loop('generate_samples', np.prod(suffix, dtype=int))
+            samples = [generator(*args, **kwargs).reshape(size_tup + (1,)) for _ in range(np.prod(suffix, dtype=int))]
+            samples = np.hstack(samples).reshape(size_tup + suffix)
     else:
         samples = None
 
@@ -693,6 +1049,31 @@ def generate_samples(generator, *args, **kwargs):
     return np.asarray(samples)
 
 
+def _align_sample_axes(args, kwargs, size, dist_shape):
+    """Line up the parameters that were drawn with a leading `size` axis.
+
+    Parameters without that axis broadcast against `dist_shape` from the
+    right, the ones with it get singleton axes inserted after the sample
+    axes. Returns None if the parameters still do not broadcast.
+    """
+    def align(value):
+        shape = np.shape(value)
+        if shape[:len(size)] != size:
+            return value
+        missing = len(dist_shape) - (len(shape) - len(size))
+        if missing <= 0:
+            return value
+        return np.reshape(value, size + (1,) * missing + shape[len(size):])
+
+    args = tuple(align(arg) for arg in args)
+    kwargs = {key: align(value) for key, value in kwargs.items()}
+    try:
+        broadcast_shape = np.broadcast(*(args + tuple(kwargs.values()))).shape
+    except ValueError:
+        return None
+    return args, kwargs, broadcast_shape
+
+
 def broadcast_distribution_samples(samples, size=None):
     """Broadcast samples drawn from distributions taking into account the
     size (i.e. the number of samples) of the draw, which is prepended to
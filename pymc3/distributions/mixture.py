@@ -98,6 +98,8 @@ class Mixture(Distribution):
             like = pm.Mixture('like', w=w, comp_dists = components, observed=data, shape=3)
     """
 
+    vectorized_random = True
+
     def __init__(self, w, comp_dists, *args, **kwargs):
         # comp_dists type checking
         if not (
@@ -517,12 +519,11 @@ class Mixture(Distribution):
                              'mixture components.'.
                              format(w_samples.size,
                                     mixed_samples.size // w.shape[-1]))
-        # Semiflatten the mixture to be able to zip it with w_samples
+        # Semiflatten the mixture to be able to index it with w_samples
         w_samples = w_samples.flatten()
         mixed_samples = np.reshape(mixed_samples, (-1, w.shape[-1]))
         # Select the samples from the mixture
-        samples = np.array([mixed[choice] for choice, mixed in
-                            zip(w_samples, mixed_samples)])
+        samples = mixed_samples[np.arange(len(w_samples)), w_samples]
         # Reshape the samples to the correct output shape
         if size is None:
             samples = np.reshape(samples, dist_shape)
@@ -564,6 +565,10 @@ class NormalMixture(Mixture):
     Note: You only have to pass in sigma or tau, but not both.
     """
 
+    # the component distribution is drawn with a flattened size and no
+    # shape, which does not line up parameters with different shapes
+    vectorized_random = False
+
     def __init__(self, w, mu, sigma=None, tau=None, sd=None, comp_shape=(), *args, **kwargs):
         if sd is not None:
             sigma = sd
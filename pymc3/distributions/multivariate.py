@@ -17,12 +17,13 @@ from pymc3.theanof import floatX
 from . import transforms
 from pymc3.util import get_variable_name
 from .distribution import (Continuous, Discrete, draw_values, generate_samples,
-                           _DrawValuesContext)
+                           get_random_state, _DrawValuesContext)
 from ..model import Deterministic
 from .continuous import ChiSquared, Normal
 from .special import gammaln, multigammaln
-from .dist_math import bound, logpow, factln
-from ..math import kron_dot, kron_diag, kron_solve_lower, kronecker
+from .dist_math import (bound, logpow, factln, MvNormalQuadForm,
+                        _cholesky_or_nan)
+from ..math import kron_dot, kron_diag, kron_solve_lower
 
 
 __all__ = ['MvNormal', 'MvStudentT', 'Dirichlet',
@@ -33,17 +34,18 @@ __all__ = ['MvNormal', 'MvStudentT', 'Dirichlet',
 
 class _QuadFormBase(Continuous):
     def __init__(self, mu=None, cov=None, chol=None, tau=None, lower=True,
-                 *args, **kwargs):
+                 groups=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if len(self.shape) > 2:
             raise ValueError("Only 1 or 2 dimensions are allowed.")
 
-        if chol is not None and not lower:
-            chol = chol.T
         if len([i for i in [tau, cov, chol] if i is not None]) != 1:
             raise ValueError('Incompatible parameterization. '
                              'Specify exactly one of tau, cov, '
                              'or chol.')
+        if chol is not None and not lower:
+            chol = tt.as_tensor_variable(chol)
+            chol = chol.dimshuffle(*range(chol.ndim - 2), chol.ndim - 1, chol.ndim - 2)
         self.mu = mu = tt.as_tensor_variable(mu)
         self.solve_lower = tt.slinalg.Solve(A_structure="lower_triangular")
         # Step methods and advi do not catch LinAlgErrors at the
@@ -53,30 +55,43 @@ class _QuadFormBase(Continuous):
         cholesky = Cholesky(lower=True, on_error='nan')
 
         if cov is not None:
-            self.k = cov.shape[0]
             self._cov_type = 'cov'
             cov = tt.as_tensor_variable(cov)
-            if cov.ndim != 2:
-                raise ValueError('cov must be two dimensional.')
-            self.chol_cov = cholesky(cov)
-            self.cov = cov
-            self._n = self.cov.shape[-1]
+            if cov.ndim not in (2, 3):
+                raise ValueError('cov must be two or three dimensional.')
+            if cov.ndim == 2:
+                self.chol_cov = cholesky(cov)
+            self.cov = matrix = cov
         elif tau is not None:
-            self.k = tau.shape[0]
             self._cov_type = 'tau'
             tau = tt.as_tensor_variable(tau)
-            if tau.ndim != 2:
-                raise ValueError('tau must be two dimensional.')
-            self.chol_tau = cholesky(tau)
-            self.tau = tau
-            self._n = self.tau.shape[-1]
+            if tau.ndim not in (2, 3):
+                raise ValueError('tau must be two or three dimensional.')
+            if tau.ndim == 2:
+                self.chol_tau = cholesky(tau)
+            self.tau = matrix = tau
         else:
-            self.k = chol.shape[0]
             self._cov_type = 'chol'
-            if chol.ndim != 2:
-                raise ValueError('chol must be two dimensional.')
-            self.chol_cov = tt.as_tensor_variable(chol)
-            self._n = self.chol_cov.shape[-1]
+            chol = tt.as_tensor_variable(chol)
+            if chol.ndim not in (2, 3):
+                raise ValueError('chol must be two or three dimensional.')
+            self.chol_cov = matrix = chol
+        self.k = matrix.shape[-1]
+        self._n = matrix.shape[-1]
+
+        # a stack of matrices, the rows of the value use the matrices
+        # given by `groups`, or one matrix each
+        self._batched = matrix.ndim == 3
+        if self._batched:
+            if groups is None:
+                groups = tt.arange(matrix.shape[0])
+            self.groups = tt.as_tensor_variable(groups)
+            if self.groups.ndim != 1:
+                raise ValueError('groups must be one dimensional.')
+        elif groups is not None:
+            raise ValueError('groups are only used with a stack of matrices.')
+        else:
+            self.groups = None
 
     def _quaddist(self, value):
         """Compute (x - mu).T @ Sigma^-1 @ (x - mu) and the logdet of Sigma."""
@@ -91,52 +106,60 @@ class _QuadFormBase(Continuous):
 
         delta = value - mu
 
-        if self._cov_type == 'cov':
-            # Use this when Theano#5908 is released.
-            # return MvNormalLogp()(self.cov, delta)
-            dist, logdet, ok = self._quaddist_cov(delta)
-        elif self._cov_type == 'tau':
-            dist, logdet, ok = self._quaddist_tau(delta)
+        if self._cov_type == 'tau':
+            matrix = self.tau
+        elif self._cov_type == 'cov':
+            matrix = self.cov
         else:
-            dist, logdet, ok = self._quaddist_chol(delta)
+            matrix = self.chol_cov
+        if self._batched:
+            quaddist, logdet, ok = MvNormalQuadForm(self._cov_type)(
+                matrix, delta, self.groups)[:3]
+            logdet, ok = logdet[self.groups], ok[self.groups]
+        else:
+            quaddist, logdet, ok = MvNormalQuadForm(self._cov_type)(matrix, delta)[:3]
 
         if onedim:
-            return dist[0], logdet, ok
-        return dist, logdet, ok
-
-    def _quaddist_chol(self, delta):
-        chol_cov = self.chol_cov
-        _, k = delta.shape
-        k = pm.floatX(k)
-        diag = tt.nlinalg.diag(chol_cov)
-        # Check if the covariance matrix is positive definite.
-        ok = tt.all(diag > 0)
-        # If not, replace the diagonal. We return -inf later, but
-        # need to prevent solve_lower from throwing an exception.
-        chol_cov = tt.switch(ok, chol_cov, 1)
-
-        delta_trans = self.solve_lower(chol_cov, delta.T).T
-        quaddist = (delta_trans ** 2).sum(axis=-1)
-        logdet = tt.sum(tt.log(diag))
+            if self._batched:
+                return quaddist[0], logdet[0], ok[0]
+            return quaddist[0], logdet, ok
         return quaddist, logdet, ok
 
-    def _quaddist_cov(self, delta):
-        return self._quaddist_chol(delta)
-
-    def _quaddist_tau(self, delta):
-        chol_tau = self.chol_tau
-        _, k = delta.shape
-        k = pm.floatX(k)
-
-        diag = tt.nlinalg.diag(chol_tau)
-        ok = tt.all(diag > 0)
-
-        chol_tau = tt.switch(ok, chol_tau, 1)
-        diag = tt.nlinalg.diag(chol_tau)
-        delta_trans = tt.dot(delta, chol_tau)
-        quaddist = (delta_trans ** 2).sum(axis=-1)
-        logdet = -tt.sum(tt.log(diag))
-        return quaddist, logdet, ok
+    def _random_batched(self, point=None, size=None):
+        """Draw the rows of all groups of a stack of matrices at once."""
+        matrix = {'cov': getattr(self, 'cov', None), 'tau': getattr(self, 'tau', None),
+                  'chol': getattr(self, 'chol_cov', None)}[self._cov_type]
+        mu, matrix, groups = draw_values([self.mu, matrix, self.groups],
+                                         point=point, size=size)
+        if size is None:
+            size = ()
+        elif not isinstance(size, tuple):
+            size = tuple(np.atleast_1d(size))
+        if mu.shape[-1] != matrix.shape[-1]:
+            raise ValueError("Shapes for mu and %s don't match" % self._cov_type)
+        # the factor of the matrix of every row, possibly for every draw
+        if self._cov_type == 'chol':
+            chol = np.tril(matrix)
+        else:
+            try:
+                chol = np.linalg.cholesky(matrix)
+            except np.linalg.LinAlgError:
+                # only the rows of the failing groups are nan
+                chol = np.array([_cholesky_or_nan(m) for m in
+                                 matrix.reshape((-1,) + matrix.shape[-2:])])
+                chol = chol.reshape(matrix.shape)
+        chol = np.take(chol, np.asarray(groups).astype('int64'), axis=-3)
+        shape = np.broadcast(np.empty(mu.shape), np.empty(chol.shape[:-1])).shape
+        if shape[:len(size)] != size:
+            shape = size + shape
+        standard_normal = get_random_state().standard_normal(shape)
+        if self._cov_type == 'tau':
+            # solve chol.T x = z
+            chol_t = np.broadcast_to(np.swapaxes(chol, -1, -2), shape + shape[-1:])
+            transformed = np.linalg.solve(chol_t, standard_normal[..., None])[..., 0]
+        else:
+            transformed = np.einsum('...ij,...j->...i', chol, standard_normal)
+        return mu + transformed
 
     def _repr_cov_params(self, dist=None):
         if dist is None:
@@ -181,6 +204,10 @@ class MvNormal(_QuadFormBase):
         tau, or chol is needed.
     lower : bool, default=True
         Whether chol is the lower tridiagonal cholesky factor.
+    groups : array of ints, optional
+        Index of the matrix of every row of the value, if `cov`, `tau` or
+        `chol` is a stack of matrices of shape `(G, k, k)`. Defaults to
+        one matrix per row.
 
     Examples
     --------
@@ -219,12 +246,17 @@ class MvNormal(_QuadFormBase):
         vals = pm.Deterministic('vals', tt.dot(chol, vals_raw.T).T)
     """
 
+    vectorized_random = True
+
     def __init__(self, mu, cov=None, tau=None, chol=None, lower=True,
-                 *args, **kwargs):
-        super().__init__(mu=mu, cov=cov, tau=tau, chol=chol, lower=lower, *args, **kwargs)
+                 groups=None, *args, **kwargs):
+        super().__init__(mu=mu, cov=cov, tau=tau, chol=chol, lower=lower,
+                         groups=groups, *args, **kwargs)
         self.mean = self.median = self.mode = self.mu = self.mu
 
     def random(self, point=None, size=None):
+        if self._batched:
+            return self._random_batched(point=point, size=size)
         if size is None:
             size = tuple()
         else:
@@ -245,7 +277,7 @@ class MvNormal(_QuadFormBase):
             except ValueError:
                 size += (mu.shape[-1],)
                 return np.nan * np.zeros(size)
-            return dist.rvs(size)
+            return dist.rvs(size, random_state=get_random_state())
         elif self._cov_type == 'chol':
             mu, chol = draw_values([self.mu, self.chol_cov],
                                    point=point, size=size)
@@ -266,7 +298,7 @@ class MvNormal(_QuadFormBase):
                 std_norm_shape = size + mu.shape
             else:
                 std_norm_shape = mu.shape
-            standard_normal = np.random.standard_normal(std_norm_shape)
+            standard_normal = get_random_state().standard_normal(std_norm_shape)
             return mu + np.einsum('...ij,...j->...i', chol, standard_normal)
         else:
             mu, tau = draw_values([self.mu, self.tau], point=point, size=size)
@@ -279,7 +311,7 @@ class MvNormal(_QuadFormBase):
             except linalg.LinAlgError:
                 return np.nan * np.zeros(size)
 
-            standard_normal = np.random.standard_normal(size)
+            standard_normal = get_random_state().standard_normal(size)
             transformed = linalg.solve_triangular(
                 chol, standard_normal.T, lower=True)
             return mu + transformed.T
@@ -339,34 +371,44 @@ class MvStudentT(_QuadFormBase):
         The cholesky factor of the covariance matrix.
     lower : bool, default=True
         Whether the cholesky fatcor is given as a lower triangular matrix.
+    groups : array of ints, optional
+        Index of the matrix of every row of the value, if `cov`, `tau` or
+        `chol` is a stack of matrices of shape `(G, k, k)`. Defaults to
+        one matrix per row.
     """
 
+    vectorized_random = True
+
     def __init__(self, nu, Sigma=None, mu=None, cov=None, tau=None, chol=None,
-                 lower=True, *args, **kwargs):
+                 lower=True, groups=None, *args, **kwargs):
         if Sigma is not None:
             if cov is not None:
                 raise ValueError('Specify only one of cov and Sigma')
             cov = Sigma
-        super().__init__(mu=mu, cov=cov, tau=tau, chol=chol, lower=lower, *args, **kwargs)
+        super().__init__(mu=mu, cov=cov, tau=tau, chol=chol, lower=lower,
+                         groups=groups, *args, **kwargs)
         self.nu = nu = tt.as_tensor_variable(nu)
         self.mean = self.median = self.mode = self.mu = self.mu
 
     def random(self, point=None, size=None):
         with _DrawValuesContext():
             nu, mu = draw_values([self.nu, self.mu], point=point, size=size)
+            groups = None
+            if self._batched:
+                groups, = draw_values([self.groups], point=point, size=size)
             if self._cov_type == 'cov':
                 cov, = draw_values([self.cov], point=point, size=size)
-                dist = MvNormal.dist(mu=np.zeros_like(mu), cov=cov)
+                dist = MvNormal.dist(mu=np.zeros_like(mu), cov=cov, groups=groups)
             elif self._cov_type == 'tau':
                 tau, = draw_values([self.tau], point=point, size=size)
-                dist = MvNormal.dist(mu=np.zeros_like(mu), tau=tau)
+                dist = MvNormal.dist(mu=np.zeros_like(mu), tau=tau, groups=groups)
             else:
                 chol, = draw_values([self.chol_cov], point=point, size=size)
-                dist = MvNormal.dist(mu=np.zeros_like(mu), chol=chol)
+                dist = MvNormal.dist(mu=np.zeros_like(mu), chol=chol, groups=groups)
 
             samples = dist.random(point, size)
 
-        chi2 = np.random.chisquare
+        chi2 = get_random_state().chisquare
         return (np.sqrt(nu) * samples.T / chi2(nu, size)).T + mu
 
     def logp(self, value):
@@ -416,6 +458,8 @@ class Dirichlet(Continuous):
         Concentration parameters (a > 0).
     """
 
+    vectorized_random = True
+
     def __init__(self, a, transform=transforms.stick_breaking,
                  *args, **kwargs):
         shape = np.atleast_1d(a.shape)[-1]
@@ -480,6 +524,30 @@ class Dirichlet(Continuous):
                                                 get_variable_name(a))
 
 
+def _batched_multinomial(n, p, size):
+    """Draw `size` multinomial samples for each row of `p` with the numbers
+    of trials `n`, with shape `(size,) + p.shape`.
+
+    The counts of the categories are drawn one after the other from their
+    binomial distributions conditional on the previous counts, for all
+    samples and rows at once.
+    """
+    random_state = get_random_state()
+    batch_shape = (size,) + p.shape[:-1]
+    remaining = np.array(np.broadcast_to(n, batch_shape), dtype='int64')
+    # the probability mass of the categories that were not drawn yet
+    mass = np.ones(p.shape[:-1])
+    out = np.empty(batch_shape + p.shape[-1:], dtype='int64')
+    for j in range(p.shape[-1] - 1):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            prob = np.where(mass > 0, p[..., j] / mass, 1.)
+        out[..., j] = random_state.binomial(remaining, np.clip(prob, 0., 1.))
+        remaining -= out[..., j]
+        mass = mass - p[..., j]
+    out[..., -1] = remaining
+    return out
+
+
 class Multinomial(Discrete):
     R"""
     Multinomial log-likelihood.
@@ -513,6 +581,8 @@ class Multinomial(Discrete):
         automatically rescaled otherwise.
     """
 
+    vectorized_random = True
+
     def __init__(self, n, p, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -560,12 +630,12 @@ class Multinomial(Discrete):
                     size = None
                 elif size[-len(p.shape):] == p.shape:
                     size = size[:len(size) - len(p.shape)]
-            randnum = np.random.multinomial(n, p, size=size)
+            randnum = get_random_state().multinomial(n, p, size=size)
             return randnum.astype(original_dtype)
         # The shapes of `p` and `n` must be broadcasted by hand depending on
         # their ndim. We will assume that the last axis of the `p` array will
-        # be the sequence to feed into np.random.multinomial. The other axis
-        # will only have to be iterated over.
+        # be the sequence of category probabilities. The other axis are batch
+        # dimensions.
         if n.ndim == p.ndim:
             # p and n have the same ndim, so n.shape[-1] must be 1
             if n.shape[-1] != 1:
@@ -622,13 +692,7 @@ class Multinomial(Discrete):
         n = np.reshape(n, (np.prod(n_p_shape), -1))
         # We renormalize p
         p = p / p.sum(axis=1, keepdims=True)
-        # We iterate calls to np.random.multinomial
-        randnum = np.asarray([
-            np.random.multinomial(nn, pp, size=_size)
-            for (nn, pp) in zip(n, p)
-        ])
-        # We swap the iteration axis with the _size axis
-        randnum = np.moveaxis(randnum, 1, 0)
+        randnum = _batched_multinomial(n[:, 0], p, int(_size))
         # We reshape the random numbers to the corresponding size + p_shape
         if size is None:
             randnum = np.reshape(randnum, p_shape)
@@ -1012,6 +1076,9 @@ class LKJCholeskyCov(Continuous):
        determinant, URL (version: 2012-04-14):
        http://math.stackexchange.com/q/130026
     """
+
+    vectorized_random = True
+
     def __init__(self, eta, n, sd_dist, *args, **kwargs):
         self.n = n
         self.eta = eta
@@ -1073,14 +1140,18 @@ class LKJCholeskyCov(Continuous):
         # original implementation in R see:
         # https://github.com/rmcelreath/rethinking/blob/master/R/distributions.r
         beta = eta - 1. + n/2.
-        r12 = 2. * stats.beta.rvs(a=beta, b=beta, size=eta_sample_shape) - 1.
+        random_state = get_random_state()
+        r12 = 2. * stats.beta.rvs(a=beta, b=beta, size=eta_sample_shape,
+                                  random_state=random_state) - 1.
         P[..., 0, 1] = r12
         P[..., 1, 1] = np.sqrt(1. - r12**2)
         for mp1 in range(2, n):
             beta -= 0.5
-            y = stats.beta.rvs(a=mp1 / 2., b=beta, size=eta_sample_shape)
-            z = stats.norm.rvs(loc=0, scale=1, size=eta_sample_shape + (mp1,))
-            z = z / np.sqrt(np.einsum('ij,ij->j', z, z))
+            y = stats.beta.rvs(a=mp1 / 2., b=beta, size=eta_sample_shape,
+                               random_state=random_state)
+            z = stats.norm.rvs(loc=0, scale=1, size=eta_sample_shape + (mp1,),
+                               random_state=random_state)
+            z = z / np.sqrt(np.sum(z ** 2, axis=-1, keepdims=True))
             P[..., 0:mp1, mp1] = np.sqrt(y[..., np.newaxis]) * z
             P[..., mp1, mp1] = np.sqrt(1. - y)
         C = np.einsum('...ji,...jk->...ik', P, P)
@@ -1194,6 +1265,8 @@ class LKJCorr(Continuous):
         100(9), pp.1989-2001.
     """
 
+    vectorized_random = True
+
     def __init__(self, eta=None, n=None, p=None, transform='interval', *args, **kwargs):
         if (p is not None) and (n is not None) and (eta is None):
             warnings.warn('Parameters to LKJCorr have changed: shape parameter n -> eta '
@@ -1230,14 +1303,18 @@ class LKJCorr(Continuous):
         # original implementation in R see:
         # https://github.com/rmcelreath/rethinking/blob/master/R/distributions.r
         beta = eta - 1. + n/2.
-        r12 = 2. * stats.beta.rvs(a=beta, b=beta, size=size) - 1.
+        random_state = get_random_state()
+        r12 = 2. * stats.beta.rvs(a=beta, b=beta, size=size,
+                                  random_state=random_state) - 1.
         P = np.eye(n)[:, :, np.newaxis] * np.ones(size)
         P[0, 1] = r12
         P[1, 1] = np.sqrt(1. - r12**2)
         for mp1 in range(2, n):
             beta -= 0.5
-            y = stats.beta.rvs(a=mp1 / 2., b=beta, size=size)
-            z = stats.norm.rvs(loc=0, scale=1, size=(mp1, ) + size)
+            y = stats.beta.rvs(a=mp1 / 2., b=beta, size=size,
+                               random_state=random_state)
+            z = stats.norm.rvs(loc=0, scale=1, size=(mp1, ) + size,
+                               random_state=random_state)
             z = z / np.sqrt(np.einsum('ij,ij->j', z, z))
             P[0:mp1, mp1] = np.sqrt(y) * z
             P[mp1, mp1] = np.sqrt(1. - y)
@@ -1358,6 +1435,8 @@ class MatrixNormal(Continuous):
                                    observed=data, shape=(m, n))
     """
 
+    vectorized_random = True
+
     def __init__(self, mu=0, rowcov=None, rowchol=None, rowtau=None,
                  colcov=None, colchol=None, coltau=None, shape=None, *args,
                  **kwargs):
@@ -1434,28 +1513,25 @@ class MatrixNormal(Continuous):
             self.colchol_cov = tt.as_tensor_variable(colchol)
 
     def random(self, point=None, size=None):
+        # the Cholesky factors of the covariance matrices are computed from
+        # all their samples at once
+        colchol = self.colcov if self._colcov_type == 'cov' else self.colchol_cov
+        rowchol = self.rowcov if self._rowcov_type == 'cov' else self.rowchol_cov
         mu, colchol, rowchol = draw_values(
-                                [self.mu, self.colchol_cov, self.rowchol_cov],
+                                [self.mu, colchol, rowchol],
                                 point=point,
                                 size=size)
-        if size is None:
-            size = ()
-        if size in (None, ()):
-            standard_normal = np.random.standard_normal((self.shape[0], colchol.shape[-1]))
-            samples = mu + np.matmul(rowchol, np.matmul(standard_normal, colchol.T))
-        else:
-            samples = []
-            size = tuple(np.atleast_1d(size))
-            if mu.shape == tuple(self.shape):
-                for _ in range(np.prod(size)):
-                    standard_normal = np.random.standard_normal((self.shape[0], colchol.shape[-1]))
-                    samples.append(mu + np.matmul(rowchol, np.matmul(standard_normal, colchol.T)))
-            else:
-                for j in range(np.prod(size)):
-                    standard_normal = np.random.standard_normal((self.shape[0], colchol[j].shape[-1]))
-                    samples.append(mu[j] +
-                                np.matmul(rowchol[j], np.matmul(standard_normal, colchol[j].T)))
-            samples = np.array(samples).reshape(size + tuple(self.shape))
+        if self._colcov_type == 'cov':
+            colchol = np.linalg.cholesky(colchol)
+        if self._rowcov_type == 'cov':
+            rowchol = np.linalg.cholesky(rowchol)
+        size = () if size is None else tuple(np.atleast_1d(size))
+        # the parameters may have a leading axis of samples, matmul
+        # broadcasts the matrix products over it
+        standard_normal = get_random_state().standard_normal(
+            size + (self.shape[0], colchol.shape[-1]))
+        samples = mu + np.matmul(rowchol, np.matmul(standard_normal,
+                                                    np.swapaxes(colchol, -1, -2)))
         return samples
 
 
@@ -1489,6 +1565,42 @@ class MatrixNormal(Continuous):
         return norm - 0.5*trquaddist - m*half_collogdet - n*half_rowlogdet
 
 
+def _kron_dot_samples(matrices, samples, n_batch):
+    """Multiply the samples, with shape `batch + (n_1, ..., n_D)`, by the
+    Kronecker product of the D square matrices without forming it.
+
+    The d-th matrix acts on the axis of length n_d. The matrices may have
+    the leading `batch` axes of the samples, e.g. if they were drawn with a
+    `size`.
+    """
+    n_factors = len(matrices)
+    for axis, matrix in enumerate(matrices, n_batch):
+        if matrix.ndim == 2:
+            samples = np.tensordot(samples, matrix, axes=(axis, 1))
+        else:
+            # line up the batch axes of the matrix with the ones of the
+            # samples, which have the other factor axes in between
+            matrix = np.reshape(matrix, matrix.shape[:-2] +
+                                (1,) * (n_factors - 1) + matrix.shape[-2:])
+            samples = np.einsum('...ij,...j->...i', matrix,
+                                np.moveaxis(samples, axis, -1))
+        samples = np.moveaxis(samples, -1, axis)
+    return samples
+
+
+def _kron_diag_samples(diags):
+    """Diagonal of the Kronecker product of diagonal matrices, with the
+    shape `batch + (n_1, ..., n_D)`, where the diagonals may have leading
+    `batch` axes."""
+    n_factors = len(diags)
+    out = 1.
+    for axis, diag in enumerate(diags):
+        out = out * np.reshape(diag, np.shape(diag)[:-1] + (1,) * axis +
+                               np.shape(diag)[-1:] +
+                               (1,) * (n_factors - 1 - axis))
+    return out
+
+
 class KroneckerNormal(Continuous):
     R"""
     Multivariate normal log-likelihood with Kronecker-structured covariance.
@@ -1578,6 +1690,8 @@ class KroneckerNormal(Continuous):
     .. [1] Saatchi, Y. (2011). "Scalable inference for structured Gaussian process models"
     """
 
+    vectorized_random = True
+
     def __init__(self, mu, covs=None, chols=None, evds=None, sigma=None,
                  *args, **kwargs):
         self._setup(covs, chols, evds, sigma)
@@ -1610,13 +1724,13 @@ class KroneckerNormal(Continuous):
                 self.N = tt.prod(self.sizes)
         elif chols is not None:
             self._cov_type = 'chol'
+            self.chols = chols
             if self.is_noisy:  # A strange case...
                 # Noise requires eigendecomposition
                 covs = [tt.dot(chol, chol.T) for chol in chols]
                 eigh_map = map(eigh, covs)
                 self._setup_evd(eigh_map)
             else:
-                self.chols = chols
                 self.chol_diags = list(map(tt.nlinalg.diag, self.chols))
                 self.sizes = tt.as_tensor_variable(
                                 [chol.shape[0] for chol in self.chols])
@@ -1637,41 +1751,66 @@ class KroneckerNormal(Continuous):
             self.eigs += self.sigma**2
         self.N = self.eigs.shape[0]
 
-    def _setup_random(self):
-        if not hasattr(self, 'mv_params'):
-            self.mv_params = {'mu': self.mu}
-            if self._cov_type == 'cov':
-                cov = kronecker(*self.covs)
-                if self.is_noisy:
-                    cov = cov + self.sigma**2 * tt.identity_like(cov)
-                self.mv_params['cov'] = cov
-            elif self._cov_type == 'chol':
-                if self.is_noisy:
-                    covs = []
-                    for eig, Q in zip(self.eigs_sep, self.Qs):
-                        cov_i = tt.dot(Q, tt.dot(tt.diag(eig), Q.T))
-                        covs.append(cov_i)
-                    cov = kronecker(*covs)
-                    if self.is_noisy:
-                        cov = cov + self.sigma**2 * tt.identity_like(cov)
-                    self.mv_params['chol'] = self.cholesky(cov)
-                else:
-                    self.mv_params['chol'] = kronecker(*self.chols)
-            elif self._cov_type == 'evd':
-                covs = []
-                for eig, Q in zip(self.eigs_sep, self.Qs):
-                    cov_i = tt.dot(Q, tt.dot(tt.diag(eig), Q.T))
-                    covs.append(cov_i)
-                cov = kronecker(*covs)
-                if self.is_noisy:
-                    cov = cov + self.sigma**2 * tt.identity_like(cov)
-                self.mv_params['cov'] = cov
-
     def random(self, point=None, size=None):
-        # Expand params into terms MvNormal can understand to force consistency
-        self._setup_random()
-        dist = MvNormal.dist(**self.mv_params)
-        return dist.random(point, size)
+        """
+        Draw random values from Kronecker normal distribution.
+
+        The standard normal samples are multiplied by the square roots of
+        the covariance matrices of the factors one axis at a time, the dense
+        covariance matrix is never formed.
+
+        Parameters
+        ----------
+        point : dict, optional
+            Dict of variable values on which random values are to be
+            conditioned (uses default point if not specified).
+        size : int, optional
+            Desired size of random sample (returns one sample if not
+            specified).
+
+        Returns
+        -------
+        array
+        """
+        if self._cov_type == 'evd':
+            matrices = self.Qs
+        elif self._cov_type == 'chol':
+            matrices = self.chols
+        else:
+            matrices = self.covs
+        n_factors = len(matrices)
+        params = [self.mu] + list(matrices)
+        if self._cov_type == 'evd':
+            params.extend(self.eigs_sep)
+        if self.is_noisy:
+            params.append(self.sigma)
+        values = draw_values(params, point=point, size=size)
+        mu, matrices = values[0], values[1:1 + n_factors]
+        size = () if size is None else tuple(np.atleast_1d(size))
+
+        eigs = None
+        if self._cov_type == 'evd':
+            eigs = values[1 + n_factors:1 + 2 * n_factors]
+        elif self.is_noisy:
+            # noise requires eigendecompositions, as in the logp
+            if self._cov_type == 'chol':
+                matrices = [np.matmul(chol, np.swapaxes(chol, -1, -2))
+                            for chol in matrices]
+            eigs, matrices = zip(*map(np.linalg.eigh, matrices))
+        elif self._cov_type == 'cov':
+            matrices = list(map(np.linalg.cholesky, matrices))
+
+        shape = tuple(matrix.shape[-1] for matrix in matrices)
+        samples = get_random_state().standard_normal(size + shape)
+        if eigs is not None:
+            variance = _kron_diag_samples(eigs)
+            if self.is_noisy:
+                sigma = values[-1]
+                variance = variance + np.reshape(
+                    sigma, np.shape(sigma) + (1,) * n_factors)**2
+            samples = samples * np.sqrt(variance)
+        samples = _kron_dot_samples(matrices, samples, len(size))
+        return mu + np.reshape(samples, size + (-1,))
 
     def _quaddist(self, value):
         """Computes the quadratic (x-mu)^T @ K^-1 @ (x-mu) and log(det(K))"""
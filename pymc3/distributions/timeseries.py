@@ -1,10 +1,12 @@
+import numpy as np
 import theano.tensor as tt
-from theano import scan
 
 from pymc3.util import get_variable_name
 from .continuous import get_tau_sigma, Normal, Flat
+from .dist_math import linear_recurrence, kalman_filter, _kalman_filter
 from . import multivariate
 from . import distribution
+from .distribution import draw_values, get_random_state
 
 
 __all__ = [
@@ -14,7 +16,8 @@ __all__ = [
     'GARCH11',
     'EulerMaruyama',
     'MvGaussianRandomWalk',
-    'MvStudentTRandomWalk'
+    'MvStudentTRandomWalk',
+    'LinearGaussianStateSpace'
 ]
 
 
@@ -228,16 +231,12 @@ class GARCH11(distribution.Continuous):
 
     def get_volatility(self, x):
         x = x[:-1]
-
-        def volatility_update(x, vol, w, a, b):
-            return tt.sqrt(w + a * tt.square(x) + b * tt.square(vol))
-
-        vol, _ = scan(fn=volatility_update,
-                      sequences=[x],
-                      outputs_info=[self.initial_vol],
-                      non_sequences=[self.omega, self.alpha_1,
-                                     self.beta_1])
-        return tt.concatenate([[self.initial_vol], vol])
+        # the variance is a linear recurrence,
+        # sigma_t^2 = (omega + alpha_1 * y_{t-1}^2) + beta_1 * sigma_{t-1}^2
+        innov = self.omega + self.alpha_1 * tt.square(x)
+        coef = tt.ones_like(innov) * self.beta_1
+        var = linear_recurrence(tt.square(self.initial_vol), coef, innov)
+        return tt.concatenate([[self.initial_vol], tt.sqrt(var)])
 
     def logp(self, x):
         vol = self.get_volatility(x)
@@ -375,3 +374,187 @@ class MvStudentTRandomWalk(MvGaussianRandomWalk):
                                                 get_variable_name(nu),
                                                 get_variable_name(mu),
                                                 get_variable_name(cov))
+
+
+class LinearGaussianStateSpace(distribution.Continuous):
+    R"""
+    Linear Gaussian state space model, with the states marginalized by a
+    Kalman filter.
+
+    .. math::
+
+        x_0 \sim N(\mu_0, P_0)
+
+        x_t = F x_{t-1} + w_t, \quad w_t \sim N(0, Q)
+
+        y_t = H x_t + v_t, \quad v_t \sim N(0, R)
+
+    The distribution is the one of the observations :math:`y_t`. The log-
+    probability of a series of length T is computed in O(T) by a Kalman
+    filter and its gradient by one backward pass, so that only the system
+    matrices have to be sampled, not the d-dimensional states. The states
+    can be drawn afterwards with :meth:`sample_states`.
+
+    Parameters
+    ----------
+    transition : tensor
+        Transition matrix F of the states, of shape (d, d).
+    state_cov : tensor
+        Covariance matrix Q of the state innovations, of shape (d, d).
+    design : tensor
+        Observation matrix H, of shape (k, d).
+    obs_cov : tensor
+        Covariance matrix R of the observation noise, of shape (k, k).
+    init_mu : tensor
+        Mean of the initial state, of shape (d,).
+    init_cov : tensor
+        Covariance matrix of the initial state, of shape (d, d).
+
+    Notes
+    -----
+    The shape of the distribution is (T, k), or (T,) if k is 1, and must
+    be given, also for observed variables. The covariance matrices must be
+    symmetric. Q and the initial covariance
+    may be singular, the covariance of the one step ahead predictions of
+    the observations must be positive definite.
+    """
+
+    vectorized_random = True
+
+    def __init__(self, transition, state_cov, design, obs_cov, init_mu,
+                 init_cov, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if len(self.shape) not in (1, 2):
+            raise ValueError('The shape (T,) or (T, k) of the observations '
+                             'must be given, got shape {}.'.format(self.shape))
+        self.transition = tt.as_tensor_variable(transition)
+        self.state_cov = tt.as_tensor_variable(state_cov)
+        self.design = tt.as_tensor_variable(design)
+        self.obs_cov = tt.as_tensor_variable(obs_cov)
+        self.init_mu = tt.as_tensor_variable(init_mu)
+        self.init_cov = tt.as_tensor_variable(init_cov)
+        self.mean = tt.as_tensor_variable(0.)
+
+    def _system(self, point=None, size=None):
+        return draw_values([self.transition, self.state_cov, self.design,
+                            self.obs_cov, self.init_mu, self.init_cov],
+                           point=point, size=size)
+
+    def random(self, point=None, size=None):
+        """
+        Draw random values from the state space model.
+
+        The states and observations of all samples are simulated together,
+        one time step after the other.
+
+        Parameters
+        ----------
+        point : dict, optional
+            Dict of variable values on which random values are to be
+            conditioned (uses default point if not specified).
+        size : int, optional
+            Desired size of random sample (returns one sample if not
+            specified).
+
+        Returns
+        -------
+        array
+        """
+        F, Q, H, R, m0, P0 = self._system(point=point, size=size)
+        size = () if size is None else tuple(np.atleast_1d(size))
+        random_state = get_random_state()
+        sqrt_Q, sqrt_R, sqrt_P0 = map(_psd_sqrt, (Q, R, P0))
+        d, k = F.shape[-1], H.shape[-2]
+        n_steps = self.shape[0]
+
+        def noise(sqrt_cov, n):
+            return _matvec(sqrt_cov, random_state.standard_normal(size + (n,)))
+
+        x = m0 + noise(sqrt_P0, d)
+        samples = np.empty(size + (n_steps, k))
+        for t in range(n_steps):
+            if t:
+                x = _matvec(F, x) + noise(sqrt_Q, d)
+            samples[..., t, :] = _matvec(H, x) + noise(sqrt_R, k)
+        return samples.reshape(size + tuple(self.shape))
+
+    def sample_states(self, value, point=None, size=None):
+        """
+        Draw the states from their distribution given the observations.
+
+        This is the forward filtering backward sampling simulation smoother,
+        the Kalman filter runs once and all samples are drawn together in
+        the backward pass.
+
+        Parameters
+        ----------
+        value : array
+            Observations, with the shape of the distribution.
+        point : dict, optional
+            Dict of variable values of the system matrices (uses default
+            point if not specified).
+        size : int, optional
+            Desired size of random sample (returns one sample if not
+            specified).
+
+        Returns
+        -------
+        array
+            The states, of shape `size + (T, d)`.
+        """
+        F, Q, H, R, m0, P0 = (np.asarray(v, dtype='float64')
+                              for v in self._system(point=point))
+        value = np.asarray(value, dtype='float64')
+        filt = _kalman_filter(value.reshape(len(value), -1), F, Q, H, R, m0, P0)
+        if not np.all(np.isfinite(filt.logp)):
+            raise ValueError('The covariance of the predicted observations '
+                             'is not positive definite.')
+        size = () if size is None else tuple(np.atleast_1d(size))
+        random_state = get_random_state()
+        n_steps, d = filt.filt_mean.shape
+
+        def draw(mean, cov):
+            z = random_state.standard_normal(size + (d,))
+            return mean + z.dot(_psd_sqrt(cov).T)
+
+        states = np.empty(size + (n_steps, d))
+        states[..., -1, :] = x = draw(filt.filt_mean[-1], filt.filt_cov[-1])
+        for t in range(n_steps - 2, -1, -1):
+            m, P = filt.filt_mean[t], filt.filt_cov[t]
+            # smoother gain P F^T P_pred^-1 of the next prediction
+            gain = P.dot(F.T).dot(np.linalg.pinv(filt.pred_cov[t + 1]))
+            mean = m + (x - filt.pred_mean[t + 1]).dot(gain.T)
+            cov = P - gain.dot(F).dot(P)
+            states[..., t, :] = x = draw(mean, (cov + cov.T) / 2)
+        return states
+
+    def logp(self, value):
+        if value.ndim == 1:
+            value = value.dimshuffle(0, 'x')
+        logp = kalman_filter(value, self.transition, self.state_cov,
+                             self.design, self.obs_cov, self.init_mu,
+                             self.init_cov)[0]
+        return tt.sum(logp)
+
+    def _repr_latex_(self, name=None, dist=None):
+        if dist is None:
+            dist = self
+        transition = dist.transition
+        design = dist.design
+        name = r'\text{%s}' % name
+        return r'${} \sim \text{{LinearGaussianStateSpace}}(\mathit{{transition}}={},~\mathit{{design}}={})$'.format(
+            name,
+            get_variable_name(transition),
+            get_variable_name(design))
+
+
+def _matvec(matrix, vector):
+    """Products of stacks of matrices and vectors."""
+    return np.matmul(matrix, vector[..., None])[..., 0]
+
+
+def _psd_sqrt(cov):
+    """Square roots `L` of stacks of positive semi-definite matrices, with
+    `L L^T = cov` also for singular matrices."""
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    return eigvecs * np.sqrt(np.clip(eigvals, 0, None))[..., None, :]
@@ -1,4 +1,4 @@
 from . import cov
 from . import mean
 from . import util
-from .gp import Latent, Marginal, MarginalSparse, TP, LatentKron, MarginalKron
+from .gp import Latent, Marginal, MarginalSparse, TP, LatentKron, MarginalKron, HSGP, MarginalCG
@@ -1,6 +1,7 @@
 import numpy as np
 import theano.tensor as tt
 from functools import reduce
+from scipy.special import gamma
 from operator import mul, add
 
 __all__ = ['Constant',
@@ -35,6 +36,9 @@ class Covariance:
         function operates on.
     """
 
+    # whether k(x, x') only depends on x - x'
+    stationary = False
+
     def __init__(self, input_dim, active_dims=None):
         self.input_dim = input_dim
         if active_dims is None:
@@ -66,6 +70,18 @@ class Covariance:
     def full(self, X, Xs):
         raise NotImplementedError
 
+    def power_spectral_density(self, omega):
+        R"""
+        Evaluate the power spectral density of a stationary kernel, the
+        Fourier transform of :math:`k(x - x')`.
+
+        Parameters
+        ----------
+        omega : The angular frequencies, with shape `(m, input_dim)`.
+        """
+        raise NotImplementedError(
+            "{} has no spectral density".format(self.__class__.__name__))
+
     def _slice(self, X, Xs):
         X = tt.as_tensor_variable(X[:, self.active_dims])
         if Xs is not None:
@@ -113,6 +129,13 @@ class Combination(Covariance):
             else:
                 self.factor_list.append(factor)
 
+    @property
+    def stationary(self):
+        # constants are only allowed as scalars, not as matrices
+        return all(factor.stationary if isinstance(factor, Covariance)
+                   else getattr(factor, 'ndim', np.ndim(factor)) == 0
+                   for factor in self.factor_list)
+
     def merge_factors(self, X, Xs=None, diag=False):
         factor_list = []
         for factor in self.factor_list:
@@ -140,11 +163,29 @@ class Add(Combination):
     def __call__(self, X, Xs=None, diag=False):
         return reduce(add, self.merge_factors(X, Xs, diag))
 
+    def power_spectral_density(self, omega):
+        if not all(isinstance(factor, Covariance) for factor in self.factor_list):
+            raise NotImplementedError(
+                "The spectral density of a sum with constants is not a function")
+        return reduce(add, [factor.power_spectral_density(omega)
+                            for factor in self.factor_list])
+
 
 class Prod(Combination):
     def __call__(self, X, Xs=None, diag=False):
         return reduce(mul, self.merge_factors(X, Xs, diag))
 
+    def power_spectral_density(self, omega):
+        covs = [factor for factor in self.factor_list
+                if isinstance(factor, Covariance)]
+        scales = [factor for factor in self.factor_list
+                  if not isinstance(factor, Covariance)]
+        if len(covs) != 1 or any(np.ndim(scale) > 0 for scale in scales):
+            raise NotImplementedError(
+                "Spectral densities are only available for the product "
+                "of one covariance function and scalars")
+        return reduce(mul, scales, covs[0].power_spectral_density(omega))
+
 
 class Kron(Covariance):
     R"""Form a covariance object that is the kronecker product of other covariances.
@@ -193,6 +234,8 @@ class Constant(Covariance):
        k(x, x') = c
     """
 
+    stationary = True
+
     def __init__(self, c):
         super().__init__(1, None)
         self.c = c
@@ -216,6 +259,8 @@ class WhiteNoise(Covariance):
        k(x, x') = \sigma^2 \mathrm{I}
     """
 
+    stationary = True
+
     def __init__(self, sigma):
         super().__init__(1, None)
         self.sigma = sigma
@@ -241,6 +286,8 @@ class Stationary(Covariance):
     ls_inv : Inverse lengthscale.  1 / ls.  One of ls or ls_inv must be provided.
     """
 
+    stationary = True
+
     def __init__(self, input_dim, ls=None, ls_inv=None, active_dims=None):
         super().__init__(input_dim, active_dims)
         if (ls is None and ls_inv is None) or (ls is not None and ls_inv is not None):
@@ -269,6 +316,21 @@ class Stationary(Covariance):
         r2 = self.square_dist(X, Xs)
         return tt.sqrt(r2 + 1e-12)
 
+    def _scaled_frequencies(self, omega):
+        """The product of all lengthscales and the squared norms of the
+        frequencies in units of the lengthscales."""
+        ls = self.ls * tt.ones(self.input_dim)
+        return tt.prod(ls), tt.sum(tt.square(omega * ls), 1)
+
+    def _matern_power_spectral_density(self, omega, nu):
+        # Rasmussen & Williams (2006), eq. 4.15, with one lengthscale per
+        # dimension
+        D = self.input_dim
+        c = (2.0 ** D * np.pi ** (D / 2.0) * gamma(nu + D / 2.0)
+             * (2.0 * nu) ** nu / gamma(nu))
+        ls_prod, w2 = self._scaled_frequencies(omega)
+        return c * ls_prod * tt.power(2.0 * nu + w2, -(nu + D / 2.0))
+
     def diag(self, X):
         return tt.alloc(1.0, X.shape[0])
 
@@ -312,6 +374,11 @@ class ExpQuad(Stationary):
         X, Xs = self._slice(X, Xs)
         return tt.exp(-0.5 * self.square_dist(X, Xs))
 
+    def power_spectral_density(self, omega):
+        D = self.input_dim
+        ls_prod, w2 = self._scaled_frequencies(omega)
+        return (2.0 * np.pi) ** (D / 2.0) * ls_prod * tt.exp(-0.5 * w2)
+
 
 class RatQuad(Stationary):
     R"""
@@ -349,6 +416,9 @@ class Matern52(Stationary):
         return ((1.0 + np.sqrt(5.0) * r + 5.0 / 3.0 * tt.square(r))
                 * tt.exp(-1.0 * np.sqrt(5.0) * r))
 
+    def power_spectral_density(self, omega):
+        return self._matern_power_spectral_density(omega, 2.5)
+
 
 class Matern32(Stationary):
     R"""
@@ -365,6 +435,9 @@ class Matern32(Stationary):
         r = self.euclidean_dist(X, Xs)
         return (1.0 + np.sqrt(3.0) * r) * tt.exp(-np.sqrt(3.0) * r)
 
+    def power_spectral_density(self, omega):
+        return self._matern_power_spectral_density(omega, 1.5)
+
 
 class Exponential(Stationary):
     R"""
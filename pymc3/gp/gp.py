@@ -2,19 +2,57 @@ import functools
 import warnings
 
 import numpy as np
+import theano
 import theano.tensor as tt
 
 import pymc3 as pm
 from pymc3.gp.cov import Covariance, Constant
 from pymc3.gp.mean import Zero
 from pymc3.gp.util import (conditioned_vars, infer_shape,
-                           stabilize, cholesky, solve_lower, solve_upper)
-from pymc3.distributions import draw_values
+                           stabilize, cholesky, solve_lower, solve_upper,
+                           cg_marginal_logp, toeplitz_column)
+from pymc3.distributions import draw_values, get_random_state
+from pymc3.memoize import Cache
+from pymc3.theanof import inputvars
 from theano.tensor.nlinalg import eigh
 from ..math import (cartesian, kron_dot, kron_diag,
-                    kron_solve_lower, kron_solve_upper)
+                    kron_solve_lower, kron_solve_upper,
+                    toeplitz_cholesky, toeplitz_logdet, toeplitz_solve,
+                    _toeplitz_cholesky)
 
-__all__ = ['Latent', 'Marginal', 'TP', 'MarginalSparse', 'LatentKron', 'MarginalKron']
+__all__ = ['Latent', 'Marginal', 'TP', 'MarginalSparse', 'LatentKron', 'MarginalKron',
+           'HSGP', 'MarginalCG']
+
+
+# The Toeplitz algorithms loop in Python over the rows, LAPACK is faster
+# for smaller matrices.
+_TOEPLITZ_MIN_SIZE = 512
+
+
+def _toeplitz_min_size(toeplitz):
+    """Minimal size of a Toeplitz covariance matrix for which the Toeplitz
+    algorithms are used.  `toeplitz` is None for the default threshold."""
+    if toeplitz is None:
+        return _TOEPLITZ_MIN_SIZE
+    return 0 if toeplitz else np.inf
+
+
+def _stable_cholesky(cov_func, X):
+    """Cholesky factor of `stabilize(cov_func(X))`, by the Schur algorithm
+    in O(n^2) if it is a large Toeplitz matrix."""
+    c = toeplitz_column(cov_func, X, jitter=1e-6, min_size=_TOEPLITZ_MIN_SIZE)
+    if c is None:
+        return cholesky(stabilize(cov_func(X)))
+    return toeplitz_cholesky(c)
+
+
+def _toeplitz_random(mu, c, point=None, size=None):
+    """Draw from a multivariate normal with a Toeplitz covariance matrix
+    with first column `c`."""
+    mu, c = draw_values([mu, c], point=point)
+    L, _ = _toeplitz_cholesky(c)
+    size = () if size is None else tuple(np.atleast_1d(size))
+    return mu + np.dot(get_random_state().normal(size=size + mu.shape), L.T)
 
 
 class Base:
@@ -46,6 +84,56 @@ class Base:
     def predict(self, Xnew, point=None, given=None, diag=False):
         raise NotImplementedError
 
+    def _predict_trace(self, Xnew, trace, factors, build_predict,
+                       chunksize, model):
+        """Predictive means and variances at `Xnew` for every point of `trace`.
+
+        `factors` are the symbolic terms that only depend on the training
+        data and the hyperparameters, e.g. a Cholesky factor. They are
+        computed once per distinct value of the variables they depend on.
+        `build_predict(Xs, *factors)` returns the symbolic mean and variance
+        at the rows `Xs`, it is evaluated for chunks of `chunksize` rows.
+        """
+        model = pm.modelcontext(model)
+        Xnew = pm.floatX(np.asarray(Xnew))
+        points = list(trace.points()) if hasattr(trace, 'points') else list(trace)
+
+        with theano.configparser.change_flags(compute_test_value='ignore'):
+            Xs = tt.matrix('Xnew')
+            factor_vars = [factor.type() for factor in factors]
+            mu, var = build_predict(Xs, *factor_vars)
+
+        factor_inputs = _model_inputs(model, factors)
+        predict_inputs = _model_inputs(model, [mu, var])
+        factor_fn = theano.function(factor_inputs, factors)
+        predict_fn = theano.function(predict_inputs + factor_vars + [Xs],
+                                     [mu, var], on_unused_input='ignore')
+
+        # factorizations of recent hyperparameter values, e.g. for
+        # repeated draws of Metropolis-type samplers
+        cache = Cache(maxsize=8)
+        n_new = len(Xnew)
+        mus = np.empty((len(points), n_new))
+        variances = np.empty((len(points), n_new))
+        for i, point in enumerate(points):
+            values = [point[var.name] for var in factor_inputs]
+            key = tuple(np.asarray(value).tobytes() for value in values)
+            try:
+                factor_values = cache.lookup(key)
+            except KeyError:
+                factor_values = cache[key] = factor_fn(*values)
+            args = [point[var.name] for var in predict_inputs] + factor_values
+            for start in range(0, n_new, chunksize):
+                rows = slice(start, start + chunksize)
+                mus[i, rows], variances[i, rows] = predict_fn(*(args + [Xnew[rows]]))
+        return mus, variances
+
+
+def _model_inputs(model, outputs):
+    """Free variables of `model` that `outputs` depend on."""
+    inputs = set(inputvars(outputs))
+    return [var for var in model.vars if var in inputs]
+
 
 @conditioned_vars(["X", "f"])
 class Latent(Base):
@@ -69,6 +157,10 @@ class Latent(Base):
     distributed.  For more information on the `prior` and `conditional` methods,
     see their docstrings.
 
+    If `X` is a single column of evenly spaced values and the covariance
+    function is stationary, the covariance matrix is a Toeplitz matrix.  Its
+    Cholesky factor is then computed by the Schur algorithm in O(n^2) time.
+
     Parameters
     ----------
     cov_func : None, 2D array, or instance of Covariance
@@ -108,13 +200,19 @@ class Latent(Base):
 
     def _build_prior(self, name, X, reparameterize=True, **kwargs):
         mu = self.mean_func(X)
-        cov = stabilize(self.cov_func(X))
         shape = infer_shape(X, kwargs.pop("shape", None))
         if reparameterize:
             v = pm.Normal(name + "_rotated_", mu=0.0, sigma=1.0, shape=shape, **kwargs)
-            f = pm.Deterministic(name, mu + cholesky(cov).dot(v))
+            f = pm.Deterministic(name, mu + _stable_cholesky(self.cov_func, X).dot(v))
         else:
-            f = pm.MvNormal(name, mu=mu, cov=cov, shape=shape, **kwargs)
+            c = toeplitz_column(self.cov_func, X, jitter=1e-6,
+                                min_size=_TOEPLITZ_MIN_SIZE)
+            if c is None:
+                cov = stabilize(self.cov_func(X))
+                f = pm.MvNormal(name, mu=mu, cov=cov, shape=shape, **kwargs)
+            else:
+                f = pm.MvNormal(name, mu=mu, chol=toeplitz_cholesky(c),
+                                shape=shape, **kwargs)
         return f
 
     def prior(self, name, X, reparameterize=True, **kwargs):
@@ -163,9 +261,8 @@ class Latent(Base):
         return X, f, cov_total, mean_total
 
     def _build_conditional(self, Xnew, X, f, cov_total, mean_total):
-        Kxx = cov_total(X)
         Kxs = self.cov_func(X, Xnew)
-        L = cholesky(stabilize(Kxx))
+        L = _stable_cholesky(cov_total, X)
         A = solve_lower(L, Kxs)
         v = solve_lower(L, f - mean_total(X))
         mu = self.mean_func(Xnew) + tt.dot(tt.transpose(A), v)
@@ -337,6 +434,14 @@ class Marginal(Base):
     implement regression on data that is normally distributed.  For more
     information on the `prior` and `conditional` methods, see their docstrings.
 
+    If `X` is a single column of evenly spaced values and the covariance
+    function and noise are stationary, the covariance matrix is a Toeplitz
+    matrix.  For at least 512 points the marginal likelihood is then
+    computed by the Levinson-Durbin recursion and FFTs in O(n^2) time and
+    O(n) memory, and the Cholesky factor used by `conditional` and
+    `predict` by the Schur algorithm.  See the `toeplitz` argument of
+    `marginal_likelihood`.
+
     Parameters
     ----------
     cov_func : None, 2D array, or instance of Covariance
@@ -382,7 +487,17 @@ class Marginal(Base):
         cov = Kxx + Knx
         return mu, cov
 
-    def marginal_likelihood(self, name, X, y, noise, is_observed=True, **kwargs):
+    # Use y as first argument, so that we can use functools.partial
+    # in marginal_likelihood instead of lambda. This makes pickling
+    # possible.
+    def _build_toeplitz_logp(self, y, X, noise):
+        r = y - self.mean_func(X)
+        c = toeplitz_column(self.cov_func, X, noise)
+        constant = 0.5 * r.shape[0] * tt.log(2.0 * np.pi)
+        return -0.5 * (tt.dot(r, toeplitz_solve(c, r)) + toeplitz_logdet(c)) - constant
+
+    def marginal_likelihood(self, name, X, y, noise, is_observed=True,
+                            toeplitz=None, **kwargs):
         R"""
         Returns the marginal likelihood distribution, given the input
         locations `X` and the data `y`.
@@ -393,6 +508,11 @@ class Marginal(Base):
 
            y \mid X,\theta \sim \int p(y \mid f,\, X,\, \theta) \, p(f \mid X,\, \theta) \, df
 
+        The distribution is a `MvNormal`, except when the covariance matrix
+        is a Toeplitz matrix that is handled as such, see `toeplitz`.  It is
+        then a `DensityDist` with the same log-probability and random draws,
+        but without the `mu` and `cov` attributes of `MvNormal`.
+
         Parameters
         ----------
         name : string
@@ -409,6 +529,12 @@ class Marginal(Base):
         is_observed : bool
             Whether to set `y` as an `observed` variable in the `model`.
             Default is `True`.
+        toeplitz : bool or None
+            Whether to use the Levinson-Durbin recursion if `X` is a regular
+            grid and the covariance function and noise are stationary.
+            Default is `None`, to use it for at least 512 points, where it
+            is faster than the Cholesky decomposition.  If `False`, the
+            distribution is always a `MvNormal`.
         **kwargs
             Extra keyword arguments that are passed to `MvNormal` distribution
             constructor.
@@ -416,10 +542,21 @@ class Marginal(Base):
 
         if not isinstance(noise, Covariance):
             noise = pm.gp.cov.WhiteNoise(noise)
-        mu, cov = self._build_marginal_likelihood(X, noise)
         self.X = X
         self.y = y
         self.noise = noise
+        self._toeplitz = toeplitz
+        c = toeplitz_column(self.cov_func, X, noise,
+                            min_size=_toeplitz_min_size(toeplitz))
+        if c is not None:
+            logp = functools.partial(self._build_toeplitz_logp, X=X, noise=noise)
+            random = functools.partial(_toeplitz_random, self.mean_func(X), c)
+            if is_observed:
+                return pm.DensityDist(name, logp, random=random, observed=y, **kwargs)
+            else:
+                shape = infer_shape(X, kwargs.pop("shape", None))
+                return pm.DensityDist(name, logp, random=random, shape=shape, **kwargs)
+        mu, cov = self._build_marginal_likelihood(X, noise)
         if is_observed:
             return pm.MvNormal(name, mu=mu, cov=cov, observed=y, **kwargs)
         else:
@@ -444,15 +581,26 @@ class Marginal(Base):
             X, y, noise = self.X, self.y, self.noise
         return X, y, noise, cov_total, mean_total
 
+    def _build_factors(self, X, y, noise, cov_total, mean_total):
+        rxx = y - mean_total(X)
+        c = toeplitz_column(cov_total, X, noise, jitter=1e-6,
+                            min_size=_toeplitz_min_size(getattr(self, '_toeplitz', None)))
+        if c is None:
+            Kxx = cov_total(X)
+            Knx = noise(X)
+            L = cholesky(stabilize(Kxx) + Knx)
+        else:
+            L = toeplitz_cholesky(c)
+        v = solve_lower(L, rxx)
+        return [L, v]
+
     def _build_conditional(self, Xnew, pred_noise, diag, X, y, noise,
-                           cov_total, mean_total):
-        Kxx = cov_total(X)
+                           cov_total, mean_total, factors=None):
+        if factors is None:
+            factors = self._build_factors(X, y, noise, cov_total, mean_total)
+        L, v = factors
         Kxs = self.cov_func(X, Xnew)
-        Knx = noise(X)
-        rxx = y - mean_total(X)
-        L = cholesky(stabilize(Kxx) + Knx)
         A = solve_lower(L, Kxs)
-        v = solve_lower(L, rxx)
         mu = self.mean_func(Xnew) + tt.dot(tt.transpose(A), v)
         if diag:
             Kss = self.cov_func(Xnew, diag=True)
@@ -556,6 +704,182 @@ class Marginal(Base):
         mu, cov = self._build_conditional(Xnew, pred_noise, diag, *givens)
         return mu, cov
 
+    def predict_trace(self, Xnew, trace, pred_noise=False, given=None,
+                      chunksize=1000, model=None):
+        R"""
+        Return the means and variances of the conditional distribution at
+        `Xnew` for every point of a trace.
+
+        The Cholesky factor of the covariance of the training data is
+        computed once for every distinct value of the hyperparameters.
+        `Xnew` is processed in chunks of `chunksize` rows and only the
+        diagonal of the predictive covariance is computed, the memory
+        requirement does not grow with the square of the number of new
+        points.
+
+        Parameters
+        ----------
+        Xnew : array-like
+            Function input values.  If one-dimensional, must be a column
+            vector with shape `(n, 1)`.
+        trace : MultiTrace or list of points
+            The points to condition on, e.g. posterior samples.
+        pred_noise : bool
+            Whether or not observation noise is included in the conditional.
+            Default is `False`.
+        given : dict
+            Same as `conditional` method.
+        chunksize : int
+            The number of rows of `Xnew` that are evaluated together.
+        model : Model (optional if in `with` context)
+
+        Returns
+        -------
+        mu, var : arrays of shape `(n_points, n_new)`
+        """
+        givens = self._get_given_vals(given)
+        factors = self._build_factors(*givens)
+
+        def build_predict(Xs, *factors):
+            return self._build_conditional(Xs, pred_noise, True, *givens,
+                                           factors=factors)
+        return self._predict_trace(Xnew, trace, factors, build_predict,
+                                   chunksize, model)
+
+
+class MarginalCG(Marginal):
+    R"""
+    Marginal Gaussian process with a matrix-free marginal likelihood.
+
+    The same model as `gp.Marginal`, but the log-density of the marginal
+    likelihood and its gradient are computed with preconditioned conjugate
+    gradients and stochastic Lanczos quadrature for the log-determinant.
+    These only need products of the covariance matrix with vectors, which
+    are evaluated `block_size` rows at a time.  The memory requirement is
+    linear in the number of data points and the time quadratic, instead of
+    the cubic time of the Cholesky decomposition.  Both are estimates, the
+    log-determinant and the gradient with respect to the hyperparameters
+    are stochastic.  The probe vectors are fixed when the marginal
+    likelihood is created, so that the log-density is a deterministic
+    function of the parameters.
+
+    The `conditional` and `predict` methods are the same as the ones of
+    `gp.Marginal` and use the Cholesky decomposition.
+
+    Parameters
+    ----------
+    cov_func : None, 2D array, or instance of Covariance
+        The covariance function.  Defaults to zero.
+    mean_func : None, instance of Mean
+        The mean function.  Defaults to zero.
+    n_probes : int
+        Number of random probe vectors of the log-determinant estimate.
+    max_iter : int
+        Maximum number of conjugate gradient iterations.
+    tol : float
+        Tolerance of the relative residual norm of the conjugate gradients.
+    precond_rank : int
+        Rank of the pivoted Cholesky preconditioner.
+    block_size : int
+        Number of rows of the covariance matrix that are formed at a time.
+    random_seed : int
+        Seed of the probe vectors.
+
+    Examples
+    --------
+    .. code:: python
+
+        # A large number of inputs
+        X = np.random.rand(20000, 2)
+
+        with pm.Model() as model:
+            ls = pm.Gamma("ls", alpha=2, beta=4)
+            cov_func = pm.gp.cov.Matern52(2, ls=ls)
+            gp = pm.gp.MarginalCG(cov_func=cov_func)
+
+            sigma = pm.HalfCauchy("sigma", beta=3)
+            y_ = gp.marginal_likelihood("y", X=X, y=y, noise=sigma)
+
+    References
+    ----------
+    -   Gardner, J., Pleiss, G., Weinberger, K. Q., Bindel, D. and Wilson,
+        A. G. (2018). GPyTorch: Blackbox Matrix-Matrix Gaussian Process
+        Inference with GPU Acceleration.
+    """
+
+    def __init__(self, mean_func=Zero(), cov_func=Constant(0.0), n_probes=10,
+                 max_iter=1000, tol=1e-5, precond_rank=15, block_size=512,
+                 random_seed=None):
+        super().__init__(mean_func, cov_func)
+        self.solver_kwargs = dict(n_probes=n_probes, max_iter=max_iter, tol=tol,
+                                  precond_rank=precond_rank, block_size=block_size,
+                                  random_seed=random_seed)
+
+    def __add__(self, other):
+        new_gp = super().__add__(other)
+        new_gp.solver_kwargs = self.solver_kwargs
+        return new_gp
+
+    # Use y as first argument, so that we can use functools.partial
+    # in marginal_likelihood instead of lambda. This makes pickling
+    # possible.
+    def _build_marginal_likelihood_logp(self, y, X, noise):
+        r = y - self.mean_func(X)
+        if isinstance(noise, pm.gp.cov.WhiteNoise):
+            cov_func = self.cov_func
+            noise_diag = noise(X, diag=True)
+        else:
+            cov_func = self.cov_func + noise
+            noise_diag = tt.zeros_like(r)
+        return cg_marginal_logp(cov_func, X, noise_diag, r, **self.solver_kwargs)
+
+    def marginal_likelihood(self, name, X, y, noise, is_observed=True, **kwargs):
+        R"""
+        Returns the marginal likelihood distribution, given the input
+        locations `X` and the data `y`.
+
+        Parameters
+        ----------
+        name : string
+            Name of the random variable
+        X : array-like
+            Function input values.  If one-dimensional, must be a column
+            vector with shape `(n, 1)`.  Must be a numpy array, it is split
+            into blocks of rows.
+        y : array-like
+            Data that is the sum of the function with the GP prior and Gaussian
+            noise.  Must have shape `(n, )`.
+        noise : scalar, Variable, or Covariance
+            Standard deviation of the Gaussian noise.  Can also be a Covariance for
+            non-white noise, which is then treated like a part of the
+            covariance function.
+        is_observed : bool
+            Whether to set `y` as an `observed` variable in the `model`.
+            Default is `True`.
+        **kwargs
+            Extra keyword arguments that are passed to `DensityDist`
+            distribution constructor.
+        """
+        if isinstance(X, tt.TensorConstant):
+            X = X.value
+        elif isinstance(X, (np.ndarray, tuple, list)):
+            X = np.asarray(X)
+        else:
+            raise TypeError("MarginalCG requires X to be a numpy array, "
+                            "not {}".format(type(X)))
+        if not isinstance(noise, Covariance):
+            noise = pm.gp.cov.WhiteNoise(noise)
+        self.X = X
+        self.y = y
+        self.noise = noise
+        logp = functools.partial(self._build_marginal_likelihood_logp,
+                                 X=X, noise=noise)
+        if is_observed:
+            return pm.DensityDist(name, logp, observed=y, **kwargs)
+        else:
+            shape = infer_shape(X, kwargs.pop("shape", None))
+            return pm.DensityDist(name, logp, shape=shape, **kwargs)
+
 
 @conditioned_vars(["X", "Xu", "y", "sigma"])
 class MarginalSparse(Marginal):
@@ -719,7 +1043,7 @@ class MarginalSparse(Marginal):
             shape = infer_shape(X, kwargs.pop("shape", None))
             return pm.DensityDist(name, logp, shape=shape, **kwargs)
 
-    def _build_conditional(self, Xnew, pred_noise, diag, X, Xu, y, sigma, cov_total, mean_total):
+    def _build_factors(self, X, Xu, y, sigma, cov_total, mean_total):
         sigma2 = tt.square(sigma)
         Kuu = cov_total(Xu)
         Kuf = cov_total(Xu, X)
@@ -736,9 +1060,17 @@ class MarginalSparse(Marginal):
         r = y - mean_total(X)
         r_l = r / Lamd
         c = solve_lower(L_B, tt.dot(A, r_l))
+        return [Luu, L_B, solve_upper(tt.transpose(L_B), c)]
+
+    def _build_conditional(self, Xnew, pred_noise, diag, X, Xu, y, sigma,
+                           cov_total, mean_total, factors=None):
+        if factors is None:
+            factors = self._build_factors(X, Xu, y, sigma, cov_total, mean_total)
+        Luu, L_B, b = factors
+        sigma2 = tt.square(sigma)
         Kus = self.cov_func(Xu, Xnew)
         As = solve_lower(Luu, Kus)
-        mu = self.mean_func(Xnew) + tt.dot(tt.transpose(As), solve_upper(tt.transpose(L_B), c))
+        mu = self.mean_func(Xnew) + tt.dot(tt.transpose(As), b)
         C = solve_lower(L_B, As)
         if diag:
             Kss = self.cov_func(Xnew, diag=True)
@@ -1072,7 +1404,7 @@ class MarginalKron(Base):
             return pm.KroneckerNormal(name, mu=mu, covs=covs, sigma=sigma,
                                       shape=shape, **kwargs)
 
-    def _build_conditional(self, Xnew, pred_noise, diag):
+    def _build_factors(self):
         Xs, y, sigma = self.Xs, self.y, self.sigma
 
         # Old points
@@ -1085,15 +1417,25 @@ class MarginalKron(Base):
         if sigma is not None:
             eigs += sigma**2
 
+        alpha = kron_dot(QTs, delta)
+        alpha = alpha/eigs[:, None]
+        alpha = kron_dot(Qs, alpha)
+        return list(Qs) + [eigs, alpha]
+
+    def _build_conditional(self, Xnew, pred_noise, diag, factors=None):
+        sigma = self.sigma
+        if factors is None:
+            factors = self._build_factors()
+        Qs, eigs, alpha = factors[:-2], factors[-2], factors[-1]
+        QTs = list(map(tt.transpose, Qs))
+        X = cartesian(*self.Xs)
+
         # New points
         Km = self.cov_func(Xnew, diag=diag)
         Knm = self.cov_func(X, Xnew)
         Kmn = Knm.T
 
         # Build conditional mu
-        alpha = kron_dot(QTs, delta)
-        alpha = alpha/eigs[:, None]
-        alpha = kron_dot(Qs, alpha)
         mu = tt.dot(Kmn, alpha).ravel() + self.mean_func(Xnew)
 
         # Build conditional cov
@@ -1191,3 +1533,195 @@ class MarginalKron(Base):
         """
         mu, cov = self._build_conditional(Xnew, pred_noise, diag)
         return mu, cov
+
+    def predict_trace(self, Xnew, trace, pred_noise=False, chunksize=1000,
+                      model=None):
+        R"""
+        Return the means and variances of the conditional distribution at
+        `Xnew` for every point of a trace, just as in `Marginal`.
+
+        The eigendecompositions of the covariance matrices of the input
+        dimensions are computed once for every distinct value of the
+        hyperparameters.
+
+        Parameters
+        ----------
+        Xnew : array-like
+            Function input values.  If one-dimensional, must be a column
+            vector with shape `(n, 1)`.
+        trace : MultiTrace or list of points
+            The points to condition on, e.g. posterior samples.
+        pred_noise : bool
+            Whether or not observation noise is included in the conditional.
+            Default is `False`.
+        chunksize : int
+            The number of rows of `Xnew` that are evaluated together.
+        model : Model (optional if in `with` context)
+
+        Returns
+        -------
+        mu, var : arrays of shape `(n_points, n_new)`
+        """
+        factors = self._build_factors()
+
+        def build_predict(Xs, *factors):
+            return self._build_conditional(Xs, pred_noise, True,
+                                           factors=factors)
+        return self._predict_trace(Xnew, trace, factors, build_predict,
+                                   chunksize, model)
+
+
+@conditioned_vars(["X", "f"])
+class HSGP(Base):
+    R"""
+    Hilbert space approximate Gaussian process.
+
+    The `gp.HSGP` class approximates a GP with a stationary covariance
+    function by a linear combination of `m` basis functions, the
+    eigenfunctions of the Laplace operator on a box :math:`[-L, L]^D`
+    around the inputs [1]_.  The weights of the basis functions are
+    independent normal variables with variances given by the power
+    spectral density of the covariance function,
+
+    .. math::
+
+       f(x) \approx \mu(x) + \sum_{j=1}^m
+           \phi_j(x) \sqrt{S(\sqrt{\lambda_j})} \beta_j \,, \quad
+       \beta_j \sim \mathcal{N}(0, 1)
+
+    Evaluating the prior costs :math:`O(nm)` instead of :math:`O(n^3)`,
+    and the basis does not depend on the hyperparameters.  The covariance
+    function has to implement `power_spectral_density`, as `ExpQuad`,
+    `Matern52` and `Matern32` (and their products with scalars) do.  The
+    approximation is accurate away from the boundary of the box, for
+    lengthscales that are not much shorter than `L / m`.
+
+    Parameters
+    ----------
+    m : int or list of int
+        The number of basis functions for every input dimension.  The
+        total number of basis functions is their product.
+    L : float or list of float, optional
+        Half width of the box, per input dimension, relative to the center
+        of `X`.  Defaults to `c` times the largest distance of `X` from
+        its center.
+    c : float
+        Factor for the default `L`, defaults to 1.5.
+    cov_func : instance of Covariance
+        A stationary covariance function.
+    mean_func : None, instance of Mean
+        The mean function.  Defaults to zero.
+
+    Examples
+    --------
+    .. code:: python
+
+        X = np.linspace(0, 10, 100000)[:, None]
+
+        with pm.Model() as model:
+            ls = pm.Gamma("ls", alpha=2, beta=1)
+            eta = pm.HalfNormal("eta", sigma=1)
+            cov_func = eta**2 * pm.gp.cov.Matern52(1, ls=ls)
+
+            gp = pm.gp.HSGP(m=200, cov_func=cov_func)
+            f = gp.prior("f", X=X)
+
+        ...
+
+        with model:
+            fcond = gp.conditional("fcond", Xnew=Xnew)
+
+    References
+    ----------
+    .. [1] A. Solin and S. Sarkka. "Hilbert Space Methods for Reduced-Rank
+       Gaussian Process Regression", Statistics and Computing 30, 419-446,
+       2020.
+    """
+
+    def __init__(self, m, L=None, c=1.5, mean_func=Zero(), cov_func=Constant(0.0)):
+        super().__init__(mean_func, cov_func)
+        self.m = m
+        self.L = L
+        self.c = c
+
+    def __add__(self, other):
+        raise TypeError("Additive, Hilbert space approximate GPs not implemented")
+
+    def _set_boundary(self, X):
+        X = np.asarray(X)
+        self.center = np.mean(X, 0)
+        if self.L is None:
+            self.L = self.c * np.max(np.abs(X - self.center), 0)
+        self.L = np.broadcast_to(np.asarray(self.L, dtype=float), X.shape[1:])
+        m = np.broadcast_to(np.asarray(self.m, dtype=int), X.shape[1:])
+        indices = cartesian(*[np.arange(1, k + 1) for k in m])
+        # square roots of the eigenvalues of the Laplacian, per dimension
+        self.sqrt_eigs = np.pi * indices / (2.0 * self.L)
+
+    def basis(self, X):
+        R"""
+        The basis functions evaluated at `X`, with shape
+        `(n, number of basis functions)`.
+        """
+        X = np.asarray(X) - self.center
+        phi = (np.sin(self.sqrt_eigs * (X[:, None, :] + self.L))
+               / np.sqrt(self.L))
+        return pm.floatX(np.prod(phi, 2))
+
+    def _build_prior(self, name, X, **kwargs):
+        self._set_boundary(X)
+        psd = self.cov_func.power_spectral_density(pm.floatX(self.sqrt_eigs))
+        size = self.sqrt_eigs.shape[0]
+        beta = pm.Normal(name + "_coeffs_", mu=0.0, sigma=1.0, shape=size, **kwargs)
+        self.weights = beta * tt.sqrt(psd)
+        return self._build_conditional(X)
+
+    def _build_conditional(self, Xnew):
+        return self.mean_func(Xnew) + tt.dot(self.basis(Xnew), self.weights)
+
+    def prior(self, name, X, **kwargs):
+        R"""
+        Returns the approximate GP prior distribution evaluated over the
+        input locations `X`.
+
+        The weights of the basis functions are added to the model as the
+        random variable `name + "_coeffs_"`, `f` is a deterministic
+        function of them.
+
+        Parameters
+        ----------
+        name : string
+            Name of the random variable
+        X : array-like
+            Function input values.  If one-dimensional, must be a column
+            vector with shape `(n, 1)`.
+        **kwargs
+            Extra keyword arguments that are passed to the `Normal`
+            distribution of the weights.
+        """
+        f = pm.Deterministic(name, self._build_prior(name, X, **kwargs))
+        self.X = X
+        self.f = f
+        return f
+
+    def conditional(self, name, Xnew):
+        R"""
+        Returns the approximate GP evaluated over new input locations
+        `Xnew`.
+
+        Given the weights of the basis functions, the approximation is a
+        deterministic function, so the conditional distribution is a
+        `Deterministic`.  `Xnew` should lie within the box of the
+        approximation.
+
+        Parameters
+        ----------
+        name : string
+            Name of the random variable
+        Xnew : array-like
+            Function input values.  If one-dimensional, must be a column
+            vector with shape `(n, 1)`.
+        """
+        # raises if prior was not called
+        self.X
+        return pm.Deterministic(name, self._build_conditional(Xnew))
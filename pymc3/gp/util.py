@@ -1,6 +1,9 @@
 from scipy.cluster.vq import kmeans
 import numpy as np
+import scipy.linalg
+import theano
 import theano.tensor as tt
+from theano.compile import SharedVariable
 
 cholesky = tt.slinalg.cholesky
 solve_lower = tt.slinalg.Solve(A_structure='lower_triangular')
@@ -41,6 +44,358 @@ def kmeans_inducing_points(n_inducing, X):
     return Xu * scaling
 
 
+def kernel_blocks(X, block_size):
+    """Split the rows of `X` into blocks of `block_size` rows.
+
+    The last block is padded with copies of the last row.  Returns an array
+    of shape `(n_blocks, block_size, n_dims)`.
+    """
+    X = np.asarray(X)
+    n_blocks = -(-X.shape[0] // block_size)
+    pad = n_blocks * block_size - X.shape[0]
+    Xp = np.concatenate([X, np.repeat(X[-1:], pad, axis=0)])
+    return Xp.reshape((n_blocks, block_size) + X.shape[1:])
+
+
+def kernel_matvec(cov_func, X, V, block_size):
+    """Symbolic product `cov_func(X) V` that only forms `block_size` rows
+    of the covariance matrix at a time."""
+    blocks = kernel_blocks(X, block_size)
+    X = tt.as_tensor_variable(np.asarray(X))
+
+    def block_product(Xb):
+        return tt.dot(cov_func(Xb, X), V)
+
+    KV, _ = theano.scan(block_product, sequences=[tt.as_tensor_variable(blocks)])
+    return KV.reshape((-1, V.shape[1]))[:X.shape[0]]
+
+
+def kernel_forms(cov_func, X, A, B, block_size):
+    """Symbolic column-wise bilinear forms `diag(A^T cov_func(X) B)`, which
+    only form `block_size` rows of the covariance matrix at a time."""
+    blocks = kernel_blocks(X, block_size)
+    n_blocks, block_size = blocks.shape[:2]
+    X = tt.as_tensor_variable(np.asarray(X))
+    pad = tt.zeros((n_blocks * block_size - X.shape[0], A.shape[1]), dtype=A.dtype)
+    A_blocks = tt.concatenate([A, pad]).reshape((n_blocks, block_size, A.shape[1]))
+
+    def block_forms(Xb, Ab):
+        return tt.sum(Ab * tt.dot(cov_func(Xb, X), B), 0)
+
+    forms, _ = theano.scan(block_forms,
+                           sequences=[tt.as_tensor_variable(blocks), A_blocks])
+    return tt.sum(forms, 0)
+
+
+def pivoted_cholesky(diag, row, rank, tol=1e-10):
+    """Partial pivoted Cholesky decomposition `L L^T` of a positive
+    semi-definite matrix given by its diagonal and a function returning
+    its rows.  Stops early once the remaining diagonal is below `tol`
+    times its largest initial value."""
+    d = np.array(diag, dtype=float)
+    L = np.zeros((len(d), rank))
+    threshold = tol * np.max(d)
+    for j in range(rank):
+        i = np.argmax(d)
+        if d[i] <= threshold:
+            return L[:, :j]
+        L[:, j] = (row(i) - np.dot(L[:, :j], L[i, :j])) / np.sqrt(d[i])
+        d = np.clip(d - L[:, j]**2, 0, None)
+    return L
+
+
+class WoodburyPreconditioner:
+    """Low rank plus diagonal approximation `L L^T + diag(d)` of a
+    covariance matrix, with its inverse, log-determinant and samples."""
+
+    def __init__(self, L, d):
+        self.L = L
+        self.d = d
+        self._Ld = L / d[:, None]
+        inner = np.eye(L.shape[1]) + np.dot(L.T, self._Ld)
+        self._chol = scipy.linalg.cholesky(inner, lower=True)
+        self.logdet = (np.sum(np.log(d)) +
+                       2 * np.sum(np.log(np.diag(self._chol))))
+
+    def solve(self, V):
+        if not self.L.shape[1]:
+            return V / self.d[:, None]
+        inner = scipy.linalg.cho_solve((self._chol, True), np.dot(self._Ld.T, V))
+        return V / self.d[:, None] - np.dot(self._Ld, inner)
+
+    def sample(self, rng, size):
+        return (np.dot(self.L, rng.randn(self.L.shape[1], size)) +
+                np.sqrt(self.d)[:, None] * rng.randn(len(self.d), size))
+
+
+def mbcg(matvec, B, precond, max_iter, tol):
+    """Preconditioned conjugate gradients for several right hand sides.
+
+    Solves `K X = B` for the columns of `B`, where `matvec(V)` computes
+    `K V` and `precond(V)` applies the inverse of the preconditioner.
+    Columns stop being updated once their relative residual norm is
+    below `tol`.
+
+    Returns
+    -------
+    X : array
+        The solutions.
+    alphas, betas : arrays
+        The step sizes and direction updates of every iteration and
+        column, they define the Lanczos tridiagonal matrices.
+    n_iter : array
+        The number of iterations done for every column.
+    """
+    X = np.zeros_like(B)
+    R = B.copy()
+    Z = precond(R)
+    P = Z.copy()
+    rz = np.sum(R * Z, 0)
+    b_norm = np.linalg.norm(B, axis=0)
+    b_norm[b_norm == 0] = 1.
+    active = np.linalg.norm(R, axis=0) / b_norm >= tol
+    n_iter = np.zeros(B.shape[1], dtype=int)
+    alphas, betas = [], []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(max_iter):
+            if not active.any():
+                break
+            KP = matvec(P)
+            alpha = np.where(active, rz / np.sum(P * KP, 0), 0.)
+            X += alpha * P
+            R -= alpha * KP
+            Z = precond(R)
+            rz_new = np.sum(R * Z, 0)
+            beta = np.where(active, rz_new / rz, 0.)
+            alphas.append(alpha)
+            betas.append(beta)
+            n_iter += active
+            active &= np.linalg.norm(R, axis=0) / b_norm >= tol
+            P = Z + beta * P
+            rz = rz_new
+    return X, np.array(alphas), np.array(betas), n_iter
+
+
+def lanczos_log_quadrature(alphas, betas):
+    """Gauss quadrature `e_1^T log(T) e_1` of the Lanczos tridiagonal
+    matrix `T` given by the coefficients of conjugate gradients."""
+    m = len(alphas)
+    if m == 0:
+        return 0.
+    diag = 1. / alphas
+    diag[1:] += betas[:-1] / alphas[:-1]
+    off = np.sqrt(betas[:-1]) / alphas[:-1]
+    eigs, vecs = scipy.linalg.eigh_tridiagonal(diag, off)
+    return np.sum(vecs[0]**2 * np.log(eigs))
+
+
+class CGSolveLogDet(theano.Op):
+    R"""
+    Solve and log-determinant of a GP covariance matrix without forming it.
+
+    The covariance matrix is :math:`K = k(X, X) + \mathrm{diag}(d)` for a
+    covariance function :math:`k` and the diagonal `d` of white noise.
+    Systems are solved with preconditioned conjugate gradients, which only
+    need products of :math:`K` with vectors.  These are evaluated in blocks
+    of rows.  The preconditioner is a partial pivoted Cholesky decomposition
+    of :math:`k(X, X)` plus a diagonal.  The log-determinant is estimated by
+    stochastic Lanczos quadrature, using the conjugate gradient iterations
+    of the solves with the random probe vectors :math:`z_j \sim N(0, P)`.
+
+    Applied to the inputs `theta` of the covariance function (see
+    `CGSolveLogDet.theta`), `d` and the residuals `r`, it returns
+    :math:`K^{-1} r`, the solves :math:`K^{-1} z_j` and preconditioned
+    probes :math:`P^{-1} z_j` as columns of matrices, and the
+    log-determinant estimate.  The probes are drawn with a fixed seed, so
+    that the results are deterministic functions of the inputs.  The
+    outputs are not differentiable, see `cg_marginal_logp`.
+
+    Parameters
+    ----------
+    cov_func : Covariance
+        The covariance function.
+    X : array-like
+        Input locations.
+    n_probes : int
+        Number of probe vectors of the log-determinant estimate.
+    max_iter : int
+        Maximum number of conjugate gradient iterations.
+    tol : float
+        Tolerance of the relative residual norm of the solves.
+    precond_rank : int
+        Rank of the pivoted Cholesky preconditioner.
+    block_size : int
+        Number of rows of the covariance matrix formed at a time.
+    random_seed : int
+        Seed of the probe vectors.
+    """
+
+    def __init__(self, cov_func, X, n_probes=10, max_iter=1000, tol=1e-5,
+                 precond_rank=15, block_size=512, random_seed=None):
+        X = np.asarray(X)
+        self.n_probes = n_probes
+        self.max_iter = max_iter
+        self.tol = tol
+        self.precond_rank = min(precond_rank, X.shape[0])
+        if random_seed is None:
+            random_seed = np.random.randint(2**30)
+        self.random_seed = random_seed
+        with theano.configparser.change_flags(compute_test_value='ignore'):
+            V = tt.matrix('V')
+            idx = tt.lvector('idx')
+            Xt = tt.as_tensor_variable(X)
+            KV = kernel_matvec(cov_func, X, V, block_size)
+            diag = cov_func(Xt, diag=True)
+            rows = cov_func(Xt[idx], Xt)
+            self.theta = [v for v in theano.gof.graph.inputs([KV, diag, rows])
+                          if not isinstance(v, (tt.Constant, SharedVariable))
+                          and v is not V and v is not idx]
+            self._matvec = theano.function(self.theta + [V], KV,
+                                           on_unused_input='ignore')
+            self._diag = theano.function(self.theta, tt.ones_like(Xt[:, 0]) * diag,
+                                         on_unused_input='ignore')
+            self._rows = theano.function(self.theta + [idx], rows,
+                                         on_unused_input='ignore')
+
+    def make_node(self, *inputs):
+        inputs = [tt.as_tensor_variable(i) for i in inputs]
+        r = inputs[-1]
+        outputs = [r.type(), tt.matrix(dtype=r.dtype),
+                   tt.matrix(dtype=r.dtype), tt.scalar(dtype=r.dtype)]
+        return theano.Apply(self, inputs, outputs)
+
+    def perform(self, node, inputs, outputs):
+        theta, noise, r = inputs[:-2], inputs[-2], inputs[-1]
+        kernel_diag = self._diag(*theta)
+        L = pivoted_cholesky(kernel_diag, lambda i: self._rows(*(theta + [[i]]))[0],
+                             self.precond_rank)
+        d = noise + np.clip(kernel_diag - np.sum(L**2, 1), 0, None)
+        d = np.maximum(d, 1e-10 * np.max(kernel_diag + noise))
+        precond = WoodburyPreconditioner(L, d)
+        Z = precond.sample(np.random.RandomState(self.random_seed), self.n_probes)
+
+        def matvec(V):
+            return self._matvec(*(theta + [V])) + noise[:, None] * V
+
+        B = np.column_stack([r, Z])
+        X, alphas, betas, n_iter = mbcg(matvec, B, precond.solve,
+                                        self.max_iter, self.tol)
+        # squared norms of the whitened probes
+        norms = np.sum(Z * precond.solve(Z), 0)
+        quadratures = [lanczos_log_quadrature(alphas[:m, j + 1], betas[:m, j + 1])
+                       for j, m in enumerate(n_iter[1:])]
+        logdet = precond.logdet + np.mean(norms * quadratures)
+        dtype = node.outputs[0].dtype
+        outputs[0][0] = X[:, 0].astype(dtype)
+        outputs[1][0] = X[:, 1:].astype(dtype)
+        outputs[2][0] = precond.solve(Z).astype(dtype)
+        outputs[3][0] = np.array(logdet, dtype=dtype)
+
+    def infer_shape(self, node, shapes):
+        n = shapes[-1][0]
+        return [(n,), (n, self.n_probes), (n, self.n_probes), ()]
+
+    def connection_pattern(self, node):
+        return [[False] * len(node.outputs) for _ in node.inputs]
+
+    def grad(self, inputs, grads):
+        return [theano.gradient.DisconnectedType()() for _ in inputs]
+
+
+def cg_marginal_logp(cov_func, X, noise, r, **kwargs):
+    R"""
+    Log-density of a GP marginal likelihood with conjugate gradients.
+
+    The value of the returned graph is the estimate of
+
+    .. math::
+
+       -\frac{1}{2} r^T K^{-1} r - \frac{1}{2} \log |K| - \frac{n}{2} \log 2\pi
+
+    computed by `CGSolveLogDet` with :math:`K = k(X, X) + \mathrm{diag}(d)`.
+    Its gradient is the stochastic estimate
+
+    .. math::
+
+       \frac{1}{2} \alpha^T \frac{\partial K}{\partial \theta} \alpha
+       - \frac{1}{2} \frac{1}{p} \sum_j (K^{-1} z_j)^T
+         \frac{\partial K}{\partial \theta} P^{-1} z_j,
+       \qquad \alpha = K^{-1} r
+
+    of Gardner et al. (2018), which also only needs the covariance matrix
+    in blocks of rows.
+
+    Parameters
+    ----------
+    cov_func : Covariance
+        The covariance function :math:`k`.
+    X : array-like
+        Input locations.
+    noise : tensor
+        The diagonal `d` of the white noise.
+    r : tensor
+        The residuals of the data from the mean.
+    **kwargs
+        Passed to `CGSolveLogDet`.
+
+    References
+    ----------
+    -   Gardner, J., Pleiss, G., Weinberger, K. Q., Bindel, D. and Wilson,
+        A. G. (2018). GPyTorch: Blackbox Matrix-Matrix Gaussian Process
+        Inference with GPU Acceleration.
+    """
+    op = CGSolveLogDet(cov_func, X, **kwargs)
+    noise = tt.ones_like(r) * noise
+    alpha, W, U, logdet = op(*(op.theta + [noise, r]))
+    A = tt.concatenate([alpha[:, None], W], 1)
+    B = tt.concatenate([alpha[:, None], U], 1)
+    block_size = kwargs.get('block_size', 512)
+    forms = (kernel_forms(cov_func, X, A, B, block_size) +
+             tt.sum(A * noise[:, None] * B, 0))
+    # the values equal r^T alpha and zero, the gradients are the estimates
+    quadratic = 2 * tt.dot(r, alpha) - forms[0]
+    trace = tt.mean(forms[1:])
+    trace = trace - theano.gradient.disconnected_grad(trace)
+    constant = 0.5 * r.shape[0] * tt.log(2.0 * np.pi)
+    return -0.5 * (quadratic + logdet + trace) - constant
+
+
+def regular_grid(X):
+    """Whether `X` is a column of at least two evenly spaced values."""
+    if isinstance(X, tt.TensorConstant):
+        X = X.value
+    elif isinstance(X, (tuple, list)):
+        X = np.asarray(X)
+    if not isinstance(X, np.ndarray) or X.ndim != 2 or X.shape[1] != 1:
+        return False
+    steps = np.diff(X[:, 0])
+    return len(steps) > 0 and steps[0] != 0 and np.allclose(steps, steps[0], rtol=1e-8, atol=0)
+
+
+def toeplitz_column(cov_func, X, noise=None, jitter=0.0, min_size=0):
+    """First column of the covariance matrix `cov_func(X) + noise(X)` if it
+    is a Toeplitz matrix of at least `min_size` rows, otherwise None.
+
+    This is the case if the covariance functions are stationary and `X` a
+    regular grid, see `regular_grid`.  Only the covariances with the first
+    point are evaluated.  `jitter` is added to the variance.
+    """
+    cov_funcs = [cov_func] if noise is None else [cov_func, noise]
+    if not all(getattr(cov, 'stationary', False) for cov in cov_funcs):
+        return None
+    if not regular_grid(X):
+        return None
+    if isinstance(X, tt.TensorConstant):
+        X = X.value
+    X = np.asarray(X)
+    if X.shape[0] < min_size:
+        return None
+    c = sum(cov(X[:1], X)[0] for cov in cov_funcs)
+    variance = sum(cov(X[:1], diag=True)[0] for cov in cov_funcs)
+    # white noise only enters the diagonal
+    return tt.set_subtensor(c[0], variance + jitter)
+
+
 def conditioned_vars(varnames):
     """ Decorator for validating attrs that are conditioned on. """
     def gp_wrapper(cls):
@@ -15,6 +15,7 @@ from theano.gof import Op, Apply
 import numpy as np
 import scipy as sp
 import scipy.sparse
+import scipy.fftpack
 from scipy.linalg import block_diag as scipy_block_diag
 from pymc3.theanof import floatX, largest_common_dtype, ix_
 from functools import reduce, partial
@@ -357,3 +358,333 @@ def block_diagonal(matrices, sparse=False, format='csr'):
     if len(matrices) == 1:  # graph optimization
         return matrices[0]
     return BlockDiagonalMatrix(sparse=sparse, format=format)(*matrices)
+
+
+def toeplitz(c):
+    """Symmetric Toeplitz matrix with first column `c`."""
+    c = tt.as_tensor_variable(c)
+    idx = tt.arange(c.shape[0])
+    return c[abs_(idx[:, None] - idx[None, :])]
+
+
+# the last key and result of `_levinson_durbin`, the solves, log-determinant
+# and their gradients usually need it for the same matrix. It is replaced as
+# one tuple, so that threads never see the key of one matrix with the result
+# of another.
+_LEVINSON_LAST = (None, None)
+
+
+def _levinson_durbin(c):
+    """First column of the inverse and log-determinant of the symmetric
+    positive definite Toeplitz matrix with first column `c`, in O(n^2)."""
+    global _LEVINSON_LAST
+    key = (c.dtype.str, c.tobytes())
+    last_key, last_result = _LEVINSON_LAST
+    if last_key == key:
+        return last_result
+    n = len(c)
+    a = np.zeros(n)
+    a[0] = 1.
+    err = c[0]
+    log_det = np.log(err)
+    for k in range(1, n):
+        reflection = -np.dot(a[:k], c[k:0:-1]) / err
+        a[:k + 1] += reflection * a[k::-1].copy()
+        err *= 1. - reflection**2
+        log_det += np.log(err)
+    result = (a / err, log_det)
+    _LEVINSON_LAST = (key, result)
+    return result
+
+
+def _fft_size(n):
+    return sp.fftpack.next_fast_len(2 * n - 1)
+
+
+def _lower_toeplitz_dot(v, B):
+    """Product of the lower triangular Toeplitz matrix with first column
+    `v` and the matrix `B`, by FFT."""
+    n = len(v)
+    size = _fft_size(n)
+    return np.fft.irfft(np.fft.rfft(v, size)[:, None] * np.fft.rfft(B, size, axis=0),
+                        size, axis=0)[:n]
+
+
+def _toeplitz_inverse_dot(x, B):
+    r"""Product of the inverse of a symmetric Toeplitz matrix with the
+    matrix `B`, where `x` is the first column of the inverse.
+
+    Uses the Gohberg-Semencul formula
+    :math:`T^{-1} = (L(x) L(x)^T - L(z) L(z)^T) / x_0` with lower
+    triangular Toeplitz matrices and :math:`z = (0, x_{n-1}, \ldots, x_1)`.
+    """
+    z = np.concatenate([[0.], x[:0:-1]])
+    out = np.zeros_like(B)
+    for v, sign in ((x, 1.), (z, -1.)):
+        out += sign * _lower_toeplitz_dot(v, _lower_toeplitz_dot(v, B[::-1])[::-1])
+    return out / x[0]
+
+
+def _correlate(a, b):
+    """Correlations `sum_j a[j] b[j + k]` for `k >= 0`, summed over the
+    columns of `a` and `b`."""
+    n = a.shape[0]
+    size = _fft_size(n)
+    fa = np.fft.rfft(a, size, axis=0)
+    fb = np.fft.rfft(b, size, axis=0)
+    return np.fft.irfft(np.sum(np.conj(fa) * fb, 1), size)[:n]
+
+
+def _toeplitz_cholesky(c):
+    """Cholesky factor of the symmetric positive definite Toeplitz matrix
+    with first column `c` by the Schur algorithm, in O(n^2).
+
+    Returns the factor and the second generators, which are needed for
+    the gradient.
+    """
+    n = len(c)
+    L = np.zeros((n, n))
+    V = np.zeros((n, n))
+    u = c / np.sqrt(c[0])
+    v = u.copy()
+    v[0] = 0.
+    for k in range(n):
+        L[k:, k] = u
+        V[k:, k] = v
+        if k == n - 1:
+            break
+        u, v = u[:-1], v[1:]
+        rho = v[0] / u[0]
+        s = np.sqrt(1. - rho**2)
+        u, v = (u - rho * v) / s, (v - rho * u) / s
+    return L, V
+
+
+def _toeplitz_cholesky_grad(c, L, V, gL):
+    """Reverse mode of `_toeplitz_cholesky`, in O(n^2)."""
+    n = len(c)
+    gu = gL[n - 1:, n - 1].copy()
+    gv = np.zeros(1)
+    for k in range(n - 2, -1, -1):
+        # the generators before and after step k
+        u, v = L[k:, k], V[k:, k]
+        u1, v1 = L[k + 1:, k + 1], V[k + 1:, k + 1]
+        rho = v[1] / u[0]
+        s = np.sqrt(1. - rho**2)
+        grho = (np.dot(gu, -v[1:] / s + u1 * rho / s**2) +
+                np.dot(gv, -u[:-1] / s + v1 * rho / s**2))
+        gu_prev = np.zeros(n - k)
+        gv_prev = np.zeros(n - k)
+        gu_prev[:-1] = (gu - rho * gv) / s
+        gv_prev[1:] = (gv - rho * gu) / s
+        gv_prev[1] += grho / u[0]
+        gu_prev[0] -= grho * rho / u[0]
+        gu = gu_prev + gL[k:, k]
+        gv = gv_prev
+    gc = gu / np.sqrt(c[0])
+    gc[1:] += gv[1:] / np.sqrt(c[0])
+    gc[0] -= 0.5 * (np.dot(gu, L[:, 0]) + np.dot(gv, V[:, 0])) / c[0]
+    return gc
+
+
+class ToeplitzDot(Op):
+    """Product of the symmetric Toeplitz matrix with first column `c` and
+    a vector or matrix `b`, by FFT in O(n log n).
+    """
+    __props__ = ()
+
+    def make_node(self, c, b):
+        c = tt.as_tensor_variable(c)
+        b = tt.as_tensor_variable(b)
+        return Apply(self, [c, b], [b.type()])
+
+    def perform(self, node, inputs, outputs, params=None):
+        c, b = inputs
+        n = len(c)
+        size = _fft_size(n)
+        column = np.zeros(size)
+        column[:n] = c
+        column[size - n + 1:] = c[:0:-1]
+        B = b.reshape((n, -1))
+        out = np.fft.irfft(np.fft.rfft(column)[:, None] * np.fft.rfft(B, size, axis=0),
+                           size, axis=0)[:n]
+        outputs[0][0] = out.reshape(b.shape).astype(node.outputs[0].dtype)
+
+    def grad(self, inputs, grads):
+        c, b = inputs
+        g, = grads
+        return [toeplitz_correlation(g, b), toeplitz_dot(c, g)]
+
+    def infer_shape(self, node, shapes):
+        return [shapes[1]]
+
+
+class ToeplitzCorrelation(Op):
+    """Gradient of a bilinear form of a symmetric Toeplitz matrix with
+    respect to its first column.
+
+    Returns `g` with `g[0] = sum_i y[i] x[i]` and
+    `g[k] = sum_i y[i + k] x[i] + y[i] x[i + k]` for `k > 0`, summed over
+    the columns if `y` and `x` are matrices.
+    """
+    __props__ = ()
+
+    def make_node(self, y, x):
+        y = tt.as_tensor_variable(y)
+        x = tt.as_tensor_variable(x)
+        return Apply(self, [y, x], [tt.vector(dtype=x.dtype)])
+
+    def perform(self, node, inputs, outputs, params=None):
+        y, x = inputs
+        n = y.shape[0]
+        y = y.reshape((n, -1))
+        x = x.reshape((n, -1))
+        out = _correlate(y, x) + _correlate(x, y)
+        out[0] /= 2.
+        outputs[0][0] = out.astype(node.outputs[0].dtype)
+
+    def grad(self, inputs, grads):
+        y, x = inputs
+        g, = grads
+        return [toeplitz_dot(g, x), toeplitz_dot(g, y)]
+
+    def infer_shape(self, node, shapes):
+        return [shapes[0][:1]]
+
+
+class ToeplitzSolve(Op):
+    """Solve `T x = b` for the symmetric positive definite Toeplitz matrix
+    `T` with first column `c`.
+
+    The first column of the inverse is computed by the Levinson-Durbin
+    recursion in O(n^2), the products with the inverse by FFT in
+    O(n log n).
+    """
+    __props__ = ()
+
+    def make_node(self, c, b):
+        c = tt.as_tensor_variable(c)
+        b = tt.as_tensor_variable(b)
+        return Apply(self, [c, b], [b.type()])
+
+    def perform(self, node, inputs, outputs, params=None):
+        c, b = inputs
+        x, _ = _levinson_durbin(c)
+        out = _toeplitz_inverse_dot(x, b.reshape((len(c), -1)))
+        outputs[0][0] = out.reshape(b.shape).astype(node.outputs[0].dtype)
+
+    def grad(self, inputs, grads):
+        c, b = inputs
+        g, = grads
+        x = self(c, b)
+        y = self(c, g)
+        return [-toeplitz_correlation(y, x), y]
+
+    def infer_shape(self, node, shapes):
+        return [shapes[1]]
+
+
+class ToeplitzInverseSums(Op):
+    """Gradient of the log-determinant of a symmetric positive definite
+    Toeplitz matrix with respect to its first column, the sums of the
+    diagonals of its inverse."""
+    __props__ = ()
+
+    def make_node(self, c):
+        c = tt.as_tensor_variable(c)
+        return Apply(self, [c], [c.type()])
+
+    def perform(self, node, inputs, outputs, params=None):
+        c, = inputs
+        n = len(c)
+        x, _ = _levinson_durbin(c)
+        z = np.concatenate([[0.], x[:0:-1]])
+        # sum_j v[j] v[j + k] (n - k - j) for both triangular factors of
+        # the Gohberg-Semencul formula
+        k = np.arange(n)
+        sums = np.zeros(n)
+        for v, sign in ((x, 1.), (z, -1.)):
+            V = v[:, None]
+            J = (k * v)[:, None]
+            sums += sign * ((n - k) * _correlate(V, V) - _correlate(J, V))
+        sums /= x[0]
+        sums[1:] *= 2.
+        outputs[0][0] = sums.astype(node.outputs[0].dtype)
+
+    def grad(self, inputs, grads):
+        return [theano.gradient.grad_not_implemented(self, 0, inputs[0])]
+
+    def infer_shape(self, node, shapes):
+        return shapes
+
+
+class ToeplitzLogDet(Op):
+    """Log-determinant of the symmetric positive definite Toeplitz matrix
+    with first column `c`, by the Levinson-Durbin recursion in O(n^2)."""
+    __props__ = ()
+
+    def make_node(self, c):
+        c = tt.as_tensor_variable(c)
+        return Apply(self, [c], [tt.scalar(dtype=c.dtype)])
+
+    def perform(self, node, inputs, outputs, params=None):
+        c, = inputs
+        _, log_det = _levinson_durbin(c)
+        outputs[0][0] = np.asarray(log_det, dtype=node.outputs[0].dtype)
+
+    def grad(self, inputs, grads):
+        c, = inputs
+        g, = grads
+        return [g * toeplitz_inverse_sums(c)]
+
+    def infer_shape(self, node, shapes):
+        return [()]
+
+
+class ToeplitzCholesky(Op):
+    """Lower Cholesky factor of the symmetric positive definite Toeplitz
+    matrix with first column `c`, by the Schur algorithm in O(n^2)."""
+    __props__ = ()
+
+    def make_node(self, c):
+        c = tt.as_tensor_variable(c)
+        return Apply(self, [c], [tt.matrix(dtype=c.dtype)])
+
+    def perform(self, node, inputs, outputs, params=None):
+        c, = inputs
+        L, _ = _toeplitz_cholesky(c)
+        outputs[0][0] = L.astype(node.outputs[0].dtype)
+
+    def grad(self, inputs, grads):
+        c, = inputs
+        g, = grads
+        return [ToeplitzCholeskyGrad()(c, g)]
+
+    def infer_shape(self, node, shapes):
+        return [shapes[0] * 2]
+
+
+class ToeplitzCholeskyGrad(Op):
+    __props__ = ()
+
+    def make_node(self, c, g):
+        c = tt.as_tensor_variable(c)
+        g = tt.as_tensor_variable(g)
+        return Apply(self, [c, g], [c.type()])
+
+    def perform(self, node, inputs, outputs, params=None):
+        c, g = inputs
+        L, V = _toeplitz_cholesky(c)
+        gc = _toeplitz_cholesky_grad(c, L, V, np.tril(g))
+        outputs[0][0] = gc.astype(node.outputs[0].dtype)
+
+    def infer_shape(self, node, shapes):
+        return shapes[:1]
+
+
+toeplitz_dot = ToeplitzDot()
+toeplitz_correlation = ToeplitzCorrelation()
+toeplitz_solve = ToeplitzSolve()
+toeplitz_inverse_sums = ToeplitzInverseSums()
+toeplitz_logdet = ToeplitzLogDet()
+toeplitz_cholesky = ToeplitzCholesky()
@@ -1,39 +1,238 @@
+import collections
 import functools
+import itertools
 import pickle
-import collections
+import sys
+import weakref
+
+import numpy as np
+
 from .util import biwrap
+
 CACHE_REGISTRY = []
 
+# all live caches, including the per-instance caches of bound methods
+_ALL_CACHES = weakref.WeakSet()
+# global recency counter, shared by all caches for the memory budget
+_TICKS = itertools.count()
+_MEMORY_BUDGET = [None]
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', 'hits, misses, evictions, size, maxsize, nbytes')
+
+
+class Cache:
+    """
+    Mapping with least-recently-used eviction and hit/miss statistics.
+
+    Parameters
+    ----------
+    name : str
+        Name of the cache in :func:`cache_info`.
+    maxsize : int, optional
+        Maximum number of entries. None (default) means unbounded.
+    sizeof : callable, optional
+        Estimate of the memory used by a cached value, in bytes. Used for
+        the global budget set by :func:`set_memory_budget`.
+    """
+
+    def __init__(self, name='', maxsize=None, sizeof=None):
+        self.name = name
+        self._maxsize = maxsize
+        self.sizeof = _estimate_nbytes if sizeof is None else sizeof
+        self._data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        _ALL_CACHES.add(self)
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        self._maxsize = maxsize
+        self._shrink()
+
+    def lookup(self, key):
+        """Return the cached value of `key` and count the hit or miss.
+
+        Raises KeyError if `key` is not cached.
+        """
+        try:
+            value, nbytes, _ = self._data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._data[key] = (value, nbytes, next(_TICKS))
+        self._data.move_to_end(key)
+        return value
+
+    def __getitem__(self, key):
+        return self._data[key][0]
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            self._pop(key)
+        nbytes = self.sizeof(value)
+        self._data[key] = (value, nbytes, next(_TICKS))
+        self.nbytes += nbytes
+        self._shrink()
+        _enforce_memory_budget()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, len(self),
+                         self.maxsize, self.nbytes)
+
+    def _pop(self, key):
+        _, nbytes, _ = self._data.pop(key)
+        self.nbytes -= nbytes
+
+    def _oldest_tick(self):
+        for _, _, tick in self._data.values():
+            return tick
+        return None
+
+    def _evict_oldest(self):
+        key = next(iter(self._data))
+        self._pop(key)
+        self.evictions += 1
+
+    def _shrink(self):
+        if self._maxsize is None:
+            return
+        while len(self._data) > self._maxsize:
+            self._evict_oldest()
+
+    def _drop_dead_keys(self, *args):
+        dead = [key for key in self._data if _has_dead_ref(key)]
+        for key in dead:
+            self._pop(key)
+
+
+def _has_dead_ref(key):
+    if isinstance(key, weakref.ref):
+        return key() is None
+    if isinstance(key, tuple):
+        return any(_has_dead_ref(k) for k in key)
+    return False
+
+
+def _enforce_memory_budget():
+    budget = _MEMORY_BUDGET[0]
+    if budget is None:
+        return
+    caches = list(_ALL_CACHES)
+    total = sum(cache.nbytes for cache in caches)
+    while total > budget:
+        filled = [cache for cache in caches if len(cache)]
+        if not filled:
+            break
+        oldest = min(filled, key=lambda cache: cache._oldest_tick())
+        total -= oldest.nbytes
+        oldest._evict_oldest()
+        total += oldest.nbytes
+
+
+def set_memory_budget(nbytes=None):
+    """Limit the estimated memory of all memoization caches together.
+
+    When the budget is exceeded, the least recently used entries of all
+    caches are evicted. None (default) removes the limit.
+    """
+    _MEMORY_BUDGET[0] = nbytes
+    _enforce_memory_budget()
+
+
+def _estimate_nbytes(value):
+    """Rough estimate of the memory held by a cached value."""
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes)
+    # compiled theano functions keep their inputs and shared values
+    storage = getattr(value, 'input_storage', None)
+    if isinstance(storage, list):
+        return sys.getsizeof(value) + sum(
+            _estimate_nbytes(getattr(container, 'data', None))
+            for container in storage)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(map(_estimate_nbytes, value))
+    return sys.getsizeof(value)
+
 
 @biwrap
-def memoize(obj, bound=False):
+def memoize(obj, bound=False, maxsize=None):
     """
-    An expensive memoizer that works with unhashables
+    A memoizer that works with unhashables
+
+    The results are stored in a :class:`Cache` with least-recently-used
+    eviction once `maxsize` entries are stored (unbounded by default).
+    Arguments that are instances of :class:`WithMemoization` (e.g. models)
+    are only weakly referenced, their entries are dropped once they are
+    garbage collected.
     """
     # this is declared not to be a bound method, so just attach new attr to obj
     if not bound:
-        obj.cache = {}
+        obj.cache = Cache(_qualified_name(obj), maxsize)
         CACHE_REGISTRY.append(obj.cache)
 
     @functools.wraps(obj)
     def memoizer(*args, **kwargs):
         if not bound:
-            key = (hashable(args), hashable(kwargs))
             cache = obj.cache
+            key = (hashable(args, cache), hashable(kwargs, cache))
         else:
             # bound methods have self as first argument, remove it to compute key
-            key = (hashable(args[1:]), hashable(kwargs))
             if not hasattr(args[0], '_cache'):
-                setattr(args[0], '_cache', collections.defaultdict(dict))
+                setattr(args[0], '_cache', {})
                 # do not add to cache regestry
-            cache = getattr(args[0], '_cache')[obj.__name__]
-        if key not in cache:
-            cache[key] = obj(*args, **kwargs)
-
-        return cache[key]
+            caches = getattr(args[0], '_cache')
+            cache = caches.get(obj.__name__)
+            if cache is None:
+                cache = caches[obj.__name__] = Cache(obj.__name__, maxsize)
+            key = (hashable(args[1:], cache), hashable(kwargs, cache))
+        try:
+            return cache.lookup(key)
+        except KeyError:
+            value = cache[key] = obj(*args, **kwargs)
+            return value
+    if not bound:
+        memoizer.cache_info = obj.cache.info
     return memoizer
 
 
+def _qualified_name(obj):
+    module = getattr(obj, '__module__', None)
+    name = getattr(obj, '__qualname__', getattr(obj, '__name__', repr(obj)))
+    return name if module is None else '{}.{}'.format(module, name)
+
+
+def cache_info():
+    """Statistics of the caches of all memoized functions.
+
+    Returns
+    -------
+    dict of :class:`CacheInfo`, indexed by the qualified function names
+    """
+    return {cache.name: cache.info() for cache in CACHE_REGISTRY}
+
+
 def clear_cache(obj=None):
     if obj is None:
         for c in CACHE_REGISTRY:
@@ -59,14 +258,29 @@ class WithMemoization:
         self.__dict__.update(state)
 
 
-def hashable(a):
+def hashable(a, cache=None):
     """
     Turn some unhashable objects into hashable ones.
+
+    Containers are converted recursively, numpy arrays are keyed by their
+    contents and instances of :class:`WithMemoization` by a weak reference.
+    If `cache` is given, its entries are removed when such an instance is
+    garbage collected. Everything else that is hashable, e.g. theano
+    variables, is used as is. Pickling is the last resort.
     """
+    if isinstance(a, WithMemoization):
+        callback = None if cache is None else cache._drop_dead_keys
+        return weakref.ref(a, callback)
     if isinstance(a, dict):
-        return hashable(tuple((hashable(a1), hashable(a2)) for a1, a2 in a.items()))
+        return (dict, tuple((hashable(k, cache), hashable(v, cache))
+                            for k, v in a.items()))
+    if isinstance(a, (tuple, list)):
+        return (type(a), tuple(hashable(v, cache) for v in a))
+    if isinstance(a, np.ndarray):
+        return (np.ndarray, a.dtype.str, a.shape, hash(a.tobytes()))
     try:
-        return hash(a)
+        hash(a)
+        return a
     except TypeError:
         pass
     # Not hashable >>>
@@ -74,6 +288,6 @@ def hashable(a):
         return hash(pickle.dumps(a))
     except Exception:
         if hasattr(a, '__dict__'):
-            return hashable(a.__dict__)
+            return hashable(a.__dict__, cache)
         else:
             return id(a)
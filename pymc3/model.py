@@ -16,7 +16,8 @@ from pymc3.theanof import set_theano_conf, floatX
 import pymc3 as pm
 from pymc3.math import flatten_list
 from .memoize import memoize, WithMemoization
-from .theanof import gradient, hessian, inputvars, generator
+from .theanof import (gradient, hessian, hessian_vector_product, inputvars,
+                      generator)
 from .vartypes import typefilter, discrete_types, continuous_types, isgenerator
 from .blocking import DictToArrayBijection, ArrayOrdering
 from .util import get_transformed_name
@@ -109,10 +110,14 @@ def get_named_nodes_and_relations(graph):
     else:
         node_parents = {}
         node_children = {}
-    return _get_named_nodes_and_relations(graph, None, {}, node_parents, node_children)
+    return _get_named_nodes_and_relations(graph, None, {}, node_parents,
+                                          node_children, set())
 
 def _get_named_nodes_and_relations(graph, parent, leaf_nodes,
-                                        node_parents, node_children):
+                                   node_parents, node_children, visited):
+    # Shared subgraphs are only walked once: the inputs of a named node are
+    # expanded on its first visit, those of an unnamed node once per named
+    # parent.
     if getattr(graph, 'owner', None) is None:  # Leaf node
         if graph.name is not None:  # Named leaf node
             leaf_nodes.update({graph.name: graph})
@@ -136,18 +141,22 @@ def _get_named_nodes_and_relations(graph, parent, leaf_nodes,
                 node_children[parent].add(graph)
             else:
                 node_parents[graph] = set()
+            if graph in visited:
+                return leaf_nodes, node_parents, node_children
+            visited.add(graph)
             # The current node will be set as the parent of the next
             # nodes only if it is a named node
             parent = graph
             # Init the nodes children to an empty set
             node_children[graph] = set()
+        else:
+            if (graph, parent) in visited:
+                return leaf_nodes, node_parents, node_children
+            visited.add((graph, parent))
         for i in graph.owner.inputs:
-            temp_nodes, temp_inter, temp_tree = \
-                _get_named_nodes_and_relations(i, parent, leaf_nodes,
-                                               node_parents, node_children)
-            leaf_nodes.update(temp_nodes)
-            node_parents.update(temp_inter)
-            node_children.update(temp_tree)
+            _get_named_nodes_and_relations(i, parent, leaf_nodes,
+                                           node_parents, node_children,
+                                           visited)
     return leaf_nodes, node_parents, node_children
 
 
@@ -402,8 +411,6 @@ class ValueGradFunction:
     """
     def __init__(self, cost, grad_vars, extra_vars=None, dtype=None,
                  casting='no', **kwargs):
-        from .distributions import TensorType
-
         if extra_vars is None:
             extra_vars = []
 
@@ -436,18 +443,7 @@ class ValueGradFunction:
                                 'floating point but is %s.'
                                 % (var.name, var.dtype))
 
-        givens = []
-        self._extra_vars_shared = {}
-        for var in extra_vars:
-            shared = theano.shared(var.tag.test_value, var.name + '_shared__')
-            # test TensorType compatibility
-            if hasattr(var.tag.test_value, 'shape'):
-                testtype = TensorType(var.dtype, var.tag.test_value.shape)
-
-                if testtype != shared.type:
-                    shared.type = testtype
-            self._extra_vars_shared[var.name] = shared
-            givens.append((var, shared))
+        self._extra_vars_shared, givens = _make_extra_shared(extra_vars)
 
         self._vars_joined, self._cost_joined = self._build_joined(
             self._cost, grad_vars, self._ordering.vmap)
@@ -457,8 +453,11 @@ class ValueGradFunction:
 
         inputs = [self._vars_joined]
 
+        self._givens = givens
+        self._function_kwargs = kwargs
         self._theano_function = theano.function(
             inputs, [self._cost_joined, grad], givens=givens, **kwargs)
+        self._hessp_function = None
 
     def set_extra_values(self, extra_vars):
         self._extra_are_set = True
@@ -495,6 +494,35 @@ class ValueGradFunction:
             out[...] = dlogp
             return logp
 
+    def hessp(self, array, vector, extra_vars=None):
+        """Compute the product of the negative hessian of the cost with a vector.
+
+        The function is compiled on the first call. Its cost is a small
+        multiple of a gradient evaluation, and the hessian is never formed.
+        """
+        if extra_vars is not None:
+            self.set_extra_values(extra_vars)
+
+        if not self._extra_are_set:
+            raise ValueError('Extra values are not set.')
+
+        if array.shape != (self.size,) or vector.shape != (self.size,):
+            raise ValueError('Invalid shape for array or vector. Must be %s '
+                             'but are %s and %s.'
+                             % ((self.size,), array.shape, vector.shape))
+
+        if self._hessp_function is None:
+            vector_joined = tt.vector('__vector_joined', dtype=self.dtype)
+            vector_joined.tag.test_value = np.zeros(self.size, dtype=self.dtype)
+            hessp = hessian_vector_product(
+                self._cost_joined, self._vars_joined, vector_joined)
+            hessp.name = '__hessp'
+            self._hessp_function = theano.function(
+                [self._vars_joined, vector_joined], hessp,
+                givens=self._givens, **self._function_kwargs)
+
+        return self._hessp_function(array, vector)
+
     @property
     def profile(self):
         """Profiling information of the underlying theano function."""
@@ -504,21 +532,24 @@ class ValueGradFunction:
         """Convert a dictionary with values for grad_vars to an array."""
         array = np.empty(self.size, dtype=self.dtype)
         for varmap in self._ordering.vmap:
-            array[varmap.slc] = point[varmap.var].ravel().astype(self.dtype)
+            array[varmap.slc] = np.ravel(point[varmap.var])
         return array
 
     def array_to_dict(self, array):
-        """Convert an array to a dictionary containing the grad_vars."""
+        """Convert an array to a dictionary containing the grad_vars.
+
+        The values are reshaped views into `array`, not copies.
+        """
         if array.shape != (self.size,):
             raise ValueError('Array should have shape (%s,) but has %s'
                              % (self.size, array.shape))
         if array.dtype != self.dtype:
             raise ValueError('Array has invalid dtype. Should be %s but is %s'
-                             % (self._dtype, self.dtype))
+                             % (self.dtype, array.dtype))
         point = {}
         for varmap in self._ordering.vmap:
             data = array[varmap.slc].reshape(varmap.shp)
-            point[varmap.var] = data.astype(varmap.dtyp)
+            point[varmap.var] = data.astype(varmap.dtyp, copy=False)
 
         return point
 
@@ -543,6 +574,214 @@ class ValueGradFunction:
         return args_joined, theano.clone(cost, replace=replace)
 
 
+def _make_extra_shared(extra_vars):
+    """Create shared variables holding the values of `extra_vars`."""
+    from .distributions import TensorType
+
+    givens = []
+    extra_vars_shared = {}
+    for var in extra_vars:
+        shared = theano.shared(var.tag.test_value, var.name + '_shared__')
+        # test TensorType compatibility
+        if hasattr(var.tag.test_value, 'shape'):
+            testtype = TensorType(var.dtype, var.tag.test_value.shape)
+
+            if testtype != shared.type:
+                shared.type = testtype
+        extra_vars_shared[var.name] = shared
+        givens.append((var, shared))
+    return extra_vars_shared, givens
+
+
+class BatchedLogpFunction:
+    """Create a theano function that computes a log-probability, and
+    optionally its gradient, for every row of a matrix of flat points.
+
+    Parameters
+    ----------
+    factors : list of theano variables
+        Elementwise log-probability terms, the cost of a point is the sum
+        of all their elements.
+    vars : list of named theano variables
+        The variables whose flattened values form the rows of the input.
+    extra_vars : list of named theano variables or None
+        Other arguments of the function that are assumed constant. They
+        are stored in shared variables and can be set using
+        `set_extra_values`.
+    compute_grad : bool, default=False
+        Whether to also return the gradient of the cost of every row.
+    vectorize : {'auto', True, False}, default='auto'
+        Whether to evaluate all rows in a single graph with a leading batch
+        dimension (see :func:`pymc3.theanof.batch_graph`). If False or if
+        the graph contains ops that can not be batched, the rows are
+        evaluated in a `theano.scan` loop. With 'auto', the batched graph is
+        additionally compared with the unbatched one at random points
+        around the test point, and only used if they agree.
+    dtype : str, default=theano.config.floatX
+        The dtype of the arrays.
+    kwargs
+        Extra arguments are passed on to `theano.function`.
+
+    Attributes
+    ----------
+    size : int
+        The number of elements in one row.
+    vectorized : bool
+        Whether the compiled function uses the batched graph.
+    """
+    def __init__(self, factors, vars, extra_vars=None, compute_grad=False,
+                 vectorize='auto', dtype=None, **kwargs):
+        if extra_vars is None:
+            extra_vars = []
+
+        names = [arg.name for arg in vars + extra_vars]
+        if any(name is None for name in names):
+            raise ValueError('Arguments must be named.')
+        if len(set(names)) != len(names):
+            raise ValueError('Names of the arguments are not unique.')
+        if vectorize not in ('auto', True, False):
+            raise ValueError("vectorize must be one of 'auto', True or False.")
+
+        if dtype is None:
+            dtype = theano.config.floatX
+        self.dtype = dtype
+        if compute_grad:
+            for var in vars:
+                if not np.issubdtype(var.dtype, np.floating):
+                    raise TypeError('Invalid dtype for variable %s. Must be '
+                                    'floating point but is %s.'
+                                    % (var.name, var.dtype))
+
+        self._vars = vars
+        self._extra_vars = extra_vars
+        self._ordering = ArrayOrdering(vars)
+        self.size = self._ordering.size
+        self.compute_grad = compute_grad
+        self._extra_are_set = False
+        self._extra_vars_shared, givens = _make_extra_shared(extra_vars)
+
+        with theano.configparser.change_flags(compute_test_value='ignore'):
+            batch = tt.matrix('__args_batch', dtype=self.dtype)
+            outputs = None
+            if vectorize:
+                try:
+                    outputs = self._build_vectorized(factors, batch)
+                except NotImplementedError:
+                    outputs = None
+            if outputs is not None:
+                self._theano_function = theano.function(
+                    [batch], outputs, givens=givens, **kwargs)
+                if vectorize == 'auto' and not self._check_vectorized(factors, givens):
+                    outputs = None
+            self.vectorized = outputs is not None
+            if not self.vectorized:
+                outputs = self._build_scan(factors, batch)
+                self._theano_function = theano.function(
+                    [batch], outputs, givens=givens, **kwargs)
+
+    def _replacement(self, var, value):
+        """Reshape the slice of a flat (batch of) point(s) that belongs to `var`."""
+        varmap = self._ordering[var.name]
+        batch_ndim = value.ndim - 1
+        shape = tuple(value.shape[i] for i in range(batch_ndim)) + varmap.shp
+        value = value[..., varmap.slc].reshape(shape, ndim=batch_ndim + len(varmap.shp))
+        value = tt.patternbroadcast(value, (False,) * batch_ndim + var.broadcastable)
+        return tt.cast(value, var.dtype)
+
+    def _build_vectorized(self, factors, batch):
+        replace = {var: self._replacement(var, batch) for var in self._vars}
+        factors, batched = pm.theanof.batch_graph(factors, replace)
+        logp = tt.zeros_like(batch[:, 0])
+        for factor, is_batched in zip(factors, batched):
+            if is_batched:
+                if factor.ndim > 1:
+                    factor = tt.sum(factor, axis=list(range(1, factor.ndim)))
+                logp = logp + factor
+            else:
+                logp = logp + tt.sum(factor)
+        logp.name = '__logp_batch'
+        if self.compute_grad:
+            grad = tt.grad(tt.sum(logp), batch)
+            grad.name = '__grad_batch'
+            return [logp, grad]
+        return logp
+
+    def _build_scan(self, factors, batch):
+        cost = tt.sum([tt.sum(factor) for factor in factors])
+
+        def single(row):
+            replace = {var: self._replacement(var, row) for var in self._vars}
+            logp = theano.clone(cost, replace=replace)
+            if self.compute_grad:
+                return [logp, tt.grad(logp, row)]
+            return logp
+
+        outputs, _ = theano.scan(single, sequences=[batch], name='batched_logp')
+        return outputs
+
+    def _check_vectorized(self, factors, givens):
+        """Compare the batched graph with the unbatched cost at random points."""
+        row = tt.vector('__args_row', dtype=self.dtype)
+        replace = {var: self._replacement(var, row) for var in self._vars}
+        cost = theano.clone(tt.sum([tt.sum(factor) for factor in factors]),
+                            replace=replace)
+        single = theano.function([row], cost, givens=givens)
+
+        rng = np.random.RandomState(2412)
+        x0 = np.empty(self.size, dtype=self.dtype)
+        for var in self._vars:
+            x0[self._ordering[var.name].slc] = np.ravel(var.tag.test_value)
+        points = x0 + rng.uniform(-.5, .5, size=(3, self.size))
+        for var in self._vars:
+            if var.dtype in discrete_types:
+                slc = self._ordering[var.name].slc
+                points[:, slc] = np.round(points[:, slc])
+        points = points.astype(self.dtype)
+
+        try:
+            batched = self._theano_function(points)
+        except Exception:
+            # the batched graph is not valid for these inputs
+            return False
+        if self.compute_grad:
+            batched = batched[0]
+        expected = np.array([single(point) for point in points])
+        rtol = 1e-5 if self.dtype == 'float64' else 1e-3
+        return np.allclose(batched, expected, rtol=rtol, equal_nan=True)
+
+    def set_extra_values(self, extra_vars):
+        self._extra_are_set = True
+        for var in self._extra_vars:
+            self._extra_vars_shared[var.name].set_value(extra_vars[var.name])
+
+    def __call__(self, array, extra_vars=None):
+        """Evaluate the function at the rows of `array`.
+
+        Parameters
+        ----------
+        array : array of shape `(n_points, size)`
+        extra_vars : dict, optional
+            New values of the extra variables.
+
+        Returns
+        -------
+        logp : array of shape `(n_points,)`
+        dlogp : array of shape `(n_points, size)`
+            Only if `compute_grad` is True.
+        """
+        if extra_vars is not None:
+            self.set_extra_values(extra_vars)
+
+        if self._extra_vars and not self._extra_are_set:
+            raise ValueError('Extra values are not set.')
+
+        if array.ndim != 2 or array.shape[1] != self.size:
+            raise ValueError('Invalid shape for array. Must be (n_points, %s) '
+                             'but is %s.' % (self.size, array.shape))
+
+        return self._theano_function(np.asarray(array, dtype=self.dtype))
+
+
 class Model(Context, Factor, WithMemoization, metaclass=InitContextMeta):
     """Encapsulates the variables and likelihood factors of a model.
 
@@ -662,6 +901,10 @@ class Model(Context, Factor, WithMemoization, metaclass=InitContextMeta):
             self.deterministics = treelist()
             self.potentials = treelist()
             self.missing_values = treelist()
+        # draw orders resolved by `draw_values`
+        self._draw_values_plans = {}
+        # free variables of the factors, see `markov_blanket`
+        self._factor_inputs_cache = {}
 
     @property
     def model(self):
@@ -721,6 +964,51 @@ class Model(Context, Factor, WithMemoization, metaclass=InitContextMeta):
         extra_vars = [var for var in self.free_RVs if var.name not in varnames]
         return ValueGradFunction(self.logpt, grad_vars, extra_vars, **kwargs)
 
+    def logp_batched_function(self, vars=None, compute_grad=False,
+                              jacobian=True, factors=None, **kwargs):
+        """Compile a function of the log-probability for many points at once.
+
+        Parameters
+        ----------
+        vars : list of free variables, optional
+            The variables whose flattened values form the rows of the
+            input matrix (Defaults to all free variables). The other free
+            variables are extra variables of the function.
+        compute_grad : bool
+            Whether to also compute the gradients with respect to `vars`.
+        jacobian : bool
+            Whether to include the jacobian terms of transformed variables.
+        factors : list, optional
+            The random variables and potentials whose log-probabilities
+            are summed (Defaults to all of them).
+        kwargs
+            Extra arguments are passed on to :class:`BatchedLogpFunction`.
+
+        Returns
+        -------
+        BatchedLogpFunction
+        """
+        if vars is None:
+            vars = list(typefilter(self.free_RVs, continuous_types))
+            if not compute_grad:
+                vars = list(self.free_RVs)
+        if factors is None:
+            factors = self.basic_RVs + self.potentials
+        varnames = [var.name for var in vars]
+        extra_vars = [var for var in self.free_RVs if var.name not in varnames]
+
+        terms = []
+        for factor in factors:
+            if not hasattr(factor, 'logp_elemwiset'):
+                # potential
+                terms.append(factor)
+            elif jacobian:
+                terms.append(factor.logp_elemwiset * factor.scaling)
+            else:
+                terms.append(factor.logp_nojac_unscaledt * factor.scaling)
+        return BatchedLogpFunction(terms, vars, extra_vars,
+                                   compute_grad=compute_grad, **kwargs)
+
     @property
     def logpt(self):
         """Theano scalar of log-probability of the model"""
@@ -760,6 +1048,57 @@ class Model(Context, Factor, WithMemoization, metaclass=InitContextMeta):
             factors += [tt.sum(factor) for factor in self.potentials]
             return tt.sum(factors)
 
+    def markov_blanket(self, vars):
+        """Factors of the log-probability that depend on `vars`.
+
+        These are the random variables in `vars`, their children and all
+        other random variables and potentials whose graphs contain any of
+        `vars`. The remaining factors are constant in `vars`.
+
+        Parameters
+        ----------
+        vars : list of free random variables
+
+        Returns
+        -------
+        list of random variables and potentials, in the order of
+        `basic_RVs + potentials`
+        """
+        vars = set(inputvars(vars))
+        return [factor for factor in self.basic_RVs + self.potentials
+                if not vars.isdisjoint(self._factor_inputs(factor))]
+
+    def blanket_logpt(self, vars):
+        """Theano scalar of the terms of the log-probability that depend
+        on `vars`.
+
+        It differs from `logpt` by terms that are constant in `vars`, and it
+        is `logpt` if all factors of the model depend on `vars`. Step
+        methods that only update `vars` can use it in place of `logpt`.
+        """
+        factors = self.markov_blanket(vars)
+        if len(factors) == len(self.basic_RVs) + len(self.potentials):
+            return self.logpt
+        with self:
+            terms = [factor.logpt if isinstance(factor, Factor) else tt.sum(factor)
+                     for factor in factors]
+            logp = tt.sum(terms)
+            if self.name:
+                logp.name = '__logp_blanket_%s' % self.name
+            else:
+                logp.name = '__logp_blanket'
+            return logp
+
+    def _factor_inputs(self, factor):
+        """Free variables in the graph of a factor, computed once."""
+        try:
+            return self._factor_inputs_cache[factor]
+        except KeyError:
+            graph = factor.logpt if isinstance(factor, Factor) else factor
+            inputs = frozenset(inputvars(graph))
+            self._factor_inputs_cache[factor] = inputs
+            return inputs
+
     @property
     def vars(self):
         """List of unobserved random variables used as inputs to the model
@@ -1153,8 +1492,9 @@ def Point(*args, **kwargs):
     except Exception as e:
         raise TypeError(
             "can't turn {} and {} into a dict. {}".format(args, kwargs, e))
+    varnames = set(map(str, model.vars))
     return dict((str(k), np.array(v)) for k, v in d.items()
-                if str(k) in map(str, model.vars))
+                if str(k) in varnames)
 
 
 class FastPointFunc:
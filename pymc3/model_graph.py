@@ -1,21 +1,14 @@
-import itertools
+import weakref
 
-from theano.gof.graph import ancestors
 from theano.compile import SharedVariable
 
 from .util import get_default_varnames
 import pymc3 as pm
 
+__all__ = ['ModelGraph', 'model_to_graphviz', 'get_dependencies']
 
-def powerset(iterable):
-    """All *nonempty* subsets of an iterable.
-
-    From itertools docs.
-
-    powerset([1,2,3]) --> (1,) (2,) (3,) (1,2) (1,3) (2,3) (1,2,3)
-    """
-    s = list(iterable)
-    return itertools.chain.from_iterable(itertools.combinations(s, r) for r in range(1, len(s)+1))
+# dependencies of the named variables by model, see `get_dependencies`
+_DEPENDENCIES = weakref.WeakKeyDictionary()
 
 
 class ModelGraph:
@@ -24,7 +17,8 @@ class ModelGraph:
         self.var_names = get_default_varnames(self.model.named_vars, include_transformed=False)
         self.var_list = self.model.named_vars.values()
         self.transform_map = {v.transformed: v.name for v in self.var_list if hasattr(v, 'transformed')}
-        self._deterministics = None
+        self._named = set(self.var_list)
+        self._nearest = {}
 
     def get_deterministics(self, var):
         """Compute the deterministic nodes of the graph"""
@@ -35,29 +29,46 @@ class ModelGraph:
                 deterministics.append(v)
         return deterministics
 
-    def _ancestors(self, var, func, blockers=None):
-        """Get ancestors of a function that are also named PyMC3 variables"""
-        return set([j for j in ancestors([func], blockers=blockers) if j in self.var_list and j != var])
+    def _nearest_named(self, var):
+        """Named variables that are ancestors of `var` without another named
+        variable in between. `var` itself is returned if it is named.
+
+        The results for all intermediate variables are stored, so that every
+        node of the model graph is visited once per `ModelGraph`.
+        """
+        nearest = self._nearest
+        named = self._named
+        stack = [var]
+        while stack:
+            v = stack[-1]
+            if v in nearest:
+                stack.pop()
+            elif v in named or v.owner is None:
+                nearest[v] = frozenset([v]) if v in named else frozenset()
+                stack.pop()
+            else:
+                missing = [i for i in v.owner.inputs if i not in nearest]
+                if missing:
+                    stack.extend(missing)
+                else:
+                    nearest[v] = frozenset().union(
+                        *(nearest[i] for i in v.owner.inputs))
+                    stack.pop()
+        return nearest[var]
 
     def _get_ancestors(self, var, func):
-        """Get all ancestors of a function, doing some accounting for deterministics
+        """Get the named variables that are direct inputs of `func`
 
-        Specifically, if a deterministic is an input, theano.gof.graph.ancestors will
-        return only the inputs *to the deterministic*.  However, if we pass in the
-        deterministic as a blocker, it will skip those nodes.
+        Deterministics between them are accounted for by stopping at the
+        first named variable on every path.
         """
-        deterministics = self.get_deterministics(var)
-        upstream = self._ancestors(var, func)
-
-        # Usual case
-        if upstream == self._ancestors(var, func, blockers=upstream):
-            return upstream
-        else: # deterministic accounting
-            for d in powerset(upstream):
-                blocked = self._ancestors(var, func, blockers=d)
-                if set(d) == blocked:
-                    return d
-        raise RuntimeError('Could not traverse graph. Consider raising an issue with developers.')
+        if func.owner is not None and func in self._named:
+            # a deterministic or potential, skip the variable itself
+            inputs = func.owner.inputs
+        else:
+            inputs = [func]
+        upstream = frozenset().union(*(self._nearest_named(i) for i in inputs))
+        return set(upstream - {var})
 
     def _filter_parents(self, var, parents):
         """Get direct parents of a var, as strings"""
@@ -174,12 +185,38 @@ class ModelGraph:
                 for var_name in var_names:
                     self._make_node(var_name, graph)
 
-        for key, values in self.make_compute_graph().items():
+        for key, values in get_dependencies(self.model).items():
             for value in values:
                 graph.edge(value.replace(':', '&'), key.replace(':', '&'))
         return graph
 
 
+def get_dependencies(model=None):
+    """Direct parents of the named variables of a model.
+
+    The graph of the model is traversed once and the result is stored until
+    variables are added to the model. Deterministics count as variables, a
+    random variable that depends on another one through a deterministic has
+    the deterministic as parent.
+
+    Parameters
+    ----------
+    model : Model (optional if in `with` context)
+
+    Returns
+    -------
+    dict: str -> set[str]
+        The names of the parents of every variable, without transformed
+        variables.
+    """
+    model = pm.modelcontext(model)
+    n_vars = len(model.named_vars)
+    cached = _DEPENDENCIES.get(model)
+    if cached is None or cached[0] != n_vars:
+        cached = _DEPENDENCIES[model] = (n_vars, ModelGraph(model).make_compute_graph())
+    return {name: set(parents) for name, parents in cached[1].items()}
+
+
 def model_to_graphviz(model=None):
     """Produce a graphviz Digraph from a PyMC3 model.
 
@@ -9,7 +9,8 @@ import theano.gradient as tg
 
 from .backends.base import BaseTrace, MultiTrace
 from .backends.ndarray import NDArray
-from .distributions.distribution import draw_values
+from .distributions.distribution import (draw_values, use_random_state,
+                                         record_sampling_loops, _as_random_state)
 from .model import modelcontext, Point, all_continuous
 from .step_methods import (NUTS, HamiltonianMC, Metropolis, BinaryMetropolis,
                            BinaryGibbsMetropolis, CategoricalGibbsMetropolis,
@@ -221,7 +222,9 @@ def sample(draws=500, step=None, init='auto', n_init=200000, start=None, trace=N
           removed in a future release.
         * advi : Run ADVI to estimate posterior mean and diagonal mass matrix.
         * advi_map: Initialize ADVI with MAP and use MAP as starting point.
-        * map : Use the MAP as starting point. This is discouraged.
+        * map : Use the mode of the sampled density, found from the MAP, as starting point and
+          the curvature of a Laplace approximation at the mode as mass matrix. This is
+          discouraged.
         * nuts : Run NUTS and estimate posterior mean and mass matrix from the trace.
     n_init : int
         Number of iterations of initializer. Only works for 'nuts' and 'ADVI'.
@@ -408,6 +411,9 @@ def sample(draws=500, step=None, init='auto', n_init=200000, start=None, trace=N
 
         if isinstance(step, list):
             step = CompoundStep(step)
+        # a step method reused from an earlier run must not carry its state
+        if hasattr(step, 'reset_state'):
+            step.reset_state()
         if start is None:
             start = {}
         if isinstance(start, dict):
@@ -850,7 +856,7 @@ def _prepare_iter_population(draws, chains, step, start, parallelize, tune=None,
     steppers = [None] * nchains
     for c in range(nchains):
         # need indepenent samplers for each chain
-        # it is important to copy the actual steppers (but not the delta_logp)
+        # it is important to copy the actual steppers (but not the compiled logp)
         if isinstance(step, CompoundStep):
             chainstep = CompoundStep([copy(m) for m in step.methods])
         else:
@@ -1045,7 +1051,7 @@ def stop_tuning(step):
 
 
 def sample_posterior_predictive(trace, samples=None, model=None, vars=None, size=None,
-                                random_seed=None, progressbar=True):
+                                random_seed=None, progressbar=True, cores=1, chunks=None):
     """Generate posterior predictive samples from a model given a trace.
 
     Parameters
@@ -1063,12 +1069,22 @@ def sample_posterior_predictive(trace, samples=None, model=None, vars=None, size
     size : int
         The number of random draws from the distribution specified by the parameters in each
         sample of the trace.
-    random_seed : int
-        Seed for the random number generator.
+    random_seed : int or numpy.random.RandomState
+        Seed for the random number generator, or the random state to draw
+        the samples from. The global numpy random state is left untouched,
+        so that several predictive samplings can run in threads.
     progressbar : bool
         Whether or not to display a progress bar in the command line. The bar shows the percentage
         of completion, the sampling speed in samples per second (SPS), and the estimated remaining
         time until completion ("expected time of arrival"; ETA).
+    cores : int
+        The number of processes that draw the samples. Defaults to 1.
+    chunks : int
+        The number of shards the posterior draws are split into. Every shard
+        is drawn with its own random state seeded from `random_seed`, so that
+        the samples are the same for a given `random_seed` and `chunks`,
+        whatever the number of `cores`. Defaults to `cores` if it is larger
+        than 1, otherwise all samples are drawn from a single random state.
 
     Returns
     -------
@@ -1090,8 +1106,15 @@ def sample_posterior_predictive(trace, samples=None, model=None, vars=None, size
     if vars is None:
         vars = model.observed_RVs
 
-    if random_seed is not None:
-        np.random.seed(random_seed)
+    if chunks is None and cores > 1:
+        chunks = cores
+    if chunks is not None:
+        if chunks < 1 or cores < 1:
+            raise ValueError('`chunks` and `cores` must be positive.')
+        points = [_trace_point(trace, idx, nchain, len_trace)
+                  for idx in range(samples)]
+        return _sample_posterior_predictive_shards(
+            points, vars, size, random_seed, progressbar, cores, chunks)
 
     indices = np.arange(samples)
 
@@ -1100,16 +1123,12 @@ def sample_posterior_predictive(trace, samples=None, model=None, vars=None, size
 
     ppc_trace = defaultdict(list)
     try:
-        for idx in indices:
-            if nchain > 1:
-                chain_idx, point_idx = np.divmod(idx, len_trace)
-                param = trace._straces[chain_idx % nchain].point(point_idx)
-            else:
-                param = trace[idx % len_trace]
-
-            values = draw_values(vars, point=param, size=size)
-            for k, v in zip(vars, values):
-                ppc_trace[k.name].append(v)
+        with use_random_state(random_seed):
+            for idx in indices:
+                param = _trace_point(trace, idx, nchain, len_trace)
+                values = draw_values(vars, point=param, size=size)
+                for k, v in zip(vars, values):
+                    ppc_trace[k.name].append(v)
 
     except KeyboardInterrupt:
         pass
@@ -1121,6 +1140,106 @@ def sample_posterior_predictive(trace, samples=None, model=None, vars=None, size
     return {k: np.asarray(v) for k, v in ppc_trace.items()}
 
 
+def _trace_point(trace, idx, nchain, len_trace):
+    if nchain > 1:
+        chain_idx, point_idx = np.divmod(idx, len_trace)
+        return trace._straces[chain_idx % nchain].point(point_idx)
+    return trace[idx % len_trace]
+
+
+class _PredictiveShardDrawer:
+    """Draw the posterior predictive samples of shards of posterior points
+    into the preallocated arrays `out`, indexed by variable name."""
+
+    def __init__(self, vars, size, out):
+        self.vars = vars
+        self.size = size
+        self.out = out
+
+    def __call__(self, shard):
+        start, points, seed = shard
+        random_state = np.random.RandomState(seed)
+        for i, point in enumerate(points, start):
+            values = draw_values(self.vars, point=point, size=self.size,
+                                 random_state=random_state)
+            for var, value in zip(self.vars, values):
+                out = self.out[var.name]
+                if np.shape(value) != out.shape[1:]:
+                    raise ValueError(
+                        'The posterior predictive samples of {} have shape {} '
+                        'instead of {}.'.format(var.name, np.shape(value),
+                                                out.shape[1:]))
+                out[i] = value
+        return len(points)
+
+
+# the shard drawer of a worker process, set by `_init_predictive_worker`
+_PREDICTIVE_DRAWER = None
+
+
+def _init_predictive_worker(vars, size, buffers, shapes):
+    global _PREDICTIVE_DRAWER
+    out = {name: np.frombuffer(buffers[name], dtype).reshape(shape)
+           for name, (shape, dtype) in shapes.items()}
+    _PREDICTIVE_DRAWER = _PredictiveShardDrawer(vars, size, out)
+
+
+def _draw_predictive_shard(shard):
+    return _PREDICTIVE_DRAWER(shard)
+
+
+def _sample_posterior_predictive_shards(points, vars, size, random_seed,
+                                        progressbar, cores, chunks):
+    """Draw the posterior predictive samples of `points` in `chunks` shards,
+    each with its own seed, using `cores` processes that write into shared
+    memory."""
+    if not points or not vars:
+        return {}
+    seeds = _as_random_state(random_seed).randint(2 ** 30, size=chunks)
+    bounds = np.linspace(0, len(points), chunks + 1).astype(int)
+    shards = [(start, points[start:stop], seed)
+              for start, stop, seed in zip(bounds[:-1], bounds[1:], seeds)
+              if stop > start]
+
+    # the shape and dtype of one sample of each variable, from a throwaway draw
+    first = draw_values(vars, point=points[0], size=size,
+                        random_state=np.random.RandomState(0))
+    shapes = {var.name: ((len(points),) + np.shape(value),
+                         np.asarray(value).dtype)
+              for var, value in zip(vars, first)}
+
+    if progressbar:
+        progress = tqdm(total=len(points))
+    try:
+        if cores == 1:
+            out = {name: np.empty(shape, dtype)
+                   for name, (shape, dtype) in shapes.items()}
+            drawer = _PredictiveShardDrawer(vars, size, out)
+            for shard in shards:
+                n = drawer(shard)
+                if progressbar:
+                    progress.update(n)
+            return out
+
+        import multiprocessing
+        import multiprocessing.sharedctypes
+        buffers = {name: multiprocessing.sharedctypes.RawArray(
+                       'c', max(int(np.prod(shape)) * dtype.itemsize, 1))
+                   for name, (shape, dtype) in shapes.items()}
+        with multiprocessing.Pool(
+                min(cores, len(shards)), _init_predictive_worker,
+                (vars, size, buffers, shapes)) as pool:
+            for n in pool.imap_unordered(_draw_predictive_shard, shards):
+                if progressbar:
+                    progress.update(n)
+        return {name: np.frombuffer(buffers[name], dtype)[:int(np.prod(shape))]
+                .reshape(shape)
+                for name, (shape, dtype) in shapes.items()}
+    finally:
+        if progressbar:
+            progress.close()
+
+
 def sample_ppc(*args, **kwargs):
     """This method is deprecated.  Please use :func:`~sampling.sample_posterior_predictive`"""
     message = 'sample_ppc() is deprecated.  Please use sample_posterior_predictive()'
@@ -1149,8 +1268,10 @@ def sample_posterior_predictive_w(traces, samples=None, models=None, weights=Non
         only be meaningful if all models share the same distributions for the observed RVs.
     weights: array-like
         Individual weights for each trace. Default, same weight for each model.
-    random_seed : int
-        Seed for the random number generator.
+    random_seed : int or numpy.random.RandomState
+        Seed for the random number generator, or the random state to draw
+        the samples from. The global numpy random state is left untouched,
+        so that several predictive samplings can run in threads.
     progressbar : bool
         Whether or not to display a progress bar in the command line. The bar shows the percentage
         of completion, the sampling speed in samples per second (SPS), and the estimated remaining
@@ -1162,7 +1283,7 @@ def sample_posterior_predictive_w(traces, samples=None, models=None, weights=Non
         Dictionary with the variables as keys. The values corresponding to the
         posterior predictive samples from the weighted models.
     """
-    np.random.seed(random_seed)
+    random_state = _as_random_state(random_seed)
 
     if models is None:
         models = [modelcontext(models)] * len(traces)
@@ -1199,7 +1320,7 @@ def sample_posterior_predictive_w(traces, samples=None, models=None, weights=Non
         except AttributeError:
             nchain = 1
 
-        indices = np.random.randint(0, nchain * len_trace, j)
+        indices = random_state.randint(0, nchain * len_trace, j)
         if nchain > 1:
             chain_idx, point_idx = np.divmod(indices, len_trace)
             for idx in zip(chain_idx, point_idx):
@@ -1233,7 +1354,7 @@ def sample_posterior_predictive_w(traces, samples=None, models=None, weights=Non
     if samples is None:
         samples = len_trace
 
-    indices = np.random.randint(0, len_trace, samples)
+    indices = random_state.randint(0, len_trace, samples)
 
     if progressbar:
         indices = tqdm(indices, total=samples)
@@ -1247,7 +1368,8 @@ def sample_posterior_predictive_w(traces, samples=None, models=None, weights=Non
             # one observed.
             ppc[var.name].append(draw_values([var],
                                              point=param,
-                                             size=size[idx]
+                                             size=size[idx],
+                                             random_state=random_state
                                              )[0])
 
     except KeyboardInterrupt:
@@ -1279,8 +1401,9 @@ def sample_prior_predictive(samples=500, model=None, vars=None, random_seed=None
         A list of names of variables for which to compute the posterior predictive
          samples.
         Defaults to `model.named_vars`.
-    random_seed : int
-        Seed for the random number generator.
+    random_seed : int or numpy.random.RandomState
+        Seed for the random number generator, or the random state to draw
+        the samples from. The global numpy random state is left untouched.
 
     Returns
     -------
@@ -1293,11 +1416,15 @@ def sample_prior_predictive(samples=500, model=None, vars=None, random_seed=None
     if vars is None:
         vars = set(model.named_vars.keys())
 
-    if random_seed is not None:
-        np.random.seed(random_seed)
     names = get_default_varnames(model.named_vars, include_transformed=False)
     # draw_values fails with auto-transformed variables. transform them later!
-    values = draw_values([model[name] for name in names], size=samples)
+    with record_sampling_loops() as loops:
+        values = draw_values([model[name] for name in names], size=samples,
+                             random_state=random_seed)
+    if loops:
+        _log.info('Some prior predictive samples were drawn one at a time, in '
+                  'Python loops over the samples of: %s',
+                  ', '.join(sorted(loops)))
 
     data = {k: v for k, v in zip(names, values)}
 
@@ -1341,7 +1468,9 @@ def init_nuts(init='auto', chains=1, n_init=500000, model=None,
           removed in a future release.
         * advi : Run ADVI to estimate posterior mean and diagonal mass matrix.
         * advi_map: Initialize ADVI with MAP and use MAP as starting point.
-        * map : Use the MAP as starting point. This is discouraged.
+        * map : Use the mode of the sampled density, found from the MAP, as starting point and
+          the curvature of a Laplace approximation at the mode as mass matrix. This is
+          discouraged.
         * nuts : Run NUTS and estimate posterior mean and mass matrix from
           the trace.
     chains : int
@@ -1474,9 +1603,12 @@ def init_nuts(init='auto', chains=1, n_init=500000, model=None,
         potential = quadpotential.QuadPotentialDiag(cov)
     elif init == 'map':
         start = pm.find_MAP(include_transformed=True)
-        cov = pm.find_hessian(point=start)
-        start = [start] * chains
-        potential = quadpotential.QuadPotentialFull(cov)
+        # the mode of the sampled density, which includes the jacobian
+        # terms that find_MAP leaves out, and the exact diagonal there
+        approx = pm.laplace_approximation(start=start, n_probes=None,
+                                          progressbar=progressbar)
+        start = [approx.mean_point] * chains
+        potential = approx.potential()
     elif init == 'nuts':
         init_trace = pm.sample(draws=n_init, step=pm.NUTS(),
                                tune=n_init // 2,
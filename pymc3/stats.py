@@ -2,16 +2,21 @@
 from collections import namedtuple
 import itertools
 import pkg_resources
+import multiprocessing as mp
 import warnings
+import weakref
 
 import numpy as np
 import pandas as pd
+import theano
+from theano.compile import SharedVariable
 from scipy.stats import dirichlet
 from scipy.optimize import minimize
 from scipy.signal import fftconvolve
 from tqdm import tqdm
 
 from .model import modelcontext
+from .memoize import hashable
 from .util import get_default_varnames
 import pymc3 as pm
 from pymc3.theanof import floatX
@@ -125,6 +130,13 @@ def autocov(x, lag=None):
 def _log_post_trace(trace, model=None, progressbar=False):
     """Calculate the elementwise log-posterior for the sampled trace.
 
+    The result is cached per (trace, model) pair, so that computing several
+    information criteria for the same trace only evaluates the
+    log-likelihood once. The cache entry is dropped when the trace or the
+    model are garbage collected, and it is recomputed when samples are added
+    to the trace or when shared data of the likelihood, e.g. set by
+    :func:`pymc3.set_data`, changed.
+
     Parameters
     ----------
     trace : result of MCMC run
@@ -141,6 +153,44 @@ def _log_post_trace(trace, model=None, progressbar=False):
         The contribution of the observations to the logp of the whole model.
     """
     model = modelcontext(model)
+
+    try:
+        cache = _LOG_POST_CACHE.setdefault(trace, weakref.WeakKeyDictionary())
+    except TypeError:
+        # lists of points can not be cached
+        cache = {}
+    data_key = _shared_data_key(model)
+    cached = cache.get(model)
+    if (cached is not None and cached[0] == data_key
+            and cached[1].shape[0] == _n_points(trace)):
+        return cached[1]
+
+    logp = _compute_log_post_trace(trace, model, progressbar)
+    # the cached array is shared between callers
+    logp.setflags(write=False)
+    cache[model] = (data_key, logp)
+    return logp
+
+
+_LOG_POST_CACHE = weakref.WeakKeyDictionary()
+
+
+def _shared_data_key(model):
+    """Key of the current values of the shared variables the log-likelihood
+    of the observed variables depends on."""
+    inputs = theano.gof.graph.inputs([var.logpt for var in model.observed_RVs])
+    return tuple((id(var), hashable(var.get_value(borrow=True)))
+                 for var in inputs if isinstance(var, SharedVariable))
+
+
+def _n_points(trace):
+    try:
+        return len(trace) * trace.nchains
+    except AttributeError:
+        return len(trace)
+
+
+def _compute_log_post_trace(trace, model, progressbar):
     cached = [(var, var.logp_elemwise) for var in model.observed_RVs]
 
     def logp_vals_point(pt):
@@ -161,11 +211,20 @@ def _log_post_trace(trace, model=None, progressbar=False):
     except AttributeError:
         points = trace
 
-    points = tqdm(points) if progressbar else points
+    n_points = _n_points(trace)
+    points = tqdm(points, total=n_points) if progressbar else points
 
     try:
-        logp = (logp_vals_point(pt) for pt in points)
-        return np.stack(logp)
+        # fill a preallocated array instead of stacking one row per point
+        logp = None
+        for i, pt in enumerate(points):
+            vals = logp_vals_point(pt)
+            if logp is None:
+                logp = np.empty((n_points, vals.size), dtype=vals.dtype)
+            logp[i] = vals
+        if logp is None:
+            logp = floatX(np.empty((0, 0)))
+        return logp
     finally:
         if progressbar:
             points.close()
@@ -205,6 +264,11 @@ def waic(trace, model=None, pointwise=False, progressbar=False):
     model = modelcontext(model)
 
     log_py = _log_post_trace(trace, model, progressbar=progressbar)
+    return _waic_log_py(log_py, pointwise)
+
+
+def _waic_log_py(log_py, pointwise):
+    """WAIC from the pointwise log-likelihood matrix, see :func:`waic`."""
     if log_py.size == 0:
         raise ValueError('The model does not contain observed values.')
 
@@ -275,15 +339,14 @@ def loo(trace, model=None, pointwise=False, reff=None, progressbar=False):
     model = modelcontext(model)
 
     if reff is None:
-        if trace.nchains == 1:
-            reff = 1.
-        else:
-            eff = pm.effective_n(trace)
-            eff_ave = pm.stats.dict2pd(eff, 'eff').mean()
-            samples = len(trace) * trace.nchains
-            reff = eff_ave / samples
+        reff = _relative_eff(trace)
 
     log_py = _log_post_trace(trace, model, progressbar=progressbar)
+    return _loo_log_py(log_py, reff, pointwise)
+
+
+def _loo_log_py(log_py, reff, pointwise):
+    """LOO from the pointwise log-likelihood matrix, see :func:`loo`."""
     if log_py.size == 0:
         raise ValueError('The model does not contain observed values.')
 
@@ -317,6 +380,16 @@ def loo(trace, model=None, pointwise=False, reff=None, progressbar=False):
         return LOO_r(loo_lppd, loo_lppd_se, p_loo, warn_mg)
 
 
+def _relative_eff(trace):
+    """Average relative MCMC efficiency of the variables in `trace`."""
+    if trace.nchains == 1:
+        return 1.
+    eff = pm.effective_n(trace)
+    eff_ave = pm.stats.dict2pd(eff, 'eff').mean()
+    samples = len(trace) * trace.nchains
+    return eff_ave / samples
+
+
 def _psislw(lw, reff):
     """Pareto smoothed importance sampling (PSIS).
 
@@ -336,56 +409,61 @@ def _psislw(lw, reff):
     """
     n, m = lw.shape
 
-    lw_out = np.copy(lw, order='F')
-    kss = np.empty(m)
+    # improve numerical accuracy
+    lw_out = lw - np.max(lw, axis=0)
+    kss = np.full(m, np.inf)
 
     # precalculate constants
     cutoff_ind = - int(np.ceil(min(n / 5., 3 * (n / reff) ** 0.5))) - 1
     cutoffmin = np.log(np.finfo(float).tiny)
     k_min = 1. / 3
 
-    # loop over sets of log weights
-    for i, x in enumerate(lw_out.T):
-        # improve numerical accuracy
-        x -= np.max(x)
-        # sort the array
-        x_sort_ind = np.argsort(x)
-        # divide log weights into body and right tail
-        xcutoff = max(x[x_sort_ind[cutoff_ind]], cutoffmin)
-
-        expxcutoff = np.exp(xcutoff)
-        tailinds, = np.where(x > xcutoff)
-        x2 = x[tailinds]
-        n2 = len(x2)
+    # divide log weights into body and right tail. Only the largest weights
+    # of each set are needed in sorted order.
+    n_top = min(-cutoff_ind, n)
+    cols = np.arange(m)
+    top_ind = np.argpartition(lw_out, n - n_top, axis=0)[n - n_top:]
+    top = lw_out[top_ind, cols]
+    order = np.argsort(top, axis=0)
+    sort_ind = top_ind[order, cols]
+    lw_sort = top[order, cols]
+    xcutoff = np.maximum(lw_sort[0], cutoffmin)
+    expxcutoff = np.exp(xcutoff)
+    # the tail consists of the n_tail largest weights of each set
+    n_tail = (lw_sort > xcutoff).sum(axis=0)
+
+    # the tail length is the same for nearly all observations, so that the
+    # generalized Pareto distributions can be fitted in a few vectorized
+    # groups instead of one observation at a time
+    for n2 in np.unique(n_tail):
         if n2 <= 4:
             # not enough tail samples for gpdfit
-            k = np.inf
-        else:
-            # order of tail samples
-            x2si = np.argsort(x2)
-            # fit generalized Pareto distribution to the right tail samples
-            x2 = np.exp(x2) - expxcutoff
-            k, sigma = _gpdfit(x2[x2si])
-
-        if k >= k_min and not np.isinf(k):
-            # no smoothing if short tail or GPD fit failed
-            # compute ordered statistic for the fit
-            sti = np.arange(0.5, n2) / n2
-            qq = _gpinv(sti, k, sigma)
-            qq = np.log(qq + expxcutoff)
-            # place the smoothed tail into the output array
-            x[tailinds[x2si]] = qq
-            # truncate smoothed values to the largest raw weight 0
-            x[x > 0] = 0
-        # renormalize weights
-        x -= logsumexp(x)
-        # store tail index k
-        kss[i] = k
+            continue
+        cols, = np.nonzero(n_tail == n2)
+        x2 = np.exp(lw_sort[-n2:, cols]) - expxcutoff[cols]
+        k, sigma = _gpdfit(x2)
+        kss[cols] = k
+
+        # no smoothing if short tail or GPD fit failed
+        smooth = (k >= k_min) & np.isfinite(k)
+        if not np.any(smooth):
+            continue
+        cols, k, sigma = cols[smooth], k[smooth], sigma[smooth]
+        # compute ordered statistic for the fit
+        sti = np.arange(0.5, n2) / n2
+        qq = _gpinv(sti[:, None], k, sigma)
+        qq = np.log(qq + expxcutoff[cols])
+        # place the smoothed tail into the output array and truncate
+        # smoothed values to the largest raw weight 0
+        lw_out[sort_ind[-n2:, cols], cols] = np.minimum(qq, 0)
+
+    # renormalize weights
+    lw_out -= logsumexp(lw_out, axis=0)
 
     return lw_out, kss
 
 
-def _gpdfit(x):
+def _gpdfit(x, chunksize=2**22):
     """Estimate the parameters for the Generalized Pareto Distribution (GPD)
 
     Empirical Bayes estimate for the parameters of the generalized Pareto
@@ -394,40 +472,60 @@ def _gpdfit(x):
     Parameters
     ----------
     x : array
-        sorted 1D data array
+        sorted 1D data array, or 2D array with one sorted set of data per
+        column. The columns are fitted independently.
+    chunksize : int
+        Maximum number of elements of the temporary arrays. The columns
+        are processed in chunks accordingly.
 
     Returns
     -------
-    k : float
+    k : float or array
         estimated shape parameter
-    sigma : float
+    sigma : float or array
         estimated scale parameter
     """
+    x = np.asarray(x)
+    if x.ndim == 1:
+        k, sigma = _gpdfit(x[:, None], chunksize)
+        return k[0], sigma[0]
+
     prior_bs = 3
     prior_k = 10
-    n = len(x)
+    n, ncols = x.shape
     m = 30 + int(n**0.5)
+    step = max(1, chunksize // (m * max(n, m)))
+
+    k = np.empty(ncols)
+    sigma = np.empty(ncols)
+    for start in range(0, ncols, step):
+        chunk = slice(start, start + step)
+        k[chunk], sigma[chunk] = _gpdfit_columns(x[:, chunk], m, prior_bs,
+                                                 prior_k)
+    return k, sigma
+
+
+def _gpdfit_columns(x, m, prior_bs, prior_k):
+    n = x.shape[0]
 
     bs = 1 - np.sqrt(m / (np.arange(1, m + 1, dtype=float) - 0.5))
-    bs /= prior_bs * x[int(n/4 + 0.5) - 1]
+    bs = bs[:, None] / (prior_bs * x[int(n/4 + 0.5) - 1])
     bs += 1 / x[-1]
 
-    ks = np.log1p(-bs[:, None] * x).mean(axis=1)
+    # shape (m, n_columns)
+    ks = np.log1p(-bs[:, None, :] * x).mean(axis=1)
     L = n * (np.log(-(bs / ks)) - ks - 1)
     w = 1 / np.exp(L - L[:, None]).sum(axis=1)
 
     # remove negligible weights
-    dii = w >= 10 * np.finfo(float).eps
-    if not np.all(dii):
-        w = w[dii]
-        bs = bs[dii]
+    w[w < 10 * np.finfo(float).eps] = 0
     # normalise w
-    w /= w.sum()
+    w /= w.sum(axis=0)
 
     # posterior mean for b
-    b = np.sum(bs * w)
+    b = np.sum(bs * w, axis=0)
     # estimate for k
-    k = np.log1p(- b * x).mean()
+    k = np.log1p(- b * x).mean(axis=0)
     # add prior for k
     k = (n * k + prior_k * 0.5) / (n + prior_k)
     sigma = - k / b
@@ -436,34 +534,34 @@ def _gpdfit(x):
 
 
 def _gpinv(p, k, sigma):
-    """Inverse Generalized Pareto distribution function"""
-    x = np.full_like(p, np.nan)
-    if sigma <= 0:
-        return x
-    ok = (p > 0) & (p < 1)
-    if np.all(ok):
-        if np.abs(k) < np.finfo(float).eps:
-            x = - np.log1p(-p)
-        else:
-            x = np.expm1(-k * np.log1p(-p)) / k
-        x *= sigma
-    else:
-        if np.abs(k) < np.finfo(float).eps:
-            x[ok] = - np.log1p(-p[ok])
-        else:
-            x[ok] = np.expm1(-k * np.log1p(-p[ok])) / k
-        x *= sigma
-        x[p == 0] = 0
-        if k >= 0:
-            x[p == 1] = np.inf
-        else:
-            x[p == 1] = - sigma / k
+    """Inverse Generalized Pareto distribution function
+
+    `p`, `k` and `sigma` are broadcast against each other.
+    """
+    p, k, sigma = np.broadcast_arrays(p, k, sigma)
+    x = np.full(p.shape, np.nan)
+    valid = sigma > 0
+    ok = valid & (p > 0) & (p < 1)
+
+    p_ok, k_ok = p[ok], k[ok]
+    small_k = np.abs(k_ok) < np.finfo(float).eps
+    safe_k = np.where(small_k, 1., k_ok)
+    x[ok] = np.where(small_k,
+                     - np.log1p(-p_ok),
+                     np.expm1(-safe_k * np.log1p(-p_ok)) / safe_k)
+    x[ok] *= sigma[ok]
+
+    x[valid & (p == 0)] = 0
+    one = valid & (p == 1)
+    x[one & (k >= 0)] = np.inf
+    neg = one & (k < 0)
+    x[neg] = - sigma[neg] / k[neg]
 
     return x
 
 
 def compare(model_dict, ic='WAIC', method='stacking', b_samples=1000,
-            alpha=1, seed=None, round_to=2):
+            alpha=1, seed=None, round_to=2, cores=1):
     R"""Compare models based on the widely available information criterion (WAIC)
     or leave-one-out (LOO) cross-validation.
     Read more theory here - in a paper by some of the leading authorities on
@@ -499,6 +597,11 @@ def compare(model_dict, ic='WAIC', method='stacking', b_samples=1000,
            np.random state is used.
     round_to : int
         Number of decimals used to round results (default 2).
+    cores : int
+        The number of processes used to compute the information criteria
+        of the models in parallel. Each worker process evaluates the
+        pointwise log-likelihood of a model and its information criterion.
+        Default 1, no parallelization.
 
     Returns
     -------
@@ -530,13 +633,11 @@ def compare(model_dict, ic='WAIC', method='stacking', b_samples=1000,
         names = np.arange(len(model_dict))
 
     if ic == 'WAIC':
-        ic_func = waic
         df_comp = pd.DataFrame(index=names,
                                columns=['WAIC', 'pWAIC', 'dWAIC', 'weight',
                                         'SE', 'dSE', 'var_warn'])
 
     elif ic == 'LOO':
-        ic_func = loo
         df_comp = pd.DataFrame(index=names,
                                columns=['LOO', 'pLOO', 'dLOO', 'weight',
                                         'SE', 'dSE', 'shape_warn'])
@@ -553,9 +654,17 @@ def compare(model_dict, ic='WAIC', method='stacking', b_samples=1000,
         raise ValueError('The method {}, to compute weights,'
                          'is not supported.'.format(method))
 
-    ics = []
-    for n, (m, t) in zip(names, model_dict.items()):
-        ics.append((n, ic_func(t, m, pointwise=True)))
+    jobs = [(m, t, ic) for m, t in model_dict.items()]
+    if cores > 1 and len(jobs) > 1:
+        pool = mp.Pool(processes=min(cores, len(jobs)))
+        try:
+            results = pool.starmap(_model_ic, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_model_ic(*job) for job in jobs]
+    ics = list(zip(names, results))
 
     ics.sort(key=lambda x: x[1][0])
 
@@ -641,6 +750,14 @@ def compare(model_dict, ic='WAIC', method='stacking', b_samples=1000,
         return df_comp.sort_values(by=ic)
 
 
+def _model_ic(model, trace, ic):
+    """Pointwise information criterion `ic` of one model of :func:`compare`."""
+    log_py = _log_post_trace(trace, model)
+    if ic == 'WAIC':
+        return _waic_log_py(log_py, True)
+    return _loo_log_py(log_py, _relative_eff(trace), True)
+
+
 def _ic_matrix(ics):
     """Store the previously computed pointwise predictive accuracy values (ics)
     in a 2D matrix array.
@@ -16,6 +16,7 @@ from .metropolis import MultivariateNormalProposal
 from .gibbs import ElemwiseCategorical
 
 from .slicer import Slice
+from .slicer import MultivariateSlice
 
 from .elliptical_slice import EllipticalSlice
 
@@ -4,6 +4,8 @@ from ..theanof import inputvars
 from ..blocking import ArrayOrdering, DictToArrayBijection
 import numpy as np
 from numpy.random import uniform
+from theano.compile import SharedVariable
+from theano.gof.graph import inputs as graph_inputs
 from enum import IntEnum, unique
 
 __all__ = [
@@ -107,6 +109,56 @@ class BlockedStep:
         if hasattr(self, 'tune'):
             self.tune = False
 
+    def _blanket_logpt(self, vars, model):
+        """Terms of the log-probability of `model` that depend on `vars`.
+
+        Also sets `_complete_logp`, whether these are all terms of the
+        model, i.e. whether their value is the model log-probability.
+        """
+        factors = model.markov_blanket(vars)
+        self._complete_logp = (
+            len(factors) == len(model.basic_RVs) + len(model.potentials))
+        logpt = model.blanket_logpt(vars)
+        self._blanket_names = {var.name for var in inputvars(logpt)}
+        self._data_shared = [var for var in graph_inputs([logpt])
+                             if isinstance(var, SharedVariable)]
+        return logpt
+
+    def _state_logp(self, q, logp, fixed):
+        """Log-density at the state `q` of the sampled variables.
+
+        The value stored by `_remember_state` in the previous step is reused
+        if neither `q` nor the values `fixed` of the variables that are not
+        updated by this step method (e.g. by other methods of a
+        `CompoundStep`) nor the values of shared data (e.g. after
+        `pm.set_data`) changed since.
+        """
+        last = getattr(self, '_last_state', None)
+        if (last is not None and np.array_equal(q, last[0])
+                and _equal_values(fixed, last[2])
+                and all(var.get_value(borrow=True) is value
+                        for var, value in last[3])):
+            return last[1]
+        return logp(q)
+
+    def _remember_state(self, q, logp_q, fixed):
+        # a new tuple, so that copies of the step method don't share it.
+        # Shared data is compared by identity, `set_value` replaces the
+        # array and the reference kept here prevents reusing its id.
+        data = [(var, var.get_value(borrow=True))
+                for var in getattr(self, '_data_shared', [])]
+        self._last_state = (np.copy(q), logp_q,
+                            {name: np.copy(value) for name, value in fixed.items()},
+                            data)
+
+    def reset_state(self):
+        """Forget the log-density carried over from the previous step."""
+        self._last_state = None
+
+
+def _equal_values(a, b):
+    return a.keys() == b.keys() and all(np.array_equal(a[k], b[k]) for k in a)
+
 
 class ArrayStep(BlockedStep):
     """
@@ -127,9 +179,24 @@ class ArrayStep(BlockedStep):
         self.fs = fs
         self.allvars = allvars
         self.blocked = blocked
+        self._bij = DictToArrayBijection(self.ordering, {})
+
+    @property
+    def _fixed_values(self):
+        """Values of the variables of the current point not sampled by
+        this step method.
+
+        Only the variables the log-probability depends on are included if
+        it was built by `_blanket_logpt`.
+        """
+        names = self.ordering.by_name
+        blanket = getattr(self, '_blanket_names', None)
+        return {name: value for name, value in self._bij.dpt.items()
+                if name not in names and (blanket is None or name in blanket)}
 
     def step(self, point):
-        bij = DictToArrayBijection(self.ordering, point)
+        bij = self._bij
+        bij.dpt = point
 
         inputs = [bij.mapf(x) for x in self.fs]
         if self.allvars:
@@ -163,13 +230,19 @@ class ArrayStepShared(BlockedStep):
         self.ordering = ArrayOrdering(vars)
         self.shared = {str(var): shared for var, shared in shared.items()}
         self.blocked = blocked
-        self.bij = None
+        self.bij = DictToArrayBijection(self.ordering, {})
+
+    @property
+    def _fixed_values(self):
+        """Values of the shared variables at the current point."""
+        point = self.bij.dpt
+        return {name: point[name] for name in self.shared}
 
     def step(self, point):
         for var, share in self.shared.items():
             share.set_value(point[var])
 
-        self.bij = DictToArrayBijection(self.ordering, point)
+        self.bij.dpt = point
 
         if self.generates_stats:
             apoint, stats = self.astep(self.bij.map(point))
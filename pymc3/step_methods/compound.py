@@ -52,6 +52,11 @@ class CompoundStep:
         for method in self.methods:
             method.stop_tuning()
 
+    def reset_state(self):
+        for method in self.methods:
+            if hasattr(method, 'reset_state'):
+                method.reset_state()
+
     @property
     def vars_shape_dtype(self):
         dtype_shapes = {}
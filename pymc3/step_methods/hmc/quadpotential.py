@@ -8,7 +8,8 @@ from pymc3.theanof import floatX
 
 
 __all__ = ['quad_potential', 'QuadPotentialDiag', 'QuadPotentialFull',
-           'QuadPotentialFullInv', 'QuadPotentialDiagAdapt', 'isquadpotential']
+           'QuadPotentialFullInv', 'QuadPotentialDiagAdapt', 'QuadPotentialLowRank',
+           'isquadpotential']
 
 
 def quad_potential(C, is_cov):
@@ -376,6 +377,64 @@ class QuadPotentialDiag(QuadPotential):
         return 0.5 * np.dot(x, v_out)
 
 
+class QuadPotentialLowRank(QuadPotential):
+    """Quad potential using a low-rank-plus-diagonal covariance matrix."""
+
+    def __init__(self, v, vecs, vals, dtype=None):
+        """Represent the covariance as ``S (I + U diag(vals - 1) U^T) S``.
+
+        Memory and cost per evaluation are linear in the dimension, which
+        makes this suitable for very large models.
+
+        Parameters
+        ----------
+        v : vector, ndim = 1
+            Diagonal of the covariance matrix before the low-rank
+            correction, ``S = diag(v ** .5)``.
+        vecs : matrix, ndim = 2
+            Orthonormal columns ``U`` of the low-rank correction.
+        vals : vector, ndim = 1
+            Positive eigenvalues of ``S^-1 cov S^-1`` in the span of `vecs`.
+        """
+        if dtype is None:
+            dtype = theano.config.floatX
+        self.dtype = dtype
+        vals = np.asarray(vals)
+        if np.any(vals <= 0):
+            raise ValueError('Eigenvalues of the low-rank correction must be positive.')
+        self.s = (v ** .5).astype(self.dtype)
+        self.inv_s = (1. / self.s).astype(self.dtype)
+        self.vecs = vecs.astype(self.dtype)
+        self.vals = vals.astype(self.dtype)
+        self._inv_sqrt_vals = (vals ** -.5 - 1).astype(self.dtype)
+
+    def velocity(self, x, out=None):
+        """Compute the current velocity at a position in parameter space."""
+        y = self.s * x
+        y += self.vecs.dot((self.vals - 1) * self.vecs.T.dot(y))
+        y *= self.s
+        if out is None:
+            return y
+        out[:] = y
+
+    def random(self):
+        """Draw random value from QuadPotential."""
+        n = floatX(normal(size=self.s.shape))
+        n += self.vecs.dot(self._inv_sqrt_vals * self.vecs.T.dot(n))
+        return n * self.inv_s
+
+    def energy(self, x, velocity=None):
+        """Compute kinetic energy at a position in parameter space."""
+        if velocity is None:
+            velocity = self.velocity(x)
+        return .5 * x.dot(velocity)
+
+    def velocity_energy(self, x, v_out):
+        """Compute velocity and return kinetic energy at a position in parameter space."""
+        self.velocity(x, out=v_out)
+        return 0.5 * np.dot(x, v_out)
+
+
 class QuadPotentialFullInv(QuadPotential):
     """QuadPotential object for Hamiltonian calculations using inverse of covariance matrix."""
 
@@ -95,6 +95,7 @@ class Metropolis(ArrayStepShared):
     stats_dtypes = [{
         'accept': np.float64,
         'tune': np.bool,
+        'model_logp': np.float64,
     }]
 
     def __init__(self, vars=None, S=None, proposal_dist=None, scaling=1.,
@@ -132,8 +133,9 @@ class Metropolis(ArrayStepShared):
 
         self.mode = mode
 
-        shared = pm.make_shared_replacements(vars, model)
-        self.delta_logp = delta_logp(model.logpt, vars, shared)
+        logpt = self._blanket_logpt(vars, model)
+        shared = blanket_shared_replacements(logpt, vars, model)
+        self.logp = array_logp(logpt, vars, shared)
         super().__init__(vars, shared)
 
     def astep(self, q0):
@@ -159,15 +161,21 @@ class Metropolis(ArrayStepShared):
         else:
             q = floatX(q0 + delta)
 
-        accept = self.delta_logp(q, q0)
+        fixed = self._fixed_values
+        logp0 = self._state_logp(q0, self.logp, fixed)
+        logp = self.logp(q)
+        accept = logp - logp0
         q_new, accepted = metrop_select(accept, q, q0)
         self.accepted += accepted
+        logp_new = logp if accepted else logp0
+        self._remember_state(q_new, logp_new, fixed)
 
         self.steps_until_tune -= 1
 
         stats = {
             'tune': self.tune,
             'accept': np.exp(accept),
+            'model_logp': logp_new if self._complete_logp else np.nan,
         }
 
         return q_new, [stats]
@@ -256,7 +264,7 @@ class BinaryMetropolis(ArrayStep):
             raise ValueError(
                 'All variables must be Bernoulli for BinaryMetropolis')
 
-        super().__init__(vars, [model.fastlogp])
+        super().__init__(vars, [model.fastfn(self._blanket_logpt(vars, model))])
 
     def astep(self, q0, logp):
 
@@ -337,7 +345,7 @@ class BinaryGibbsMetropolis(ArrayStep):
             raise ValueError(
                 'All variables must be binary for BinaryGibbsMetropolis')
 
-        super().__init__(vars, [model.fastlogp])
+        super().__init__(vars, [model.fastfn(self._blanket_logpt(vars, model))])
 
     def astep(self, q0, logp):
         order = self.order
@@ -424,7 +432,7 @@ class CategoricalGibbsMetropolis(ArrayStep):
             raise ValueError('Argument \'proposal\' should either be ' +
                     '\'uniform\' or \'proportional\'')
 
-        super().__init__(vars, [model.fastlogp])
+        super().__init__(vars, [model.fastfn(self._blanket_logpt(vars, model))])
 
     def astep_unif(self, q0, logp):
         dimcats = self.dimcats
@@ -533,6 +541,7 @@ class DEMetropolis(PopulationArrayStepShared):
     stats_dtypes = [{
         'accept': np.float64,
         'tune': np.bool,
+        'model_logp': np.float64,
     }]
 
     def __init__(self, vars=None, S=None, proposal_dist=None, lamb=None, scaling=0.001,
@@ -565,8 +574,9 @@ class DEMetropolis(PopulationArrayStepShared):
 
         self.mode = mode
 
-        shared = pm.make_shared_replacements(vars, model)
-        self.delta_logp = delta_logp(model.logpt, vars, shared)
+        logpt = self._blanket_logpt(vars, model)
+        shared = blanket_shared_replacements(logpt, vars, model)
+        self.logp = array_logp(logpt, vars, shared)
         super().__init__(vars, shared)
 
     def astep(self, q0):
@@ -588,15 +598,21 @@ class DEMetropolis(PopulationArrayStepShared):
         # propose a jump
         q = floatX(q0 + self.lamb * (r1 - r2) + epsilon)
 
-        accept = self.delta_logp(q, q0)
+        fixed = self._fixed_values
+        logp0 = self._state_logp(q0, self.logp, fixed)
+        logp = self.logp(q)
+        accept = logp - logp0
         q_new, accepted = metrop_select(accept, q, q0)
         self.accepted += accepted
+        logp_new = logp if accepted else logp0
+        self._remember_state(q_new, logp_new, fixed)
 
         self.steps_until_tune -= 1
 
         stats = {
             'tune': self.tune,
             'accept': np.exp(accept),
+            'model_logp': logp_new if self._complete_logp else np.nan,
         }
 
         return q_new, [stats]
@@ -620,14 +636,26 @@ def softmax(x):
     return e_x / np.sum(e_x, axis = 0)
 
 
-def delta_logp(logp, vars, shared):
-    [logp0], inarray0 = pm.join_nonshared_inputs([logp], vars, shared)
+def blanket_shared_replacements(logp, vars, model):
+    """Shared replacements for the variables other than `vars` that `logp`
+    depends on.
+
+    Compared to `make_shared_replacements`, the values of variables outside
+    of the Markov blanket of `vars` are neither set before every step nor
+    compared to detect changes of the state.
+    """
+    inputs = set(pm.inputvars(logp)) - set(vars)
+    unshared = [var for var in model.vars if var not in inputs]
+    return pm.make_shared_replacements(unshared, model)
 
-    tensor_type = inarray0.type
-    inarray1 = tensor_type('inarray1')
 
-    logp1 = pm.CallableTensor(logp0)(inarray1)
+def array_logp(logp, vars, shared):
+    """Compile `logp` as a function of the flat array of `vars`.
+
+    The other variables of the model are taken from `shared`.
+    """
+    [logp0], inarray0 = pm.join_nonshared_inputs([logp], vars, shared)
 
-    f = theano.function([inarray1, inarray0], logp1 - logp0)
+    f = theano.function([inarray0], logp0)
     f.trust_input = True
     return f
@@ -8,7 +8,7 @@ from ..model import modelcontext
 from ..theanof import inputvars
 from ..vartypes import continuous_types
 
-__all__ = ['Slice']
+__all__ = ['Slice', 'MultivariateSlice']
 
 LOOP_ERR_MSG = 'max slicer iters %d exceeded'
 
@@ -31,6 +31,10 @@ class Slice(ArrayStep):
     """
     name = 'slice'
     default_blocked = False
+    generates_stats = True
+    stats_dtypes = [{
+        'model_logp': np.float64,
+    }]
 
     def __init__(self, vars=None, w=1., tune=True, model=None,
                  iter_limit=np.inf, **kwargs):
@@ -44,16 +48,21 @@ class Slice(ArrayStep):
             vars = self.model.cont_vars
         vars = inputvars(vars)
 
-        super().__init__(vars, [self.model.fastlogp], **kwargs)
+        logp = self.model.fastfn(self._blanket_logpt(vars, self.model))
+        super().__init__(vars, [logp], **kwargs)
 
     def astep(self, q0, logp):
         self.w = np.resize(self.w, len(q0))  # this is a repmat
         q = np.copy(q0)  # TODO: find out if we need this
         ql = np.copy(q0)  # l for left boundary
         qr = np.copy(q0)  # r for right boudary
+        # the log-density at q is carried over from the previous step and
+        # from one coordinate to the next
+        fixed = self._fixed_values
+        logp_q = self._state_logp(q0, logp, fixed)
         for i in range(len(q0)):
             # uniformly sample from 0 to p(q), but in log space
-            y = logp(q) - nr.standard_exponential()
+            y = logp_q - nr.standard_exponential()
             ql[i] = q[i] - nr.uniform(0, self.w[i])
             qr[i] = q[i] + self.w[i]
             # Stepping out procedure
@@ -72,13 +81,15 @@ class Slice(ArrayStep):
 
             cnt = 0
             q[i] = nr.uniform(ql[i], qr[i])
-            while logp(q) < y:  # Changed leq to lt, to accomodate for locally flat posteriors
+            logp_q = logp(q)
+            while logp_q < y:  # Changed leq to lt, to accomodate for locally flat posteriors
                 # Sample uniformly from slice
                 if q[i] > q0[i]:
                     qr[i] = q[i]
                 elif q[i] < q0[i]:
                     ql[i] = q[i]
                 q[i] = nr.uniform(ql[i], qr[i])
+                logp_q = logp(q)
                 cnt += 1
                 if cnt > self.iter_limit:
                     raise RuntimeError(LOOP_ERR_MSG % self.iter_limit)
@@ -92,7 +103,8 @@ class Slice(ArrayStep):
                 ql[i] = q[i]
         if self.tune:
             self.n_tunes += 1
-        return q
+        self._remember_state(q, logp_q, fixed)
+        return q, [{'model_logp': logp_q if self._complete_logp else np.nan}]
 
     @staticmethod
     def competence(var, has_grad):
@@ -101,3 +113,233 @@ class Slice(ArrayStep):
                 return Competence.PREFERRED
             return Competence.COMPATIBLE
         return Competence.INCOMPATIBLE
+
+
+class MultivariateSlice(ArrayStep):
+    """
+    Multivariate slice sampler step method
+
+    All variables of the block are updated together, with moves that are
+    scaled by an estimate of their covariance adapted during tuning.
+    Intervals along a direction are expanded by doubling, which needs a
+    number of log-probability evaluations logarithmic in the ratio of the
+    slice width to the initial width [1]_.
+
+    Parameters
+    ----------
+    vars : list
+        List of variables for sampler.
+    method : str
+        One of
+
+        - 'factor' (default): one univariate slice update along each of
+          the principal directions of the covariance, in random order
+          (factor slice sampling [2]_).
+        - 'direction': one univariate slice update along a random
+          direction, drawn from a normal distribution with the covariance.
+        - 'hyperrect': one update in a hyperrectangle around the current
+          point with the standard deviations as widths, that is shrunk
+          towards the current point until a point of the slice is found
+          [1]_.
+    w : float
+        Width of the initial interval or hyperrectangle, in units of the
+        estimated standard deviations (Defaults to 2).
+    max_doublings : int
+        Maximum number of times an interval is doubled (Defaults to 10).
+    tune : bool
+        Flag for tuning (Defaults to True).
+    tune_interval : int
+        The number of tuning iterations between updates of the covariance
+        estimate (Defaults to 100).
+    model : PyMC Model
+        Optional model for sampling step. Defaults to None (taken from context).
+
+    References
+    ----------
+    .. [1] R. M. Neal. "Slice Sampling", The Annals of Statistics 31(3),
+       705-767, 2003.
+    .. [2] M. M. Tibbits, C. Groendyke, M. Haran, and J. C. Liechty.
+       "Automated Factor Slice Sampling", Journal of Computational and
+       Graphical Statistics 23(2), 543-563, 2014.
+    """
+    name = 'multivariate_slice'
+    default_blocked = True
+    generates_stats = True
+    stats_dtypes = [{
+        'model_logp': np.float64,
+        'nevals': np.int64,
+    }]
+
+    def __init__(self, vars=None, method='factor', w=2., max_doublings=10,
+                 tune=True, tune_interval=100, model=None,
+                 iter_limit=np.inf, **kwargs):
+        self.model = modelcontext(model)
+        self.w = w
+        self.max_doublings = max_doublings
+        self.tune = tune
+        self.tune_interval = tune_interval
+        self.steps_until_tune = tune_interval
+        self.iter_limit = iter_limit
+
+        if method == 'factor':
+            self.move = self._move_factor
+        elif method == 'direction':
+            self.move = self._move_direction
+        elif method == 'hyperrect':
+            self.move = self._move_hyperrect
+        else:
+            raise ValueError("Argument 'method' should be one of 'factor', "
+                             "'direction' or 'hyperrect'")
+        self.method = method
+
+        if vars is None:
+            vars = self.model.cont_vars
+        vars = inputvars(vars)
+
+        logp = self.model.fastfn(self._blanket_logpt(vars, self.model))
+        super().__init__(vars, [logp], **kwargs)
+
+        ndim = self.ordering.size
+        self._n_tune = 0
+        self._mean = np.zeros(ndim)
+        self._m2 = np.zeros((ndim, ndim))
+        self._set_covariance(np.eye(ndim))
+
+    def _set_covariance(self, cov):
+        vals, vecs = np.linalg.eigh(cov)
+        # principal directions, scaled to one standard deviation
+        self._factors = vecs * np.sqrt(np.maximum(vals, 0.))
+        self._chol = np.linalg.cholesky(cov)
+        self._sd = np.sqrt(np.diag(cov))
+
+    def _adapt(self, q):
+        # running estimate of the covariance of the draws during tuning
+        self._n_tune += 1
+        delta = q - self._mean
+        self._mean += delta / self._n_tune
+        self._m2 += np.outer(delta, q - self._mean)
+
+        self.steps_until_tune -= 1
+        if self.steps_until_tune > 0:
+            return
+        self.steps_until_tune = self.tune_interval
+        n = self._n_tune
+        if n <= len(q) + 1:
+            return
+        # shrink towards a small multiple of the identity, the estimate
+        # is singular for few draws
+        cov = self._m2 / (n - 1)
+        cov = n / (n + 5.) * cov + 1e-3 * 5. / (n + 5.) * np.eye(len(q))
+        self._set_covariance(cov)
+
+    def astep(self, q0, logp):
+        fixed = self._fixed_values
+        logp_q = self._state_logp(q0, logp, fixed)
+        q, logp_q, nevals = self.move(q0, logp_q, logp)
+        if self.tune:
+            self._adapt(q)
+        self._remember_state(q, logp_q, fixed)
+        stats = {
+            'model_logp': logp_q if self._complete_logp else np.nan,
+            'nevals': nevals,
+        }
+        return q, [stats]
+
+    def _move_factor(self, q, logp_q, logp):
+        nevals = 0
+        for i in nr.permutation(self._factors.shape[1]):
+            q, logp_q, n = self._slice_along(q, logp_q, self._factors[:, i], logp)
+            nevals += n
+        return q, logp_q, nevals
+
+    def _move_direction(self, q, logp_q, logp):
+        z = nr.standard_normal(len(q))
+        direction = self._chol.dot(z / np.linalg.norm(z))
+        return self._slice_along(q, logp_q, direction, logp)
+
+    def _move_hyperrect(self, q0, logp_q0, logp):
+        y = logp_q0 - nr.standard_exponential()
+        widths = self.w * self._sd
+        ql = q0 - widths * nr.uniform(size=len(q0))
+        qr = ql + widths
+        nevals = 0
+        while True:
+            q = nr.uniform(ql, qr)
+            logp_q = logp(q)
+            nevals += 1
+            if logp_q > y:
+                return q, logp_q, nevals
+            if nevals > self.iter_limit:
+                raise RuntimeError(LOOP_ERR_MSG % self.iter_limit)
+            # shrink all sides towards the current point
+            below = q < q0
+            ql[below] = q[below]
+            qr[~below] = q[~below]
+
+    def _slice_along(self, q0, logp_q0, direction, logp):
+        """Univariate slice update along `direction` with the doubling
+        procedure and the acceptance test of Neal (2003), figures 4 to 6.
+
+        Returns the new point, its log-probability and the number of
+        evaluations of `logp`.
+        """
+        values = {0.: logp_q0}
+
+        def f(t):
+            try:
+                return values[t]
+            except KeyError:
+                value = values[t] = logp(q0 + t * direction)
+                return value
+
+        w = self.w
+        y = logp_q0 - nr.standard_exponential()
+        left = -w * nr.uniform()
+        right = left + w
+        k = self.max_doublings
+        while k > 0 and (y < f(left) or y < f(right)):
+            if nr.uniform() < .5:
+                left -= right - left
+            else:
+                right += right - left
+            k -= 1
+
+        lower, upper = left, right
+        cnt = 0
+        while True:
+            t = nr.uniform(lower, upper)
+            logp_t = f(t)
+            if y < logp_t and self._acceptable(t, y, left, right, f):
+                # evaluations at points that were only looked up are
+                # not counted twice
+                return q0 + t * direction, logp_t, len(values) - 1
+            if t < 0:
+                lower = t
+            else:
+                upper = t
+            cnt += 1
+            if cnt > self.iter_limit:
+                raise RuntimeError(LOOP_ERR_MSG % self.iter_limit)
+
+    def _acceptable(self, t, y, left, right, f):
+        """Whether the doubling procedure started at `t` could have
+        produced the interval (`left`, `right`), which makes the update
+        reversible."""
+        differ = False
+        while right - left > 1.1 * self.w:
+            middle = .5 * (left + right)
+            if (0 < middle) == (t >= middle):
+                differ = True
+            if t < middle:
+                right = middle
+            else:
+                left = middle
+            if differ and y >= f(left) and y >= f(right):
+                return False
+        return True
+
+    @staticmethod
+    def competence(var, has_grad):
+        if var.dtype in continuous_types:
+            return Competence.COMPATIBLE
+        return Competence.INCOMPATIBLE
@@ -150,13 +150,17 @@ def sample_smc(draws=5000, step=None, cores=None, progressbar=False, model=None,
     shared = make_shared_replacements(variables, model)
     prior_logp = logp_forw([model.varlogpt], variables, shared)
     likelihood_logp = logp_forw([model.datalogpt], variables, shared)
+    # evaluate the whole population with one call per stage
+    prior_logp_batch = model.logp_batched_function(variables, factors=model.free_RVs)
+    likelihood_logp_batch = model.logp_batched_function(
+        variables, factors=model.observed_RVs + model.potentials)
 
     pm._log.info("Sample initial stage: ...")
     posterior, var_info = _initial_population(draws, model, variables)
 
     while beta < 1:
         # compute plausibility weights (measure fitness)
-        likelihoods = np.array([likelihood_logp(sample) for sample in posterior]).squeeze()
+        likelihoods = likelihood_logp_batch(posterior)
         beta, old_beta, weights, sj = _calc_beta(beta, likelihoods, step.threshold)
         model.marginal_likelihood *= sj
         # resample based on plausibility weights (selection)
@@ -176,7 +180,7 @@ def sample_smc(draws=5000, step=None, cores=None, progressbar=False, model=None,
         pm._log.info("Stage: {:d} Beta: {:.3f} Steps: {:d}".format(stage, beta, step.n_steps))
         # Apply Metropolis kernel (mutation)
         proposed = draws * step.n_steps
-        priors = np.array([prior_logp(sample) for sample in posterior]).squeeze()
+        priors = prior_logp_batch(posterior)
         tempered_logp = priors + likelihoods * beta
         deltas = np.squeeze(proposal(step.n_steps) * step.scaling)
 
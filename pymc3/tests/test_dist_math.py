@@ -10,7 +10,11 @@ import pytest
 from ..theanof import floatX
 from ..distributions import Discrete
 from ..distributions.dist_math import (
-    bound, factln, alltrue_scalar, MvNormalLogp, SplineWrapper, i0e)
+    bound, factln, alltrue_scalar, MvNormalLogp, SplineWrapper, i0e, betainc,
+    betainc_da, betainc_db,
+    LinearInterpolation, MvNormalQuadForm, linear_recurrence, kalman_filter,
+    KalmanFilter, KalmanFilterGrad)
+from scipy import special
 
 
 def test_bound():
@@ -176,6 +180,110 @@ class TestMvNormalLogp():
         tt.grad(g_delta.sum() + g_cov.sum(), [delta, cov])
 
 
+class TestMvNormalQuadForm:
+    def setup_method(self):
+        np.random.seed(42)
+        self.chol = floatX(np.array([[1, 0, 0], [0.9, 2, 0], [-0.3, 0.1, 0.6]]))
+        self.cov = floatX(np.dot(self.chol, self.chol.T))
+        self.delta = floatX(np.random.randn(5, 3))
+        self.params = {'cov': self.cov, 'tau': floatX(np.linalg.inv(self.cov)),
+                       'chol': self.chol}
+
+    @pytest.mark.parametrize('param', ['cov', 'tau', 'chol'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_values(self, param):
+        quaddist, logdet, ok = MvNormalQuadForm(param)(
+            self.params[param], self.delta)[:3]
+        expect = np.einsum('ij,jk,ik->i', self.delta, np.linalg.inv(self.cov),
+                           self.delta)
+        npt.assert_allclose(quaddist.eval(), expect, rtol=1e-5)
+        npt.assert_allclose(logdet.eval(), 0.5 * np.linalg.slogdet(self.cov)[1],
+                            rtol=1e-5)
+        assert ok.eval()
+
+    @pytest.mark.parametrize('param', ['cov', 'tau'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_not_positive_definite(self, param):
+        matrix = tt.matrix('matrix')
+        outputs = MvNormalQuadForm(param)(matrix, self.delta)
+        f = theano.function([matrix], [outputs[2]] + tt.grad(
+            outputs[0].sum() + outputs[1], [matrix]))
+        ok, g_matrix = f(floatX(np.array([[1, 0.5, 0], [0.5, -2, 0], [0, 0, 1]])))
+        assert not ok
+        assert np.all(np.isnan(g_matrix))
+
+    @pytest.mark.parametrize('param', ['cov', 'tau', 'chol'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_grad(self, param):
+        op = MvNormalQuadForm(param)
+
+        def func(matrix, delta):
+            quaddist, logdet = op(matrix, delta)[:2]
+            return quaddist * 0.7 - 2 * logdet
+
+        utt.verify_grad(func, [self.params[param], self.delta])
+
+    @pytest.mark.parametrize('param', ['cov', 'tau', 'chol'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_hessian(self, param):
+        op = MvNormalQuadForm(param)
+
+        def func(matrix, delta):
+            quaddist, logdet = op(matrix, delta)[:2]
+            g_matrix, g_delta = tt.grad(quaddist.sum() - logdet, [matrix, delta])
+            return g_matrix.sum() + (g_delta ** 2).sum()
+
+        # second differences are too inaccurate in single precision
+        utt.verify_grad(func, [self.params[param].astype('float64'),
+                               self.delta.astype('float64')])
+
+
+class TestMvNormalQuadFormBatched:
+    def setup_method(self):
+        np.random.seed(42)
+        a = np.random.randn(3, 3, 3)
+        self.cov = floatX(np.einsum('gij,gkj->gik', a, a) + 3 * np.eye(3))
+        self.delta = floatX(np.random.randn(7, 3))
+        self.groups = np.array([2, 0, 0, 1, 2, 2, 0])
+        self.params = {'cov': self.cov, 'tau': floatX(np.linalg.inv(self.cov)),
+                       'chol': floatX(np.linalg.cholesky(self.cov))}
+
+    @pytest.mark.parametrize('param', ['cov', 'tau', 'chol'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_values(self, param):
+        quaddist, logdet, ok = MvNormalQuadForm(param)(
+            self.params[param], self.delta, self.groups)[:3]
+        expect = [d.dot(np.linalg.solve(self.cov[g], d))
+                  for g, d in zip(self.groups, self.delta)]
+        npt.assert_allclose(quaddist.eval(), expect, rtol=1e-5)
+        npt.assert_allclose(logdet.eval(), 0.5 * np.linalg.slogdet(self.cov)[1],
+                            rtol=1e-5)
+        assert ok.eval().all()
+
+    @pytest.mark.parametrize('param', ['cov', 'tau', 'chol'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_grad(self, param):
+        op = MvNormalQuadForm(param)
+
+        def func(matrix, delta):
+            quaddist, logdet = op(matrix, delta, self.groups)[:2]
+            return quaddist * 0.7 - 2 * logdet[self.groups]
+
+        utt.verify_grad(func, [self.params[param], self.delta])
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_not_positive_definite(self):
+        cov = self.cov.copy()
+        cov[1, 0, 0] = -1
+        matrix = tt.tensor3('matrix')
+        outputs = MvNormalQuadForm('cov')(matrix, self.delta, self.groups)
+        f = theano.function([matrix], [outputs[2]] + tt.grad(
+            outputs[0].sum() + outputs[1].sum(), [matrix]))
+        ok, g_matrix = f(cov)
+        npt.assert_equal(ok, [True, False, True])
+        npt.assert_equal(np.isnan(g_matrix).all(axis=(1, 2)), [False, True, False])
+
+
 class TestSplineWrapper:
     @theano.configparser.change_flags(compute_test_value="ignore")
     def test_grad(self):
@@ -195,6 +303,154 @@ class TestSplineWrapper:
             tt.grad(g_x, [x_var])
 
 
+class TestLinearInterpolation:
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_values(self):
+        xp = np.array([0., 0.5, 2., 3.])
+        fp = np.array([1., 2., 0., 4.])
+        x = np.array([-1., 0., 0.25, 0.5, 1., 3., 4.])
+        spline = interpolate.InterpolatedUnivariateSpline(xp, fp, k=1, ext='zeros')
+        for mode in ['FAST_RUN', 'FAST_COMPILE']:
+            x_var = tt.dvector('x')
+            z = LinearInterpolation()(x_var, xp, fp)
+            dz = LinearInterpolation(derivative=True)(x_var, xp, fp)
+            f = theano.function([x_var], [z, dz], mode=mode)
+            values, slopes = f(x)
+            npt.assert_allclose(values, spline(x))
+            npt.assert_allclose(slopes, [0., 2., 2., -4. / 3, -4. / 3, 4., 0.])
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_grad(self):
+        xp = np.linspace(0, 1, 100)
+        fp = xp * xp
+        interp = LinearInterpolation()
+        utt.verify_grad(lambda x: interp(x, xp, fp), [[0.5, 0.123]])
+
+
+class TestLinearRecurrence:
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_values(self):
+        coef = np.array([0.5, -1., 2., 0.1])
+        innov = np.array([1., 2., -0.5, 3.])
+        expected = []
+        h = 1.5
+        for c, i in zip(coef, innov):
+            h = i + c * h
+            expected.append(h)
+        for mode in ['FAST_RUN', 'FAST_COMPILE']:
+            init_var = tt.dscalar('init')
+            coef_var = tt.dvector('coef')
+            innov_var = tt.dvector('innov')
+            h = linear_recurrence(init_var, coef_var, innov_var)
+            f = theano.function([init_var, coef_var, innov_var], h, mode=mode)
+            npt.assert_allclose(f(1.5, coef, innov), expected)
+            assert f(1.5, coef[:0], innov[:0]).shape == (0,)
+            with pytest.raises(ValueError):
+                f(1.5, coef[:3], innov)
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_grad(self):
+        np.random.seed(20190614)
+        utt.verify_grad(linear_recurrence,
+                        [np.array(0.7), np.random.uniform(-1, 1, 20),
+                         np.random.normal(size=20)])
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_hessian(self):
+        np.random.seed(20190614)
+
+        def grad_coef(init, coef, innov):
+            h = linear_recurrence(init, coef, innov)
+            return tt.grad(tt.sum(tt.sin(h)), coef)
+
+        utt.verify_grad(grad_coef,
+                        [np.array(0.7), np.random.uniform(-1, 1, 10),
+                         np.random.normal(size=10)])
+
+
+class TestKalmanFilter:
+    def setup_method(self):
+        rng = np.random.RandomState(20190614)
+        d, k, n_steps = 2, 3, 6
+        A, B, C = (rng.normal(size=(n, n)) for n in (d, k, d))
+        self.F = 0.5 * rng.normal(size=(d, d))
+        self.Q = A.dot(A.T) + np.eye(d)
+        self.H = rng.normal(size=(k, d))
+        self.R = B.dot(B.T) + np.eye(k)
+        self.m0 = rng.normal(size=d)
+        self.P0 = C.dot(C.T) + np.eye(d)
+        self.y = rng.normal(size=(n_steps, k))
+
+    def _dense_logp(self):
+        """Log-density of all observations as one multivariate normal."""
+        F, Q, H, R, m0, P0 = self.F, self.Q, self.H, self.R, self.m0, self.P0
+        n_steps = len(self.y)
+        power = np.linalg.matrix_power
+
+        def state_cov(t, s):
+            cov = power(F, t).dot(P0).dot(power(F, s).T)
+            for u in range(1, min(t, s) + 1):
+                cov += power(F, t - u).dot(Q).dot(power(F, s - u).T)
+            return cov
+
+        cov = np.block([[H.dot(state_cov(t, s)).dot(H.T) + (R if t == s else 0)
+                         for s in range(n_steps)] for t in range(n_steps)])
+        mean = np.concatenate([H.dot(power(F, t)).dot(m0) for t in range(n_steps)])
+        return stats.multivariate_normal(mean, cov).logpdf(self.y.ravel())
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_values(self):
+        # the C implementation is for double precision
+        inputs = [tt.dmatrix(), tt.dmatrix(), tt.dmatrix(), tt.dmatrix(),
+                  tt.dmatrix(), tt.dvector(), tt.dmatrix()]
+        values = [self.y, self.F, self.Q, self.H, self.R, self.m0, self.P0]
+        results = []
+        for mode in ['FAST_RUN', 'FAST_COMPILE']:
+            f = theano.function(inputs, kalman_filter(*inputs), mode=mode)
+            results.append(f(*values))
+            assert results[-1][0].shape == (len(self.y),)
+            npt.assert_allclose(results[-1][0].sum(), self._dense_logp())
+        for c_result, py_result in zip(*results):
+            npt.assert_allclose(c_result, py_result, rtol=1e-10, atol=1e-12)
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_filters_once(self):
+        F = tt.matrix()
+        logp = kalman_filter(self.y, F, self.Q, self.H, self.R, self.m0, self.P0)[0]
+        f = theano.function([F], [tt.sum(logp), tt.grad(tt.sum(logp), F)])
+        ops = [node.op for node in f.maker.fgraph.toposort()]
+        assert sum(isinstance(op, KalmanFilter) for op in ops) == 1
+        assert sum(isinstance(op, KalmanFilterGrad) for op in ops) == 1
+
+    @pytest.mark.parametrize('mode', ['FAST_RUN', 'FAST_COMPILE'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_not_positive_definite(self, mode):
+        R = -np.eye(3)
+        H = np.zeros((3, 2))
+        F = tt.dmatrix()
+        logp = kalman_filter(self.y, F, self.Q, H, R, self.m0, self.P0)[0]
+        f = theano.function([F], [logp, tt.grad(tt.sum(logp), F)], mode=mode)
+        logp_val, grad = f(self.F)
+        assert np.all(np.isneginf(logp_val))
+        assert np.all(np.isnan(grad))
+        with pytest.raises(ValueError):
+            f(np.eye(3))
+
+    @pytest.mark.parametrize('mode', ['FAST_RUN', 'FAST_COMPILE'])
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_grad(self, mode):
+        def sym(matrix):
+            return (matrix + matrix.T) / 2
+
+        def logp(y, F, Q, H, R, m0, P0):
+            # the covariance matrices are assumed symmetric
+            return kalman_filter(y, F, sym(Q), H, sym(R), m0, sym(P0))[0]
+
+        utt.verify_grad(logp, [self.y, self.F, self.Q, self.H, self.R,
+                               self.m0, self.P0],
+                        rng=np.random.RandomState(20190614), mode=mode)
+
+
 class TestI0e:
     @theano.configparser.change_flags(compute_test_value="ignore")
     def test_grad(self):
@@ -202,3 +458,47 @@ class TestI0e:
         utt.verify_grad(i0e, [-2.])
         utt.verify_grad(i0e, [[0.5, -2.]])
         utt.verify_grad(i0e, [[[0.5, -2.]]])
+
+
+class TestBetaInc:
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_values(self):
+        a = np.array([0.1, 0.5, 2., 30., 700.])
+        b = np.array([0.3, 4., 0.7, 40., 800.])
+        x = np.array([0.01, 0.2, 0.9, 0.45, 0.46])
+        npt.assert_allclose(betainc(a, b, x).eval(), special.betainc(a, b, x),
+                            rtol=1e-10)
+        npt.assert_allclose(betainc(2., 3., np.array([0., 1.])).eval(), [0., 1.])
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_grad(self):
+        utt.verify_grad(betainc, [0.5, 3., 0.2])
+        utt.verify_grad(betainc, [2., 0.7, 0.9])
+        utt.verify_grad(betainc, [[30., 0.5], [40., 2.], [0.45, 0.8]])
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    @pytest.mark.parametrize('derivative', [betainc_da, betainc_db])
+    def test_derivative_c_code(self, derivative):
+        a = np.array([0.1, 0.5, 2., 30., 700., 2., 2.])
+        b = np.array([0.3, 4., 0.7, 40., 800., 3., 3.])
+        x = np.array([0.01, 0.2, 0.9, 0.45, 0.46, 0., 1.])
+        inputs = tt.dvectors('a', 'b', 'x')
+        c_fn = theano.function(inputs, derivative(*inputs), mode='FAST_RUN')
+        py_fn = theano.function(inputs, derivative(*inputs),
+                                mode=theano.Mode(linker='py'))
+        values = py_fn(a, b, x)
+        npt.assert_allclose(c_fn(a, b, x), values, rtol=1e-10)
+        # I_x(a, b) is constant at both ends
+        npt.assert_array_equal(values[-2:], 0.)
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    @pytest.mark.parametrize('mode', ['FAST_RUN', theano.Mode(linker='py')])
+    def test_derivative_dtype(self, mode):
+        inputs = tt.fvectors('a', 'b', 'x')
+        fn = theano.function(inputs, [betainc_da(*inputs), betainc_db(*inputs)],
+                             mode=mode)
+        values = [np.array([0.5, 2.], dtype='float32'),
+                  np.array([4., 0.7], dtype='float32'),
+                  np.array([0.2, 0.9], dtype='float32')]
+        for value in fn(*values):
+            assert value.dtype == np.float32
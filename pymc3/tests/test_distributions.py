@@ -843,6 +843,31 @@ class TestMatchesScipy(SeededTest):
         f_dlogp = theano.function([cov, x], dlogp)
         assert not np.all(np.isfinite(f_dlogp(cov_val, np.ones(2))))
 
+    @pytest.mark.parametrize('param', ['cov', 'tau', 'chol'])
+    def test_mvnormal_batched(self, param):
+        covs = np.array([[[1., 0.5], [0.5, 2.]], [[3., -1.], [-1., 1.]],
+                         [[0.5, 0.], [0., 0.2]]])
+        matrix = {'cov': covs, 'tau': np.linalg.inv(covs),
+                  'chol': np.linalg.cholesky(covs)}[param]
+        groups = np.array([2, 0, 0, 1, 2])
+        value = floatX(np.random.randn(5, 2))
+        value_var = tt.as_tensor_variable(value)
+        mu = floatX(np.array([0.3, -1.]))
+        normal = MvNormal.dist(mu=mu, groups=groups, shape=(5, 2), **{param: matrix})
+        expect = [scipy.stats.multivariate_normal(mu, covs[g]).logpdf(x)
+                  for g, x in zip(groups, value)]
+        assert_allclose(normal.logp(value_var).eval(), expect, rtol=1e-5)
+        studentt = MvStudentT.dist(nu=4., mu=mu, groups=groups, shape=(5, 2),
+                                   **{param: matrix})
+        expect = [mvt_logpdf(x, 4., covs[g], mu) for g, x in zip(groups, value)]
+        assert_allclose(studentt.logp(value_var).eval(), expect, rtol=1e-5)
+
+        # one matrix per row
+        normal = MvNormal.dist(mu=mu, shape=(3, 2), **{param: matrix})
+        expect = [scipy.stats.multivariate_normal(mu, cov).logpdf(x)
+                  for cov, x in zip(covs, value[:3])]
+        assert_allclose(normal.logp(value_var[:3]).eval(), expect, rtol=1e-5)
+
     def test_mvnormal_init_fail(self):
         with Model():
             with pytest.raises(ValueError):
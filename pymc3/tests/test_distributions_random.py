@@ -6,6 +6,7 @@ from scipy.special import expit
 from scipy import linalg
 import numpy.random as nr
 import theano
+import theano.tensor as tt
 
 import pymc3 as pm
 from pymc3.distributions.distribution import (draw_values,
@@ -115,6 +116,32 @@ class TestDrawValues(SeededTest):
         assert isinstance(mu, np.ndarray)
         assert isinstance(tau, np.ndarray)
 
+    def test_draw_order_is_cached(self, monkeypatch):
+        with pm.Model() as model:
+            x = pm.Normal('x', mu=0., sigma=1.)
+            exp_x = pm.Deterministic('exp_x', pm.math.exp(x))
+            y = pm.Normal('y', mu=exp_x, sigma=1.)
+
+        def draw():
+            exp_x_draw, x_draw = draw_values([exp_x, x])
+            npt.assert_almost_equal(np.exp(x_draw), exp_x_draw)
+            y_draw, = draw_values([y], point={'x': 1.})
+            assert np.shape(y_draw) == ()
+            # the plans of deterministics are stored on the model in context
+            with model:
+                mu, = draw_values([y.distribution.mu], point={'x': 1.})
+            npt.assert_almost_equal(mu, np.exp(1.))
+
+        draw()
+        assert len(model._draw_values_plans) == 3
+
+        def fail(graph):
+            raise AssertionError('The graph was traversed again')
+        monkeypatch.setattr(pm.distributions.distribution,
+                            'get_named_nodes_and_relations', fail)
+        for _ in range(3):
+            draw()
+
 
 class TestDrawValuesContext:
     def test_normal_context(self):
@@ -677,6 +704,21 @@ class TestScalarParameterSamples(SeededTest):
                 extra_args={'lower': False}
             )
 
+    @pytest.mark.parametrize('param', ['cov', 'tau', 'chol'])
+    def test_mv_normal_batched(self, param):
+        covs = np.array([RandomPdMatrix(3) for _ in range(4)])
+        chols = np.linalg.cholesky(covs)
+        matrix = {'cov': covs, 'tau': np.linalg.inv(covs), 'chol': chols}[param]
+        groups = np.array([3, 0, 0, 2, 1, 3])
+        mu = np.random.randn(6, 3)
+        dist = pm.MvNormal.dist(mu=mu, groups=groups, shape=(6, 3),
+                                **{param: matrix})
+        samples = dist.random(size=500)
+        assert samples.shape == (500, 6, 3)
+        # whitened samples are standard normal
+        z = np.linalg.solve(chols[groups], (samples - mu)[..., None])[..., 0]
+        assert st.kstest(z.ravel(), 'norm').pvalue > 1e-3
+
     def test_matrix_normal(self):
         def ref_rand(size, mu, rowcov, colcov):
             return st.matrix_normal.rvs(mean=mu, rowcov=rowcov, colcov=colcov, size=size)
@@ -944,3 +986,200 @@ def test_density_dist_without_random_not_sampleable():
     samples = 500
     with pytest.raises(ValueError):
         pm.sample_posterior_predictive(trace, samples=samples, model=model, size=100)
+
+
+@pytest.mark.parametrize('dist', [
+    lambda: pm.Normal.dist(mu=np.zeros(3), sigma=1.),
+    lambda: pm.Exponential.dist(lam=2., shape=3),
+    lambda: pm.Wald.dist(mu=1., lam=2., shape=3),
+    lambda: pm.Categorical.dist(p=np.array([0.2, 0.3, 0.5]), shape=3),
+    lambda: pm.ZeroInflatedNegativeBinomial.dist(psi=0.5, mu=3., alpha=2., shape=3),
+    lambda: pm.MvNormal.dist(mu=np.zeros(3), cov=np.eye(3), shape=3),
+    lambda: pm.LKJCorr.dist(n=3, eta=2.),
+], ids=['scipy', 'numpy', 'custom', 'categorical', 'zinb', 'mvnormal', 'lkj'])
+def test_random_state(dist):
+    dist = dist()
+    state = np.random.get_state()
+    samples = []
+    for seed in (1, 1, np.random.RandomState(1), 2):
+        with pm.distributions.use_random_state(seed):
+            samples.append(dist.random(size=5))
+    npt.assert_array_equal(samples[0], samples[1])
+    npt.assert_array_equal(samples[0], samples[2])
+    assert not np.array_equal(samples[0], samples[3])
+    # the global random state is left untouched
+    npt.assert_array_equal(np.random.get_state()[1], state[1])
+    assert pm.distributions.get_random_state() is np.random.mtrand._rand
+
+
+def test_draw_values_random_state():
+    with pm.Model():
+        mu = pm.Normal('mu', shape=2)
+        x = pm.Normal('x', mu=mu, sigma=1., shape=2)
+        samples = [draw_values([mu, x], size=5, random_state=seed)
+                   for seed in (1, 1, 2)]
+    npt.assert_array_equal(samples[0], samples[1])
+    assert not np.array_equal(samples[0], samples[2])
+
+
+def test_use_random_state_is_thread_local():
+    from concurrent.futures import ThreadPoolExecutor
+    dist = pm.Normal.dist(mu=0., sigma=1., shape=1000)
+
+    def draw(seed):
+        with pm.distributions.use_random_state(seed):
+            return [dist.random() for _ in range(20)]
+
+    expected = [draw(seed) for seed in range(4)]
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(draw, range(4)))
+    npt.assert_array_equal(results, expected)
+
+
+def _hyperprior(dist, *args, **kwargs):
+    name = 'h{}'.format(len(pm.modelcontext(None).named_vars))
+    return dist(name, *args, **kwargs)
+
+
+def _real():
+    return _hyperprior(pm.Normal, 0., 1.)
+
+
+def _pos():
+    return _hyperprior(pm.Gamma, 4., 4.)
+
+
+def _unit():
+    return _hyperprior(pm.Beta, 2., 2.)
+
+
+def _simplex():
+    return _hyperprior(pm.Dirichlet, a=np.ones(3))
+
+
+# distributions that draw all prior predictive samples at once, with
+# parameters that are random variables themselves
+VECTORIZED_RANDOM = {
+    'Uniform': lambda: pm.Uniform('x', lower=-_pos(), upper=_pos(), shape=3),
+    'Normal': lambda: pm.Normal('x', mu=_real(), sigma=_pos(), shape=3),
+    'TruncatedNormal': lambda: pm.TruncatedNormal('x', mu=_real(), sigma=_pos(), lower=-1., upper=2., shape=3),
+    'HalfNormal': lambda: pm.HalfNormal('x', sigma=_pos(), shape=3),
+    'Wald': lambda: pm.Wald('x', mu=_pos(), lam=_pos() + 1., shape=3),
+    'Beta': lambda: pm.Beta('x', alpha=_pos(), beta=_pos() + 1., shape=3),
+    'Kumaraswamy': lambda: pm.Kumaraswamy('x', a=_pos(), b=_pos() + 1., shape=3),
+    'Exponential': lambda: pm.Exponential('x', lam=_pos(), shape=3),
+    'Laplace': lambda: pm.Laplace('x', mu=_real(), b=_pos(), shape=3),
+    'StudentT': lambda: pm.StudentT('x', nu=_pos() + 1., mu=_real(), sigma=_pos(), shape=3),
+    'Cauchy': lambda: pm.Cauchy('x', alpha=_real(), beta=_pos(), shape=3),
+    'HalfCauchy': lambda: pm.HalfCauchy('x', beta=_pos(), shape=3),
+    'Gamma': lambda: pm.Gamma('x', alpha=_pos(), beta=_pos() + 1., shape=3),
+    'InverseGamma': lambda: pm.InverseGamma('x', alpha=_pos() + 1., beta=_pos() + 2., shape=3),
+    'Weibull': lambda: pm.Weibull('x', alpha=_pos(), beta=_pos() + 1., shape=3),
+    'HalfStudentT': lambda: pm.HalfStudentT('x', nu=_pos() + 1., sigma=_pos(), shape=3),
+    'Lognormal': lambda: pm.Lognormal('x', mu=_real(), sigma=_pos(), shape=3),
+    'ChiSquared': lambda: pm.ChiSquared('x', nu=_pos() + 1., shape=3),
+    'ExGaussian': lambda: pm.ExGaussian('x', mu=_real(), sigma=_pos(), nu=_pos() + 1., shape=3),
+    'VonMises': lambda: pm.VonMises('x', mu=_real(), kappa=_pos(), shape=3),
+    'SkewNormal': lambda: pm.SkewNormal('x', mu=_real(), sigma=_pos(), alpha=_real(), shape=3),
+    'Triangular': lambda: pm.Triangular('x', lower=-1. - _pos(), c=_unit(), upper=1. + _pos(), shape=3),
+    'Gumbel': lambda: pm.Gumbel('x', mu=_real(), beta=_pos(), shape=3),
+    'Logistic': lambda: pm.Logistic('x', mu=_real(), s=_pos(), shape=3),
+    'LogitNormal': lambda: pm.LogitNormal('x', mu=_real(), sigma=_pos(), shape=3),
+    'Rice': lambda: pm.Rice('x', nu=_pos(), sigma=_pos() + 1., shape=3),
+    'Pareto': lambda: pm.Pareto('x', alpha=_pos() + 1., m=_pos(), shape=3),
+    'Interpolated': lambda: pm.Interpolated('x', x_points=np.linspace(0, 1, 5), pdf_points=np.ones(5), shape=3),
+    'Binomial': lambda: pm.Binomial('x', n=10, p=_unit(), shape=3),
+    'BetaBinomial': lambda: pm.BetaBinomial('x', alpha=_pos(), beta=_pos() + 1., n=10, shape=3),
+    'Bernoulli': lambda: pm.Bernoulli('x', p=_unit(), shape=3),
+    'DiscreteWeibull': lambda: pm.DiscreteWeibull('x', q=_unit(), beta=_pos(), shape=3),
+    'Poisson': lambda: pm.Poisson('x', mu=_pos(), shape=3),
+    'NegativeBinomial': lambda: pm.NegativeBinomial('x', mu=_pos(), alpha=_pos() + 1., shape=3),
+    'Constant': lambda: pm.Constant('x', c=_real(), shape=3),
+    'ZeroInflatedPoisson': lambda: pm.ZeroInflatedPoisson('x', psi=_unit(), theta=_pos(), shape=3),
+    'ZeroInflatedBinomial': lambda: pm.ZeroInflatedBinomial('x', psi=_unit(), n=10, p=_unit() * 0.5, shape=3),
+    'ZeroInflatedNegativeBinomial': lambda: pm.ZeroInflatedNegativeBinomial('x', psi=_unit(), mu=_pos(), alpha=_pos() + 1., shape=3),
+    'DiscreteUniform': lambda: pm.DiscreteUniform('x', lower=0, upper=5, shape=3),
+    'Geometric': lambda: pm.Geometric('x', p=_unit(), shape=3),
+    'Categorical': lambda: pm.Categorical('x', p=_simplex(), shape=3),
+    'MvNormal': lambda: pm.MvNormal('x', mu=_real() * np.ones(3), cov=np.eye(3), shape=3),
+    'MvStudentT': lambda: pm.MvStudentT('x', nu=_pos() + 2., mu=_real() * np.ones(3), cov=np.eye(3), shape=3),
+    'Dirichlet': lambda: pm.Dirichlet('x', a=_pos() * np.ones(3), shape=3),
+    'Multinomial': lambda: pm.Multinomial('x', n=10, p=_simplex(), shape=3),
+    'LKJCorr': lambda: pm.LKJCorr('x', n=3, eta=2.),
+    'MatrixNormal': lambda: pm.MatrixNormal('x', mu=_real() * np.ones((2, 3)), rowcov=np.eye(2), colcov=_pos() * np.eye(3), shape=(2, 3)),
+    'KroneckerNormal': lambda: pm.KroneckerNormal('x', mu=_real() * np.ones(6), covs=[_pos() * np.eye(2), np.eye(3)], shape=6),
+    'LKJCholeskyCov': lambda: pm.LKJCholeskyCov('x', n=3, eta=2., sd_dist=pm.HalfNormal.dist(1.)),
+    'Mixture': lambda: pm.Mixture('x', w=_simplex(), comp_dists=pm.Poisson.dist(mu=_pos() * np.ones(3)), shape=3),
+    'LinearGaussianStateSpace': lambda: pm.LinearGaussianStateSpace('x', transition=0.9 * np.eye(2), state_cov=_pos() * np.eye(2), design=np.ones((1, 2)), obs_cov=np.eye(1), init_mu=_real() * np.ones(2), init_cov=np.eye(2), shape=(5, 1)),
+}
+
+
+@pytest.mark.parametrize('name', sorted(VECTORIZED_RANDOM))
+def test_vectorized_random(name):
+    with pm.Model():
+        x = VECTORIZED_RANDOM[name]()
+        with pm.distributions.record_sampling_loops() as loops:
+            prior = pm.sample_prior_predictive(7, vars=['x'])
+    assert prior['x'].shape == (7,) + tuple(x.distribution.shape)
+    assert not loops
+
+
+def test_vectorized_random_declarations():
+    classes = [getattr(pm.distributions, name) for name in dir(pm.distributions)]
+    declared = {cls for cls in classes if isinstance(cls, type)
+                and issubclass(cls, pm.Distribution) and cls.vectorized_random}
+    assert declared == {getattr(pm, name) for name in VECTORIZED_RANDOM}
+
+
+def test_draw_values_batches_deterministics():
+    idx = np.array([0, 1, 1, 2, 0])
+    x = np.linspace(-1., 1., 5)
+    with pm.Model():
+        a = pm.Normal('a', shape=3)
+        b = pm.Normal('b')
+        mu = pm.Deterministic('mu', a[idx] + b * x)
+        pm.Normal('y', mu=mu, sigma=1., shape=5)
+        with pm.distributions.record_sampling_loops() as loops:
+            prior = pm.sample_prior_predictive(50)
+    assert not loops
+    npt.assert_allclose(prior['mu'],
+                        prior['a'][:, idx] + prior['b'][:, None] * x)
+    assert prior['y'].shape == (50, 5)
+
+
+def test_draw_values_counts_sampling_loops():
+    with pm.Model():
+        a = pm.Normal('a', shape=3)
+        pm.Deterministic('mu', tt.sort(a))
+        with pm.distributions.record_sampling_loops() as loops:
+            prior = pm.sample_prior_predictive(10, vars=['mu', 'a'])
+    npt.assert_allclose(prior['mu'], np.sort(prior['a'], axis=-1))
+    assert loops == {'theano graph of mu': 10}
+
+
+def test_draw_values_counts_undeclared_random():
+    with pm.Model():
+        pm.DensityDist('x', lambda value: -value ** 2,
+                       random=lambda point=None, size=None: np.zeros(size))
+        with pm.distributions.record_sampling_loops() as loops:
+            pm.sample_prior_predictive(10)
+    assert loops == {'random of DensityDist': 10}
+
+
+def test_generate_samples_aligns_sample_axis():
+    with pm.Model():
+        s = pm.Gamma('s', 4., 4.)
+        pm.Normal('x', mu=np.arange(6.).reshape(2, 3), sigma=s, shape=(2, 3))
+        prior = pm.sample_prior_predictive(7)
+    assert prior['x'].shape == (7, 2, 3)
+
+
+def test_kronecker_normal_random_matches_dense_cholesky():
+    covs = [np.array([[2., .5], [.5, 1.]]), np.array([[1., .3, 0.], [.3, 2., .4], [0., .4, 1.5]])]
+    chols = [np.linalg.cholesky(cov) for cov in covs]
+    mu = np.arange(6.)
+    dist = pm.KroneckerNormal.dist(mu=mu, covs=covs, shape=6)
+    with pm.distributions.use_random_state(1):
+        samples = dist.random(size=(4, 5))
+    z = np.random.RandomState(1).standard_normal((4, 5, 6))
+    npt.assert_allclose(samples, mu + z.dot(np.kron(*chols).T))
@@ -1,10 +1,13 @@
 from ..model import Model
 from ..distributions.continuous import Flat, Normal
-from ..distributions.timeseries import EulerMaruyama, AR1, AR, GARCH11
+from ..distributions.timeseries import (EulerMaruyama, AR1, AR, GARCH11,
+                                        LinearGaussianStateSpace)
 from ..sampling import sample, sample_posterior_predictive
 from ..theanof import floatX
 
 import numpy as np
+import pytest
+from scipy import stats
 
 def test_AR():
     # AR1
@@ -91,6 +94,34 @@ def test_GARCH11():
     np.testing.assert_allclose(garch_like, reg_like)
 
 
+def test_LinearGaussianStateSpace():
+    # a local level model, the states are a random walk
+    data = np.array([0.26, 0.73, 1.42, 0.98, 1.61, 2.35, 2.02, 2.87])
+    n = len(data)
+    sigma_level, sigma_obs = 0.5, 0.3
+    with Model() as t:
+        LinearGaussianStateSpace('y', transition=np.eye(1),
+                                 state_cov=sigma_level**2 * np.eye(1),
+                                 design=np.eye(1), obs_cov=sigma_obs**2 * np.eye(1),
+                                 init_mu=np.zeros(1), init_cov=np.eye(1),
+                                 shape=n)
+    level_cov = np.ones((n, n)) + sigma_level**2 * np.minimum(*np.indices((n, n)))
+    reg_like = stats.multivariate_normal(
+        np.zeros(n), level_cov + sigma_obs**2 * np.eye(n)).logpdf(data)
+    np.testing.assert_allclose(t['y'].logp({'y': data}), reg_like)
+
+    dist = t['y'].distribution
+    assert dist.random(size=4).shape == (4, n)
+    with pytest.raises(ValueError):
+        LinearGaussianStateSpace.dist(np.eye(1), np.eye(1), np.eye(1), np.eye(1),
+                                      np.zeros(1), np.eye(1))
+    states = dist.sample_states(data, size=2000)
+    assert states.shape == (2000, n, 1)
+    # the smoothed mean of the last state is the filtered one
+    gain = np.linalg.solve(level_cov + sigma_obs**2 * np.eye(n), level_cov[-1])
+    np.testing.assert_allclose(states[:, -1, 0].mean(), gain.dot(data), atol=0.05)
+
+
 
 def _gen_sde_path(sde, pars, dt, n, x0):
     xs = [x0]
@@ -8,6 +8,7 @@ import theano.tensor as tt
 import numpy as np
 import numpy.testing as npt
 import pytest
+import scipy.stats
 
 np.random.seed(101)
 
@@ -1051,3 +1052,230 @@ class TestMarginalKron:
                                      cov_funcs=self.cov_funcs)
         with pytest.raises(TypeError):
             gp1 + gp2
+
+
+class TestPredictTrace:
+    def setup_method(self):
+        self.X = np.random.randn(20, 1)
+        self.y = np.sin(self.X[:, 0]) + np.random.randn(20) * 0.1
+        self.Xnew = np.linspace(-2, 2, 11)[:, None]
+        self.points = [{'ls_log__': np.array(np.log(ls)),
+                        'sigma_log__': np.array(np.log(sigma))}
+                       for ls, sigma in [(0.5, 0.1), (0.5, 0.1), (1., 0.2)]]
+
+    def check_predict(self, gp, model, **kwargs):
+        with model:
+            mu, var = gp.predict_trace(self.Xnew, self.points, chunksize=4,
+                                       **kwargs)
+            for point, mu_i, var_i in zip(self.points, mu, var):
+                expected = gp.predict(self.Xnew, point=point, diag=True,
+                                      **kwargs)
+                npt.assert_allclose(mu_i, expected[0], rtol=1e-5, atol=1e-8)
+                npt.assert_allclose(var_i, expected[1], rtol=1e-5, atol=1e-8)
+
+    @pytest.mark.parametrize('pred_noise', [False, True])
+    def testMarginal(self, pred_noise):
+        with pm.Model() as model:
+            ls = pm.Lognormal('ls', 0., 1.)
+            sigma = pm.HalfNormal('sigma', 1.)
+            gp = pm.gp.Marginal(cov_func=pm.gp.cov.ExpQuad(1, ls))
+            gp.marginal_likelihood('y', self.X, self.y, noise=sigma)
+        self.check_predict(gp, model, pred_noise=pred_noise)
+
+    def testMarginalSparse(self):
+        with pm.Model() as model:
+            ls = pm.Lognormal('ls', 0., 1.)
+            sigma = pm.HalfNormal('sigma', 1.)
+            gp = pm.gp.MarginalSparse(cov_func=pm.gp.cov.ExpQuad(1, ls))
+            gp.marginal_likelihood('y', self.X, self.X[::4], self.y, noise=sigma)
+        self.check_predict(gp, model)
+
+    def testMarginalKron(self):
+        Xs = [np.linspace(0, 1, 4)[:, None], np.linspace(0, 1, 5)[:, None]]
+        y = np.random.randn(20) * 0.1
+        with pm.Model() as model:
+            ls = pm.Lognormal('ls', 0., 1.)
+            sigma = pm.HalfNormal('sigma', 1.)
+            gp = pm.gp.MarginalKron(cov_funcs=[pm.gp.cov.ExpQuad(1, ls),
+                                               pm.gp.cov.Matern52(1, 0.3)])
+            gp.marginal_likelihood('y', Xs, y, sigma=sigma)
+        self.Xnew = np.random.rand(7, 2)
+        self.check_predict(gp, model)
+
+    def testFactorsReused(self):
+        with pm.Model() as model:
+            ls = pm.Lognormal('ls', 0., 1.)
+            sigma = pm.HalfNormal('sigma', 1.)
+            gp = pm.gp.Marginal(cov_func=pm.gp.cov.ExpQuad(1, ls))
+            gp.marginal_likelihood('y', self.X, self.y, noise=sigma)
+            trace = pm.sampling.NDArray(model=model, vars=model.vars)
+            trace.setup(len(self.points), chain=0)
+            for point in self.points:
+                trace.record(point)
+            trace = pm.backends.base.MultiTrace([trace])
+            mu, var = gp.predict_trace(self.Xnew, trace)
+        assert mu.shape == var.shape == (3, 11)
+        npt.assert_allclose(mu[0], mu[1])
+        assert (var > 0).all()
+
+
+class TestHSGP:
+    @pytest.mark.parametrize('cov_class', [pm.gp.cov.ExpQuad,
+                                           pm.gp.cov.Matern52,
+                                           pm.gp.cov.Matern32])
+    def testCovarianceApprox(self, cov_class):
+        X = np.linspace(-1, 3, 40)[:, None]
+        with pm.Model():
+            cov_func = 2.0 * cov_class(1, ls=0.7)
+            gp = pm.gp.HSGP(m=200, c=2.0, cov_func=cov_func)
+            gp.prior('f', X=X)
+            phi = gp.basis(X)
+            psd = cov_func.power_spectral_density(gp.sqrt_eigs).eval()
+            K = cov_func(X).eval()
+        npt.assert_allclose(np.dot(phi * psd, phi.T), K, atol=5e-3)
+
+    def testSpectralDensityARD(self):
+        # the density of a product of one-dimensional kernels on separate
+        # dimensions is the product of their densities
+        omega = np.random.randn(5, 2)
+        cov = pm.gp.cov.ExpQuad(2, ls=[0.5, 2.])
+        cov1 = pm.gp.cov.ExpQuad(1, ls=0.5)
+        cov2 = pm.gp.cov.ExpQuad(1, ls=2.)
+        npt.assert_allclose(
+            cov.power_spectral_density(omega).eval(),
+            (cov1.power_spectral_density(omega[:, :1]) *
+             cov2.power_spectral_density(omega[:, 1:])).eval())
+        with pytest.raises(NotImplementedError):
+            pm.gp.cov.Cosine(1, ls=1.).power_spectral_density(omega)
+
+    def testPriorConditional(self):
+        X = np.random.rand(30, 2)
+        Xnew = np.random.rand(7, 2)
+        with pm.Model() as model:
+            gp = pm.gp.HSGP(m=[6, 5], cov_func=pm.gp.cov.ExpQuad(2, ls=0.3),
+                            mean_func=pm.gp.mean.Constant(1.))
+            f = gp.prior('f', X=X)
+            fnew = gp.conditional('fnew', Xnew=np.concatenate([X[:3], Xnew]))
+        assert model['f_coeffs_'].tag.test_value.shape == (30,)
+        f_val, fnew_val = model.fn([f, fnew])({'f_coeffs_': np.random.randn(30)})
+        npt.assert_allclose(fnew_val[:3], f_val[:3], rtol=1e-6)
+
+
+class TestMarginalCG:
+    def setup_method(self):
+        np.random.seed(20)
+        self.X = np.random.rand(40, 2)
+        self.y = np.sin(3 * self.X[:, 0]) + 0.1 * np.random.randn(40)
+
+    def build(self, gp_class, **kwargs):
+        with pm.Model() as model:
+            ls = pm.Gamma('ls', alpha=2, beta=4)
+            sigma = pm.HalfNormal('sigma', sd=1)
+            cov_func = 1.5 * pm.gp.cov.Matern52(2, ls=ls)
+            gp = gp_class(cov_func=cov_func,
+                          mean_func=pm.gp.mean.Constant(0.5), **kwargs)
+            gp.marginal_likelihood('y', X=self.X, y=self.y, noise=sigma)
+        func = model.logp_dlogp_function()
+        func.set_extra_values({})
+        return func
+
+    def testFullRankPreconditioner(self):
+        # the preconditioner is exact, the solves converge immediately
+        # and the log-determinant is exact
+        exact = self.build(pm.gp.Marginal)
+        cg = self.build(pm.gp.MarginalCG, precond_rank=40, n_probes=200,
+                        block_size=16, random_seed=2)
+        q = exact.dict_to_array({'ls_log__': np.log(0.3),
+                                 'sigma_log__': np.log(0.2)})
+        logp, dlogp = exact(q)
+        logp_cg, dlogp_cg = cg(q)
+        npt.assert_allclose(logp_cg, logp, rtol=1e-6)
+        npt.assert_allclose(dlogp_cg, dlogp, rtol=0.1)
+
+    def testLowRankPreconditioner(self):
+        exact = self.build(pm.gp.Marginal)
+        cg = self.build(pm.gp.MarginalCG, precond_rank=10, n_probes=200,
+                        block_size=16, random_seed=2)
+        q = exact.dict_to_array({'ls_log__': np.log(0.3),
+                                 'sigma_log__': np.log(0.2)})
+        # the log-determinant is a stochastic estimate
+        npt.assert_allclose(cg(q)[0], exact(q)[0], atol=1.)
+        # the probes are fixed
+        npt.assert_allclose(cg(q)[0], cg(q)[0])
+
+
+class TestToeplitzGrid:
+    def setup_method(self):
+        np.random.seed(5)
+        self.X = np.linspace(0, 3, 30)[:, None]
+        self.y = np.sin(2 * self.X[:, 0]) + 0.1 * np.random.randn(30)
+        self.cov_func = 2.0 * pm.gp.cov.Matern52(1, ls=0.4)
+        self.K = self.cov_func(self.X).eval()
+
+    def testRegularGrid(self):
+        assert pm.gp.util.regular_grid(self.X)
+        assert pm.gp.util.regular_grid(self.X[::-1])
+        assert not pm.gp.util.regular_grid(self.X[:, 0])
+        assert not pm.gp.util.regular_grid(self.X ** 2)
+        assert not pm.gp.util.regular_grid(np.random.rand(30, 2))
+        noise = pm.gp.cov.WhiteNoise(0.5)
+        c = pm.gp.util.toeplitz_column(self.cov_func, self.X, noise)
+        npt.assert_allclose(c.eval(), self.K[:, 0] + 0.25 * np.eye(30)[:, 0])
+        linear = pm.gp.cov.Linear(1, c=1.)
+        assert pm.gp.util.toeplitz_column(linear, self.X) is None
+        assert pm.gp.util.toeplitz_column(self.cov_func + linear, self.X) is None
+        assert pm.gp.util.toeplitz_column(self.cov_func, self.X, min_size=31) is None
+
+    def testMarginal(self):
+        with pm.Model() as model:
+            gp = pm.gp.Marginal(cov_func=self.cov_func,
+                                mean_func=pm.gp.mean.Constant(0.5))
+            y = gp.marginal_likelihood('y', X=self.X, y=self.y, noise=0.3,
+                                       toeplitz=True)
+        cov = self.K + 0.09 * np.eye(30)
+        npt.assert_allclose(
+            model.logp(model.test_point),
+            scipy.stats.multivariate_normal.logpdf(self.y, 0.5 * np.ones(30), cov))
+        assert isinstance(y.distribution, pm.DensityDist)
+        assert y.distribution.random().shape == (30,)
+        assert y.distribution.random(size=4).shape == (4, 30)
+
+        with pm.Model() as dense_model:
+            dense_gp = pm.gp.Marginal(cov_func=self.cov_func,
+                                      mean_func=pm.gp.mean.Constant(0.5))
+            y_dense = dense_gp.marginal_likelihood('y', X=self.X, y=self.y,
+                                                   noise=0.3, toeplitz=False)
+        assert isinstance(y_dense.distribution, pm.MvNormal)
+        with pm.Model():
+            # small grids use the Cholesky decomposition by default
+            y_default = pm.gp.Marginal(cov_func=self.cov_func).marginal_likelihood(
+                'y', X=self.X, y=self.y, noise=0.3)
+        assert isinstance(y_default.distribution, pm.MvNormal)
+        npt.assert_allclose(dense_model.logp(dense_model.test_point),
+                            model.logp(model.test_point))
+
+        Xnew = np.linspace(-1, 4, 9)[:, None]
+        mu, var = gp.predict(Xnew, point=model.test_point, diag=True)
+        Kxs = self.cov_func(self.X, Xnew).eval()
+        Kss = self.cov_func(Xnew).eval()
+        cov_stable = cov + 1e-6 * np.eye(30)
+        mu_ref = 0.5 + np.dot(Kxs.T, np.linalg.solve(cov_stable, self.y - 0.5))
+        var_ref = np.diag(Kss - np.dot(Kxs.T, np.linalg.solve(cov_stable, Kxs)))
+        npt.assert_allclose(mu, mu_ref, rtol=1e-5)
+        npt.assert_allclose(var, var_ref, rtol=1e-5, atol=1e-8)
+
+    @pytest.mark.parametrize('reparameterize', [True, False])
+    def testLatent(self, reparameterize, monkeypatch):
+        monkeypatch.setattr(pm.gp.gp, '_TOEPLITZ_MIN_SIZE', 0)
+        with pm.Model() as model:
+            gp = pm.gp.Latent(cov_func=self.cov_func)
+            f = gp.prior('f', X=self.X, reparameterize=reparameterize)
+        L = np.linalg.cholesky(self.K + 1e-6 * np.eye(30))
+        v = np.random.randn(30)
+        if reparameterize:
+            f_val = model.fn(f)({'f_rotated_': v})
+            npt.assert_allclose(f_val, np.dot(L, v), rtol=1e-6)
+        else:
+            npt.assert_allclose(
+                model.logp({'f': v}),
+                scipy.stats.multivariate_normal.logpdf(v, np.zeros(30), np.dot(L, L.T)))
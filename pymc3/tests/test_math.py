@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import numpy.testing as npt
 import theano
@@ -5,9 +7,13 @@ import theano.tensor as tt
 from theano.tests import unittest_tools as utt
 from pymc3.math import (
     LogDet, logdet, probit, invprobit, expand_packed_triangular,
-    log1pexp, log1mexp, kronecker, cartesian, kron_dot, kron_solve_lower)
+    log1pexp, log1mexp, kronecker, cartesian, kron_dot, kron_solve_lower,
+    toeplitz, toeplitz_dot, toeplitz_correlation, toeplitz_solve,
+    toeplitz_logdet, toeplitz_cholesky)
+import scipy.linalg
 from .helpers import SeededTest
 import pytest
+import pymc3 as pm
 from pymc3.theanof import floatX
 
 
@@ -174,3 +180,51 @@ def test_expand_packed_triangular():
     assert np.all(expand_upper.eval({packed: upper_packed}) == upper)
     assert np.all(expand_diag_lower.eval({packed: lower_packed}) == floatX(np.diag(vals)))
     assert np.all(expand_diag_upper.eval({packed: upper_packed}) == floatX(np.diag(vals)))
+
+
+class TestToeplitz(SeededTest):
+    def setup_method(self):
+        super().setup_method()
+        utt.seed_rng()
+        x = np.arange(12) * 0.3
+        self.c = np.exp(-0.5 * x**2)
+        self.c[0] += 0.1
+        self.T = scipy.linalg.toeplitz(self.c)
+        self.B = np.random.randn(12, 3)
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_values(self):
+        c = tt.vector()
+        B = tt.matrix()
+        b = tt.vector()
+        npt.assert_allclose(toeplitz(c).eval({c: self.c}), self.T)
+        npt.assert_allclose(toeplitz_dot(c, B).eval({c: self.c, B: self.B}),
+                            np.dot(self.T, self.B))
+        npt.assert_allclose(toeplitz_solve(c, B).eval({c: self.c, B: self.B}),
+                            np.linalg.solve(self.T, self.B))
+        npt.assert_allclose(toeplitz_solve(c, b).eval({c: self.c, b: self.B[:, 0]}),
+                            np.linalg.solve(self.T, self.B[:, 0]))
+        npt.assert_allclose(toeplitz_logdet(c).eval({c: self.c}),
+                            np.linalg.slogdet(self.T)[1])
+        npt.assert_allclose(toeplitz_cholesky(c).eval({c: self.c}),
+                            np.linalg.cholesky(self.T))
+
+    @theano.configparser.change_flags(compute_test_value="ignore")
+    def test_grad(self):
+        utt.verify_grad(toeplitz_dot, [self.c, self.B])
+        utt.verify_grad(toeplitz_correlation, [self.B, self.B[::-1].copy()])
+        utt.verify_grad(toeplitz_solve, [self.c, self.B])
+        utt.verify_grad(toeplitz_logdet, [self.c])
+        utt.verify_grad(toeplitz_cholesky, [self.c])
+
+    def test_levinson_durbin_threads(self):
+        columns = [self.c * scale for scale in np.linspace(1., 2., 8)]
+        expected = [np.linalg.inv(scipy.linalg.toeplitz(c))[:, 0] for c in columns]
+
+        def solve(i):
+            for _ in range(50):
+                npt.assert_allclose(pm.math._levinson_durbin(columns[i])[0],
+                                    expected[i])
+
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(solve, range(len(columns))))
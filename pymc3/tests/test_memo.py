@@ -1,4 +1,10 @@
-from pymc3.memoize import memoize
+import gc
+import weakref
+
+import numpy as np
+
+import pymc3 as pm
+from pymc3.memoize import memoize, cache_info, clear_cache, set_memory_budget
 
 
 def getmemo():
@@ -14,3 +20,101 @@ def test_memo():
     assert f('x', ['y', 'z']) == "x['y', 'z']"
     assert f('x', ['a', 'z']) == "x['a', 'z']"
     assert f('x', ['y', 'z']) == "x['y', 'z']"
+
+
+def test_memo_lru():
+    calls = []
+
+    @memoize(maxsize=2)
+    def f(a):
+        calls.append(a)
+        return a
+
+    f(1), f(2), f(1), f(3)
+    # 2 was the least recently used entry
+    assert list(f.cache) == [((tuple, (1,)), (dict, ())),
+                             ((tuple, (3,)), (dict, ()))]
+    f(2)
+    assert calls == [1, 2, 3, 2]
+    info = f.cache_info()
+    assert (info.hits, info.misses, info.evictions, info.size) == (1, 4, 2, 2)
+    assert cache_info()[f.cache.name] == info
+
+    f.cache.maxsize = 1
+    assert len(f.cache) == 1
+    clear_cache(f)
+    assert f.cache_info().size == 0 and f.cache_info().nbytes == 0
+
+
+def test_memo_bound_maxsize():
+    class A(pm.memoize.WithMemoization):
+        @memoize(bound=True, maxsize=1)
+        def f(self, a):
+            return a
+
+        @memoize(bound=True)
+        def g(self, a):
+            return a
+
+    obj = A()
+    obj.f(1), obj.f(2), obj.g(1), obj.g(2)
+    assert obj._cache['f'].maxsize == 1 and len(obj._cache['f']) == 1
+    assert obj._cache['g'].maxsize is None and len(obj._cache['g']) == 2
+
+
+def test_memo_unhashable_keys():
+    calls = []
+
+    @memoize
+    def f(a):
+        calls.append(a)
+        return len(calls)
+
+    assert f(np.arange(3)) == f(np.arange(3)) == 1
+    assert f([np.ones(2), {'a': [1]}]) == f([np.ones(2), {'a': [1]}]) == 2
+    # different dtype
+    assert f(np.arange(3.)) == 3
+    assert len(calls) == 3
+
+
+def test_memo_weak_models():
+    @memoize
+    def f(model):
+        return len(model.named_vars)
+
+    model = pm.Model()
+    ref = weakref.ref(model)
+    assert f(model) == 0
+    assert len(f.cache) == 1
+    del model
+    gc.collect()
+    assert ref() is None
+    assert len(f.cache) == 0
+
+
+def test_memory_budget(monkeypatch):
+    @memoize
+    def f(n):
+        return np.zeros(n, dtype='int8')
+
+    @memoize
+    def g(n):
+        return np.zeros(n, dtype='int8')
+
+    # ignore the entries of the other caches
+    monkeypatch.setattr(pm.memoize, '_ALL_CACHES',
+                        weakref.WeakSet([f.cache, g.cache]))
+    try:
+        f(1000), g(1000), f(2000)
+        assert f.cache.nbytes == 3000
+        set_memory_budget(3500)
+        # f(1000) is the least recently used entry
+        assert f.cache.nbytes == 2000 and g.cache.nbytes == 1000
+        g(500)
+        assert g.cache.nbytes == 1500
+        f(1000)
+        # g(1000) is dropped now
+        assert f.cache.nbytes == 3000 and g.cache.nbytes == 500
+        assert g.cache_info().evictions == 1
+    finally:
+        set_memory_budget(None)
@@ -9,6 +9,7 @@ import pymc3 as pm
 from pymc3.distributions import HalfCauchy, Normal, transforms
 from pymc3 import Potential, Deterministic
 from pymc3.model import ValueGradFunction
+from pymc3.theanof import floatX
 
 
 class NewModel(pm.Model):
@@ -194,6 +195,65 @@ def test_empty_observed():
         npt.assert_allclose(b.tag.test_value, np.ones((2, 3)) / 2)
 
 
+def test_named_nodes_shared_subgraph():
+    x = tt.scalar('x')
+    x.tag.test_value = 0.
+    shared = x
+    for _ in range(30):
+        # every level doubles the number of paths to `x`
+        shared = shared + shared
+    y = tt.exp(shared)
+    y.name = 'y'
+    leafs, parents, children = pm.model.get_named_nodes_and_relations(y)
+    assert leafs == {'x': x}
+    assert parents == {y: set(), x: {y}}
+    assert children == {y: {x}, x: set()}
+
+
+def test_markov_blanket():
+    with pm.Model() as model:
+        a = pm.Normal('a')
+        b = pm.HalfNormal('b', sigma=tt.exp(a))
+        c = pm.Normal('c', mu=b)
+        y = pm.Normal('y', mu=c, observed=[1., 2.])
+        pot = pm.Potential('pot', -a ** 2)
+
+    b_log = model['b_log__']
+    assert model.markov_blanket([a]) == [a, b_log, pot]
+    assert model.markov_blanket([b_log]) == [b_log, c]
+    assert model.markov_blanket([c]) == [c, y]
+
+    point = {'a': 0.3, 'b_log__': -0.2, 'c': 1.5}
+    logp = model.fn(model.blanket_logpt([c]))(point)
+    npt.assert_allclose(logp, c.logp(point) + y.logp(point))
+    # the full model for variables that all factors depend on
+    npt.assert_allclose(model.fn(model.blanket_logpt(model.vars))(point),
+                        model.logp(point))
+
+
+def test_point_filters_keys():
+    with pm.Model():
+        pm.Normal('a', 0, 1)
+        pm.HalfNormal('b', 1)
+        point = pm.Point({'a': 1., 'b_log__': 0., 'c': 2.}, d=3.)
+    assert set(point) == {'a', 'b_log__'}
+    assert point['a'].dtype == np.float64
+
+
+def test_bijection_rmap_views():
+    with pm.Model() as model:
+        pm.Normal('a', 0, 1, shape=(2, 2))
+        pm.Normal('b', 0, 1)
+        pm.Poisson('n', 3)
+    bij = model.bijection
+    array = np.arange(6, dtype=bij.array_dtype)
+    point = bij.rmap(array)
+    assert point['a'].shape == (2, 2)
+    assert np.shares_memory(point['a'], array)
+    npt.assert_allclose(bij.map(point), array)
+    assert point['n'].dtype == model['n'].dtype
+
+
 class TestValueGradFunction(unittest.TestCase):
     def test_no_extra(self):
         a = tt.vector('a')
@@ -270,6 +330,25 @@ class TestValueGradFunction(unittest.TestCase):
         assert len(point_) == 3
         assert point_['extra1'] == 5
 
+    def test_array_to_dict_views(self):
+        self.f_grad.set_extra_values({'extra1': 5})
+        array = np.arange(self.f_grad.size).astype(self.f_grad.dtype)
+        point = self.f_grad.array_to_dict(array)
+        assert point['val2'].shape == (2, 3)
+        assert np.shares_memory(point['val1'], array)
+        assert np.shares_memory(point['val2'], array)
+
+    def test_hessp(self):
+        with pm.Model() as m:
+            cov = np.array([[2., .5, 0.], [.5, 1., .2], [0., .2, 3.]])
+            pm.MvNormal('a', mu=np.zeros(3), cov=cov, shape=3)
+        func = m.logp_dlogp_function()
+        func.set_extra_values(m.test_point)
+        array = floatX(np.random.randn(func.size))
+        vector = floatX(np.random.randn(func.size))
+        npt.assert_allclose(func.hessp(array, vector),
+                            np.linalg.solve(cov, vector), rtol=1e-5)
+
     def test_edge_case(self):
         # Edge case discovered in #2948
         ndim = 3
@@ -301,3 +380,71 @@ class TestValueGradFunction(unittest.TestCase):
         gf = m.logp_dlogp_function()
 
         assert m['x2_missing'].type == gf._extra_vars_shared['x2_missing'].type
+
+
+class TestBatchedLogpFunction:
+    def setup_method(self):
+        with pm.Model() as self.model:
+            mu = pm.Normal('mu', 0, 1)
+            sd = pm.HalfNormal('sd', 1)
+            x = pm.Normal('x', mu, sd, shape=3)
+            pm.Poisson('k', 3)
+            pm.Normal('y', x.sum(), 1, observed=np.array([1., 2.]))
+            pm.Normal('z', x, 1, observed=np.array([[1., 2., 3.], [0., 0., 0.]]))
+            Potential('pot', -mu ** 2)
+        self.bij = pm.DictToArrayBijection(
+            pm.ArrayOrdering(self.model.free_RVs), self.model.test_point)
+        points = [self.model.test_point]
+        for _ in range(4):
+            point = self.model.test_point
+            for name in ['mu', 'sd_log__', 'x']:
+                point[name] = point[name] + np.random.randn(*point[name].shape)
+            points.append(point)
+        self.points = points
+        self.array = floatX(np.array([self.bij.map(point) for point in points]))
+
+    @pytest.mark.parametrize('vectorize', ['auto', False])
+    def test_logp(self, vectorize):
+        f = self.model.logp_batched_function(vectorize=vectorize)
+        assert f.vectorized == (vectorize == 'auto')
+        expected = [self.model.logp(point) for point in self.points]
+        npt.assert_allclose(f(self.array), expected, rtol=1e-5)
+
+    def test_logp_nojac(self):
+        f = self.model.logp_batched_function(jacobian=False)
+        expected = [self.model.logp_nojac(point) for point in self.points]
+        npt.assert_allclose(f(self.array), expected, rtol=1e-5)
+
+    def test_factors(self):
+        f = self.model.logp_batched_function(factors=self.model.observed_RVs)
+        logp = self.model.fn(self.model.datalogpt - self.model['pot'])
+        expected = [logp(point) for point in self.points]
+        npt.assert_allclose(f(self.array), expected, rtol=1e-5)
+
+    @pytest.mark.parametrize('vectorize', ['auto', False])
+    def test_grad(self, vectorize):
+        f = self.model.logp_batched_function(compute_grad=True, vectorize=vectorize)
+        grad_func = self.model.logp_dlogp_function()
+        logps, grads = f(self.array[:, :f.size], extra_vars={'k': np.array(3)})
+        assert grads.shape == (5, f.size)
+        for point, logp, grad in zip(self.points, logps, grads):
+            grad_func.set_extra_values(point)
+            logp_, grad_ = grad_func(grad_func.dict_to_array(point))
+            npt.assert_allclose(logp, logp_, rtol=1e-5)
+            npt.assert_allclose(grad, grad_, rtol=1e-5)
+
+    def test_fallback(self):
+        with pm.Model() as model:
+            pm.MvNormal('a', mu=np.zeros(2), cov=np.eye(2), shape=2)
+            pm.Dirichlet('b', np.ones(3))
+        f = model.logp_batched_function()
+        assert not f.vectorized
+        bij = pm.DictToArrayBijection(pm.ArrayOrdering(model.free_RVs), model.test_point)
+        array = floatX(np.array([bij.map(model.test_point)] * 2))
+        npt.assert_allclose(f(array), [model.logp(model.test_point)] * 2, rtol=1e-5)
+
+    def test_invalid_shape(self):
+        f = self.model.logp_batched_function()
+        with pytest.raises(ValueError) as err:
+            f(self.array[0])
+        err.match('Invalid shape')
@@ -1,6 +1,6 @@
 import numpy as np
 import pymc3 as pm
-from pymc3.model_graph import ModelGraph, model_to_graphviz
+from pymc3.model_graph import ModelGraph, model_to_graphviz, get_dependencies
 
 from .helpers import SeededTest
 
@@ -77,3 +77,28 @@ class TestSimpleModel(SeededTest):
         for key in self.compute_graph:
             assert key in g.source
 
+
+
+def test_deterministic_chain():
+    # every deterministic depends on all previous ones, the parents are
+    # found without enumerating subsets of the upstream variables
+    with pm.Model() as model:
+        x = pm.Normal('x')
+        dets = [x]
+        for i in range(30):
+            dets.append(pm.Deterministic('d%d' % i, sum(dets) + 1.))
+        pm.Normal('y', mu=dets[-1] * dets[-2], observed=1.)
+
+    compute_graph = get_dependencies(model)
+    assert compute_graph['d0'] == {'x'}
+    assert compute_graph['d29'] == {'x'} | {'d%d' % i for i in range(29)}
+    assert compute_graph['y'] == {'d28', 'd29'}
+
+
+def test_dependencies_cached():
+    with pm.Model():
+        a = pm.Normal('a')
+        assert get_dependencies() == {'a': set()}
+        assert get_dependencies() is not get_dependencies()
+        pm.Normal('b', mu=a)
+        assert get_dependencies() == {'a': set(), 'b': {'a'}}
@@ -119,6 +119,24 @@ def test_random_dense():
             assert np.allclose(cov_, inv, atol=0.1)
 
 
+def test_equal_lowrank():
+    np.random.seed(42)
+    for _ in range(3):
+        v = np.random.rand(5) + .5
+        vecs, _ = np.linalg.qr(np.random.randn(5, 2))
+        vals = np.array([.1, 4.])
+        s = np.diag(v ** .5)
+        cov = s.dot(np.eye(5) + vecs.dot(np.diag(vals - 1)).dot(vecs.T)).dot(s)
+        pot = quadpotential.QuadPotentialLowRank(v, vecs, vals)
+        x = floatX(np.random.randn(5))
+        npt.assert_allclose(pot.velocity(x), cov.dot(x), rtol=1e-4)
+        npt.assert_allclose(pot.energy(x), .5 * x.dot(cov).dot(x), rtol=1e-4)
+
+        samples = np.array([pot.random() for _ in range(2000)])
+        cov_ = np.cov(samples.T)
+        assert np.allclose(cov_, np.linalg.inv(cov), rtol=0.1, atol=0.1)
+
+
 def test_user_potential():
     model = pymc3.Model()
     with model:
@@ -139,6 +139,29 @@ def test_empty_model():
         error.match('any free variables')
 
 
+class InPlaceStep(pm.step_methods.arraystep.ArrayStep):
+    """Returns the same array in every step, incremented in place."""
+    def __init__(self, vars):
+        super().__init__(vars, [])
+        self.q = None
+
+    def astep(self, q0):
+        if self.q is None:
+            self.q = q0
+        self.q += 1.
+        return self.q
+
+
+def test_trace_does_not_alias_step_array():
+    # the values of a point are views into the array returned by astep
+    with pm.Model():
+        a = pm.Normal('a', shape=2)
+        trace = pm.sample(3, step=InPlaceStep([a]), tune=0, chains=1,
+                          start={'a': np.zeros(2)},
+                          compute_convergence_checks=False)
+    npt.assert_array_equal(trace['a'], [[1., 1.], [2., 2.], [3., 3.]])
+
+
 def test_partial_trace_sample():
     with pm.Model() as model:
         a = pm.Normal('a', mu=0, sigma=1)
@@ -361,6 +384,50 @@ class TestSamplePPC(SeededTest):
                                rtol=rtol)
 
 
+    def test_random_seed_in_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        with pm.Model() as model:
+            mu = pm.Normal('mu', 0., 1.)
+            pm.Normal('a', mu=mu, sigma=1, observed=np.zeros(20))
+        points = [{'mu': m} for m in np.linspace(-1, 1, 10)]
+
+        def ppc(seed):
+            return pm.sample_posterior_predictive(
+                points, samples=10, model=model, random_seed=seed,
+                progressbar=False)['a']
+
+        expected = [ppc(seed) for seed in range(4)]
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(ppc, range(4)))
+        npt.assert_array_equal(results, expected)
+        assert not np.array_equal(expected[0], expected[1])
+
+    def test_chunks(self):
+        with pm.Model() as model:
+            mu = pm.Normal('mu', 0., 1., shape=2)
+            pm.Normal('a', mu=mu, sigma=1, observed=np.zeros((3, 2)))
+            pm.Poisson('b', mu=pm.math.exp(mu), observed=np.zeros(2))
+        points = [{'mu': m} for m in np.linspace(-1, 1, 20).reshape(10, 2)]
+
+        def ppc(**kwargs):
+            return pm.sample_posterior_predictive(
+                points, samples=25, model=model, random_seed=1,
+                progressbar=False, **kwargs)
+
+        sequential = ppc(chunks=3)
+        parallel = ppc(chunks=3, cores=2)
+        assert sequential['a'].shape == (25, 3, 2)
+        assert sequential['b'].shape == (25, 2)
+        for name in ('a', 'b'):
+            npt.assert_array_equal(sequential[name], parallel[name])
+            assert sequential[name].dtype == parallel[name].dtype
+        assert not np.array_equal(sequential['a'], ppc(chunks=4)['a'])
+        # shards only depend on the random seed, not on the process
+        npt.assert_array_equal(ppc(chunks=3, cores=3)['a'], sequential['a'])
+        with pytest.raises(ValueError):
+            ppc(chunks=0)
+
+
 class TestSamplePPCW(SeededTest):
     def test_sample_posterior_predictive_w(self):
         data0 = np.random.normal(0, 1, size=500)
@@ -524,6 +591,19 @@ class TestSamplePriorPredictive(SeededTest):
             prior = pm.sample_prior_predictive(10)
         assert prior['mu'].shape == (10, 5)
 
+    def test_random_seed(self):
+        with pm.Model():
+            mu = pm.Normal('mu')
+            pm.Gamma('x', mu=pm.math.exp(mu), sigma=1., shape=3)
+            state = np.random.get_state()
+            priors = [pm.sample_prior_predictive(10, random_seed=seed)
+                      for seed in (1, 1, np.random.RandomState(1), 2)]
+        for name in ('mu', 'x'):
+            npt.assert_array_equal(priors[0][name], priors[1][name])
+            npt.assert_array_equal(priors[0][name], priors[2][name])
+            assert not np.array_equal(priors[0][name], priors[3][name])
+        npt.assert_array_equal(np.random.get_state()[1], state[1])
+
     def test_zeroinflatedpoisson(self):
         with pm.Model():
             theta = pm.Beta('theta', alpha=1, beta=1)
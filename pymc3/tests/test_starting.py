@@ -1,7 +1,8 @@
 from .checks import close_to
 import numpy as np
+import theano.tensor as tt
 from pymc3.tuning import starting
-from pymc3 import Model, Uniform, Normal, Beta, Binomial, find_MAP, Point
+from pymc3 import Model, Uniform, Normal, Beta, Binomial, Potential, find_MAP, Point
 from .models import simple_model, non_normal, simple_arbitrary_det
 from .helpers import select_by_precision
 
@@ -69,3 +70,44 @@ def test_find_MAP():
 
     close_to(map_est2['mu'], 0, tol)
     close_to(map_est2['sigma'], 1, tol)
+
+
+def test_find_MAP_multistart():
+    with Model():
+        Normal('x', mu=np.array([-2., 2.]), sigma=np.array([1., 3.]), shape=2)
+        starts = [{'x': np.array([0., 0.])}, {'x': np.array([5., -5.])},
+                  {'x': np.array([-1., 1.])}]
+        maps, results = starting.find_MAP_multistart(
+            starts, cores=1, return_raw=True, progressbar=False)
+
+    assert len(maps) == 3
+    assert len(results) == 3
+    for map_est, result in zip(maps, results):
+        close_to(map_est['x'], [-2., 2.], select_by_precision(float64=1e-5, float32=1E-3))
+        assert result.success
+    logps = [-result.fun for result in results]
+    assert logps == sorted(logps, reverse=True)
+
+
+def test_find_MAP_multistart_ranked():
+    with Model():
+        x = Normal('x', mu=0., sigma=1.)
+        Normal('y', mu=0., sigma=1.)
+        # a bimodal potential in x with the better mode at x = 2
+        Potential('modes', tt.log(.2 * tt.exp(-10 * (x + 2) ** 2) +
+                                  .8 * tt.exp(-10 * (x - 2) ** 2)))
+        maps = starting.find_MAP_multistart(
+            [{'x': -2.}, {'x': 2.}], cores=2, progressbar=False)
+
+    assert maps[0]['x'] > 1.
+    assert maps[1]['x'] < -1.
+    close_to(maps[0]['y'], 0., 1e-3)
+
+
+def test_find_MAP_multistart_jitter():
+    _, model, (mu, _) = simple_model()
+    with model:
+        maps = starting.find_MAP_multistart(np.int64(4), cores=1, progressbar=False)
+    assert len(maps) == 4
+    for map_est in maps:
+        close_to(map_est['x'], [mu, mu], select_by_precision(float64=1e-5, float32=1E-4))
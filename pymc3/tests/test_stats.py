@@ -49,6 +49,63 @@ def test_log_post_trace():
     npt.assert_allclose(logp, -0.5 * np.log(2 * np.pi), atol=1e-7)
 
 
+def test_log_post_trace_cached():
+    with pm.Model() as model:
+        a = pm.Normal('a')
+        pm.Normal('y', mu=a, observed=np.zeros(5))
+        trace = pm.sample(10, tune=10, chains=1)
+
+    logp = pmstats._log_post_trace(trace, model)
+    assert pmstats._log_post_trace(trace, model) is logp
+    assert not logp.flags.writeable
+
+    # points in lists are evaluated every time
+    points = list(trace.points())
+    logp_points = pmstats._log_post_trace(points, model)
+    npt.assert_allclose(logp_points, logp)
+    assert pmstats._log_post_trace(points, model) is not logp_points
+
+
+def test_log_post_trace_cache_set_data():
+    with pm.Model() as model:
+        x = pm.Data('x', np.zeros(5))
+        y = pm.Data('y', np.zeros(5))
+        a = pm.Normal('a')
+        pm.Normal('obs', mu=a * x, observed=y)
+        trace = pm.sample(10, tune=10, chains=1)
+
+    logp = pmstats._log_post_trace(trace, model)
+    waic = pm.waic(trace, model)
+    with model:
+        pm.set_data({'y': np.ones(5)})
+    npt.assert_allclose(pmstats._log_post_trace(trace, model), logp - 0.5)
+    assert pm.waic(trace, model).WAIC != waic.WAIC
+
+    # the parameters of the likelihood depend on the data too
+    with model:
+        pm.set_data({'x': np.ones(5), 'y': np.zeros(5)})
+    logp_x = pmstats._log_post_trace(trace, model)
+    npt.assert_allclose(logp_x, logp - 0.5 * trace['a'][:, None] ** 2)
+
+
+def test_compare_parallel():
+    np.random.seed(42)
+    x_obs = np.random.normal(0, 1, size=20)
+
+    model_dict = {}
+    for sigma in [0.8, 1., 1.2]:
+        with pm.Model() as model:
+            mu = pm.Normal('mu', 0, 1)
+            pm.Normal('x', mu=mu, sigma=sigma, observed=x_obs)
+            trace = pm.sample(200, tune=100, chains=1)
+        model_dict[model] = trace
+
+    for ic in ['WAIC', 'LOO']:
+        serial = pm.compare(model_dict, ic=ic, method='pseudo-BMA')
+        parallel = pm.compare(model_dict, ic=ic, method='pseudo-BMA', cores=2)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+
 def test_compare():
     np.random.seed(42)
     x_obs = np.random.normal(0, 1, size=100)
@@ -343,3 +400,11 @@ class TestDfSummary(bf.ModelBackendSampledTestCase):
         lw = np.random.randn(20000, 10)
         _, ks = pm.stats._psislw(lw, 1.)
         npt.assert_array_less(ks, .5)
+
+    def test_gpdfit_columns(self):
+        x = np.sort(np.random.exponential(size=(50, 7)), axis=0)
+        k, sigma = pm.stats._gpdfit(x, chunksize=1000)
+        for i in range(x.shape[1]):
+            k_i, sigma_i = pm.stats._gpdfit(x[:, i])
+            npt.assert_allclose(k[i], k_i)
+            npt.assert_allclose(sigma[i], sigma_i)
@@ -13,13 +13,15 @@ from .models import (
 from pymc3.sampling import assign_step_methods, sample
 from pymc3.parallel_sampling import ParallelSamplingError
 from pymc3.exceptions import SamplingError
-from pymc3.model import Model
+from pymc3.model import Model, set_data
+from pymc3.data import Data
 from pymc3.step_methods import (
     NUTS,
     BinaryGibbsMetropolis,
     CategoricalGibbsMetropolis,
     Metropolis,
     Slice,
+    MultivariateSlice,
     CompoundStep,
     NormalProposal,
     MultivariateNormalProposal,
@@ -750,6 +752,9 @@ class TestStepMethods:  # yield test doesn't work subclassing object
                 NUTS(scaling=C, is_cov=True, blocked=False),
                 Metropolis(S=C, proposal_dist=MultivariateNormalProposal, blocked=True),
                 Slice(blocked=True),
+                MultivariateSlice(method='factor'),
+                MultivariateSlice(method='direction'),
+                MultivariateSlice(method='hyperrect'),
                 HamiltonianMC(scaling=C, is_cov=True),
                 NUTS(scaling=C, is_cov=True),
                 CompoundStep(
@@ -849,6 +854,135 @@ class TestMetropolisProposal:
         npt.assert_allclose(np.cov(samples.T), cov, rtol=0.2)
 
 
+class TestStateLogpCache:
+    @pytest.mark.parametrize('step_method', [Metropolis, Slice])
+    def test_compound_model_logp(self, step_method):
+        with Model() as model:
+            a = Normal('a', shape=2)
+            b = Normal('b', mu=a.sum(), sigma=2.)
+            kwargs = dict(tune=0, chains=1, compute_convergence_checks=False)
+            # the log-density of a is the one of the model, the last block
+            # reports it for the recorded point
+            trace = sample(20, step=[step_method([b]), step_method([a])],
+                           **kwargs)
+            # the one of b does not include the prior of a
+            trace_b = sample(5, step=[step_method([a]), step_method([b])],
+                             **kwargs)
+
+        logp = np.array([model.logp(point) for point in trace.points()])
+        npt.assert_allclose(trace.get_sampler_stats('model_logp')[:, -1],
+                            logp, rtol=1e-5)
+        assert np.isnan(trace_b.get_sampler_stats('model_logp')[:, -1]).all()
+
+    def test_metropolis_reuses_logp(self):
+        with Model():
+            Normal('a', shape=3)
+            step = Metropolis()
+
+        calls = []
+        logp = step.logp
+        step.logp = lambda q: calls.append(q) or logp(q)
+        point = {'a': np.zeros(3)}
+        for _ in range(10):
+            point, _ = step.step(point)
+        # one evaluation per proposal and one for the initial point
+        assert len(calls) == 11
+
+        # changed values of other variables invalidate the cached logp
+        step._last_state[2]['a'] = np.ones(3)
+        step.step(point)
+        assert len(calls) == 13
+
+    @pytest.mark.parametrize('step_method', [Metropolis, Slice])
+    def test_set_data_between_samples(self, step_method):
+        with Model() as model:
+            x = Data('x', np.zeros(3))
+            a = Normal('a')
+            Normal('y', mu=a * x, observed=np.ones(3))
+            step = step_method([a])
+            kwargs = dict(tune=0, chains=1, compute_convergence_checks=False)
+            trace = sample(5, step=step, **kwargs)
+            set_data({'x': np.full(3, 3.)})
+            trace = sample(5, step=step, start=trace.point(-1), **kwargs)
+
+        logp = np.array([model.logp(point) for point in trace.points()])
+        npt.assert_allclose(trace.get_sampler_stats('model_logp'), logp,
+                            rtol=1e-5)
+
+    def test_set_data_between_steps(self):
+        with Model() as model:
+            x = Data('x', np.zeros(3))
+            a = Normal('a')
+            Normal('y', mu=a * x, observed=np.ones(3))
+            step = Metropolis([a], scaling=1e-10)
+
+        point = {'a': np.array(0.5)}
+        point, _ = step.step(point)
+        with model:
+            set_data({'x': np.ones(3)})
+        point, stats = step.step(point)
+        npt.assert_allclose(stats[0]['model_logp'], model.logp(point),
+                            rtol=1e-5)
+
+
+class TestMarkovBlanket:
+    def test_metropolis_blanket(self):
+        with Model() as model:
+            a = Normal('a')
+            b = Normal('b', mu=a)
+            c = Normal('c', mu=b)
+            Normal('y', mu=c, observed=[1., 2.])
+            step = Metropolis(vars=[a])
+
+        assert set(step.shared) == {'b'}
+        point = {'a': np.array(0.5), 'b': np.array(-1.), 'c': np.array(3.)}
+        step.shared['b'].set_value(-1.)
+        blanket = model['a'].logp(point) + model['b'].logp(point)
+        npt.assert_allclose(step.logp(np.array([0.5])), blanket)
+
+        # c is not compared to detect changes of the state
+        point, _ = step.step(point)
+        assert set(step._fixed_values) == {'b'}
+
+    @pytest.mark.parametrize('step_method', [Slice, BinaryGibbsMetropolis])
+    def test_array_step_blanket(self, step_method):
+        with Model() as model:
+            p = Beta('p', 2., 2.)
+            if step_method is Slice:
+                x = Normal('x', mu=p, shape=3)
+            else:
+                x = Bernoulli('x', p=p, shape=3)
+            Normal('z', mu=x.sum(), observed=1.)
+            step = step_method(vars=[x])
+
+        point = model.test_point
+        logp = step.fs[0](point)
+        expected = model['x'].logp(point) + model['z'].logp(point)
+        npt.assert_allclose(logp, expected, rtol=1e-6)
+        assert set(step._blanket_names) == {'x', 'p_logodds__'}
+
+
+class TestMultivariateSlice:
+    def test_invalid_method(self):
+        with Model():
+            Normal('x', shape=2)
+            with pytest.raises(ValueError):
+                MultivariateSlice(method='stepping_out')
+
+    @pytest.mark.parametrize('method', ['factor', 'direction', 'hyperrect'])
+    def test_stats(self, method):
+        with Model() as model:
+            Normal('x', shape=3)
+            trace = sample(50, tune=0, chains=1, random_seed=1,
+                           step=MultivariateSlice(method=method),
+                           compute_convergence_checks=False)
+        nevals = trace.get_sampler_stats('nevals')
+        assert (nevals >= 1).all()
+        logp = np.array([model.logp(point) for point in trace.points()])
+        npt.assert_allclose(trace.get_sampler_stats('model_logp'), logp,
+                            rtol=1e-6)
+
+
 class TestCompoundStep:
     samplers = (Metropolis, Slice, HamiltonianMC, NUTS, DEMetropolis)
 
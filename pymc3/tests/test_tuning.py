@@ -1,6 +1,8 @@
 import numpy as np
+import numpy.testing as npt
 from numpy import inf
-from pymc3.tuning import scaling, find_MAP
+import pymc3 as pm
+from pymc3.tuning import scaling, find_MAP, laplace_approximation
 from . import models
 
 
@@ -32,3 +34,58 @@ def test_mle_jacobian():
         map_estimate = find_MAP(method="BFGS", model=model)
 
     np.testing.assert_allclose(map_estimate["mu_i"], truth, rtol=rtol)
+
+
+def test_laplace_approximation_gaussian():
+    np.random.seed(42)
+    cov = np.random.randn(8, 8)
+    cov = cov.dot(cov.T) + np.eye(8)
+    mu = np.random.randn(8)
+    with pm.Model():
+        pm.MvNormal('x', mu=mu, cov=cov, shape=8)
+        # exact diagonal and full rank give the exact covariance
+        approx = laplace_approximation(rank=8, n_probes=8, progressbar=False)
+
+    npt.assert_allclose(approx.mean, mu, rtol=1e-4, atol=1e-4)
+    npt.assert_allclose(approx.mean_point['x'], mu, rtol=1e-4, atol=1e-4)
+    npt.assert_allclose(approx.cov_diag, np.diag(cov), rtol=1e-4)
+    x = np.random.randn(8)
+    npt.assert_allclose(approx.cov_matvec(x), cov.dot(x), rtol=1e-4)
+    npt.assert_allclose(approx.precision_matvec(x), np.linalg.solve(cov, x), rtol=1e-4)
+
+    draws = approx.random(size=5000)
+    assert draws.shape == (5000, 8)
+    npt.assert_allclose(np.cov(draws.T), cov, atol=.5)
+
+    trace = approx.sample(100)
+    assert trace['x'].shape == (100, 8)
+    assert isinstance(approx.potential(), pm.step_methods.hmc.quadpotential.QuadPotentialLowRank)
+
+
+def test_laplace_approximation_lowrank():
+    np.random.seed(42)
+    n = 50
+    sd = np.random.rand(n) + .5
+    with pm.Model():
+        z = pm.Normal('z', 0, 1)
+        pm.Normal('x', mu=z, sigma=sd, shape=n)
+        pm.Normal('y', mu=z, sigma=.1, observed=1.)
+        approx = laplace_approximation(rank=3, n_probes=10, method='trust-ncg',
+                                       progressbar=False)
+
+    npt.assert_allclose(approx.mean[:1], .990099, rtol=1e-3)
+    assert approx.vecs.shape == (n + 1, 3)
+    assert np.all(approx.cov_diag > 0)
+
+
+def test_laplace_approximation_exact_diag():
+    with pm.Model():
+        pm.Normal('x', mu=0, sigma=np.array([1e-3, 1., 10.]), shape=3)
+        pm.Flat('flat')
+        approx = laplace_approximation(rank=0, n_probes=None,
+                                       min_curvature=1e-10, progressbar=False)
+
+    diag = approx._func.array_to_dict(approx.precision_diag)
+    npt.assert_allclose(diag['x'], [1e6, 1., 1e-2], rtol=1e-5)
+    # the flat direction is floored relative to the largest curvature
+    npt.assert_allclose(diag['flat'], 1e-4, rtol=1e-5)
@@ -1,9 +1,10 @@
 import numpy as np
-import theano
 from theano import theano, scalar, tensor as tt
 from theano.configparser import change_flags
 from theano.gof import Op
 from theano.gof.graph import inputs
+from theano.compile.ops import Shape, Shape_i, ViewOp
+from theano.tensor.opt import MakeVector
 from theano.sandbox.rng_mrg import MRG_RandomStreams
 
 from .blocking import ArrayOrdering
@@ -13,6 +14,7 @@ from .vartypes import typefilter, continuous_types
 __all__ = ['gradient',
            'hessian',
            'hessian_diag',
+           'hessian_vector_product',
            'inputvars',
            'cont_inputs',
            'floatX',
@@ -176,6 +178,21 @@ def hessian_diag(f, vars=None):
         return empty_gradient
 
 
+@change_flags(compute_test_value='ignore')
+def hessian_vector_product(f, x, v):
+    """Product of the negative hessian of the scalar `f` wrt the vector `x`
+    with the vector `v`, without building the hessian.
+
+    The R-operator of the gradient is used if all ops in the graph support
+    it, otherwise the gradient of the directional derivative.
+    """
+    g = tt.grad(f, x)
+    try:
+        return -tt.Rop(g, x, v)
+    except NotImplementedError:
+        return -tt.grad(tt.sum(g * v), x)
+
+
 def makeiter(a):
     if isinstance(a, (tuple, list)):
         return a
@@ -479,3 +496,100 @@ def largest_common_dtype(tensors):
                  else smartfloatX(np.asarray(t)).dtype
                  for t in tensors)
     return np.stack([np.ones((), dtype=dtype) for dtype in dtypes]).dtype
+
+
+def batch_graph(outputs, replace):
+    """Clone a graph for a leading batch dimension of some of its inputs.
+
+    Every variable in `replace` is replaced by a variable with one
+    additional leading dimension. Ops downstream of the replaced variables
+    are rebuilt such that they operate independently on every entry of the
+    batch dimension. Only elementwise ops, dimshuffles, reductions, shapes
+    and `MakeVector` are supported.
+
+    Parameters
+    ----------
+    outputs : list of theano variables
+    replace : dict
+        Maps variables of the graph to their batched replacements.
+
+    Returns
+    -------
+    outputs : list of theano variables
+        The cloned outputs.
+    batched : list of bool
+        Whether the corresponding output has a leading batch dimension.
+
+    Raises
+    ------
+    NotImplementedError
+        If the graph contains an op downstream of a replaced variable that
+        can not be batched.
+    """
+    memo = dict(replace)
+    batched = set(replace.values())
+    for node in theano.gof.graph.io_toposort(inputs(outputs), outputs):
+        node_inputs = [memo.get(var, var) for var in node.inputs]
+        is_batched = [var in batched for var in node_inputs]
+        if not any(is_batched):
+            continue
+        new_outputs, batched_outputs = _batch_apply(node.op, node_inputs, is_batched)
+        for old, new, is_b in zip(node.outputs, new_outputs, batched_outputs):
+            memo[old] = new
+            if is_b:
+                batched.add(new)
+    outputs = [memo.get(var, var) for var in outputs]
+    return outputs, [var in batched for var in outputs]
+
+
+def _batch_apply(op, inputs, is_batched):
+    if isinstance(op, tt.Elemwise):
+        inputs = [var if b else tt.shape_padleft(var)
+                  for var, b in zip(inputs, is_batched)]
+        outputs = op.make_node(*inputs).outputs
+        return outputs, [True] * len(outputs)
+    if isinstance(op, tt.DimShuffle):
+        new_order = [0] + [i if i == 'x' else i + 1 for i in op.new_order]
+        return [inputs[0].dimshuffle(new_order)], [True]
+    if isinstance(op, (tt.elemwise.CAReduce, tt.basic.MaxAndArgmax)) and len(inputs) == 1:
+        ndim = inputs[0].ndim
+        if op.axis is None:
+            axis = tuple(range(1, ndim))
+        else:
+            axis = tuple(a % (ndim - 1) + 1 for a in op.axis)
+        if isinstance(op, tt.basic.MaxAndArgmax):
+            new_op = tt.basic.MaxAndArgmax(list(axis))
+        else:
+            new_op = _reduce_over(op, axis)
+        outputs = new_op.make_node(inputs[0]).outputs
+        return outputs, [True] * len(outputs)
+    if isinstance(op, Shape):
+        return [inputs[0].shape[1:]], [False]
+    if isinstance(op, Shape_i):
+        return [inputs[0].shape[op.i + 1]], [False]
+    if isinstance(op, ViewOp):
+        return [inputs[0]], [True]
+    if isinstance(op, MakeVector):
+        ref = inputs[is_batched.index(True)].dimshuffle(0, 'x')
+        columns = [var.dimshuffle(0, 'x') if b else tt.fill(ref, var)
+                   for var, b in zip(inputs, is_batched)]
+        return [tt.cast(tt.concatenate(columns, axis=1), op.dtype)], [True]
+    raise NotImplementedError('Op %s does not support a batch dimension.' % op)
+
+
+def _reduce_over(op, axis):
+    """The reduction `op` over the axes `axis` instead of its own."""
+    elemwise = tt.elemwise
+    if type(op) is elemwise.CAReduce:
+        return elemwise.CAReduce(op.scalar_op, axis=axis)
+    if type(op) is elemwise.CAReduceDtype:
+        return elemwise.CAReduceDtype(op.scalar_op, axis=axis, dtype=op.dtype,
+                                      acc_dtype=op.acc_dtype)
+    if isinstance(op, elemwise.Prod):
+        return type(op)(axis=axis, dtype=op.dtype, acc_dtype=op.acc_dtype,
+                        no_zeros_in_input=op.no_zeros_in_input)
+    if isinstance(op, (elemwise.Sum, elemwise.ProdWithoutZeros)):
+        return type(op)(axis=axis, dtype=op.dtype, acc_dtype=op.acc_dtype)
+    if isinstance(op, (elemwise.All, elemwise.Any)):
+        return type(op)(axis=axis)
+    raise NotImplementedError('Op %s does not support a batch dimension.' % op)
@@ -1,2 +1,3 @@
-from .starting import find_MAP
+from .starting import find_MAP, find_MAP_multistart
 from .scaling import approx_hessian, find_hessian, trace_cov, guess_scaling
+from .laplace import laplace_approximation, LaplaceApproximation
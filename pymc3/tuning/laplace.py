@@ -0,0 +1,261 @@
+'''
+Laplace approximation of the posterior for large models.
+
+The curvature of the log-probability at the mode is only accessed through
+hessian-vector products, so that neither the hessian nor the covariance
+matrix is ever formed.
+'''
+import numpy as np
+from scipy.optimize import minimize
+import scipy.sparse.linalg as spla
+
+import pymc3 as pm
+from ..model import modelcontext, Point
+from ..theanof import inputvars
+from ..vartypes import discrete_types, typefilter
+from ..util import get_default_varnames
+from .starting import CostFuncWrapper, _check_start, allinmodel
+
+__all__ = ['laplace_approximation', 'LaplaceApproximation']
+
+_HESSP_METHODS = ('newton-cg', 'trust-ncg', 'trust-krylov', 'trust-constr')
+
+
+def laplace_approximation(start=None, vars=None, rank=20, n_probes=20,
+                          optimize=True, method='L-BFGS-B', min_curvature=1e-8,
+                          maxeval=5000, progressbar=True, model=None, **kwargs):
+    """
+    Gaussian approximation of the posterior at its mode.
+
+    The precision matrix of the approximation is the negative hessian of
+    the log-probability at the mode, represented as
+    ``D^(1/2) (I + V diag(lam - 1) V^T) D^(1/2)``. `D` is a (possibly
+    stochastic) estimate of the diagonal of the hessian, and `lam`, `V` are
+    the `rank` eigenpairs of the diagonally preconditioned hessian that are
+    furthest from one, computed with Lanczos iterations. Only
+    hessian-vector products are used, the memory requirement is
+    O(ndim * rank).
+
+    Parameters
+    ----------
+    start : `dict` of parameter values (Defaults to `model.test_point`)
+    vars : list
+        List of continuous variables of the approximation (Defaults to
+        all continuous). The other free variables are kept at their
+        values in `start`.
+    rank : int
+        The number of curvature directions that are computed exactly.
+    n_probes : int or None
+        The number of random probe vectors for the estimate of the diagonal
+        of the hessian. If None or if the model has at most `n_probes`
+        dimensions, the diagonal is computed exactly with one
+        hessian-vector product per dimension.
+    optimize : bool
+        Whether to search for the mode starting from `start`. If False,
+        `start` is assumed to be the mode.
+    method : string
+        Optimization algorithm passed to `scipy.optimize.minimize`.
+        Methods that accept a `hessp` argument (e.g. 'trust-ncg') are
+        given the hessian-vector product.
+    min_curvature : float
+        Lower bound on the estimated curvatures, relative to the largest
+        one. Negative or vanishing curvature estimates are clipped to it.
+    maxeval : int
+        The maximum number of times the posterior distribution is
+        evaluated during the optimization.
+    progressbar : bool
+        Whether or not to display a progress bar during the optimization.
+    model : Model (optional if in `with` context)
+    **kwargs
+        Extra args passed to scipy.optimize.minimize
+
+    Returns
+    -------
+    approx : LaplaceApproximation
+    """
+    model = modelcontext(model)
+    start = Point(_check_start(start, model), model=model)
+
+    if vars is None:
+        vars = model.cont_vars
+    vars = inputvars(vars)
+    allinmodel(vars, model)
+    if list(typefilter(vars, discrete_types)):
+        raise ValueError('The Laplace approximation is only available for '
+                         'continuous variables.')
+
+    varnames = [var.name for var in vars]
+    extra_vars = [var for var in model.free_RVs if var.name not in varnames]
+    func = pm.model.ValueGradFunction(model.logpt, vars, extra_vars)
+    func.set_extra_values(start)
+    x0 = func.dict_to_array(start)
+
+    if optimize:
+        cost_func = CostFuncWrapper(maxeval, progressbar, logp_dlogp_func=func)
+        if method.lower() in _HESSP_METHODS:
+            kwargs.setdefault('hessp', lambda x, p: func.hessp(pm.floatX(x), pm.floatX(p)))
+        try:
+            opt_result = minimize(cost_func, x0, method=method, jac=True, **kwargs)
+            x0 = opt_result['x']
+        except (KeyboardInterrupt, StopIteration) as e:
+            if cost_func.previous_x is not None:
+                x0 = cost_func.previous_x
+            if isinstance(e, StopIteration):
+                pm._log.info(e)
+        finally:
+            cost_func.progress.close()
+        x0 = pm.floatX(x0)
+
+    def hessp(v):
+        return np.asarray(func.hessp(x0, pm.floatX(v)), dtype=np.float64)
+
+    diag = _hessian_diag(hessp, func.size, n_probes)
+    scale = np.max(np.abs(diag)) or 1.
+    diag = np.maximum(diag, min_curvature * scale)
+    vals, vecs = _leading_curvature(hessp, diag ** -.5, rank)
+    vals = np.maximum(vals, min_curvature)
+
+    return LaplaceApproximation(x0, diag, vals, vecs, func, model)
+
+
+def _hessian_diag(hessp, size, n_probes):
+    if n_probes is None or size <= n_probes:
+        return np.array([hessp(e)[i] for i, e in enumerate(np.eye(size))])
+    diag = np.zeros(size)
+    for _ in range(n_probes):
+        z = np.random.choice([-1., 1.], size=size)
+        diag += z * hessp(z)
+    return diag / n_probes
+
+
+def _leading_curvature(hessp, inv_sqrt_diag, rank):
+    """Eigenpairs of D^(-1/2) H D^(-1/2) that are furthest from one."""
+    size = len(inv_sqrt_diag)
+
+    def matvec(v):
+        v = np.ravel(v)
+        return inv_sqrt_diag * hessp(inv_sqrt_diag * v) - v
+
+    if rank <= 0:
+        return np.zeros(0), np.zeros((size, 0))
+    if rank >= size - 1:
+        dense = np.array([matvec(e) for e in np.eye(size)])
+        vals, vecs = np.linalg.eigh(.5 * (dense + dense.T))
+        order = np.argsort(-np.abs(vals))[:rank]
+        return vals[order] + 1, vecs[:, order]
+
+    operator = spla.LinearOperator((size, size), matvec=matvec, dtype=np.float64)
+    vals, vecs = spla.eigsh(operator, k=rank, which='LM')
+    return vals + 1, vecs
+
+
+class LaplaceApproximation:
+    """
+    Gaussian approximation of the posterior returned by
+    :func:`laplace_approximation`.
+
+    Attributes
+    ----------
+    mean : array
+        The mode of the log-probability as a flat array.
+    precision_diag : array
+        The estimate `D` of the diagonal of the negative hessian.
+    vals, vecs : array
+        The leading eigenpairs of ``D^(-1/2) H D^(-1/2)``.
+    """
+
+    def __init__(self, mean, precision_diag, vals, vecs, func, model):
+        self.mean = mean
+        self.precision_diag = precision_diag
+        self.vals = vals
+        self.vecs = vecs
+        self.model = model
+        self._func = func
+        self._extra_values = func.get_extra_values()
+        self._inv_sqrt_diag = precision_diag ** -.5
+
+    @property
+    def ndim(self):
+        return self.mean.size
+
+    @property
+    def mean_point(self):
+        """The mode as a point dictionary of all free variables."""
+        return self._to_point(self.mean)
+
+    @property
+    def cov_diag(self):
+        """The marginal variances of the approximation."""
+        correction = (self.vecs ** 2).dot(1. / self.vals - 1)
+        return self._inv_sqrt_diag ** 2 * (1 + correction)
+
+    def cov_matvec(self, x):
+        """Product of the covariance matrix of the approximation with `x`."""
+        y = self._inv_sqrt_diag * x
+        y = y + self.vecs.dot((1. / self.vals - 1) * self.vecs.T.dot(y))
+        return self._inv_sqrt_diag * y
+
+    def precision_matvec(self, x):
+        """Product of the precision matrix of the approximation with `x`."""
+        sqrt_diag = self.precision_diag ** .5
+        y = sqrt_diag * x
+        y = y + self.vecs.dot((self.vals - 1) * self.vecs.T.dot(y))
+        return sqrt_diag * y
+
+    def random(self, size=None):
+        """Draw flat arrays from the approximation.
+
+        Parameters
+        ----------
+        size : int, optional
+            The number of draws. If None, a single draw of shape `(ndim,)`
+            is returned, otherwise an array of shape `(size, ndim)`.
+        """
+        n = 1 if size is None else size
+        z = np.random.normal(size=(n, self.ndim))
+        z = z + (z.dot(self.vecs) * (self.vals ** -.5 - 1)).dot(self.vecs.T)
+        draws = self.mean + z * self._inv_sqrt_diag
+        if size is None:
+            return draws[0]
+        return draws
+
+    def potential(self, dtype=None):
+        """A mass matrix for HMC and NUTS with the approximate posterior
+        covariance, in the variable ordering of the approximation."""
+        from ..step_methods.hmc.quadpotential import QuadPotentialLowRank
+        return QuadPotentialLowRank(self._inv_sqrt_diag ** 2, self.vecs,
+                                    1. / self.vals, dtype=dtype)
+
+    def sample(self, draws=500, include_transformed=True):
+        """Draw samples from the approximation.
+
+        Parameters
+        ----------
+        draws : `int`
+            Number of random samples.
+        include_transformed : `bool`
+            If True, transformed variables are also sampled.
+
+        Returns
+        -------
+        trace : :class:`pymc3.backends.base.MultiTrace`
+        """
+        vars_sampled = get_default_varnames(self.model.unobserved_RVs,
+                                            include_transformed=include_transformed)
+        fn = self.model.fastfn(vars_sampled)
+        points = (self._to_point(pm.floatX(x)) for x in self.random(draws))
+        points = ({var.name: value for var, value in zip(vars_sampled, fn(point))}
+                  for point in points)
+        trace = pm.sampling.NDArray(model=self.model, vars=vars_sampled)
+        try:
+            trace.setup(draws=draws, chain=0)
+            for point in points:
+                trace.record(point)
+        finally:
+            trace.close()
+        return pm.sampling.MultiTrace([trace])
+
+    def _to_point(self, x):
+        point = self._func.array_to_dict(x)
+        point.update(self._extra_values)
+        return point
@@ -4,6 +4,8 @@ Created on Mar 12, 2011
 @author: johnsalvatier
 '''
 from scipy.optimize import minimize
+import multiprocessing as mp
+import numbers
 import numpy as np
 from numpy import isfinite, nan_to_num
 from tqdm import tqdm
@@ -18,7 +20,7 @@ from ..util import update_start_vals, get_default_varnames
 import warnings
 from inspect import getargspec
 
-__all__ = ['find_MAP']
+__all__ = ['find_MAP', 'find_MAP_multistart']
 
 
 def find_MAP(start=None, vars=None, method="L-BFGS-B",
@@ -61,16 +63,7 @@ def find_MAP(start=None, vars=None, method="L-BFGS-B",
     warnings.warn('find_MAP should not be used to initialize the NUTS sampler, simply call pymc3.sample() and it will automatically initialize NUTS in a better way.')
 
     model = modelcontext(model)
-    if start is None:
-        start = model.test_point
-    else:
-        update_start_vals(start, model.test_point, model)
-
-    if not set(start.keys()).issubset(model.named_vars.keys()):
-        extra_keys = ', '.join(set(start.keys()) - set(model.named_vars.keys()))
-        valid_keys = ', '.join(model.named_vars.keys())
-        raise KeyError('Some start parameters do not appear in the model!\n'
-                       'Valid keys are: {}, but {} was supplied'.format(valid_keys, extra_keys))
+    start = _check_start(start, model)
 
     if vars is None:
         vars = model.cont_vars
@@ -83,8 +76,14 @@ def find_MAP(start=None, vars=None, method="L-BFGS-B",
     logp_func = bij.mapf(model.fastlogp_nojac)
     x0 = bij.map(start)
 
+    logp_dlogp_func = None
     try:
-        dlogp_func = bij.mapf(model.fastdlogp_nojac(vars))
+        if disc_vars or "fmin" in kwargs:
+            dlogp_func = bij.mapf(model.fastdlogp_nojac(vars))
+        else:
+            # one theano call per iteration for both the value and the gradient
+            logp_dlogp_func = _logp_dlogp_nojac_function(vars, model)
+            logp_dlogp_func.set_extra_values(start)
         compute_gradient = True
     except (AttributeError, NotImplementedError, tg.NullTypeGradError):
         compute_gradient = False
@@ -123,7 +122,10 @@ def find_MAP(start=None, vars=None, method="L-BFGS-B",
             mx0 = opt_result
     else:
         # remove 'if' part, keep just this 'else' block after version change
-        if compute_gradient:
+        if logp_dlogp_func is not None:
+            cost_func = CostFuncWrapper(maxeval, progressbar,
+                                        logp_dlogp_func=logp_dlogp_func)
+        elif compute_gradient:
             cost_func = CostFuncWrapper(maxeval, progressbar, logp_func, dlogp_func)
         else:
             cost_func = CostFuncWrapper(maxeval, progressbar, logp_func)
@@ -150,6 +152,180 @@ def find_MAP(start=None, vars=None, method="L-BFGS-B",
         return mx
 
 
+def find_MAP_multistart(starts, vars=None, method="L-BFGS-B", cores=None,
+                        return_raw=False, include_transformed=True, progressbar=True,
+                        maxeval=5000, model=None, **kwargs):
+    """
+    Finds local maxima a posteriori from several starting points.
+
+    The optimizations are independent and run in a pool of `cores`
+    processes. Every worker holds its own copy of a single compiled
+    function that returns the log-probability together with its gradient,
+    so that each iteration costs one theano call.
+
+    Parameters
+    ----------
+    starts : int or list of `dict`
+        Starting points of the optimizations. If an int `K` is given,
+        `K` starting points are generated by adding uniform jitter in
+        [-1, 1] to `model.test_point`.
+    vars : list
+        List of variables to optimize and set to optimum (Defaults to all
+        continuous). Discrete variables are not supported, use `find_MAP`
+        for those.
+    method : string
+        Gradient based optimization algorithm passed to
+        `scipy.optimize.minimize` (Defaults to 'L-BFGS-B').
+    cores : int
+        The number of worker processes. Defaults to the number of CPUs in
+        the system, but at most the number of starting points. If 1, the
+        optimizations run sequentially in the current process.
+    return_raw : bool
+        Whether to also return the full output of scipy.optimize.minimize
+        for every optimization (Defaults to `False`)
+    include_transformed : bool
+        Flag for reporting automatically transformed variables in addition
+        to original variables (defaults to True).
+    progressbar : bool
+        Whether or not to display a progress bar over the finished
+        optimizations.
+    maxeval : int
+        The maximum number of times the posterior distribution is evaluated
+        in each optimization.
+    model : Model (optional if in `with` context)
+    **kwargs
+        Extra args passed to scipy.optimize.minimize
+
+    Returns
+    -------
+    maps : list of `dict`
+        The optima, one for each starting point, sorted by decreasing
+        log-probability.
+    results : list of scipy.optimize.OptimizeResult
+        Only if `return_raw` is True. The raw optimization results in the
+        same order as `maps`. An entry is None if the optimization was
+        stopped because `maxeval` was reached.
+    """
+    model = modelcontext(model)
+
+    if isinstance(starts, numbers.Integral):
+        starts = [_jitter_start(model) for _ in range(starts)]
+    starts = [Point(_check_start(start, model), model=model)
+              for start in starts]
+    if not starts:
+        raise ValueError('At least one starting point is required.')
+
+    if vars is None:
+        vars = model.cont_vars
+    vars = inputvars(vars)
+    allinmodel(vars, model)
+    if list(typefilter(vars, discrete_types)):
+        raise ValueError('find_MAP_multistart can only optimize continuous '
+                         'variables, use find_MAP for discrete variables.')
+
+    logp_dlogp_func = _logp_dlogp_nojac_function(vars, model)
+
+    if cores is None:
+        cores = mp.cpu_count()
+    cores = max(1, min(cores, len(starts)))
+
+    jobs = [(logp_dlogp_func.dict_to_array(start), start, method, maxeval, kwargs)
+            for start in starts]
+    progress = tqdm(total=len(jobs), disable=not progressbar)
+    try:
+        if cores > 1:
+            pool = mp.Pool(processes=cores, initializer=_init_multistart_worker,
+                           initargs=(logp_dlogp_func,))
+            try:
+                results = []
+                for result in pool.imap(_multistart_optimize, jobs):
+                    results.append(result)
+                    progress.update(1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            _init_multistart_worker(logp_dlogp_func)
+            results = []
+            for job in jobs:
+                results.append(_multistart_optimize(job))
+                progress.update(1)
+    finally:
+        progress.close()
+
+    out_vars = get_default_varnames(model.unobserved_RVs, include_transformed)
+    out_func = model.fastfn(out_vars)
+    optima = []
+    for start, (mx0, logp, opt_result) in zip(starts, results):
+        point = logp_dlogp_func.array_to_dict(mx0)
+        point.update({name: value for name, value in start.items()
+                      if name not in point})
+        mx = {var.name: value for var, value in zip(out_vars, out_func(point))}
+        optima.append((logp, mx, opt_result))
+
+    logps = np.array([logp for logp, _, _ in optima], dtype=np.float64)
+    order = np.argsort(-np.where(np.isnan(logps), -np.inf, logps), kind='mergesort')
+    maps = [optima[i][1] for i in order]
+
+    if return_raw:
+        return maps, [optima[i][2] for i in order]
+    else:
+        return maps
+
+
+def _check_start(start, model):
+    if start is None:
+        start = model.test_point
+    else:
+        update_start_vals(start, model.test_point, model)
+
+    if not set(start.keys()).issubset(model.named_vars.keys()):
+        extra_keys = ', '.join(set(start.keys()) - set(model.named_vars.keys()))
+        valid_keys = ', '.join(model.named_vars.keys())
+        raise KeyError('Some start parameters do not appear in the model!\n'
+                       'Valid keys are: {}, but {} was supplied'.format(valid_keys, extra_keys))
+    return start
+
+
+def _jitter_start(model):
+    start = model.test_point
+    for var in model.cont_vars:
+        start[var.name] = start[var.name] + np.random.uniform(-1, 1, start[var.name].shape)
+    return start
+
+
+def _logp_dlogp_nojac_function(vars, model):
+    varnames = [var.name for var in vars]
+    extra_vars = [var for var in model.free_RVs if var.name not in varnames]
+    return pm.model.ValueGradFunction(model.logp_nojact, vars, extra_vars)
+
+
+_multistart_func = None
+
+
+def _init_multistart_worker(logp_dlogp_func):
+    global _multistart_func
+    _multistart_func = logp_dlogp_func
+
+
+def _multistart_optimize(job):
+    x0, start, method, maxeval, kwargs = job
+    _multistart_func.set_extra_values(start)
+    cost_func = CostFuncWrapper(maxeval, False, logp_dlogp_func=_multistart_func)
+    try:
+        opt_result = minimize(cost_func, x0, method=method, jac=True, **kwargs)
+        mx0 = opt_result["x"]
+    except StopIteration:
+        mx0, opt_result = cost_func.previous_x, None
+    finally:
+        cost_func.progress.close()
+    if mx0 is None:
+        mx0 = x0
+    mx0 = pm.floatX(mx0)
+    logp = _multistart_func(mx0)[0]
+    return mx0, logp, opt_result
+
+
 def allfinite(x):
     return np.all(isfinite(x))
 
@@ -165,11 +341,16 @@ def allinmodel(vars, model):
 
 
 class CostFuncWrapper:
-    def __init__(self, maxeval=5000, progressbar=True, logp_func=None, dlogp_func=None):
+    def __init__(self, maxeval=5000, progressbar=True, logp_func=None, dlogp_func=None,
+                 logp_dlogp_func=None):
         self.n_eval = 0
         self.maxeval = maxeval
         self.logp_func = logp_func
-        if dlogp_func is None:
+        self.logp_dlogp_func = logp_dlogp_func
+        if logp_dlogp_func is not None:
+            self.use_gradient = True
+            self.desc = 'logp = {:,.5g}, ||grad|| = {:,.5g}'
+        elif dlogp_func is None:
             self.use_gradient = False
             self.desc = 'logp = {:,.5g}'
         else:
@@ -181,9 +362,18 @@ class CostFuncWrapper:
         self.progress.n = 0
 
     def __call__(self, x):
-        neg_value = np.float64(self.logp_func(pm.floatX(x)))
+        if self.logp_dlogp_func is not None:
+            neg_value, neg_grad = self.logp_dlogp_func(pm.floatX(x))
+            neg_value = np.float64(neg_value)
+        else:
+            neg_value = np.float64(self.logp_func(pm.floatX(x)))
         value = -1.0 * nan_to_high(neg_value)
-        if self.use_gradient:
+        if self.logp_dlogp_func is not None:
+            if np.all(np.isfinite(neg_grad)):
+                self.previous_x = x
+            grad = nan_to_num(-1.0*neg_grad)
+            grad = grad.astype(np.float64)
+        elif self.use_gradient:
             neg_grad = self.dlogp_func(pm.floatX(x))
             if np.all(np.isfinite(neg_grad)):
                 self.previous_x = x